@@ -1,6 +1,10 @@
 import { mkdir } from "node:fs/promises";
 import { dirname } from "node:path";
-import { openWorkflowIndex, writeFasta } from "@virtool/sqlite";
+import {
+	openWorkflowIndex,
+	type WriteFastaStats,
+	writeDefaultFasta,
+} from "@virtool/sqlite";
 import { workPaths } from "../paths";
 import type { NuvsStep } from "./types";
 
@@ -35,16 +39,19 @@ export const createReferenceFastaStep: NuvsStep = {
 			path: data.index.path,
 		});
 
+		let stats: WriteFastaStats;
+
 		try {
 			// Streamed from SQLite straight to disk: a real reference exceeds V8's
-			// maximum string length, so nothing here may materialise it.
-			await writeFasta(paths.referenceFasta, index.iterDefaultSequences());
+			// maximum string length, so nothing here may materialise it. A
+			// snapshot built with the FASTA embedded is copied out as it is.
+			stats = await writeDefaultFasta(paths.referenceFasta, index);
 		} finally {
 			index.close();
 		}
 
 		logger.info(
-			{ fastaPath: paths.referenceFasta },
+			{ fastaPath: paths.referenceFasta, ...stats },
 			"wrote default isolate fasta",
 		);
 	},
@@ -1,7 +1,7 @@
 import { createWriteStream } from "node:fs";
 import { rename } from "node:fs/promises";
 import { pipeline } from "node:stream/promises";
-import { findOrfs, parseFastaLines } from "@virtool/bio";
+import { findOrfsBatch, parseFastaLines } from "@virtool/bio";
 import { gzipFile } from "@virtool/workflow";
 import { workPaths } from "../paths";
 import { readLines } from "../sequences";
@@ -18,6 +18,14 @@ import type { NuvsStep } from "./types";
  */
 const MINIMUM_CONTIG_LENGTH = 300;
 
+/**
+ * Contigs handed to `findOrfsBatch` at a time.
+ *
+ * Bounds how many contig sequences are held before their ORFs are known; the
+ * batch's scratch buffers are sized to its longest contig either way.
+ */
+const ORF_BATCH_SIZE = 1000;
+
 /**
  * Find the open reading frames in the assembled contigs.
  *
@@ -45,6 +53,7 @@ export const processAssemblyStep: NuvsStep = {
 		await rename(paths.spadesScaffolds, paths.assemblyFasta);
 
 		const contigs: NuvsRawContig[] = [];
+		let batch: string[] = [];
 
 		for await (const [, sequence] of parseFastaLines(
 			readLines(paths.assemblyFasta),
@@ -53,23 +62,16 @@ export const processAssemblyStep: NuvsStep = {
 				continue;
 			}
 
-			const orfs = findOrfs(sequence);
+			batch.push(sequence);
 
-			if (orfs.length === 0) {
-				continue;
+			if (batch.length >= ORF_BATCH_SIZE) {
+				collectContigs(contigs, batch);
+				batch = [];
 			}
-
-			contigs.push({
-				index: contigs.length,
-				orfs: orfs.map(({ nuc: _nuc, ...orf }, index) => ({
-					...orf,
-					hits: [],
-					index,
-				})),
-				sequence,
-			});
 		}
 
+		collectContigs(contigs, batch);
+
 		await writeOrfsFasta(paths.orfsFasta, contigs);
 
 		await gzipFile({
@@ -94,6 +96,37 @@ export const processAssemblyStep: NuvsStep = {
 	},
 };
 
+/**
+ * Find the ORFs in a batch of contigs and append every contig that has one.
+ *
+ * Numbering happens here, in file order, so batching cannot reorder the
+ * contigs that survive.
+ */
+function collectContigs(
+	contigs: NuvsRawContig[],
+	sequences: readonly string[],
+): void {
+	const found = findOrfsBatch(sequences);
+
+	for (const [position, sequence] of sequences.entries()) {
+		const orfs = found[position];
+
+		if (orfs === undefined || orfs.length === 0) {
+			continue;
+		}
+
+		contigs.push({
+			index: contigs.length,
+			orfs: orfs.map(({ nuc: _nuc, ...orf }, index) => ({
+				...orf,
+				hits: [],
+				index,
+			})),
+			sequence,
+		});
+	}
+}
+
 /**
  * Write the ORF translations `hmmscan` will search.
  *
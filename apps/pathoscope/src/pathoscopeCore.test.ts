@@ -4,6 +4,7 @@ import { join } from "node:path";
 import type { RunSubprocess } from "@virtool/workflow";
 import { describe, expect, it, onTestFinished, vi } from "vitest";
 import {
+	decodeCoverage,
 	eliminateSubtraction,
 	findCandidateSequenceIds,
 	runExpectationMaximization,
@@ -191,6 +192,64 @@ describe("runExpectationMaximization", () => {
 			outputPath,
 		]);
 	});
+
+	it("returns the same results from interval-encoded coverage", async () => {
+		const outputPath = join(await tempDir(), "em.json");
+		const shared = {
+			refs: ["seq_a", "seq_b"],
+			pi: [0.75, 0.25],
+			read_count: 3,
+		};
+
+		const dense = await runExpectationMaximization(
+			{
+				runSubprocess: coreWriting({
+					...shared,
+					coverage: { seq_a: [0, 5, 5, 0, 5, 4, 4, 4], seq_b: [0, 0, 0] },
+				}),
+				outputPath,
+			},
+			{ alignmentPath: "/work/subtracted.bam", pScoreCutoff: 0.01 },
+		);
+
+		const runSubprocess = coreWriting({
+			...shared,
+			coverage_encoding: "intervals",
+			coverage: {
+				seq_a: {
+					length: 8,
+					intervals: [
+						[1, 3, 5],
+						[4, 5, 5],
+						[5, 8, 4],
+					],
+				},
+				seq_b: { length: 3, intervals: [] },
+			},
+		});
+
+		const results = await runExpectationMaximization(
+			{ runSubprocess, outputPath },
+			{
+				alignmentPath: "/work/subtracted.bam",
+				coverageEncoding: "intervals",
+				pScoreCutoff: 0.01,
+			},
+		);
+
+		expect(
+			vi.mocked(runSubprocess).mock.calls[0]?.[0].command.slice(-2),
+		).toEqual(["--coverage-encoding", "intervals"]);
+		expect(results).toEqual(dense);
+	});
+});
+
+describe("decodeCoverage", () => {
+	it("leaves positions outside every interval at zero", () => {
+		const dense = decodeCoverage({ length: 4, intervals: [[1, 2, 7]] });
+
+		expect(dense).toEqual([0, 7, 0, 0]);
+	});
 });
 
 describe("subtractionProc", () => {
@@ -53,6 +53,42 @@ export type PathoscopeEmResults = {
 	coverage: Record<string, number[]>;
 };
 
+/**
+ * One reference's coverage as `em --coverage-encoding intervals` writes it.
+ *
+ * Each interval is `[start, end, depth]`, zero-based and half-open, in order and
+ * never overlapping. Positions no interval covers have a depth of zero.
+ */
+export type CoverageIntervals = {
+	length: number;
+	intervals: [start: number, end: number, depth: number][];
+};
+
+/** How the `em` results file writes `coverage`. */
+export type CoverageEncoding = "dense" | "intervals";
+
+type IntervalEmResults = Omit<PathoscopeEmResults, "coverage"> & {
+	coverage_encoding: "intervals";
+	coverage: Record<string, CoverageIntervals>;
+};
+
+/**
+ * Rebuild the dense per-position depth array a reference's intervals encode —
+ * the array the core writes when coverage is not interval-encoded.
+ */
+export function decodeCoverage({
+	length,
+	intervals,
+}: CoverageIntervals): number[] {
+	const dense = new Array<number>(length).fill(0);
+
+	for (const [start, end, depth] of intervals) {
+		dense.fill(depth, start, end);
+	}
+
+	return dense;
+}
+
 /** Options shared by every subcommand invocation. */
 type CoreRun = {
 	runSubprocess: RunSubprocess;
@@ -167,15 +203,28 @@ export async function eliminateSubtraction(
 	return subtracted;
 }
 
-/** Reassign multi-mapping reads by expectation maximization. */
-export function runExpectationMaximization(
+/**
+ * Reassign multi-mapping reads by expectation maximization.
+ *
+ * With `coverageEncoding: "intervals"` the core writes each reference's
+ * coverage as its runs of non-zero depth, so the results file and the time to
+ * parse it scale with the bases covered rather than with reference length.
+ * The coverage is decoded before it is returned, so the results are the same
+ * either way.
+ */
+export async function runExpectationMaximization(
 	run: CoreRun,
 	{
 		alignmentPath,
+		coverageEncoding = "dense",
 		pScoreCutoff,
-	}: { alignmentPath: string; pScoreCutoff: number },
+	}: {
+		alignmentPath: string;
+		coverageEncoding?: CoverageEncoding;
+		pScoreCutoff: number;
+	},
 ): Promise<PathoscopeEmResults> {
-	return runCore<PathoscopeEmResults>(run, [
+	const args = [
 		"em",
 		// Singular: that is what the core's CLI names it.
 		"--alignment",
@@ -184,7 +233,33 @@ export function runExpectationMaximization(
 		String(pScoreCutoff),
 		"--output",
 		run.outputPath,
+	];
+
+	if (coverageEncoding === "dense") {
+		return runCore<PathoscopeEmResults>(run, args);
+	}
+
+	// The marker only tells the encodings apart; once decoded it is not part of
+	// the results.
+	const {
+		coverage,
+		coverage_encoding: _coverageEncoding,
+		...results
+	} = await runCore<IntervalEmResults>(run, [
+		...args,
+		"--coverage-encoding",
+		coverageEncoding,
 	]);
+
+	return {
+		...results,
+		coverage: Object.fromEntries(
+			Object.entries(coverage).map(([id, encoded]) => [
+				id,
+				decodeCoverage(encoded),
+			]),
+		),
+	};
 }
 
 /**
@@ -111,6 +111,9 @@ async function collapseReference({
 
 		// Consumed lazily by `createIndexArtifact`, so the collapsed reference is
 		// never held in memory whole — the tally rides along on the same pass.
+		// Bulk-loaded so the next OTU's `cd-hit-est` runs while this one is
+		// written; a failed collapse fails the run, so a deleted file loses
+		// nothing.
 		await createIndexArtifact(
 			paths.collapsedReference,
 			reference,
@@ -121,6 +124,7 @@ async function collapseReference({
 					yield result.otu;
 				}
 			})(),
+			{ bulkLoad: true },
 		);
 
 		logger.info({ path: paths.collapsedReference }, "wrote collapsed index");
@@ -1,7 +1,11 @@
 import { mkdtemp, rm } from "node:fs/promises";
 import { join } from "node:path";
 import type { Logger } from "@virtool/logger";
-import { openWorkflowIndex, writeFasta } from "@virtool/sqlite";
+import {
+	openWorkflowIndex,
+	type WriteFastaStats,
+	writeDefaultFasta,
+} from "@virtool/sqlite";
 import {
 	type BuildContextInput,
 	createMappingIndex,
@@ -80,16 +84,18 @@ async function writeDefaultIsolateFasta({
 }): Promise<void> {
 	const source = openWorkflowIndex({ id: indexId, path: indexPath });
 
+	let stats: WriteFastaStats;
+
 	try {
 		// Streamed from SQLite straight to disk. The sequence order is the index
 		// reader's, which decides the FASTA order and so every SAM line mapped
 		// against the built index.
-		await writeFasta(fastaPath, source.iterDefaultSequences());
+		stats = await writeDefaultFasta(fastaPath, source);
 	} finally {
 		source.close();
 	}
 
-	logger.info({ fastaPath }, "assembled default reference fasta");
+	logger.info({ fastaPath, ...stats }, "assembled default reference fasta");
 }
 
 /**
@@ -73,9 +73,12 @@ export const buildIsolateIndexStep: PathoscopeStep = {
 
 			await mkdir(paths.isolatesDir, { recursive: true });
 
-			await writeFasta(paths.isolateFasta, index.iterOtuSequences(otuIds));
+			const stats = await writeFasta(
+				paths.isolateFasta,
+				index.iterOtuSequences(otuIds),
+			);
 
-			logger.info({ otuCount: otuIds.size }, "wrote isolate fasta");
+			logger.info({ otuCount: otuIds.size, ...stats }, "wrote isolate fasta");
 		} finally {
 			index.close();
 		}
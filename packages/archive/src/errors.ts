@@ -44,3 +44,6 @@ export class ZipMemberMissingError extends ArchiveError {
 		super(`zip archive is missing ${missing}`);
 	}
 }
+
+/** A seekable gzip file is truncated, or a block does not match its header. */
+export class SeekableGzipError extends ArchiveError {}
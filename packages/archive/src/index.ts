@@ -1,4 +1,5 @@
 export * from "./compression";
 export * from "./errors";
+export * from "./seekable";
 export * from "./tar";
 export * from "./zip";
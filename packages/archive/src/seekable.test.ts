@@ -0,0 +1,328 @@
+import { randomBytes } from "node:crypto";
+import { createReadStream } from "node:fs";
+import { mkdtemp, readFile, rm, stat, writeFile } from "node:fs/promises";
+import { tmpdir } from "node:os";
+import { join } from "node:path";
+import { gunzipSync, gzipSync } from "node:zlib";
+import { afterEach, beforeEach, describe, expect, it } from "vitest";
+import { DecompressedSizeLimitError } from "./compression";
+import { SeekableGzipError } from "./errors";
+import {
+	compressSeekableGzip,
+	decompressSeekableGzipToFile,
+	openSeekableGzip,
+} from "./seekable";
+
+let workPath: string;
+
+beforeEach(async () => {
+	workPath = await mkdtemp(join(tmpdir(), "vt-seekable-"));
+});
+
+afterEach(async () => {
+	await rm(workPath, { recursive: true, force: true });
+});
+
+/** Half random, half repetitive, so blocks neither all shrink nor all grow. */
+function sampleData(size: number): Buffer {
+	const data = Buffer.alloc(size, "ACGT");
+
+	randomBytes(size / 2).copy(data);
+
+	return data;
+}
+
+/**
+ * Yield `data` in chunks of `size`, the way a download arrives, waiting
+ * `delayMs` before each chunk after the first.
+ */
+async function* chunked(data: Buffer, size: number, delayMs = 0) {
+	for (let offset = 0; offset < data.length; offset += size) {
+		if (delayMs > 0 && offset > 0) {
+			await new Promise((resolve) => setTimeout(resolve, delayMs));
+		}
+
+		yield data.subarray(offset, offset + size);
+	}
+}
+
+describe("compressSeekableGzip", () => {
+	it("writes one block per blockSize of input", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(10_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const file = await openSeekableGzip(target);
+
+		try {
+			expect(file.size).toBe(10_000);
+			expect(file.blocks.map(({ length }) => length)).toEqual([
+				4096, 4096, 1808,
+			]);
+			expect(
+				file.blocks.reduce((total, { size }) => total + size, 0),
+			).toBe((await stat(target)).size);
+		} finally {
+			await file.close();
+		}
+	});
+
+	// Old readers download the same key, so the file has to stay plain gzip.
+	it("writes a file any gzip reader decompresses", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+		const data = sampleData(50_000);
+
+		await writeFile(source, data);
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		expect(gunzipSync(await readFile(target)).equals(data)).toBe(true);
+	});
+
+	it("writes an empty file as one empty block", async () => {
+		const source = join(workPath, "empty");
+		const target = join(workPath, "empty.gz");
+
+		await writeFile(source, "");
+		await compressSeekableGzip(source, target);
+
+		expect(gunzipSync(await readFile(target))).toHaveLength(0);
+	});
+
+	it.each([
+		["a zero block size", { blockSize: 0 }],
+		["a fractional block size", { blockSize: 1.5 }],
+		["a zero concurrency", { concurrency: 0 }],
+	])("throws on %s", async (_name, options) => {
+		const source = join(workPath, "index.sqlite");
+
+		await writeFile(source, "ACGT");
+
+		await expect(
+			compressSeekableGzip(source, join(workPath, "index.sqlite.gz"), options),
+		).rejects.toThrow(RangeError);
+	});
+});
+
+describe("openSeekableGzip", () => {
+	it.each([
+		["inside one block", 100, 200],
+		["across a block boundary", 4000, 200],
+		["across several blocks", 1000, 10_000],
+		["past the end", 19_900, 500],
+	])("reads a range %s", async (_name, position, length) => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+		const data = sampleData(20_000);
+
+		await writeFile(source, data);
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const file = await openSeekableGzip(target, { cachedBlocks: 2 });
+
+		try {
+			const read = await file.read(position, length);
+
+			expect(read.equals(data.subarray(position, position + length))).toBe(
+				true,
+			);
+		} finally {
+			await file.close();
+		}
+	});
+
+	it("throws on an ordinary gzip file", async () => {
+		const path = join(workPath, "plain.gz");
+
+		await writeFile(path, gzipSync("ACGT"));
+
+		await expect(openSeekableGzip(path)).rejects.toThrow(SeekableGzipError);
+	});
+
+	it("throws on a truncated file", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(10_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const compressed = await readFile(target);
+
+		await writeFile(target, compressed.subarray(0, compressed.length - 10));
+
+		await expect(openSeekableGzip(target)).rejects.toThrow(/truncated/);
+	});
+});
+
+describe("decompressSeekableGzipToFile", () => {
+	it("decompresses blocks that arrive split across chunks", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+		const restored = join(workPath, "restored", "index.sqlite");
+		const data = sampleData(100_000);
+
+		await writeFile(source, data);
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		await decompressSeekableGzipToFile(
+			chunked(await readFile(target), 1000),
+			restored,
+			{ concurrency: 3 },
+		);
+
+		expect((await readFile(restored)).equals(data)).toBe(true);
+	});
+
+	it("decompresses an ordinary gzip file the way it always has", async () => {
+		const target = join(workPath, "reads.fq");
+
+		await decompressSeekableGzipToFile(
+			chunked(gzipSync("@read\nACGT\n+\nIIII\n"), 5),
+			target,
+		);
+
+		expect(await readFile(target, "utf8")).toBe("@read\nACGT\n+\nIIII\n");
+	});
+
+	it("refuses output past the byte limit", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(20_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		await expect(
+			decompressSeekableGzipToFile(
+				createReadStream(target),
+				join(workPath, "restored"),
+				{ maxDecompressedBytes: 10_000 },
+			),
+		).rejects.toThrow(DecompressedSizeLimitError);
+	});
+
+	it("throws on a block that does not match its checksum", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(10_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const compressed = await readFile(target);
+
+		// The first block's CRC-32, just ahead of its input size.
+		const crcOffset = compressed.readUInt32LE(16) - 8;
+
+		compressed[crcOffset] = (compressed[crcOffset] ?? 0) ^ 0xff;
+
+		await expect(
+			decompressSeekableGzipToFile(
+				chunked(compressed, 4096),
+				join(workPath, "restored"),
+			),
+		).rejects.toThrow(SeekableGzipError);
+	});
+
+	it("stops inflating a block at the size its header gives", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, Buffer.alloc(1_000_000));
+		await compressSeekableGzip(source, target, { blockSize: 1_000_000 });
+
+		const compressed = await readFile(target);
+
+		// The block's decompressed size, as its `VB` subfield gives it.
+		compressed.writeUInt32LE(1000, 20);
+
+		await expect(
+			decompressSeekableGzipToFile(
+				chunked(compressed, 4096),
+				join(workPath, "restored"),
+			),
+		).rejects.toThrow(/inflates past the 1000 bytes/);
+	});
+
+	// A download arrives more slowly than a block inflates, so the bad block
+	// fails while the next chunk is still on its way and nothing is awaiting it.
+	it("throws on a bad block that fails between chunks", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(10_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const compressed = await readFile(target);
+		const crcOffset = compressed.readUInt32LE(16) - 8;
+
+		compressed[crcOffset] = (compressed[crcOffset] ?? 0) ^ 0xff;
+
+		await expect(
+			decompressSeekableGzipToFile(
+				chunked(compressed, 1000, 20),
+				join(workPath, "restored"),
+				{ concurrency: 4 },
+			),
+		).rejects.toThrow(SeekableGzipError);
+	});
+
+	/** The first `size` bytes of a seekable file holding 20 KB. */
+	async function seekableHead(size: number): Promise<Buffer> {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(20_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		return (await readFile(target)).subarray(0, size);
+	}
+
+	it.each([
+		["before the first chunk", async () => Buffer.alloc(0)],
+		["in an ordinary gzip file", async () => gzipSync("@read\nACGT\n")],
+		["between blocks of a seekable file", () => seekableHead(6000)],
+	])("stops at once when aborted %s", async (_name, head) => {
+		const data = await head();
+		const controller = new AbortController();
+
+		// A download that stops arriving: the next chunk never comes.
+		async function* stalled() {
+			yield* chunked(data, 1000);
+			await new Promise(() => {});
+		}
+
+		const reason = new Error("cancelled");
+
+		setTimeout(() => controller.abort(reason), 20);
+
+		const error = await decompressSeekableGzipToFile(
+			stalled(),
+			join(workPath, "restored"),
+			{ concurrency: 2, signal: controller.signal },
+		).then(
+			() => null,
+			(caught: unknown) => caught,
+		);
+
+		// An ordinary file goes through `pipeline`, which wraps the reason.
+		expect(error === reason || (error as Error).cause === reason).toBe(true);
+	});
+
+	it("throws on a stream that ends partway through a block", async () => {
+		const source = join(workPath, "index.sqlite");
+		const target = join(workPath, "index.sqlite.gz");
+
+		await writeFile(source, sampleData(10_000));
+		await compressSeekableGzip(source, target, { blockSize: 4096 });
+
+		const compressed = await readFile(target);
+
+		await expect(
+			decompressSeekableGzipToFile(
+				chunked(compressed.subarray(0, compressed.length - 10), 4096),
+				join(workPath, "restored"),
+			),
+		).rejects.toThrow(/partway through a block/);
+	});
+});
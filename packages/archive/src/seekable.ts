@@ -0,0 +1,780 @@
+/**
+ * Seekable gzip: a gzip file cut into independently compressed blocks.
+ *
+ * A plain gzip stream inflates front to back on one core, so a 300 MB index
+ * snapshot is a single-threaded gunzip between the last byte arriving and the
+ * first query. Here the input is cut into fixed-size blocks and each is written
+ * as a gzip member of its own — the layout BGZF gives BAM files — so blocks
+ * inflate independently: in parallel on libuv's thread pool, as they come off
+ * the network, or one at a time at any offset.
+ *
+ * It is still gzip. Concatenated members are one valid gzip stream, so
+ * `decompressGzipToFile`, `gunzip` and anything else that reads the old files
+ * reads these, and a file keeps its `.gz` name.
+ *
+ * Every member carries one extra subfield, `VB`, holding two little-endian
+ * `uint32`s: the member's own size and the size of the block it inflates to.
+ * Walking those headers is the offset index — where every block starts,
+ * compressed and decompressed — without inflating anything.
+ */
+
+import { type FileHandle, mkdir, open } from "node:fs/promises";
+import { availableParallelism } from "node:os";
+import { dirname } from "node:path";
+import { promisify } from "node:util";
+import { crc32, deflateRaw, inflateRaw } from "node:zlib";
+import {
+	DecompressedSizeLimitError,
+	type DecompressGzipToFileOptions,
+	decompressGzipToFile,
+} from "./compression";
+import { SeekableGzipError } from "./errors";
+
+const deflateRawAsync = promisify(deflateRaw);
+const inflateRawAsync = promisify(inflateRaw);
+
+/**
+ * Bytes of input per block.
+ *
+ * Large enough that the 32 bytes of framing and the restarted dictionary cost
+ * well under a percent of the ratio, small enough that a 300 MB file is
+ * hundreds of blocks to share between cores.
+ */
+export const SEEKABLE_GZIP_BLOCK_SIZE = 1024 * 1024;
+
+/** The fixed header every block's member starts with, `VB` subfield included. */
+const MEMBER_HEADER_SIZE = 24;
+
+/** The CRC-32 and input size every gzip member ends with. */
+const MEMBER_TRAILER_SIZE = 8;
+
+/** Options for {@link compressSeekableGzip}. */
+export type CompressSeekableGzipOptions = {
+	/** Bytes of input per block. */
+	blockSize?: number;
+
+	/** Blocks compressed at once. Defaults to one per core. */
+	concurrency?: number;
+};
+
+/** Options for {@link decompressSeekableGzipToFile}. */
+export type DecompressSeekableGzipToFileOptions =
+	DecompressGzipToFileOptions & {
+		/** Blocks inflated at once. Defaults to one per core. */
+		concurrency?: number;
+	};
+
+/** One block of a seekable gzip file, as its header describes it. */
+export type SeekableGzipBlock = {
+	/** Where the block's member starts in the compressed file */
+	offset: number;
+
+	/** The size of the block's member, compressed */
+	size: number;
+
+	/** Where the block starts in the decompressed data */
+	position: number;
+
+	/** The size of the block, decompressed */
+	length: number;
+};
+
+/** A seekable gzip file, open for reads at any decompressed offset. */
+export type SeekableGzipFile = {
+	/** The size of the decompressed data */
+	readonly size: number;
+
+	/** Every block in order — the offset index */
+	readonly blocks: readonly SeekableGzipBlock[];
+
+	/**
+	 * Read up to `length` bytes of decompressed data starting at `position`.
+	 *
+	 * Only the blocks the range falls in are inflated, all at once, and the
+	 * most recently read are kept for the next call.
+	 */
+	read(position: number, length: number): Promise<Buffer>;
+
+	/** Release the file handle */
+	close(): Promise<void>;
+};
+
+/**
+ * Compress `source` to a seekable gzip file at `target`, creating `target`'s
+ * parent directory first.
+ *
+ * Blocks are read in order and compressed `concurrency` at a time on the
+ * thread pool, then written in order, so at most that many are held at once.
+ */
+export async function compressSeekableGzip(
+	source: string,
+	target: string,
+	{
+		blockSize = SEEKABLE_GZIP_BLOCK_SIZE,
+		concurrency = availableParallelism(),
+	}: CompressSeekableGzipOptions = {},
+): Promise<void> {
+	// A block and its framing have to fit the header's `uint32`s, with room
+	// for deflate's worst case of growing incompressible input.
+	if (!Number.isInteger(blockSize) || blockSize < 1 || blockSize > 2 ** 30) {
+		throw new RangeError(
+			`blockSize must be a whole number of bytes up to 1 GiB, not ${blockSize}`,
+		);
+	}
+
+	checkConcurrency(concurrency);
+
+	await mkdir(dirname(target), { recursive: true });
+
+	const input = await open(source, "r");
+
+	try {
+		const output = await open(target, "w");
+
+		try {
+			const queue: Promise<Buffer>[] = [];
+
+			let blocks = 0;
+
+			while (true) {
+				const block = Buffer.allocUnsafe(blockSize);
+				const { bytesRead } = await input.read(block, 0, blockSize, null);
+
+				if (bytesRead === 0) {
+					break;
+				}
+
+				const member = compressBlock(block.subarray(0, bytesRead));
+
+				// Awaited in order below; observed here so one that fails while
+				// an earlier one is awaited is not reported as unhandled.
+				member.catch(() => {});
+				queue.push(member);
+				blocks += 1;
+
+				const next = queue.length >= concurrency ? queue.shift() : undefined;
+
+				if (next !== undefined) {
+					await writeFully(output, await next, null);
+				}
+			}
+
+			for (const member of queue) {
+				await writeFully(output, await member, null);
+			}
+
+			// An empty file is not a gzip stream, so empty input is one empty
+			// block rather than no blocks at all.
+			if (blocks === 0) {
+				await writeFully(output, await compressBlock(Buffer.alloc(0)), null);
+			}
+		} finally {
+			await output.close();
+		}
+	} finally {
+		await input.close();
+	}
+}
+
+/**
+ * Open a seekable gzip file for reads at any decompressed offset.
+ *
+ * Builds the offset index from the block headers, one small read per block,
+ * and inflates nothing until it is read.
+ *
+ * @throws {SeekableGzipError} when `path` is not a seekable gzip file, or is
+ * truncated.
+ */
+export async function openSeekableGzip(
+	path: string,
+	{ cachedBlocks = 8 }: { cachedBlocks?: number } = {},
+): Promise<SeekableGzipFile> {
+	const handle = await open(path, "r");
+
+	let blocks: SeekableGzipBlock[];
+
+	try {
+		blocks = await readBlockIndex(handle, path);
+	} catch (error) {
+		await handle.close();
+
+		throw error;
+	}
+
+	const size = blocks.reduce((total, block) => total + block.length, 0);
+
+	// Most recently read last, as a `Map` iterates in insertion order.
+	const cache = new Map<number, Promise<Buffer>>();
+
+	function inflate(index: number): Promise<Buffer> {
+		const cached = cache.get(index);
+
+		if (cached !== undefined) {
+			cache.delete(index);
+			cache.set(index, cached);
+
+			return cached;
+		}
+
+		const block = blocks[index] as SeekableGzipBlock;
+
+		const inflated = (async () => {
+			const member = Buffer.allocUnsafe(block.size);
+
+			await readFully(handle, member, block.offset);
+
+			return inflateBlock(member, block.length, path);
+		})();
+
+		// A failed inflate is not kept for the next read to trip over.
+		inflated.catch(() => cache.delete(index));
+
+		cache.set(index, inflated);
+
+		if (cache.size > cachedBlocks) {
+			const oldest = cache.keys().next();
+
+			if (!oldest.done) {
+				cache.delete(oldest.value);
+			}
+		}
+
+		return inflated;
+	}
+
+	return {
+		size,
+		blocks,
+
+		async read(position, length) {
+			const start = Math.max(0, Math.min(position, size));
+			const end = Math.max(start, Math.min(position + length, size));
+
+			if (start === end) {
+				return Buffer.alloc(0);
+			}
+
+			const first = findBlock(blocks, start);
+			const last = findBlock(blocks, end - 1);
+
+			const inflated = await Promise.all(
+				Array.from({ length: last - first + 1 }, (_unused, offset) =>
+					inflate(first + offset),
+				),
+			);
+
+			const result = Buffer.allocUnsafe(end - start);
+
+			inflated.forEach((data, offset) => {
+				const block = blocks[first + offset] as SeekableGzipBlock;
+
+				data.copy(
+					result,
+					Math.max(0, block.position - start),
+					Math.max(0, start - block.position),
+					Math.min(block.length, end - block.position),
+				);
+			});
+
+			return result;
+		},
+
+		async close() {
+			await handle.close();
+		},
+	};
+}
+
+/**
+ * Stream a gzip object into a decompressed file, inflating a seekable one's
+ * blocks in parallel as they arrive.
+ *
+ * Each block is inflated on the thread pool as soon as its last byte is in and
+ * written at its own offset, so decompression keeps pace with the download
+ * rather than starting after it. At most `concurrency` blocks are in flight;
+ * past that the source is not read until one lands.
+ *
+ * Anything else gzip — every file written before these — is decompressed as
+ * `decompressGzipToFile` always has, so a caller need not know which it has.
+ *
+ * Aborting `signal` rejects with its reason at once, even while the source is
+ * stalled mid-download: the source is told to stop and the blocks already in
+ * flight settle first, so nothing is left writing to `target`.
+ *
+ * @throws {SeekableGzipError} when a seekable file's blocks are truncated or
+ * do not match their headers.
+ * @throws {DecompressedSizeLimitError} when the blocks would decompress past
+ * `maxDecompressedBytes`; checked before any of the excess is inflated.
+ */
+export async function decompressSeekableGzipToFile(
+	source: AsyncIterable<Uint8Array>,
+	target: string,
+	{
+		concurrency = availableParallelism(),
+		...options
+	}: DecompressSeekableGzipToFileOptions = {},
+): Promise<void> {
+	checkConcurrency(concurrency);
+	options.signal?.throwIfAborted();
+
+	const iterator = source[Symbol.asyncIterator]();
+
+	// Enough of the stream to tell a seekable file by its first header.
+	const head: Buffer[] = [];
+	let headLength = 0;
+
+	try {
+		while (headLength < MEMBER_HEADER_SIZE) {
+			const result = await nextOrAbort(iterator, options.signal);
+
+			if (result.done) {
+				break;
+			}
+
+			head.push(Buffer.from(result.value));
+			headLength += result.value.length;
+		}
+	} catch (error) {
+		await closeSource(iterator, options.signal);
+
+		throw error;
+	}
+
+	if (readBlockHeader(Buffer.concat(head)) === null) {
+		return decompressGzipToFile(
+			replay(head, iterator, options.signal),
+			target,
+			options,
+		);
+	}
+
+	await mkdir(dirname(target), { recursive: true });
+
+	const handle = await open(target, "w");
+
+	const inFlight = new Set<Promise<void>>();
+
+	// The first block to fail. A task leaves `inFlight` as soon as it settles,
+	// so one that fails between two waits is never awaited; its error is kept
+	// here and thrown at the next chance instead of being lost.
+	let failure: { error: unknown } | null = null;
+
+	function throwIfFailed(): void {
+		if (failure !== null) {
+			throw failure.error;
+		}
+	}
+
+	try {
+		const pending = head;
+		let available = headLength;
+		let member: { size: number; length: number } | null = null;
+		let position = 0;
+
+		/** Remove and return the first `size` bytes of what has arrived. */
+		function take(size: number): Buffer {
+			const joined = Buffer.concat(pending, available);
+
+			pending.length = 0;
+
+			if (joined.length > size) {
+				pending.push(joined.subarray(size));
+			}
+
+			available -= size;
+
+			return joined.subarray(0, size);
+		}
+
+		async function dispatch(data: Buffer, length: number): Promise<void> {
+			throwIfFailed();
+
+			const at = position;
+
+			position += length;
+
+			if (
+				options.maxDecompressedBytes !== undefined &&
+				position > options.maxDecompressedBytes
+			) {
+				throw new DecompressedSizeLimitError(options.maxDecompressedBytes);
+			}
+
+			const task = inflateBlock(data, length, target).then((block) =>
+				writeFully(handle, block, at),
+			);
+
+			task.then(
+				() => inFlight.delete(task),
+				(error: unknown) => {
+					inFlight.delete(task);
+					failure ??= { error };
+				},
+			);
+			inFlight.add(task);
+
+			if (inFlight.size >= concurrency) {
+				await Promise.race(inFlight);
+			}
+		}
+
+		async function drain(): Promise<void> {
+			while (true) {
+				if (member === null) {
+					if (available < MEMBER_HEADER_SIZE) {
+						return;
+					}
+
+					const joined = Buffer.concat(pending, available);
+
+					pending.length = 0;
+					pending.push(joined);
+
+					const header = readBlockHeader(joined);
+
+					if (header === null) {
+						throw new SeekableGzipError(
+							`${target}: the block at decompressed offset ${position} has no block header`,
+						);
+					}
+
+					member = header;
+				}
+
+				if (available < member.size) {
+					return;
+				}
+
+				const { size, length } = member;
+
+				member = null;
+
+				await dispatch(take(size), length);
+			}
+		}
+
+		await drain();
+
+		for (
+			let result = await nextOrAbort(iterator, options.signal);
+			!result.done;
+			result = await nextOrAbort(iterator, options.signal)
+		) {
+			throwIfFailed();
+
+			pending.push(Buffer.from(result.value));
+			available += result.value.length;
+
+			await drain();
+		}
+
+		if (available > 0) {
+			throw new SeekableGzipError(
+				`${target}: the compressed stream ends partway through a block`,
+			);
+		}
+
+		await Promise.all(inFlight);
+
+		throwIfFailed();
+	} catch (error) {
+		await closeSource(iterator, options.signal);
+		await Promise.allSettled(inFlight);
+
+		throw error;
+	} finally {
+		await handle.close();
+	}
+}
+
+/** Compress one block into a member of its own, `VB` header and all. */
+async function compressBlock(block: Buffer): Promise<Buffer> {
+	const deflated = await deflateRawAsync(block);
+
+	const member = Buffer.allocUnsafe(
+		MEMBER_HEADER_SIZE + deflated.length + MEMBER_TRAILER_SIZE,
+	);
+
+	// ID1, ID2, CM = deflate, FLG = FEXTRA, MTIME = 0, XFL = 0, OS = unknown
+	member.set([0x1f, 0x8b, 8, 4, 0, 0, 0, 0, 0, 255]);
+
+	// XLEN, then the one subfield: SI1, SI2, LEN and its two sizes.
+	member.writeUInt16LE(12, 10);
+	member.write("VB", 12, "latin1");
+	member.writeUInt16LE(8, 14);
+	member.writeUInt32LE(member.length, 16);
+	member.writeUInt32LE(block.length, 20);
+
+	deflated.copy(member, MEMBER_HEADER_SIZE);
+
+	member.writeUInt32LE(crc32(block), member.length - 8);
+	member.writeUInt32LE(block.length, member.length - 4);
+
+	return member;
+}
+
+/**
+ * Inflate one block's member, checking it against its trailer.
+ *
+ * `source` names the file in the error; `length` is the block size the header
+ * promised. Inflating stops there, so a member whose header understates what
+ * it holds fails without the rest of it ever being inflated.
+ */
+async function inflateBlock(
+	member: Buffer,
+	length: number,
+	source: string,
+): Promise<Buffer> {
+	let block: Buffer;
+
+	try {
+		block = await inflateRawAsync(
+			member.subarray(MEMBER_HEADER_SIZE, member.length - MEMBER_TRAILER_SIZE),
+			// zlib refuses a limit of zero. An empty block that holds a byte fails
+			// the length check below instead.
+			{ maxOutputLength: Math.max(length, 1) },
+		);
+	} catch (error) {
+		if (error instanceof RangeError) {
+			throw new SeekableGzipError(
+				`${source}: a block inflates past the ${length} bytes its header gives`,
+				{ cause: error },
+			);
+		}
+
+		throw new SeekableGzipError(`${source}: a block does not inflate`, {
+			cause: error,
+		});
+	}
+
+	if (
+		block.length !== length ||
+		crc32(block) !== member.readUInt32LE(member.length - 8)
+	) {
+		throw new SeekableGzipError(
+			`${source}: a block does not match its header and checksum`,
+		);
+	}
+
+	return block;
+}
+
+/**
+ * The sizes in a block's header, or null for anything that is not one.
+ *
+ * Only the exact header {@link compressBlock} writes counts. A gzip member from
+ * anywhere else is not assumed to be a block, whatever extra fields it has.
+ */
+function readBlockHeader(
+	header: Buffer,
+): { size: number; length: number } | null {
+	if (
+		header.length < MEMBER_HEADER_SIZE ||
+		header[0] !== 0x1f ||
+		header[1] !== 0x8b ||
+		header[2] !== 8 ||
+		header[3] !== 4 ||
+		header.readUInt16LE(10) !== 12 ||
+		header.toString("latin1", 12, 14) !== "VB" ||
+		header.readUInt16LE(14) !== 8
+	) {
+		return null;
+	}
+
+	const size = header.readUInt32LE(16);
+
+	if (size < MEMBER_HEADER_SIZE + MEMBER_TRAILER_SIZE) {
+		return null;
+	}
+
+	return { size, length: header.readUInt32LE(20) };
+}
+
+/** Walk every block header in the file at `handle`. */
+async function readBlockIndex(
+	handle: FileHandle,
+	path: string,
+): Promise<SeekableGzipBlock[]> {
+	const { size: fileSize } = await handle.stat();
+
+	const blocks: SeekableGzipBlock[] = [];
+	const header = Buffer.alloc(MEMBER_HEADER_SIZE);
+
+	let offset = 0;
+	let position = 0;
+
+	while (offset < fileSize) {
+		const { bytesRead } = await handle.read(
+			header,
+			0,
+			MEMBER_HEADER_SIZE,
+			offset,
+		);
+
+		const block = readBlockHeader(header.subarray(0, bytesRead));
+
+		if (block === null) {
+			throw new SeekableGzipError(
+				`${path} is not a seekable gzip file: no block header at byte ${offset}`,
+			);
+		}
+
+		if (offset + block.size > fileSize) {
+			throw new SeekableGzipError(
+				`${path} is truncated: the block at byte ${offset} runs past the end`,
+			);
+		}
+
+		blocks.push({ offset, size: block.size, position, length: block.length });
+
+		offset += block.size;
+		position += block.length;
+	}
+
+	if (blocks.length === 0) {
+		throw new SeekableGzipError(`${path} is empty`);
+	}
+
+	return blocks;
+}
+
+/** The index of the block holding decompressed byte `position`. */
+function findBlock(blocks: readonly SeekableGzipBlock[], position: number) {
+	let low = 0;
+	let high = blocks.length - 1;
+
+	while (low < high) {
+		const middle = (low + high + 1) >> 1;
+
+		if ((blocks[middle] as SeekableGzipBlock).position <= position) {
+			low = middle;
+		} else {
+			high = middle - 1;
+		}
+	}
+
+	return low;
+}
+
+function checkConcurrency(concurrency: number): void {
+	if (!Number.isInteger(concurrency) || concurrency < 1) {
+		throw new RangeError(
+			`concurrency must be a whole number of at least one, not ${concurrency}`,
+		);
+	}
+}
+
+/** Yield the chunks already read, then the rest of the stream. */
+async function* replay(
+	head: Buffer[],
+	rest: AsyncIterator<Uint8Array>,
+	signal: AbortSignal | undefined,
+): AsyncGenerator<Uint8Array> {
+	try {
+		yield* head;
+
+		for (let result = await nextOrAbort(rest, signal); !result.done; ) {
+			yield result.value;
+			result = await nextOrAbort(rest, signal);
+		}
+	} finally {
+		await closeSource(rest, signal);
+	}
+}
+
+/**
+ * The source's next chunk, or a rejection with `signal.reason` as soon as it
+ * aborts.
+ *
+ * A stalled download never settles its `next()`, so checking the signal
+ * between chunks would wait on it forever. The pending `next()` is left
+ * behind; {@link closeSource} tells the source to stop.
+ */
+async function nextOrAbort<T>(
+	iterator: AsyncIterator<T>,
+	signal: AbortSignal | undefined,
+): Promise<IteratorResult<T>> {
+	if (signal === undefined) {
+		return iterator.next();
+	}
+
+	signal.throwIfAborted();
+
+	let onAbort = () => {};
+
+	const aborted = new Promise<never>((_, reject) => {
+		onAbort = () => reject(signal.reason);
+		signal.addEventListener("abort", onAbort, { once: true });
+	});
+
+	try {
+		return await Promise.race([iterator.next(), aborted]);
+	} finally {
+		signal.removeEventListener("abort", onAbort);
+	}
+}
+
+/**
+ * Tell the source to stop and release what it holds.
+ *
+ * After an abort the source may still be stalled in the `next()` that was
+ * abandoned, and an async generator queues `return()` behind it, so it is
+ * requested but not awaited.
+ */
+async function closeSource(
+	iterator: AsyncIterator<unknown>,
+	signal: AbortSignal | undefined,
+): Promise<void> {
+	const closing = iterator.return?.();
+
+	if (signal?.aborted) {
+		closing?.catch(() => {});
+		return;
+	}
+
+	await closing;
+}
+
+/** Write all of `data` at `position`, or at the file position for null. */
+async function writeFully(
+	handle: FileHandle,
+	data: Buffer,
+	position: number | null,
+): Promise<void> {
+	let written = 0;
+
+	while (written < data.length) {
+		const { bytesWritten } = await handle.write(
+			data,
+			written,
+			data.length - written,
+			position === null ? null : position + written,
+		);
+
+		written += bytesWritten;
+	}
+}
+
+/** Fill `buffer` from `position`, failing if the file ends first. */
+async function readFully(
+	handle: FileHandle,
+	buffer: Buffer,
+	position: number,
+): Promise<void> {
+	let read = 0;
+
+	while (read < buffer.length) {
+		const { bytesRead } = await handle.read(
+			buffer,
+			read,
+			buffer.length - read,
+			position + read,
+		);
+
+		if (bytesRead === 0) {
+			throw new SeekableGzipError("a block runs past the end of the file");
+		}
+
+		read += bytesRead;
+	}
+}
@@ -1,10 +1,12 @@
 import { describe, expect, it } from "vitest";
 import {
 	findOrfs,
+	findOrfsBatch,
 	parseFasta,
 	parseFastaLines,
 	parseFastq,
 	reverseComplement,
+	scanOrfs,
 	translate,
 } from "./bio";
 
@@ -287,6 +289,90 @@ describe("findOrfs", () => {
 	});
 });
 
+describe("findOrfsBatch", () => {
+	it("returns one entry per input, in input order", () => {
+		const batch = findOrfsBatch(["", "G".repeat(300), "G".repeat(301)]);
+
+		expect(batch).toHaveLength(3);
+		expect(batch[0]).toStrictEqual([]);
+		expect(batch[1]).toStrictEqual([]);
+		expect(batch[2]).toStrictEqual(findOrfs("G".repeat(301)));
+	});
+
+	it("returns nothing for an empty batch", () => {
+		expect(findOrfsBatch([])).toStrictEqual([]);
+	});
+
+	it("agrees with findOrfs on every quirk", () => {
+		const sequences = [
+			"G".repeat(301),
+			"GCT".repeat(140),
+			`${"GCT".repeat(140)}G`,
+			`${"GCT".repeat(140)}GC`,
+			"gct".repeat(140),
+			"GCTNGA".repeat(100),
+			`ATG${"AAA".repeat(99)}TAAGG`,
+			reverseComplement(`TAA${"GCT".repeat(100)}TAA`),
+		];
+
+		expect(findOrfsBatch(sequences)).toStrictEqual(sequences.map(findOrfs));
+	});
+
+	it("throws the error findOrfs throws, naming the same base", () => {
+		const invalid = `${"A".repeat(300)}RB`;
+
+		expect(() => findOrfs(invalid)).toThrow(/Invalid nucleotide: B/);
+		expect(() => findOrfsBatch(["G".repeat(301), invalid])).toThrow(
+			/Invalid nucleotide: B/,
+		);
+	});
+
+	// The reference never looks at a sequence under the length gate, so an
+	// invalid base there is not an error.
+	it("does not validate a sequence at or below 300 bp", () => {
+		expect(findOrfsBatch(["RRR"])).toStrictEqual([[]]);
+	});
+});
+
+describe("scanOrfs", () => {
+	it("yields what findOrfs returns, in the same order", () => {
+		const seq = `ATG${"AAA".repeat(99)}TAAGG`;
+
+		expect([...scanOrfs(seq)]).toStrictEqual(findOrfs(seq));
+	});
+
+	it("reproduces the negative reverse-strand start across window boundaries", () => {
+		expect([...scanOrfs("G".repeat(301), 2)]).toStrictEqual(
+			findOrfs("G".repeat(301)),
+		);
+	});
+
+	it("yields an ORF before the rest of the sequence is scanned", () => {
+		const seq = `${"GCT".repeat(100)}TAA${"GCT".repeat(2000)}`;
+		const first = scanOrfs(seq, 10).next();
+
+		expect(first.done).toBe(false);
+		expect(first.value).toStrictEqual(findOrfs(seq)[0]);
+	});
+
+	it("yields nothing at or below 300 bp", () => {
+		expect([...scanOrfs("G".repeat(300))]).toStrictEqual([]);
+	});
+
+	// The reference rejects the whole sequence before reporting anything, so a
+	// scan must not yield the ORFs it finds ahead of the bad base.
+	it("throws before yielding when the sequence holds an invalid base", () => {
+		const scan = scanOrfs(`${"GCT".repeat(200)}B`);
+
+		expect(() => scan.next()).toThrow(/Invalid nucleotide: B/);
+	});
+
+	it("rejects a window that is not a positive integer", () => {
+		expect(() => scanOrfs("G".repeat(301), 0).next()).toThrow(RangeError);
+		expect(() => scanOrfs("G".repeat(301), 1.5).next()).toThrow(RangeError);
+	});
+});
+
 describe("parseFasta", () => {
 	it("parses a single record", () => {
 		expect(parseFasta(">a\nATCG\n")).toStrictEqual([["a", "ATCG"]]);
@@ -206,6 +206,451 @@ export function findOrfs(sequence: string): Orf[] {
 	return orfs;
 }
 
+/**
+ * ASCII byte → upper-case nucleotide byte, or 0 for anything
+ * {@link reverseComplement} would reject.
+ */
+const NUCLEOTIDE_BYTE = new Uint8Array(128);
+
+/** Upper-case nucleotide byte → its complement byte. */
+const COMPLEMENT_BYTE = new Uint8Array(128);
+
+/** Upper-case nucleotide byte → its index into {@link CODON_RESIDUE}, 0–4. */
+const NUCLEOTIDE_INDEX = new Uint8Array(128);
+
+/**
+ * Codon index `25a + 5b + c` → residue byte.
+ *
+ * Built from {@link TRANSLATION} so the two cannot disagree, with every codon
+ * the table lacks — any containing `N` outside the fourfold-degenerate ones —
+ * mapped to `X` as {@link translate} maps it.
+ */
+const CODON_RESIDUE = new Uint8Array(125);
+
+const STOP_RESIDUE = "*".charCodeAt(0);
+
+for (const [index, base] of [..."ACGTN"].entries()) {
+	const upper = base.charCodeAt(0);
+
+	NUCLEOTIDE_BYTE[upper] = upper;
+	NUCLEOTIDE_BYTE[base.toLowerCase().charCodeAt(0)] = upper;
+	NUCLEOTIDE_INDEX[upper] = index;
+	COMPLEMENT_BYTE[upper] = COMPLEMENT[base].charCodeAt(0);
+}
+
+CODON_RESIDUE.fill("X".charCodeAt(0));
+
+for (const [codon, residue] of Object.entries(TRANSLATION)) {
+	const [a, b, c] = [...codon].map((base) => "ACGTN".indexOf(base));
+
+	CODON_RESIDUE[a * 25 + b * 5 + c] = residue.charCodeAt(0);
+}
+
+/** Every byte the encoded strands and translations hold is ASCII. */
+const asciiDecoder = new TextDecoder("latin1");
+
+/** Grow-only scratch space, reused across every sequence in a batch. */
+type OrfScratch = {
+	forward: Uint8Array;
+	reverse: Uint8Array;
+	residues: Uint8Array;
+};
+
+function ensureScratch(scratch: OrfScratch, length: number): void {
+	if (scratch.forward.length < length) {
+		scratch.forward = new Uint8Array(length);
+		scratch.reverse = new Uint8Array(length);
+		scratch.residues = new Uint8Array(Math.ceil(length / 3));
+	}
+}
+
+/**
+ * Encode `sequence` as upper-case bytes into `forward`, and its reverse
+ * complement into `reverse`.
+ *
+ * @returns false if `sequence` holds anything {@link reverseComplement} would
+ * reject, leaving the caller to raise that function's own error.
+ */
+function encodeStrands(
+	sequence: string,
+	forward: Uint8Array,
+	reverse: Uint8Array,
+): boolean {
+	const length = sequence.length;
+
+	for (let i = 0; i < length; i++) {
+		const code = sequence.charCodeAt(i);
+		const byte = code < 128 ? NUCLEOTIDE_BYTE[code] : 0;
+
+		if (byte === 0) {
+			return false;
+		}
+
+		forward[i] = byte;
+		reverse[length - 1 - i] = COMPLEMENT_BYTE[byte];
+	}
+
+	return true;
+}
+
+/**
+ * Translate one frame of an encoded strand into `residues`.
+ *
+ * @returns the number of residues written, partial trailing codon dropped.
+ */
+function translateFrame(
+	strand: Uint8Array,
+	length: number,
+	frame: number,
+	residues: Uint8Array,
+): number {
+	const codonCount = Math.floor((length - frame) / 3);
+
+	for (let i = 0, p = frame; i < codonCount; i++, p += 3) {
+		residues[i] =
+			CODON_RESIDUE[
+				NUCLEOTIDE_INDEX[strand[p]] * 25 +
+					NUCLEOTIDE_INDEX[strand[p + 1]] * 5 +
+					NUCLEOTIDE_INDEX[strand[p + 2]]
+			];
+	}
+
+	return codonCount;
+}
+
+/**
+ * The `pos` of an ORF spanning residues `aaStart` to `aaEnd` of a frame, with
+ * both of {@link findOrfs}'s coordinate quirks.
+ */
+function orfPosition(
+	length: number,
+	strand: 1 | -1,
+	frame: number,
+	aaStart: number,
+	aaEnd: number,
+): [number, number] {
+	if (strand === 1) {
+		return [frame + aaStart * 3, Math.min(length, frame + aaEnd * 3 + 3)];
+	}
+
+	return [length - frame - aaEnd * 3 - 3, length - frame - aaStart * 3];
+}
+
+/** {@link clampedSlice} over encoded bytes. */
+function clampedDecode(
+	bytes: Uint8Array,
+	length: number,
+	start: number,
+	end: number,
+): string {
+	const from =
+		start < 0 ? Math.max(length + start, 0) : Math.min(start, length);
+	const to = end < 0 ? Math.max(length + end, 0) : Math.min(end, length);
+
+	return to > from ? asciiDecoder.decode(bytes.subarray(from, to)) : "";
+}
+
+function findOrfsEncoded(sequence: string, scratch: OrfScratch): Orf[] {
+	const orfs: Orf[] = [];
+	const length = sequence.length;
+
+	if (length <= 300) return orfs;
+
+	ensureScratch(scratch, length);
+
+	const { forward, reverse, residues } = scratch;
+
+	if (!encodeStrands(sequence, forward, reverse)) {
+		// Raise exactly the error the reference raises, naming the same base.
+		reverseComplement(sequence);
+	}
+
+	for (const strand of [1, -1] as const) {
+		const encoded = strand === 1 ? forward : reverse;
+
+		for (let frame = 0; frame < 3; frame++) {
+			const translation = residues.subarray(
+				0,
+				translateFrame(encoded, length, frame, residues),
+			);
+			const translationLength = translation.length;
+			let aaStart = 0;
+
+			while (aaStart < translationLength) {
+				const stopIndex = translation.indexOf(STOP_RESIDUE, aaStart);
+				const aaEnd = stopIndex === -1 ? translationLength : stopIndex;
+
+				if (aaEnd - aaStart >= 100) {
+					const [start, end] = orfPosition(
+						length,
+						strand,
+						frame,
+						aaStart,
+						aaEnd,
+					);
+
+					orfs.push({
+						pro: asciiDecoder.decode(translation.subarray(aaStart, aaEnd)),
+						nuc:
+							strand === 1
+								? clampedSlice(sequence, start, end)
+								: clampedDecode(reverse, length, start, end),
+						frame,
+						strand,
+						pos: [start, end],
+					});
+				}
+
+				aaStart = aaEnd + 1;
+			}
+		}
+	}
+
+	return orfs;
+}
+
+/**
+ * Find the ORFs in many sequences at once.
+ *
+ * Returns one array per input, in input order, each exactly what
+ * {@link findOrfs} returns for that sequence — the `> 300` gate, the
+ * discovery order and both coordinate quirks included. An invalid base throws
+ * the same error, naming the same base.
+ *
+ * The difference is in how the work is done. {@link findOrfs} builds a reverse
+ * complement and six protein strings a character at a time for every sequence.
+ * This encodes each strand once into byte buffers, translates each frame by
+ * indexing a flat codon table, and scans the residue bytes for stops — and the
+ * buffers are allocated once per batch, sized to its longest sequence, rather
+ * than once per sequence. Only the `pro` and `nuc` of an ORF that passes the
+ * 100-residue gate are ever turned back into strings.
+ */
+export function findOrfsBatch(sequences: Iterable<string>): Orf[][] {
+	const scratch: OrfScratch = {
+		forward: new Uint8Array(0),
+		reverse: new Uint8Array(0),
+		residues: new Uint8Array(0),
+	};
+
+	const results: Orf[][] = [];
+
+	for (const sequence of sequences) {
+		results.push(findOrfsEncoded(sequence, scratch));
+	}
+
+	return results;
+}
+
+/**
+ * Codons {@link scanOrfs} translates at a time.
+ *
+ * Sizes the only buffer a scan holds, whatever the length of the sequence.
+ */
+const ORF_SCAN_WINDOW = 4096;
+
+/**
+ * The upper-case byte at `position` of one strand of `sequence`.
+ *
+ * The reverse strand is read from the far end and complemented on the way, so
+ * neither strand is ever built. Only valid once {@link checkNucleotides} has
+ * passed.
+ */
+function strandByte(
+	sequence: string,
+	strand: 1 | -1,
+	position: number,
+): number {
+	if (strand === 1) {
+		return NUCLEOTIDE_BYTE[sequence.charCodeAt(position)];
+	}
+
+	return COMPLEMENT_BYTE[
+		NUCLEOTIDE_BYTE[sequence.charCodeAt(sequence.length - 1 - position)]
+	];
+}
+
+/** Translate `count` codons of one strand, from `position`, into `residues`. */
+function translateStrand(
+	sequence: string,
+	strand: 1 | -1,
+	position: number,
+	count: number,
+	residues: Uint8Array,
+): void {
+	for (let i = 0, p = position; i < count; i++, p += 3) {
+		residues[i] =
+			CODON_RESIDUE[
+				NUCLEOTIDE_INDEX[strandByte(sequence, strand, p)] * 25 +
+					NUCLEOTIDE_INDEX[strandByte(sequence, strand, p + 1)] * 5 +
+					NUCLEOTIDE_INDEX[strandByte(sequence, strand, p + 2)]
+			];
+	}
+}
+
+/**
+ * Throw what {@link reverseComplement} throws if `sequence` holds a base it
+ * rejects.
+ *
+ * The reference builds the reverse complement before it scans anything, so an
+ * invalid base fails the whole sequence before a single ORF is reported. A scan
+ * that found it on the way would already have yielded some.
+ */
+function checkNucleotides(sequence: string): void {
+	for (let i = 0; i < sequence.length; i++) {
+		const code = sequence.charCodeAt(i);
+
+		if (code >= 128 || NUCLEOTIDE_BYTE[code] === 0) {
+			reverseComplement(sequence);
+		}
+	}
+}
+
+/**
+ * {@link clampedSlice} over the reverse complement of `sequence`, building
+ * only the slice.
+ */
+function clampedReverseComplement(
+	sequence: string,
+	start: number,
+	end: number,
+): string {
+	const length = sequence.length;
+	const from =
+		start < 0 ? Math.max(length + start, 0) : Math.min(start, length);
+	const to = end < 0 ? Math.max(length + end, 0) : Math.min(end, length);
+
+	if (to <= from) {
+		return "";
+	}
+
+	const bytes = new Uint8Array(to - from);
+
+	for (let i = from; i < to; i++) {
+		bytes[i - from] = strandByte(sequence, -1, i);
+	}
+
+	return asciiDecoder.decode(bytes);
+}
+
+function scannedOrf(
+	sequence: string,
+	strand: 1 | -1,
+	frame: number,
+	aaStart: number,
+	aaEnd: number,
+): Orf {
+	const [start, end] = orfPosition(
+		sequence.length,
+		strand,
+		frame,
+		aaStart,
+		aaEnd,
+	);
+
+	const residues = new Uint8Array(aaEnd - aaStart);
+
+	translateStrand(
+		sequence,
+		strand,
+		frame + aaStart * 3,
+		residues.length,
+		residues,
+	);
+
+	return {
+		pro: asciiDecoder.decode(residues),
+		nuc:
+			strand === 1
+				? clampedSlice(sequence, start, end)
+				: clampedReverseComplement(sequence, start, end),
+		frame,
+		strand,
+		pos: [start, end],
+	};
+}
+
+/**
+ * Yield the ORFs of one sequence as they are found, without building either
+ * strand's translation.
+ *
+ * The records, and the order they come in, are exactly what {@link findOrfs}
+ * returns — the gates, the discovery order and both coordinate quirks
+ * included. What differs is the memory. {@link findOrfs} holds a reverse
+ * complement and six whole translations at once, several copies of a contig
+ * that can run to hundreds of kilobases. This walks each frame a window of
+ * `windowSize` codons at a time, reading the reverse strand straight out of
+ * `sequence`, and keeps only where the open ORF began. An ORF is yielded the
+ * moment its stop codon is seen, and its protein is translated again from the
+ * sequence then, so nothing of an ORF is held while it is still open.
+ *
+ * The six frames are walked one after another rather than together. That is
+ * what keeps the output order: walking them together would find ORFs in an
+ * order that interleaves frames, and restoring the reference's order would mean
+ * holding the later frames' ORFs back.
+ */
+export function* scanOrfs(
+	sequence: string,
+	windowSize: number = ORF_SCAN_WINDOW,
+): Generator<Orf> {
+	if (!Number.isInteger(windowSize) || windowSize < 1) {
+		throw new RangeError(
+			`Window size must be a positive integer: ${windowSize}`,
+		);
+	}
+
+	const length = sequence.length;
+
+	if (length <= 300) return;
+
+	checkNucleotides(sequence);
+
+	const window = new Uint8Array(windowSize);
+
+	for (const strand of [1, -1] as const) {
+		for (let frame = 0; frame < 3; frame++) {
+			const codonCount = Math.floor((length - frame) / 3);
+			let aaStart = 0;
+
+			for (
+				let windowStart = 0;
+				windowStart < codonCount;
+				windowStart += windowSize
+			) {
+				const residues = window.subarray(
+					0,
+					Math.min(windowSize, codonCount - windowStart),
+				);
+
+				translateStrand(
+					sequence,
+					strand,
+					frame + windowStart * 3,
+					residues.length,
+					residues,
+				);
+
+				let stopIndex = residues.indexOf(STOP_RESIDUE);
+
+				while (stopIndex !== -1) {
+					const aaEnd = windowStart + stopIndex;
+
+					if (aaEnd - aaStart >= 100) {
+						yield scannedOrf(sequence, strand, frame, aaStart, aaEnd);
+					}
+
+					aaStart = aaEnd + 1;
+					stopIndex = residues.indexOf(STOP_RESIDUE, stopIndex + 1);
+				}
+			}
+
+			// The last ORF runs off the end of the frame with no stop codon.
+			if (codonCount - aaStart >= 100) {
+				yield scannedOrf(sequence, strand, frame, aaStart, codonCount);
+			}
+		}
+	}
+}
+
 /**
  * The partially-read record a FASTA parse is in the middle of.
  *
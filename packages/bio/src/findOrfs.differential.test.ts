@@ -20,7 +20,7 @@
  */
 
 import { describe, expect, it } from "vitest";
-import { findOrfs } from "./bio";
+import { findOrfs, findOrfsBatch, scanOrfs } from "./bio";
 import golden from "./fixtures/findOrfs.json" with { type: "json" };
 
 type GoldenOrf = {
@@ -39,19 +39,21 @@ type GoldenCase = {
 
 const cases: GoldenCase[] = golden.cases;
 
+function expectedOrfs(entry: GoldenCase) {
+	return entry.orfs.map((orf) => ({
+		frame: orf.frame,
+		nuc: orf.nuc,
+		pos: [orf.pos[0], orf.pos[1]],
+		pro: orf.pro,
+		strand: orf.strand,
+	}));
+}
+
 describe("findOrfs against the golden corpus", () => {
 	it.each(cases.map((entry) => [entry.name, entry] as const))(
 		"reproduces the golden ORFs for %s",
 		(_name, entry) => {
-			expect(findOrfs(entry.sequence)).toStrictEqual(
-				entry.orfs.map((orf) => ({
-					frame: orf.frame,
-					nuc: orf.nuc,
-					pos: [orf.pos[0], orf.pos[1]],
-					pro: orf.pro,
-					strand: orf.strand,
-				})),
-			);
+			expect(findOrfs(entry.sequence)).toStrictEqual(expectedOrfs(entry));
 		},
 	);
 
@@ -93,3 +95,39 @@ describe("findOrfs against the golden corpus", () => {
 		}
 	});
 });
+
+describe("findOrfsBatch against the golden corpus", () => {
+	// One batch over the whole corpus, so the scratch buffers sized for the
+	// longest case are reused for every shorter one after it.
+	it("reproduces the golden ORFs for every case in one batch", () => {
+		expect(findOrfsBatch(cases.map((entry) => entry.sequence))).toStrictEqual(
+			cases.map(expectedOrfs),
+		);
+	});
+
+	// Reversed, so a short case follows a long one and would pick up residues a
+	// longer translation left behind if the frame length were not respected.
+	it("reproduces the golden ORFs with the corpus reversed", () => {
+		const reversed = cases.toReversed();
+
+		expect(
+			findOrfsBatch(reversed.map((entry) => entry.sequence)),
+		).toStrictEqual(reversed.map(expectedOrfs));
+	});
+});
+
+describe("scanOrfs against the golden corpus", () => {
+	// A window of one codon puts every stop on a window boundary, and seven
+	// straddles codons across boundaries at every offset; the default window
+	// holds every golden sequence whole.
+	it.each([1, 7, undefined])(
+		"reproduces the golden ORFs with a window of %s",
+		(windowSize) => {
+			for (const entry of cases) {
+				expect([...scanOrfs(entry.sequence, windowSize)]).toStrictEqual(
+					expectedOrfs(entry),
+				);
+			}
+		},
+	);
+});
@@ -0,0 +1,87 @@
+/**
+ * Time one ORF finder over one corpus written by `generateFindOrfs.py --bench`.
+ *
+ * That script runs this once per corpus and implementation, so every
+ * measurement gets a fresh process and the peak RSS it reports is its own:
+ *
+ * ```
+ * node packages/bio/src/fixtures/benchFindOrfs.ts <corpus.fa> <implementation>
+ * ```
+ *
+ * Node runs the TypeScript directly, which is why the import below names
+ * `bio.ts` with its extension. Prints one JSON object to stdout, with the same
+ * fields the Python side reports.
+ */
+
+import { readFile } from "node:fs/promises";
+import { findOrfs, findOrfsBatch, parseFasta, scanOrfs } from "../bio.ts";
+
+/** An ORF finder run over a whole corpus, returning how many ORFs it found. */
+type Implementation = (sequences: string[]) => number;
+
+const IMPLEMENTATIONS: Record<string, Implementation> = {
+	findOrfs(sequences) {
+		let count = 0;
+
+		for (const sequence of sequences) {
+			count += findOrfs(sequence).length;
+		}
+
+		return count;
+	},
+
+	findOrfsBatch(sequences) {
+		let count = 0;
+
+		for (const orfs of findOrfsBatch(sequences)) {
+			count += orfs.length;
+		}
+
+		return count;
+	},
+
+	scanOrfs(sequences) {
+		let count = 0;
+
+		for (const sequence of sequences) {
+			for (const _orf of scanOrfs(sequence)) {
+				count += 1;
+			}
+		}
+
+		return count;
+	},
+};
+
+const [corpusPath, name] = process.argv.slice(2);
+const implementation = name === undefined ? undefined : IMPLEMENTATIONS[name];
+
+if (corpusPath === undefined || implementation === undefined) {
+	throw new Error(
+		`Usage: benchFindOrfs.ts <corpus.fa> <${Object.keys(IMPLEMENTATIONS).join("|")}>`,
+	);
+}
+
+const sequences = parseFasta(await readFile(corpusPath, "utf8")).map(
+	([, sequence]) => sequence,
+);
+
+const start = performance.now();
+const orfs = implementation(sequences);
+const seconds = (performance.now() - start) / 1000;
+
+const bases = sequences.reduce((total, sequence) => total + sequence.length, 0);
+
+process.stdout.write(
+	`${JSON.stringify({
+		implementation: `typescript ${name}`,
+		contigs: sequences.length,
+		bases,
+		orfs,
+		seconds,
+		contigs_per_second: sequences.length / seconds,
+		bases_per_second: bases / seconds,
+		// Kilobytes, as `ru_maxrss` reports on Linux.
+		peak_rss_mb: process.resourceUsage().maxRSS / 1024,
+	})}\n`,
+);
@@ -13,22 +13,68 @@ Run it against a checkout or virtualenv that has ``virtool`` importable::
         > packages/bio/src/fixtures/findOrfs.json
 
 The seed is fixed, so the random cases are reproducible.
+
+The golden says nothing about throughput — its longest case is 2 kb — so the
+same script has a benchmark mode::
+
+    PYTHONPATH=<virtool site-packages> python3 \
+        packages/bio/src/fixtures/generateFindOrfs.py --bench <dir> --typescript
+
+It writes each corpus in ``BENCH_CORPORA`` to ``<dir>`` as FASTA, times
+``find_orfs`` over it and, with ``--typescript``, times each implementation in
+``benchFindOrfs.ts`` over the very same file. That needs Node 24 or later on
+``PATH``, which runs the TypeScript directly. ``--corpus`` picks corpora by
+name. Nothing it does touches the golden.
+
+Every measurement runs in a process of its own, so the peak RSS it reports is
+that measurement's alone rather than a high-water mark left by an earlier one.
+The corpus is loaded whole before timing starts on both sides, so it is in that
+figure for both. A corpus on which two implementations find a different number
+of ORFs fails the run.
 """
 
+import argparse
 import json
 import random
+import resource
+import shutil
+import subprocess
 import sys
+import time
+from pathlib import Path
 
 from virtool.bio import find_orfs
 
-random.seed(2852)
+HERE = Path(__file__).resolve().parent
+
+BENCH_TS = HERE / "benchFindOrfs.ts"
+
+# The TypeScript implementations `--typescript` times, by the name
+# `benchFindOrfs.ts` takes.
+BENCH_TS_IMPLEMENTATIONS = ("findOrfs", "findOrfsBatch", "scanOrfs")
 
+# (name, contig count, contig length, base weights in ACGT order)
+#
+# The NuVs shapes: many short contigs, and fewer long ones from a deep sample.
+# AT-rich makes stops frequent and ORFs short; GC-rich makes them rare and long,
+# which is where a finder that copies whole translations pays most. Uniform
+# corpora pass explicit weights too, because `random.choices` is many times
+# faster than the per-base `random.choice` the golden's cases are pinned to.
+BENCH_CORPORA = (
+    ("uniform-10k-1kb", 10_000, 1_000, (25, 25, 25, 25)),
+    ("at-rich-10k-1kb", 10_000, 1_000, (35, 15, 15, 35)),
+    ("gc-rich-10k-1kb", 10_000, 1_000, (15, 35, 35, 15)),
+    ("uniform-1k-100kb", 1_000, 100_000, (25, 25, 25, 25)),
+    ("at-rich-1k-100kb", 1_000, 100_000, (35, 15, 15, 35)),
+    ("gc-rich-1k-100kb", 1_000, 100_000, (15, 35, 35, 15)),
+)
 
-def random_seq(n, weights=None):
+
+def random_seq(n, weights=None, rng=random):
     bases = "ACGT"
     if weights:
-        return "".join(random.choices(bases, weights=weights, k=n))
-    return "".join(random.choice(bases) for _ in range(n))
+        return "".join(rng.choices(bases, weights=weights, k=n))
+    return "".join(rng.choice(bases) for _ in range(n))
 
 
 cases = []
@@ -53,39 +99,185 @@ def add(name, sequence):
     )
 
 
-# The length gate is `> 300`, not `>= 300`.
-add("exactly 300 bp", random_seq(300))
-add("301 bp", random_seq(301))
-add("under 300 bp", random_seq(299))
+def write_golden():
+    random.seed(2852)
+
+    # The length gate is `> 300`, not `>= 300`.
+    add("exactly 300 bp", random_seq(300))
+    add("301 bp", random_seq(301))
+    add("under 300 bp", random_seq(299))
+
+    # No stop codons at all, at three lengths. Every frame is one long ORF, the
+    # forward end clamps to the sequence length, and the reverse start goes
+    # negative because it subtracts three without clamping. The three lengths
+    # differ in the trailing remainder, which is what decides how negative.
+    add("no stops, 450 bp", "AAA" * 150)
+    add("no stops, 449 bp", "AAA" * 149 + "AA")
+    add("no stops, 448 bp", "AAA" * 149 + "A")
+
+    # Stop-rich: nothing survives the 100-residue minimum.
+    add("stops in every frame", "TAAT" * 80)
+
+    # A clean ORF flanked by stops, so the frame-0 end does not clamp.
+    add("orf between stops", "TAA" + "AAG" * 120 + "TGA" + "CCC" * 20)
+
+    # Random sequences, where the quirks show up incidentally rather than by
+    # construction.
+    for n in (320, 512, 777, 1000, 1500, 2048):
+        add(f"random {n} bp", random_seq(n))
+
+    # AT-rich makes stops frequent; GC-rich makes them rare.
+    add("at rich 900 bp", random_seq(900, weights=[35, 15, 15, 35]))
+    add("gc rich 900 bp", random_seq(900, weights=[15, 35, 35, 15]))
+
+    # Lower case and ambiguity codes, which `translate` maps to X.
+    add("lower case 600 bp", random_seq(600).lower())
+    add("with N runs", random_seq(400) + "N" * 30 + random_seq(400))
+
+    total = sum(len(c["orfs"]) for c in cases)
+    sys.stderr.write(f"{len(cases)} cases, {total} orfs\n")
+
+    print(json.dumps({"cases": cases}, indent="\t", ensure_ascii=True))
+
+
+def write_corpus(directory, name, count, length, weights):
+    """Write one benchmark corpus as FASTA, one unwrapped line per contig.
+
+    Each corpus draws from its own generator, seeded from its name, so adding,
+    removing or reordering corpora never changes the others.
+    """
+    rng = random.Random(f"find-orfs-bench:{name}")
+    path = directory / f"{name}.fa"
+
+    with path.open("w") as fh:
+        for i in range(count):
+            fh.write(f">contig_{i}\n{random_seq(length, weights, rng)}\n")
+
+    return path
+
+
+def read_corpus(path):
+    sequences = []
+
+    for line in path.read_text().splitlines():
+        if line and not line.startswith(">"):
+            sequences.append(line)
+
+    return sequences
 
-# No stop codons at all, at three lengths. Every frame is one long ORF, the
-# forward end clamps to the sequence length, and the reverse start goes negative
-# because it subtracts three without clamping. The three lengths differ in the
-# trailing remainder, which is what decides how negative.
-add("no stops, 450 bp", "AAA" * 150)
-add("no stops, 449 bp", "AAA" * 149 + "AA")
-add("no stops, 448 bp", "AAA" * 149 + "A")
 
-# Stop-rich: nothing survives the 100-residue minimum.
-add("stops in every frame", "TAAT" * 80)
+def measure(path):
+    """Time `find_orfs` over one corpus and print the result as JSON.
 
-# A clean ORF flanked by stops, so the frame-0 end does not clamp.
-add("orf between stops", "TAA" + "AAG" * 120 + "TGA" + "CCC" * 20)
+    Runs in a child process of `bench`, so `ru_maxrss` is this corpus's peak.
+    """
+    sequences = read_corpus(path)
 
-# Random sequences, where the quirks show up incidentally rather than by
-# construction.
-for n in (320, 512, 777, 1000, 1500, 2048):
-    add(f"random {n} bp", random_seq(n))
+    start = time.perf_counter()
+    orfs = sum(len(find_orfs(sequence)) for sequence in sequences)
+    seconds = time.perf_counter() - start
+
+    bases = sum(len(sequence) for sequence in sequences)
+
+    print(
+        json.dumps(
+            {
+                "implementation": "python find_orfs",
+                "contigs": len(sequences),
+                "bases": bases,
+                "orfs": orfs,
+                "seconds": seconds,
+                "contigs_per_second": len(sequences) / seconds,
+                "bases_per_second": bases / seconds,
+                # Kilobytes on Linux.
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def run_measurement(command):
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+
+def bench(directory, names, typescript):
+    if typescript and shutil.which("node") is None:
+        sys.exit("node must be on PATH to benchmark the TypeScript implementations")
+
+    corpora = [corpus for corpus in BENCH_CORPORA if not names or corpus[0] in names]
+
+    if not corpora:
+        sys.exit(f"no corpus named {', '.join(names)}")
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    print(
+        f"{'corpus':<18} {'implementation':<18} {'orfs':>9} {'contigs/s':>11} "
+        f"{'Mbases/s':>9} {'peak RSS MB':>12}"
+    )
+
+    mismatched = []
+
+    for name, count, length, weights in corpora:
+        path = write_corpus(directory, name, count, length, weights)
+
+        commands = [[sys.executable, __file__, "--measure", str(path)]]
+
+        if typescript:
+            commands += [
+                ["node", str(BENCH_TS), str(path), implementation]
+                for implementation in BENCH_TS_IMPLEMENTATIONS
+            ]
+
+        results = [run_measurement(command) for command in commands]
+
+        for result in results:
+            print(
+                f"{name:<18} {result['implementation']:<18} {result['orfs']:>9} "
+                f"{result['contigs_per_second']:>11.1f} "
+                f"{result['bases_per_second'] / 1e6:>9.2f} "
+                f"{result['peak_rss_mb']:>12.1f}"
+            )
+
+        if len({result["orfs"] for result in results}) > 1:
+            mismatched.append(name)
+
+    if mismatched:
+        sys.exit(f"implementations disagree on ORF count for {', '.join(mismatched)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--bench",
+        type=Path,
+        metavar="DIR",
+        help="write the benchmark corpora to DIR and time ORF finding over them",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        default=[],
+        help="benchmark only this corpus; repeatable",
+    )
+    parser.add_argument(
+        "--typescript",
+        action="store_true",
+        help="also time the TypeScript implementations over each corpus",
+    )
+    parser.add_argument("--measure", type=Path, help=argparse.SUPPRESS)
 
-# AT-rich makes stops frequent; GC-rich makes them rare.
-add("at rich 900 bp", random_seq(900, weights=[35, 15, 15, 35]))
-add("gc rich 900 bp", random_seq(900, weights=[15, 35, 35, 15]))
+    args = parser.parse_args()
 
-# Lower case and ambiguity codes, which `translate` maps to X.
-add("lower case 600 bp", random_seq(600).lower())
-add("with N runs", random_seq(400) + "N" * 30 + random_seq(400))
+    if args.measure:
+        measure(args.measure)
+    elif args.bench:
+        bench(args.bench, args.corpus, args.typescript)
+    else:
+        write_golden()
 
-total = sum(len(c["orfs"]) for c in cases)
-sys.stderr.write(f"{len(cases)} cases, {total} orfs\n")
 
-print(json.dumps({"cases": cases}, indent="\t", ensure_ascii=True))
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 export {
 	type FastqRecord,
 	findOrfs,
+	findOrfsBatch,
 	type Orf,
 	parseFasta,
 	parseFastaLines,
 	parseFastq,
 	reverseComplement,
+	scanOrfs,
 	translate,
 } from "./bio";
 export { compositeQuality, roundHalfEven } from "./fastqc";
@@ -13,7 +13,7 @@ import { createReadStream } from "node:fs";
 import { mkdtemp, rm } from "node:fs/promises";
 import { tmpdir } from "node:os";
 import { join } from "node:path";
-import { compressFile } from "@virtool/archive/compression";
+import { compressSeekableGzip } from "@virtool/archive/seekable";
 import {
 	createIndexArtifact,
 	type IndexOtu,
@@ -57,8 +57,16 @@ export async function writeIndexSnapshot(
 		const path = join(directory, REFERENCE_SQLITE_FILE_NAME);
 		const gzipPath = join(directory, REFERENCE_SQLITE_GZIP_FILE_NAME);
 
-		await createIndexArtifact(path, reference, otus);
-		await compressFile(path, gzipPath);
+		// The directory is removed whatever happens, so the transactional
+		// guarantees the default write pays for would never be used. Every job
+		// against the index starts by writing its default-isolate FASTA, so
+		// that is formatted once here rather than once per job. The gzip is
+		// cut into blocks so a job inflates it on every core as it downloads.
+		await createIndexArtifact(path, reference, otus, {
+			bulkLoad: true,
+			embedDefaultFasta: true,
+		});
+		await compressSeekableGzip(path, gzipPath);
 
 		return await storage.write(key, createReadStream(gzipPath));
 	} finally {
@@ -0,0 +1,334 @@
+"""Run pathoscope-core subcommands from asyncio.
+
+    runner = CoreRunner(cpus=os.cpu_count())
+
+    async with asyncio.TaskGroup() as group:
+        for sample in samples:
+            group.create_task(
+                runner.em(sample.bam, 0.01, sample.out / "em.json", on_log=log)
+            )
+
+The Python counterpart of `apps/pathoscope/src/pathoscopeCore.ts`, for
+orchestration that wants to keep every core of a machine busy across samples
+without a process pool. Each subcommand is launched as a subprocess and awaited
+without blocking the event loop, so any number of runs can be in flight while
+the caller keeps doing other work.
+
+`cpus` is a budget, shared by every run on one runner, in the way
+`tests/golden/generate.py` shares its workers. `candidates` and
+`eliminate-subtraction` hold `proc` of those CPUs while they run — their bowtie2
+or BAM writer threads — and `em`, which is single-threaded, holds one. A run
+asking for more than the whole budget is clamped to it and runs alone rather
+than never starting. Runs are admitted in the order they were requested, so a
+wide run is never starved by a stream of narrow ones behind it.
+
+The binary's stderr diagnostics are JSON lines, `{"level","target","msg"}`.
+Each is parsed and handed to `on_log` as a `LogRecord` as it arrives; a line
+that is not one of those, such as a panic message, arrives as an `error` record
+with target `stderr`. When a run finishes the results file its `--output` names
+is read back and returned parsed. A run that exits non-zero raises `CoreError`
+carrying the last few records, and never returns a results file, whatever one
+it left behind.
+
+Cancelling the task awaiting a run kills the subprocess and waits for it to
+exit before the cancellation propagates, so a cancelled run holds no CPUs and
+leaves no process behind it. The bowtie2 wrapper `candidates` starts is killed
+with the binary, and its aligner exits on its next write to the pipe the dead
+binary no longer reads. A cancelled run's output files are left as they were,
+possibly partial, for the caller to delete.
+
+Standard library only, Python 3.11 or later.
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+DEFAULT_BINARY = "pathoscope-core"
+
+# How many of a failed run's last records its `CoreError` carries.
+ERROR_CONTEXT = 20
+
+# The longest stderr line read whole. A failure message can quote a tool's own
+# stderr, which asyncio's 64 KiB default would refuse.
+STDERR_LINE_LIMIT = 1 << 20
+
+
+@dataclass(frozen=True)
+class LogRecord:
+    """One line of a run's stderr."""
+
+    level: str
+    target: str
+    msg: str
+
+    @classmethod
+    def parse(cls, line: str) -> "LogRecord":
+        """Parse a JSON-line diagnostic, or wrap a line that is not one."""
+        try:
+            record = json.loads(line)
+            return cls(
+                str(record["level"]), str(record["target"]), str(record["msg"])
+            )
+        except (ValueError, TypeError, KeyError):
+            return cls("error", "stderr", line)
+
+
+class CoreError(Exception):
+    """A pathoscope-core run exited non-zero."""
+
+    def __init__(
+        self, command: Sequence[str], returncode: int, records: list[LogRecord]
+    ):
+        self.command = list(command)
+        self.returncode = returncode
+        self.records = records
+
+        last = records[-1].msg if records else "no diagnostics"
+
+        super().__init__(f"{command[1]} exited {returncode}: {last}")
+
+
+class _CpuBudget:
+    """A first-come, first-served budget of CPUs shared by concurrent runs."""
+
+    def __init__(self, cpus: int):
+        self.cpus = cpus
+        self._free = cpus
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+    async def acquire(self, cost: int) -> None:
+        waiter = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._admit()
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].cancelled():
+                self._waiters.remove(waiter)
+                # The head of the queue may fit now that this one has left it.
+                self._admit()
+            else:
+                # Admitted in the moment before the cancellation landed.
+                self.release(cost)
+
+            raise
+
+    def release(self, cost: int) -> None:
+        self._free += cost
+        self._admit()
+
+    def _admit(self) -> None:
+        while self._waiters and self._waiters[0][0] <= self._free:
+            cost, future = self._waiters.popleft()
+            self._free -= cost
+            future.set_result(None)
+
+
+class CoreRunner:
+    """Launch pathoscope-core subcommands within a shared CPU budget.
+
+    :param binary: the pathoscope-core executable, looked up on PATH by default
+    :param cpus: CPUs every run on this runner shares, all of them by default
+    :param log_level: passed to every run as `--log-level`
+    """
+
+    def __init__(
+        self,
+        binary: str | Path = DEFAULT_BINARY,
+        cpus: int | None = None,
+        log_level: str = "info",
+    ):
+        if cpus is None:
+            cpus = os.cpu_count() or 1
+
+        if cpus < 1:
+            raise ValueError("cpus must be at least 1")
+
+        self.binary = str(binary)
+        self.log_level = log_level
+        self._budget = _CpuBudget(cpus)
+
+    async def run(
+        self,
+        args: Sequence[str],
+        output: Path,
+        proc: int = 1,
+        on_log: Callable[[LogRecord], None] | None = None,
+    ) -> Any:
+        """Run a subcommand holding `proc` CPUs, and return its parsed results.
+
+        `args` are the subcommand and its flags, `--output` included; `output`
+        is the file that flag names.
+
+        :raises CoreError: when the run exits non-zero
+        """
+        command = [self.binary, *args, "--log-level", self.log_level]
+        cost = max(1, min(proc, self._budget.cpus))
+
+        await self._budget.acquire(cost)
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STDERR_LINE_LIMIT,
+            )
+
+            try:
+                records = await _pump(process.stderr, on_log)
+                returncode = await process.wait()
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+        finally:
+            self._budget.release(cost)
+
+        if returncode != 0:
+            raise CoreError(command, returncode, list(records))
+
+        return json.loads(Path(output).read_text())
+
+    async def em(
+        self,
+        alignment: Path,
+        p_score_cutoff: float,
+        output: Path,
+        matrix_cache: Path | None = None,
+        coverage_encoding: str = "dense",
+        on_log: Callable[[LogRecord], None] | None = None,
+    ) -> dict:
+        """Run `em`, returning its results as a `PathoscopeResults` dict.
+
+        With `coverage_encoding="intervals"` each reference's coverage is left
+        as the run writes it; `dense_coverage` rebuilds the array.
+        """
+        args = [
+            "em",
+            "--alignment",
+            str(alignment),
+            "--p-score-cutoff",
+            repr(p_score_cutoff),
+            "--output",
+            str(output),
+        ]
+
+        if matrix_cache is not None:
+            args += ["--matrix-cache", str(matrix_cache)]
+
+        if coverage_encoding != "dense":
+            args += ["--coverage-encoding", coverage_encoding]
+
+        return await self.run(args, output, 1, on_log)
+
+    async def candidates(
+        self,
+        index: Path,
+        reads: Sequence[Path],
+        proc: int,
+        p_score_cutoff: float,
+        output: Path,
+        shards: int = 1,
+        on_log: Callable[[LogRecord], None] | None = None,
+    ) -> list[str]:
+        """Run `candidates`, returning the sorted candidate reference ids."""
+        args = ["candidates", "--index", str(index)]
+
+        for path in reads:
+            args += ["--reads", str(path)]
+
+        args += [
+            "--proc",
+            str(proc),
+            "--p-score-cutoff",
+            repr(p_score_cutoff),
+            "--shards",
+            str(shards),
+            "--output",
+            str(output),
+        ]
+
+        return await self.run(args, output, proc, on_log)
+
+    async def eliminate_subtraction(
+        self,
+        isolate_alignments: Path,
+        subtraction_alignments: Path,
+        output_alignments: Path,
+        input_fastq: Path,
+        output_fastq: Path,
+        proc: int,
+        output: Path,
+        memory_limit_mb: int | None = None,
+        on_log: Callable[[LogRecord], None] | None = None,
+    ) -> int:
+        """Run `eliminate-subtraction`, returning the number of reads subtracted."""
+        args = [
+            "eliminate-subtraction",
+            "--isolate-alignments",
+            str(isolate_alignments),
+            "--subtraction-alignments",
+            str(subtraction_alignments),
+            "--output-alignments",
+            str(output_alignments),
+            "--input-fastq",
+            str(input_fastq),
+            "--output-fastq",
+            str(output_fastq),
+            "--proc",
+            str(proc),
+            "--output",
+            str(output),
+        ]
+
+        if memory_limit_mb is not None:
+            args += ["--memory-limit-mb", str(memory_limit_mb)]
+
+        results = await self.run(args, output, proc, on_log)
+
+        return results["subtracted"]
+
+
+def dense_coverage(encoded: dict) -> list[int]:
+    """Rebuild one reference's dense coverage from its `intervals` encoding.
+
+    `encoded` is a value of an interval-encoded results file's `coverage`:
+    `{"length": n, "intervals": [[start, end, depth], ...]}`, half-open and in
+    order. The result is the array a dense results file holds.
+    """
+    dense = [0] * encoded["length"]
+
+    for start, end, depth in encoded["intervals"]:
+        dense[start:end] = [depth] * (end - start)
+
+    return dense
+
+
+async def _pump(
+    stderr: asyncio.StreamReader, on_log: Callable[[LogRecord], None] | None
+) -> deque[LogRecord]:
+    """Hand each stderr line to `on_log` until EOF, keeping the last few."""
+    records: deque[LogRecord] = deque(maxlen=ERROR_CONTEXT)
+
+    while line := await stderr.readline():
+        text = line.decode(errors="replace").rstrip("\n")
+
+        if not text:
+            continue
+
+        record = LogRecord.parse(text)
+        records.append(record)
+
+        if on_log is not None:
+            on_log(record)
+
+    return records
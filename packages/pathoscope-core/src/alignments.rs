@@ -0,0 +1,773 @@
+//! An alignment file read once, for building the EM matrix at any cutoff.
+//!
+//! `run_expectation_maximization` reads its alignment file twice per cutoff:
+//! once in `build_matrix` and again in `calculate_coverage_from_bam`. Both
+//! passes use only a few fields of each mapped record, and neither depends on
+//! the cutoff until after those fields are read. [`ParsedAlignments`] holds
+//! just those fields, read once, and rebuilds the matrix and coverage for each
+//! cutoff from memory.
+//!
+//! Both rebuilds mirror the frozen passes step for step. The matrix is built
+//! with the same `add_alignment` calls, in the same order, followed by the same
+//! `finalize`. That leaves the same `FxHashMap` layout, so EM sums its floats
+//! in the same order and every result is bit-identical to a run that read the
+//! file. The golden harness holds the sweep to every `em` vector.
+//!
+//! The fields can also be written to a matrix cache: a flat little-endian file
+//! stamped with the alignment file's size and modification time. A later run
+//! loads the cache instead of reading a multi-gigabyte BAM, and rebuilds it
+//! when the stamp no longer matches.
+//!
+//! The header's references are held in a [`ReferenceTable`] interned by a
+//! [`ReferenceRegistry`]. A batch aligns every sample against the same
+//! reference, so its samples share one table — one copy of the names and one
+//! lengths map — instead of each building its own.
+
+use crate::em::find_updated_score;
+use crate::matrix::PathoscopeMatrix;
+use crate::sam::{extract_alignment_score, SamReader};
+use crate::PathoscopeError;
+use log::{info, warn};
+use rustc_hash::{FxHashMap, FxHashSet};
+use std::fs::File;
+use std::io::{BufReader, BufWriter, Read, Write};
+use std::path::Path;
+use std::sync::{Arc, Mutex};
+use std::time::UNIX_EPOCH;
+
+const CACHE_MAGIC: &[u8; 8] = b"PSMATRIX";
+const CACHE_VERSION: u32 = 1;
+
+/// The fields of one mapped record that the matrix and coverage passes read.
+#[derive(Debug, Clone, PartialEq)]
+struct Alignment {
+    /// Index into [`ParsedAlignments::reads`].
+    read: u32,
+
+    /// Index into [`ParsedAlignments::references`], the record's `tid`.
+    tid: u32,
+
+    /// The AS:i score plus the read length. A record without one still counts
+    /// towards coverage if its read made the matrix through another record.
+    score: Option<f64>,
+
+    pos: i64,
+    seq_len: u32,
+}
+
+/// The references of an alignment file's header.
+#[derive(Debug, PartialEq)]
+pub struct ReferenceTable {
+    /// `(name, length)`, in `tid` order.
+    entries: Vec<(String, usize)>,
+
+    /// The lengths keyed by name, built as `calculate_coverage_from_bam` builds
+    /// its map so coverage lists references in the same order.
+    lengths: FxHashMap<String, usize>,
+}
+
+impl ReferenceTable {
+    fn new(entries: Vec<(String, usize)>) -> Self {
+        let mut lengths: FxHashMap<String, usize> = FxHashMap::default();
+
+        for (name, length) in &entries {
+            lengths.insert(name.clone(), *length);
+        }
+
+        ReferenceTable { entries, lengths }
+    }
+}
+
+/// Hands every alignment file with the same header the same [`ReferenceTable`].
+#[derive(Debug, Default)]
+pub struct ReferenceRegistry {
+    tables: Mutex<Vec<Arc<ReferenceTable>>>,
+}
+
+impl ReferenceRegistry {
+    /// The table for `entries`, built only if no earlier header matched it.
+    fn intern(&self, entries: Vec<(String, usize)>) -> Arc<ReferenceTable> {
+        let mut tables = self.tables.lock().unwrap();
+
+        if let Some(table) = tables.iter().find(|table| table.entries == entries) {
+            return Arc::clone(table);
+        }
+
+        let table = Arc::new(ReferenceTable::new(entries));
+        tables.push(Arc::clone(&table));
+
+        table
+    }
+}
+
+/// Every mapped record of an alignment file, reduced to what EM needs.
+#[derive(Debug, Clone, PartialEq)]
+pub struct ParsedAlignments {
+    /// The header's references, shared with any file that has the same header.
+    references: Arc<ReferenceTable>,
+
+    /// Read names, in order of first appearance.
+    reads: Vec<String>,
+
+    alignments: Vec<Alignment>,
+}
+
+/// The size and modification time of an alignment file, which a cache must
+/// match to be used.
+#[derive(Debug, Clone, Copy, PartialEq)]
+struct Stamp {
+    len: u64,
+    secs: u64,
+    nanos: u32,
+}
+
+impl Stamp {
+    fn of(path: &str) -> Result<Self, PathoscopeError> {
+        let metadata = std::fs::metadata(path)?;
+        let modified = metadata
+            .modified()?
+            .duration_since(UNIX_EPOCH)
+            .unwrap_or_default();
+
+        Ok(Stamp {
+            len: metadata.len(),
+            secs: modified.as_secs(),
+            nanos: modified.subsec_nanos(),
+        })
+    }
+}
+
+impl ParsedAlignments {
+    /// Read every mapped record of a SAM or BAM file.
+    ///
+    /// A file the frozen passes would fail on fails here too. That includes a
+    /// read or reference name that is not UTF-8: the matrix pass would skip
+    /// it, but the coverage pass that always follows errors on it.
+    pub fn parse(
+        alignment_path: &str,
+        registry: &ReferenceRegistry,
+    ) -> Result<Self, PathoscopeError> {
+        info!("parsing alignments from '{}'", alignment_path);
+
+        let mut reader = SamReader::new(alignment_path)?;
+        let header = reader.header().clone();
+
+        let mut references = Vec::with_capacity(header.target_count() as usize);
+
+        for tid in 0..header.target_count() {
+            let name = std::str::from_utf8(header.tid2name(tid))?.to_string();
+            let length = header.target_len(tid).ok_or_else(|| {
+                PathoscopeError::Parse(format!("No length for reference {}", name))
+            })? as usize;
+
+            references.push((name, length));
+        }
+
+        let references = registry.intern(references);
+        let mut reads = Vec::new();
+        let mut read_ids: FxHashMap<String, u32> = FxHashMap::default();
+        let mut alignments = Vec::new();
+
+        reader.stream_chunks(|chunk| {
+            for record in chunk {
+                if record.is_unmapped() {
+                    continue;
+                }
+
+                let read_name = std::str::from_utf8(record.qname())?;
+                let tid = record.tid() as u32;
+
+                if tid as usize >= references.entries.len() {
+                    return Err(PathoscopeError::Parse(format!(
+                        "read {} is mapped to no reference in the header",
+                        read_name
+                    )));
+                }
+
+                let read = match read_ids.get(read_name) {
+                    Some(&read) => read,
+                    None => {
+                        let read = reads.len() as u32;
+                        read_ids.insert(read_name.to_string(), read);
+                        reads.push(read_name.to_string());
+                        read
+                    }
+                };
+
+                alignments.push(Alignment {
+                    read,
+                    tid,
+                    score: extract_alignment_score(record),
+                    pos: record.pos(),
+                    seq_len: record.seq_len() as u32,
+                });
+            }
+
+            Ok(())
+        })?;
+
+        info!(
+            "parsed {} alignments of {} reads",
+            alignments.len(),
+            reads.len()
+        );
+
+        Ok(ParsedAlignments {
+            references,
+            reads,
+            alignments,
+        })
+    }
+
+    /// Load the alignments from `cache` if it was written from this alignment
+    /// file as it is now, or parse the file and write `cache` for next time.
+    ///
+    /// A cache that is stale or unreadable is rebuilt rather than trusted. The
+    /// new one is written beside it and renamed into place, so a run that dies
+    /// mid-write never leaves a truncated cache behind. The cache only saves
+    /// time: if it cannot be written, the run warns and goes on with the
+    /// alignments it parsed.
+    pub fn load_or_parse(
+        alignment_path: &str,
+        cache: Option<&str>,
+        registry: &ReferenceRegistry,
+    ) -> Result<Self, PathoscopeError> {
+        let Some(cache) = cache else {
+            return Self::parse(alignment_path, registry);
+        };
+
+        let stamp = Stamp::of(alignment_path)?;
+
+        if Path::new(cache).exists() {
+            match Self::read_cache(cache, registry) {
+                Ok((cached, parsed)) if cached == stamp => {
+                    info!("loaded alignments from matrix cache '{}'", cache);
+                    return Ok(parsed);
+                }
+                Ok(_) => info!("matrix cache '{}' is stale; rebuilding it", cache),
+                Err(err) => warn!(
+                    "matrix cache '{}' is unreadable ({}); rebuilding it",
+                    cache, err
+                ),
+            }
+        }
+
+        let parsed = Self::parse(alignment_path, registry)?;
+        let partial = format!("{}.partial", cache);
+
+        let written = parsed
+            .write_cache(&partial, stamp)
+            .and_then(|()| Ok(std::fs::rename(&partial, cache)?));
+
+        match written {
+            Ok(()) => info!("wrote matrix cache '{}'", cache),
+            Err(err) => {
+                warn!(
+                    "could not write matrix cache '{}' ({}); continuing without it",
+                    cache, err
+                );
+
+                let _ = std::fs::remove_file(&partial);
+            }
+        }
+
+        Ok(parsed)
+    }
+
+    /// Build the matrix `build_matrix` would build from the file at `p_score_cutoff`.
+    pub fn build_matrix(&self, p_score_cutoff: f64) -> PathoscopeMatrix {
+        let mut matrix = PathoscopeMatrix::new();
+        let mut h_read_id: Vec<Option<i32>> = vec![None; self.reads.len()];
+        let mut h_ref_id: FxHashMap<&str, i32> = FxHashMap::default();
+        let mut read_alignments: FxHashMap<i32, (FxHashSet<i32>, Vec<(i32, f64)>)> =
+            FxHashMap::default();
+
+        for alignment in &self.alignments {
+            let total_score = match alignment.score {
+                Some(score) => score,
+                None => continue,
+            };
+
+            if total_score <= p_score_cutoff {
+                continue;
+            }
+
+            matrix.min_score = total_score.min(matrix.min_score);
+            matrix.max_score = total_score.max(matrix.max_score);
+
+            // Keyed by name, as `build_matrix` keys it, so two header entries
+            // sharing a name share an index there too.
+            let ref_name = self.references.entries[alignment.tid as usize].0.as_str();
+            let ref_index = *h_ref_id.entry(ref_name).or_insert_with(|| {
+                matrix.refs.push(ref_name.to_string());
+                matrix.refs.len() as i32 - 1
+            });
+
+            let read_index =
+                *h_read_id[alignment.read as usize].get_or_insert_with(|| {
+                    matrix
+                        .reads
+                        .push(self.reads[alignment.read as usize].clone());
+                    matrix.reads.len() as i32 - 1
+                });
+
+            matrix.add_alignment(
+                read_index,
+                ref_index,
+                total_score,
+                &mut read_alignments,
+            );
+        }
+
+        matrix.finalize(read_alignments);
+
+        matrix
+    }
+
+    /// Calculate the coverage `calculate_coverage_from_bam` would from the file.
+    pub fn coverage(
+        &self,
+        matrix: &PathoscopeMatrix,
+        p_score_cutoff: f64,
+    ) -> FxHashMap<String, Vec<usize>> {
+        let mut coverage: FxHashMap<String, Vec<usize>> = FxHashMap::default();
+
+        for (ref_name, &length) in &self.references.lengths {
+            coverage.insert(ref_name.clone(), vec![0; length]);
+        }
+
+        let read_name_to_idx: FxHashMap<&str, i32> = matrix
+            .reads
+            .iter()
+            .enumerate()
+            .map(|(idx, name)| (name.as_str(), idx as i32))
+            .collect();
+
+        let ref_name_to_idx: FxHashMap<&str, i32> = matrix
+            .refs
+            .iter()
+            .enumerate()
+            .map(|(idx, name)| (name.as_str(), idx as i32))
+            .collect();
+
+        for alignment in &self.alignments {
+            let read_name = self.reads[alignment.read as usize].as_str();
+            let ref_name = self.references.entries[alignment.tid as usize].0.as_str();
+
+            let (Some(&read_index), Some(&ref_index)) = (
+                read_name_to_idx.get(read_name),
+                ref_name_to_idx.get(ref_name),
+            ) else {
+                continue;
+            };
+
+            let should_include = match matrix.unique_reads.get(&read_index) {
+                Some((unique_ref_idx, _)) => *unique_ref_idx == ref_index,
+                None => {
+                    matrix.multi_mapping_reads.contains_key(&read_index)
+                        && find_updated_score(
+                            &matrix.multi_mapping_reads,
+                            read_index,
+                            ref_index,
+                        ) >= p_score_cutoff
+                }
+            };
+
+            if !should_include {
+                continue;
+            }
+
+            if let Some(coverage_array) = coverage.get_mut(ref_name) {
+                let position = alignment.pos as usize;
+                let end_position =
+                    (position + alignment.seq_len as usize).min(coverage_array.len());
+
+                for item in coverage_array
+                    .iter_mut()
+                    .skip(position)
+                    .take(end_position - position)
+                {
+                    *item += 1;
+                }
+            }
+        }
+
+        coverage
+    }
+
+    fn write_cache(&self, path: &str, stamp: Stamp) -> Result<(), PathoscopeError> {
+        let mut writer = BufWriter::new(File::create(path)?);
+
+        writer.write_all(CACHE_MAGIC)?;
+        writer.write_all(&CACHE_VERSION.to_le_bytes())?;
+        writer.write_all(&stamp.len.to_le_bytes())?;
+        writer.write_all(&stamp.secs.to_le_bytes())?;
+        writer.write_all(&stamp.nanos.to_le_bytes())?;
+
+        writer.write_all(&(self.references.entries.len() as u32).to_le_bytes())?;
+
+        for (name, length) in &self.references.entries {
+            write_string(&mut writer, name)?;
+            writer.write_all(&(*length as u64).to_le_bytes())?;
+        }
+
+        writer.write_all(&(self.reads.len() as u32).to_le_bytes())?;
+
+        for name in &self.reads {
+            write_string(&mut writer, name)?;
+        }
+
+        writer.write_all(&(self.alignments.len() as u64).to_le_bytes())?;
+
+        for alignment in &self.alignments {
+            writer.write_all(&alignment.read.to_le_bytes())?;
+            writer.write_all(&alignment.tid.to_le_bytes())?;
+            writer.write_all(&[alignment.score.is_some() as u8])?;
+            writer
+                .write_all(&alignment.score.unwrap_or(0.0).to_bits().to_le_bytes())?;
+            writer.write_all(&alignment.pos.to_le_bytes())?;
+            writer.write_all(&alignment.seq_len.to_le_bytes())?;
+        }
+
+        writer.flush()?;
+
+        Ok(())
+    }
+
+    fn read_cache(
+        path: &str,
+        registry: &ReferenceRegistry,
+    ) -> Result<(Stamp, Self), PathoscopeError> {
+        let mut reader = BufReader::new(File::open(path)?);
+
+        let mut magic = [0u8; 8];
+        reader.read_exact(&mut magic)?;
+
+        if &magic != CACHE_MAGIC {
+            return Err(PathoscopeError::Parse("not a matrix cache".to_string()));
+        }
+
+        let version = read_u32(&mut reader)?;
+
+        if version != CACHE_VERSION {
+            return Err(PathoscopeError::Parse(format!(
+                "matrix cache version {} is not {}",
+                version, CACHE_VERSION
+            )));
+        }
+
+        let stamp = Stamp {
+            len: read_u64(&mut reader)?,
+            secs: read_u64(&mut reader)?,
+            nanos: read_u32(&mut reader)?,
+        };
+
+        let reference_count = read_u32(&mut reader)? as usize;
+        let mut references = Vec::with_capacity(reference_count.min(1 << 20));
+
+        for _ in 0..reference_count {
+            let name = read_string(&mut reader)?;
+            references.push((name, read_u64(&mut reader)? as usize));
+        }
+
+        let read_count = read_u32(&mut reader)? as usize;
+        let mut reads = Vec::with_capacity(read_count.min(1 << 20));
+
+        for _ in 0..read_count {
+            reads.push(read_string(&mut reader)?);
+        }
+
+        let alignment_count = read_u64(&mut reader)? as usize;
+        let mut alignments = Vec::with_capacity(alignment_count.min(1 << 20));
+
+        for _ in 0..alignment_count {
+            let read = read_u32(&mut reader)?;
+            let tid = read_u32(&mut reader)?;
+
+            let mut has_score = [0u8; 1];
+            reader.read_exact(&mut has_score)?;
+            let score = f64::from_bits(read_u64(&mut reader)?);
+
+            let pos = read_u64(&mut reader)? as i64;
+            let seq_len = read_u32(&mut reader)?;
+
+            if read as usize >= reads.len() || tid as usize >= references.len() {
+                return Err(PathoscopeError::Parse(
+                    "matrix cache refers past its own tables".to_string(),
+                ));
+            }
+
+            alignments.push(Alignment {
+                read,
+                tid,
+                score: (has_score[0] != 0).then_some(score),
+                pos,
+                seq_len,
+            });
+        }
+
+        let mut rest = [0u8; 1];
+
+        if reader.read(&mut rest)? != 0 {
+            return Err(PathoscopeError::Parse(
+                "matrix cache has trailing bytes".to_string(),
+            ));
+        }
+
+        Ok((
+            stamp,
+            ParsedAlignments {
+                references: registry.intern(references),
+                reads,
+                alignments,
+            },
+        ))
+    }
+}
+
+fn write_string(writer: &mut impl Write, value: &str) -> Result<(), PathoscopeError> {
+    writer.write_all(&(value.len() as u32).to_le_bytes())?;
+    writer.write_all(value.as_bytes())?;
+
+    Ok(())
+}
+
+fn read_u32(reader: &mut impl Read) -> Result<u32, PathoscopeError> {
+    let mut bytes = [0u8; 4];
+    reader.read_exact(&mut bytes)?;
+
+    Ok(u32::from_le_bytes(bytes))
+}
+
+fn read_u64(reader: &mut impl Read) -> Result<u64, PathoscopeError> {
+    let mut bytes = [0u8; 8];
+    reader.read_exact(&mut bytes)?;
+
+    Ok(u64::from_le_bytes(bytes))
+}
+
+fn read_string(reader: &mut impl Read) -> Result<String, PathoscopeError> {
+    let mut bytes = vec![0u8; read_u32(reader)? as usize];
+    reader.read_exact(&mut bytes)?;
+
+    String::from_utf8(bytes).map_err(|err| PathoscopeError::Utf8(err.utf8_error()))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::coverage::calculate_coverage_from_bam;
+    use crate::matrix::build_matrix;
+
+    fn fixture(name: &str) -> String {
+        format!("{}/tests/fixtures/{name}", env!("CARGO_MANIFEST_DIR"))
+    }
+
+    /// Compare two matrices field by field, floats by their bits.
+    fn assert_matrices_identical(
+        name: &str,
+        want: &PathoscopeMatrix,
+        got: &PathoscopeMatrix,
+    ) {
+        assert_eq!(want.refs, got.refs, "{name}: refs differ");
+        assert_eq!(want.reads, got.reads, "{name}: reads differ");
+        assert_eq!(
+            want.max_score.to_bits(),
+            got.max_score.to_bits(),
+            "{name}: max_score"
+        );
+        assert_eq!(
+            want.min_score.to_bits(),
+            got.min_score.to_bits(),
+            "{name}: min_score"
+        );
+
+        let unique = |matrix: &PathoscopeMatrix| {
+            matrix
+                .unique_reads
+                .iter()
+                .map(|(read, (reference, score))| (*read, *reference, score.to_bits()))
+                .collect::<Vec<_>>()
+        };
+
+        // Iteration order as well as content: EM sums in this order.
+        assert_eq!(unique(want), unique(got), "{name}: unique reads differ");
+
+        let multi = |matrix: &PathoscopeMatrix| {
+            matrix
+                .multi_mapping_reads
+                .iter()
+                .map(|(read, (refs, scores, normalized, max))| {
+                    (
+                        *read,
+                        refs.clone(),
+                        scores.iter().map(|v| v.to_bits()).collect::<Vec<_>>(),
+                        normalized.iter().map(|v| v.to_bits()).collect::<Vec<_>>(),
+                        max.to_bits(),
+                    )
+                })
+                .collect::<Vec<_>>()
+        };
+
+        assert_eq!(
+            multi(want),
+            multi(got),
+            "{name}: multi-mapping reads differ"
+        );
+    }
+
+    #[test]
+    fn test_build_matrix_matches_the_frozen_pass() {
+        for name in [
+            "minimal_test.sam",
+            "test_basic.sam",
+            "test_cutoff.sam",
+            "test_em_with_multimapping.sam",
+            "test_isolates_minimal.sam",
+            "to_subtraction.sam",
+        ] {
+            let parsed =
+                ParsedAlignments::parse(&fixture(name), &ReferenceRegistry::default())
+                    .unwrap();
+
+            for cutoff in [0.0, 0.01, 0.5, 60.0] {
+                let want = build_matrix(&fixture(name), Some(cutoff)).unwrap();
+                let got = parsed.build_matrix(cutoff);
+
+                assert_matrices_identical(&format!("{name}@{cutoff}"), &want, &got);
+
+                assert_eq!(
+                    calculate_coverage_from_bam(&fixture(name), &want, cutoff)
+                        .unwrap()
+                        .into_iter()
+                        .collect::<Vec<_>>(),
+                    parsed
+                        .coverage(&got, cutoff)
+                        .into_iter()
+                        .collect::<Vec<_>>(),
+                    "{name}@{cutoff}: coverage differs"
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn test_parse_fails_where_the_frozen_pass_does() {
+        for name in ["test_em_integration.sam", "to_isolates.sam"] {
+            assert!(
+                ParsedAlignments::parse(&fixture(name), &ReferenceRegistry::default())
+                    .is_err(),
+                "{name} should not parse"
+            );
+        }
+    }
+
+    #[test]
+    fn test_matrix_cache_round_trips() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let cache = temp.path().join("matrix.cache");
+        let cache = cache.to_str().unwrap();
+        let path = fixture("test_em_with_multimapping.sam");
+        let registry = ReferenceRegistry::default();
+
+        let parsed =
+            ParsedAlignments::load_or_parse(&path, Some(cache), &registry).unwrap();
+
+        assert!(
+            Path::new(cache).exists(),
+            "the cache should have been written"
+        );
+        assert!(!Path::new(&format!("{cache}.partial")).exists());
+
+        let (stamp, loaded) = ParsedAlignments::read_cache(cache, &registry).unwrap();
+
+        assert_eq!(stamp, Stamp::of(&path).unwrap());
+        assert_eq!(parsed, loaded);
+        assert_eq!(
+            ParsedAlignments::load_or_parse(&path, Some(cache), &registry).unwrap(),
+            parsed
+        );
+    }
+
+    #[test]
+    fn test_matrix_cache_is_rebuilt_when_stale_or_corrupt() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let cache = temp.path().join("matrix.cache");
+        let cache = cache.to_str().unwrap();
+        let path = fixture("test_basic.sam");
+        let registry = ReferenceRegistry::default();
+        let parsed =
+            ParsedAlignments::parse(&path, &ReferenceRegistry::default()).unwrap();
+
+        // Written from this file, but stamped as some other version of it.
+        let other = parsed.clone();
+        let mut stamp = Stamp::of(&path).unwrap();
+        stamp.len += 1;
+        ParsedAlignments {
+            alignments: Vec::new(),
+            ..other
+        }
+        .write_cache(cache, stamp)
+        .unwrap();
+
+        assert_eq!(
+            ParsedAlignments::load_or_parse(&path, Some(cache), &registry).unwrap(),
+            parsed
+        );
+
+        std::fs::write(cache, b"PSMATRIX\x01").unwrap();
+
+        assert_eq!(
+            ParsedAlignments::load_or_parse(&path, Some(cache), &registry).unwrap(),
+            parsed
+        );
+        assert_eq!(
+            ParsedAlignments::read_cache(cache, &registry).unwrap().1,
+            parsed
+        );
+    }
+
+    #[test]
+    fn test_matrix_cache_that_cannot_be_written_is_skipped() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let path = fixture("test_basic.sam");
+        let registry = ReferenceRegistry::default();
+        let parsed = ParsedAlignments::parse(&path, &registry).unwrap();
+
+        // A directory with something in it can be neither read nor replaced.
+        let cache = temp.path().join("matrix.cache");
+        std::fs::create_dir(&cache).unwrap();
+        std::fs::write(cache.join("keep"), b"").unwrap();
+        let cache = cache.to_str().unwrap();
+
+        assert_eq!(
+            ParsedAlignments::load_or_parse(&path, Some(cache), &registry).unwrap(),
+            parsed
+        );
+        assert!(!Path::new(&format!("{cache}.partial")).exists());
+
+        let missing = temp.path().join("missing/matrix.cache");
+
+        assert_eq!(
+            ParsedAlignments::load_or_parse(&path, missing.to_str(), &registry)
+                .unwrap(),
+            parsed
+        );
+    }
+
+    #[test]
+    fn test_registry_shares_identical_headers() {
+        let registry = ReferenceRegistry::default();
+
+        let first =
+            ParsedAlignments::parse(&fixture("test_basic.sam"), &registry).unwrap();
+        let second =
+            ParsedAlignments::parse(&fixture("test_basic.sam"), &registry).unwrap();
+        let other =
+            ParsedAlignments::parse(&fixture("to_subtraction.sam"), &registry).unwrap();
+
+        assert!(Arc::ptr_eq(&first.references, &second.references));
+        assert!(!Arc::ptr_eq(&first.references, &other.references));
+        assert_eq!(registry.tables.lock().unwrap().len(), 2);
+    }
+}
@@ -0,0 +1,389 @@
+//! Run `eliminate-subtraction` and `em` for many samples in one process.
+//!
+//! A plate of samples is otherwise a process launch per sample per stage, each
+//! re-reading the same reference's header and rebuilding the same maps from it.
+//! A batch reads a manifest of samples and runs them on a bounded pool of
+//! worker threads that share one [`ReferenceRegistry`], so every sample aligned
+//! against the same reference shares one table of its names and lengths.
+//!
+//! Each stage writes the results file the single-shot subcommand would write
+//! for the same arguments, byte for byte; the golden harness holds a batch to
+//! every `em` and `eliminate-subtraction` vector. Within a sample, subtraction
+//! runs before EM, the order the workflow runs them in, and a sample stops at
+//! its first failure. One sample failing never stops the others.
+
+use crate::alignments::{ParsedAlignments, ReferenceRegistry};
+use crate::{
+    run_eliminate_subtraction, run_eliminate_subtraction_bounded,
+    run_parsed_expectation_maximization, write_json, write_results, CoverageEncoding,
+    PathoscopeError, SubtractionSummary,
+};
+use log::{error, info};
+use rustc_hash::FxHashSet;
+use serde::{Deserialize, Serialize};
+use std::fs::File;
+use std::io::BufReader;
+use std::panic::{catch_unwind, AssertUnwindSafe};
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::Mutex;
+use std::thread;
+
+/// The samples of a batch, read from a JSON manifest.
+#[derive(Debug, Deserialize)]
+#[serde(deny_unknown_fields)]
+pub struct Manifest {
+    pub samples: Vec<Sample>,
+}
+
+/// One sample and the stages to run for it. Each stage takes the arguments of
+/// its subcommand, named as they are on the command line.
+#[derive(Debug, Deserialize)]
+#[serde(deny_unknown_fields)]
+pub struct Sample {
+    /// Identifies the sample in logs and in the batch summary.
+    pub name: String,
+
+    #[serde(default)]
+    pub eliminate_subtraction: Option<SubtractionStage>,
+
+    #[serde(default)]
+    pub em: Option<EmStage>,
+}
+
+/// The arguments of `eliminate-subtraction` for one sample.
+#[derive(Debug, Deserialize)]
+#[serde(deny_unknown_fields)]
+pub struct SubtractionStage {
+    pub isolate_alignments: PathBuf,
+    pub subtraction_alignments: PathBuf,
+    pub output_alignments: PathBuf,
+    pub input_fastq: PathBuf,
+    pub output_fastq: PathBuf,
+    pub proc: u32,
+    pub output: PathBuf,
+
+    #[serde(default)]
+    pub memory_limit_mb: Option<u32>,
+}
+
+/// The arguments of `em` for one sample.
+#[derive(Debug, Deserialize)]
+#[serde(deny_unknown_fields)]
+pub struct EmStage {
+    pub alignment: PathBuf,
+    pub p_score_cutoff: f64,
+    pub output: PathBuf,
+
+    #[serde(default)]
+    pub matrix_cache: Option<PathBuf>,
+
+    #[serde(default)]
+    pub coverage_encoding: CoverageEncoding,
+}
+
+/// How one sample of a batch ended, as listed in the batch summary.
+#[derive(Debug, Serialize)]
+pub struct SampleOutcome {
+    pub name: String,
+    pub ok: bool,
+
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub error: Option<String>,
+}
+
+impl Manifest {
+    /// Read and check a manifest.
+    ///
+    /// Sample names must be unique and every sample must have a stage to run.
+    /// A stage's `proc` and `memory_limit_mb` must be at least 1, as the
+    /// subcommand's must.
+    pub fn from_path(path: &Path) -> Result<Self, PathoscopeError> {
+        let file = File::open(path)?;
+        let manifest: Manifest = serde_json::from_reader(BufReader::new(file))
+            .map_err(|err| {
+                PathoscopeError::Parse(format!("manifest {}: {}", path.display(), err))
+            })?;
+
+        let mut names = FxHashSet::default();
+
+        for sample in &manifest.samples {
+            if !names.insert(sample.name.as_str()) {
+                return Err(PathoscopeError::Batch(format!(
+                    "sample {} appears more than once",
+                    sample.name
+                )));
+            }
+
+            if sample.eliminate_subtraction.is_none() && sample.em.is_none() {
+                return Err(PathoscopeError::Batch(format!(
+                    "sample {} has no stage to run",
+                    sample.name
+                )));
+            }
+
+            if let Some(stage) = &sample.eliminate_subtraction {
+                if stage.proc == 0 || stage.memory_limit_mb == Some(0) {
+                    return Err(PathoscopeError::Batch(format!(
+                        "sample {}: proc and memory_limit_mb must be at least 1",
+                        sample.name
+                    )));
+                }
+            }
+        }
+
+        Ok(manifest)
+    }
+}
+
+/// Run every sample of `manifest`, at most `jobs` at a time.
+///
+/// Samples are started in manifest order, and the outcomes are returned in it.
+/// A panic while running a sample is caught and reported as that sample's
+/// failure rather than taking the batch down with it.
+pub fn run_batch(manifest: &Manifest, jobs: u32) -> Vec<SampleOutcome> {
+    let registry = ReferenceRegistry::default();
+    let next = AtomicUsize::new(0);
+    let outcomes: Mutex<Vec<Option<SampleOutcome>>> =
+        Mutex::new(manifest.samples.iter().map(|_| None).collect());
+
+    let workers = (jobs.max(1) as usize).min(manifest.samples.len());
+
+    info!(
+        "running a batch of {} samples on {} workers",
+        manifest.samples.len(),
+        workers
+    );
+
+    thread::scope(|scope| {
+        for _ in 0..workers {
+            scope.spawn(|| loop {
+                let index = next.fetch_add(1, Ordering::Relaxed);
+
+                let Some(sample) = manifest.samples.get(index) else {
+                    break;
+                };
+
+                let outcome = run_sample(sample, &registry);
+                outcomes.lock().unwrap()[index] = Some(outcome);
+            });
+        }
+    });
+
+    outcomes
+        .into_inner()
+        .unwrap()
+        .into_iter()
+        .map(|outcome| outcome.expect("every sample is run by a worker"))
+        .collect()
+}
+
+fn run_sample(sample: &Sample, registry: &ReferenceRegistry) -> SampleOutcome {
+    info!("starting sample {}", sample.name);
+
+    let result = catch_unwind(AssertUnwindSafe(|| run_stages(sample, registry)))
+        .unwrap_or_else(|panic| {
+            let message = panic
+                .downcast_ref::<&str>()
+                .map(|message| message.to_string())
+                .or_else(|| panic.downcast_ref::<String>().cloned())
+                .unwrap_or_else(|| "unknown panic".to_string());
+
+            Err(PathoscopeError::Batch(format!("panicked: {}", message)))
+        });
+
+    match result {
+        Ok(()) => {
+            info!("finished sample {}", sample.name);
+
+            SampleOutcome {
+                name: sample.name.clone(),
+                ok: true,
+                error: None,
+            }
+        }
+        Err(err) => {
+            error!("sample {} failed: {}", sample.name, err);
+
+            SampleOutcome {
+                name: sample.name.clone(),
+                ok: false,
+                error: Some(err.to_string()),
+            }
+        }
+    }
+}
+
+fn run_stages(
+    sample: &Sample,
+    registry: &ReferenceRegistry,
+) -> Result<(), PathoscopeError> {
+    if let Some(stage) = &sample.eliminate_subtraction {
+        let subtracted = match stage.memory_limit_mb {
+            Some(memory_limit_mb) => run_eliminate_subtraction_bounded(
+                &stage.isolate_alignments.to_string_lossy(),
+                &stage.subtraction_alignments.to_string_lossy(),
+                &stage.output_alignments.to_string_lossy(),
+                &stage.input_fastq.to_string_lossy(),
+                &stage.output_fastq.to_string_lossy(),
+                stage.proc,
+                memory_limit_mb,
+            )?,
+            None => run_eliminate_subtraction(
+                &stage.isolate_alignments.to_string_lossy(),
+                &stage.subtraction_alignments.to_string_lossy(),
+                &stage.output_alignments.to_string_lossy(),
+                &stage.input_fastq.to_string_lossy(),
+                &stage.output_fastq.to_string_lossy(),
+                stage.proc,
+            )?,
+        };
+
+        write_json(&stage.output, &SubtractionSummary { subtracted })?;
+    }
+
+    if let Some(stage) = &sample.em {
+        let alignment = stage.alignment.to_string_lossy();
+        let matrix_cache = stage
+            .matrix_cache
+            .as_ref()
+            .map(|path| path.to_string_lossy().into_owned());
+
+        let alignments = ParsedAlignments::load_or_parse(
+            &alignment,
+            matrix_cache.as_deref(),
+            registry,
+        )?;
+        let results = run_parsed_expectation_maximization(
+            &alignment,
+            &alignments,
+            stage.p_score_cutoff,
+        )?;
+
+        write_results(&stage.output, &results, stage.coverage_encoding)?;
+    }
+
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn fixture(name: &str) -> PathBuf {
+        Path::new(env!("CARGO_MANIFEST_DIR"))
+            .join("tests/fixtures")
+            .join(name)
+    }
+
+    fn write_manifest(dir: &Path, manifest: serde_json::Value) -> PathBuf {
+        let path = dir.join("manifest.json");
+        std::fs::write(&path, manifest.to_string()).unwrap();
+        path
+    }
+
+    #[test]
+    fn test_manifest_rejects_duplicate_and_empty_samples() {
+        let temp = tempfile::TempDir::new().unwrap();
+
+        for (samples, expected) in [
+            (
+                serde_json::json!([{"name": "a"}]),
+                "sample a has no stage to run",
+            ),
+            (
+                serde_json::json!([
+                    {"name": "a", "em": {"alignment": "x", "p_score_cutoff": 0.01, "output": "y"}},
+                    {"name": "a", "em": {"alignment": "x", "p_score_cutoff": 0.01, "output": "z"}},
+                ]),
+                "sample a appears more than once",
+            ),
+        ] {
+            let path =
+                write_manifest(temp.path(), serde_json::json!({ "samples": samples }));
+            let err = Manifest::from_path(&path).unwrap_err();
+
+            assert!(err.to_string().contains(expected), "{err}");
+        }
+
+        let path = write_manifest(
+            temp.path(),
+            serde_json::json!({"samples": [], "extra": true}),
+        );
+
+        assert!(matches!(
+            Manifest::from_path(&path),
+            Err(PathoscopeError::Parse(_))
+        ));
+    }
+
+    #[test]
+    fn test_manifest_cutoff_parses_as_the_command_line_does() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let path = temp.path().join("manifest.json");
+
+        // Without `float_roundtrip` serde_json reads this one ULP high.
+        let cutoff = "0.09517514429500175";
+
+        std::fs::write(
+            &path,
+            format!(
+                r#"{{"samples": [{{"name": "a", "em": {{
+                    "alignment": "x", "p_score_cutoff": {cutoff}, "output": "y"
+                }}}}]}}"#
+            ),
+        )
+        .unwrap();
+
+        let manifest = Manifest::from_path(&path).unwrap();
+        let stage = manifest.samples[0].em.as_ref().unwrap();
+
+        assert_eq!(
+            stage.p_score_cutoff.to_bits(),
+            cutoff.parse::<f64>().unwrap().to_bits()
+        );
+    }
+
+    #[test]
+    fn test_failed_sample_does_not_stop_the_others() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let out = |name: &str| temp.path().join(name);
+
+        let path = write_manifest(
+            temp.path(),
+            serde_json::json!({"samples": [
+                {"name": "broken", "em": {
+                    "alignment": fixture("to_isolates.sam"),
+                    "p_score_cutoff": 0.01,
+                    "output": out("broken.json"),
+                }},
+                {"name": "basic", "em": {
+                    "alignment": fixture("test_basic.sam"),
+                    "p_score_cutoff": 0.01,
+                    "output": out("basic.json"),
+                }},
+                {"name": "again", "em": {
+                    "alignment": fixture("test_basic.sam"),
+                    "p_score_cutoff": 0.01,
+                    "output": out("again.json"),
+                }},
+            ]}),
+        );
+
+        let outcomes = run_batch(&Manifest::from_path(&path).unwrap(), 2);
+
+        assert_eq!(
+            outcomes
+                .iter()
+                .map(|outcome| (outcome.name.as_str(), outcome.ok))
+                .collect::<Vec<_>>(),
+            [("broken", false), ("basic", true), ("again", true)]
+        );
+        assert!(outcomes[0].error.is_some());
+        assert!(!out("broken.json").exists());
+        assert_eq!(
+            std::fs::read(out("basic.json")).unwrap(),
+            std::fs::read(out("again.json")).unwrap()
+        );
+    }
+}
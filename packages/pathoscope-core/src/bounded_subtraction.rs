@@ -0,0 +1,916 @@
+//! Subtraction in bounded memory, for hosts with tens of millions of reads.
+//!
+//! `subtraction.rs` holds every subtraction read name in a hash map and every
+//! eliminated one in a set, as heap strings. Against a plant host that is
+//! gigabytes. This module writes the same output files, byte for byte, holding
+//! only a sort buffer of a chosen size: read names are spilled to sorted run
+//! files on disk and joined by merging them.
+//!
+//! 1. The subtraction's scored records are spilled as (name, order, score).
+//! 2. The isolate records `subtraction.rs` would consider are spilled as
+//!    (name, record index, score).
+//! 3. The two are merge-joined. An isolate record is eliminated when the last
+//!    subtraction score for its name is at least its own, as
+//!    `SubtractionProcessor` decides it. Its index is set in a bitset, and its
+//!    name goes to a sorted run of eliminated names.
+//! 4. The FASTQ's records are spilled as (name, record index) and joined with
+//!    the eliminated names into a second bitset.
+//! 5. The isolate file and the FASTQ are read again, and whatever is not in
+//!    their bitsets is written out.
+//!
+//! Runs are sorted by a 64-bit fingerprint of the name and then by the name
+//! itself, so nearly every comparison is of two integers. Names are compared
+//! only when fingerprints are equal, so a collision costs a comparison and
+//! never a wrong answer. Each spill is sorted on `proc` threads.
+//!
+//! What stays in memory is the sort buffer, a read buffer per open run, and
+//! one bit per isolate record and per FASTQ record. The runs live in a
+//! directory beside the output alignments, removed when the subtraction ends.
+
+use crate::sam::{extract_alignment_score, SamReader};
+use crate::PathoscopeError;
+use log::info;
+use rust_htslib::bam;
+use rust_htslib::bam::Format;
+use rustc_hash::FxHasher;
+use std::cmp::{Ordering, Reverse};
+use std::collections::BinaryHeap;
+use std::fs::File;
+use std::hash::Hasher;
+use std::io::{BufRead, BufReader, BufWriter, Read, Write};
+use std::path::PathBuf;
+use std::thread;
+
+/// Most runs merged at once. More are first merged in groups of this many,
+/// which keeps the open files and their read buffers bounded too.
+const MAX_FAN_IN: usize = 64;
+
+/// Memory held by one buffered name besides its bytes.
+const KEY_BYTES: usize = std::mem::size_of::<Key>();
+
+/// Eliminate subtraction-mapped reads without holding their names in memory.
+///
+/// Writes the same alignment and FASTQ files as
+/// [`eliminate_subtraction`](crate::subtraction::eliminate_subtraction) and
+/// returns the same count.
+///
+/// # Arguments
+/// * `isolate_sam_path` - Path to the isolate SAM/BAM file
+/// * `subtraction_sam_path` - Path to the subtraction SAM/BAM file
+/// * `output_sam_path` - Path to write the filtered BAM file
+/// * `input_fastq_path` - Path to the input FASTQ file to filter
+/// * `output_fastq_path` - Path to write the filtered FASTQ file
+/// * `proc` - Number of threads for sorting and BAM compression
+/// * `memory_limit` - Bytes of read names to buffer before spilling a run
+///
+/// # Returns
+/// Number of reads that were subtracted (eliminated)
+pub fn eliminate_subtraction_bounded(
+    isolate_sam_path: &str,
+    subtraction_sam_path: &str,
+    output_sam_path: &str,
+    input_fastq_path: &str,
+    output_fastq_path: &str,
+    proc: usize,
+    memory_limit: usize,
+) -> Result<usize, PathoscopeError> {
+    eliminate(
+        &Inputs {
+            isolate: isolate_sam_path,
+            subtraction: subtraction_sam_path,
+            output_alignments: output_sam_path,
+            input_fastq: input_fastq_path,
+            output_fastq: output_fastq_path,
+        },
+        proc.max(1),
+        memory_limit,
+        fingerprint,
+    )
+}
+
+struct Inputs<'a> {
+    isolate: &'a str,
+    subtraction: &'a str,
+    output_alignments: &'a str,
+    input_fastq: &'a str,
+    output_fastq: &'a str,
+}
+
+fn eliminate(
+    inputs: &Inputs,
+    proc: usize,
+    memory_limit: usize,
+    fingerprint: fn(&[u8]) -> u64,
+) -> Result<usize, PathoscopeError> {
+    info!(
+        "starting bounded subtraction elimination: isolate={}, subtraction={}, \
+         output={}, proc={}, memory_limit={}",
+        inputs.isolate,
+        inputs.subtraction,
+        inputs.output_alignments,
+        proc,
+        memory_limit
+    );
+
+    let spill = SpillDir::create(&format!("{}.spill", inputs.output_alignments))?;
+    let sorter =
+        |prefix| RunSorter::new(&spill, prefix, memory_limit, proc, fingerprint);
+
+    let mut subtraction = sorter("subtraction");
+    let mut order = 0;
+
+    SamReader::new(inputs.subtraction)?.stream_chunks(|chunk| {
+        for record in chunk {
+            if record.is_unmapped() {
+                continue;
+            }
+
+            let read_id = std::str::from_utf8(record.qname())?;
+
+            if let Some(total_score) = extract_alignment_score(record) {
+                subtraction.push(
+                    read_id.as_bytes(),
+                    order,
+                    (total_score as f32).to_bits(),
+                )?;
+                order += 1;
+            }
+        }
+
+        Ok(())
+    })?;
+
+    info!("spilled {} subtraction scores", order);
+
+    let mut isolates = sorter("isolates");
+    let mut isolate_records = 0;
+
+    let mut reader = SamReader::new(inputs.isolate)
+        .map_err(|_| PathoscopeError::Parse("Failed to open SAM file".to_string()))?;
+
+    reader.stream_chunks(|chunk| {
+        for record in chunk {
+            if let Some(isolate_score) = isolate_score(record) {
+                isolates.push(
+                    record.qname(),
+                    isolate_records,
+                    isolate_score.to_bits(),
+                )?;
+            }
+
+            isolate_records += 1;
+        }
+
+        Ok(())
+    })?;
+
+    let mut eliminated_names = RunWriter::create(spill.run("eliminated"))?;
+    let mut eliminated_records = Bits::default();
+    let mut subtracted_count = 0;
+
+    {
+        let mut groups = subtraction.finish()?;
+        let mut isolates = isolates.finish()?;
+        let mut group = groups.next_group()?;
+        let mut last_eliminated: Option<Entry> = None;
+
+        while let Some(isolate) = isolates.next_entry()? {
+            while group
+                .as_ref()
+                .is_some_and(|group| group.key_cmp(&isolate) == Ordering::Less)
+            {
+                group = groups.next_group()?;
+            }
+
+            let Some(group) = &group else {
+                break;
+            };
+
+            if group.key_cmp(&isolate) != Ordering::Equal
+                || f32::from_bits(group.value) < f32::from_bits(isolate.value)
+            {
+                continue;
+            }
+
+            eliminated_records.set(isolate.order);
+
+            if last_eliminated
+                .as_ref()
+                .is_none_or(|last| last.key_cmp(&isolate) != Ordering::Equal)
+            {
+                eliminated_names.write(&isolate)?;
+                subtracted_count += 1;
+                last_eliminated = Some(isolate);
+            }
+        }
+    }
+
+    let eliminated_names = eliminated_names.finish()?;
+
+    info!("{} reads eliminated; filtering FASTQ", subtracted_count);
+
+    let mut fastq = sorter("fastq");
+
+    for_each_fastq_record(inputs.input_fastq, |index, read_id, _| {
+        fastq.push(read_id.as_bytes(), index, 0)
+    })?;
+
+    let mut dropped_records = Bits::default();
+
+    {
+        let mut fastq = fastq.finish()?;
+        let mut eliminated = Merged::open(vec![eliminated_names])?;
+        let mut name = eliminated.next_entry()?;
+
+        while let Some(record) = fastq.next_entry()? {
+            while name
+                .as_ref()
+                .is_some_and(|name| name.key_cmp(&record) == Ordering::Less)
+            {
+                name = eliminated.next_entry()?;
+            }
+
+            match &name {
+                None => break,
+                Some(name) if name.key_cmp(&record) == Ordering::Equal => {
+                    dropped_records.set(record.order)
+                }
+                Some(_) => {}
+            }
+        }
+    }
+
+    write_isolates(inputs, proc, &eliminated_records)?;
+
+    let mut writer = BufWriter::new(File::create(inputs.output_fastq)?);
+
+    for_each_fastq_record(inputs.input_fastq, |index, _, lines| {
+        if !dropped_records.get(index) {
+            for line in lines {
+                writer.write_all(line.as_bytes())?;
+            }
+        }
+
+        Ok(())
+    })?;
+
+    writer.flush()?;
+
+    info!(
+        "subtraction complete: {} reads eliminated",
+        subtracted_count
+    );
+
+    Ok(subtracted_count)
+}
+
+/// The score an isolate record is compared at, or `None` for a record
+/// `process_isolate_file` neither writes nor eliminates.
+fn isolate_score(record: &bam::Record) -> Option<f32> {
+    if record.is_unmapped() || record.tid() < 0 {
+        return None;
+    }
+
+    extract_alignment_score(record).map(|score| score as f32)
+}
+
+/// Write every isolate record `process_isolate_file` would keep.
+fn write_isolates(
+    inputs: &Inputs,
+    proc: usize,
+    eliminated: &Bits,
+) -> Result<(), PathoscopeError> {
+    let mut reader = SamReader::new(inputs.isolate)
+        .map_err(|_| PathoscopeError::Parse("Failed to open SAM file".to_string()))?;
+
+    let header = bam::Header::from_template(reader.header());
+
+    let mut writer =
+        bam::Writer::from_path(inputs.output_alignments, &header, Format::Bam)
+            .map_err(PathoscopeError::Htslib)?;
+
+    writer.set_threads(proc).map_err(PathoscopeError::Htslib)?;
+
+    let mut index = 0;
+
+    reader.stream_chunks(|chunk| {
+        for record in chunk {
+            if isolate_score(record).is_some() && !eliminated.get(index) {
+                writer.write(record).map_err(PathoscopeError::Htslib)?;
+            }
+
+            index += 1;
+        }
+
+        Ok(())
+    })
+}
+
+/// Call `f` with the index, read id and lines of each FASTQ record, reading
+/// them exactly as `filter_fastq_file` does.
+fn for_each_fastq_record<F>(path: &str, mut f: F) -> Result<(), PathoscopeError>
+where
+    F: FnMut(u64, &str, &[String]) -> Result<(), PathoscopeError>,
+{
+    let mut reader = BufReader::new(File::open(path)?);
+    let mut lines = vec![String::new(); 4];
+    let mut index = 0;
+
+    loop {
+        let mut read = 0;
+
+        for line in lines.iter_mut() {
+            line.clear();
+
+            if reader.read_line(line)? == 0 {
+                break;
+            }
+
+            read += 1;
+        }
+
+        // A trailing partial record is dropped, as it is there.
+        if read != 4 {
+            break;
+        }
+
+        if !lines[0].starts_with('@') {
+            return Err(PathoscopeError::Parse(
+                "Invalid FASTQ format: header line should start with '@'".to_string(),
+            ));
+        }
+
+        let read_id = lines[0][1..].split_whitespace().next().unwrap_or("");
+
+        f(index, read_id, &lines)?;
+        index += 1;
+    }
+
+    Ok(())
+}
+
+fn fingerprint(name: &[u8]) -> u64 {
+    let mut hasher = FxHasher::default();
+    hasher.write(name);
+    hasher.finish()
+}
+
+/// A growable bitset over record indexes.
+#[derive(Default)]
+struct Bits(Vec<u64>);
+
+impl Bits {
+    fn set(&mut self, index: u64) {
+        let word = (index / 64) as usize;
+
+        if word >= self.0.len() {
+            self.0.resize(word + 1, 0);
+        }
+
+        self.0[word] |= 1 << (index % 64);
+    }
+
+    fn get(&self, index: u64) -> bool {
+        self.0
+            .get((index / 64) as usize)
+            .is_some_and(|word| word & (1 << (index % 64)) != 0)
+    }
+}
+
+/// The directory a subtraction spills its runs to, removed when dropped.
+struct SpillDir {
+    path: PathBuf,
+}
+
+impl SpillDir {
+    fn create(path: &str) -> Result<Self, PathoscopeError> {
+        std::fs::create_dir_all(path)?;
+
+        Ok(SpillDir { path: path.into() })
+    }
+
+    fn run(&self, name: &str) -> PathBuf {
+        self.path.join(name)
+    }
+}
+
+impl Drop for SpillDir {
+    fn drop(&mut self) {
+        let _ = std::fs::remove_dir_all(&self.path);
+    }
+}
+
+/// A buffered name: its bytes are `names[start..start + len]` in the sorter.
+#[derive(Clone, Copy)]
+struct Key {
+    fingerprint: u64,
+    order: u64,
+    start: usize,
+    len: u32,
+    value: u32,
+}
+
+/// One name read back from a run.
+struct Entry {
+    fingerprint: u64,
+    name: Vec<u8>,
+    order: u64,
+    value: u32,
+}
+
+impl Entry {
+    /// Order by name, fingerprint first.
+    fn key_cmp(&self, other: &Entry) -> Ordering {
+        self.fingerprint
+            .cmp(&other.fingerprint)
+            .then_with(|| self.name.cmp(&other.name))
+    }
+
+    /// Order by name, then by order within a name: the order of a run.
+    fn run_cmp(&self, other: &Entry) -> Ordering {
+        self.key_cmp(other).then(self.order.cmp(&other.order))
+    }
+}
+
+/// Buffers names up to a memory limit, spilling each full buffer as a sorted
+/// run.
+struct RunSorter<'a> {
+    spill: &'a SpillDir,
+    prefix: &'static str,
+    memory_limit: usize,
+    threads: usize,
+    fingerprint: fn(&[u8]) -> u64,
+    names: Vec<u8>,
+    keys: Vec<Key>,
+    runs: Vec<PathBuf>,
+    created: usize,
+}
+
+impl<'a> RunSorter<'a> {
+    fn new(
+        spill: &'a SpillDir,
+        prefix: &'static str,
+        memory_limit: usize,
+        threads: usize,
+        fingerprint: fn(&[u8]) -> u64,
+    ) -> Self {
+        RunSorter {
+            spill,
+            prefix,
+            memory_limit,
+            threads,
+            fingerprint,
+            names: Vec::new(),
+            keys: Vec::new(),
+            runs: Vec::new(),
+            created: 0,
+        }
+    }
+
+    fn push(
+        &mut self,
+        name: &[u8],
+        order: u64,
+        value: u32,
+    ) -> Result<(), PathoscopeError> {
+        let held = self.names.len() + name.len() + (self.keys.len() + 1) * KEY_BYTES;
+
+        if !self.keys.is_empty() && held > self.memory_limit {
+            self.spill()?;
+        }
+
+        self.keys.push(Key {
+            fingerprint: (self.fingerprint)(name),
+            order,
+            start: self.names.len(),
+            len: name.len() as u32,
+            value,
+        });
+
+        self.names.extend_from_slice(name);
+
+        Ok(())
+    }
+
+    /// Sort the buffer, a slice per thread, and write it as one run by merging
+    /// the sorted slices.
+    fn spill(&mut self) -> Result<(), PathoscopeError> {
+        let path = self.next_run();
+        let names = &self.names;
+        let name = |key: &Key| &names[key.start..key.start + key.len as usize];
+        let compare = |a: &Key, b: &Key| {
+            a.fingerprint
+                .cmp(&b.fingerprint)
+                .then_with(|| name(a).cmp(name(b)))
+                .then(a.order.cmp(&b.order))
+        };
+
+        let slice_len = self.keys.len().div_ceil(self.threads).max(1);
+
+        thread::scope(|scope| {
+            for slice in self.keys.chunks_mut(slice_len) {
+                scope.spawn(move || slice.sort_unstable_by(compare));
+            }
+        });
+
+        let mut writer = RunWriter::create(path)?;
+        let mut heads: BinaryHeap<Reverse<(Head, usize)>> = BinaryHeap::new();
+        let mut slices: Vec<_> =
+            self.keys.chunks(slice_len).map(|s| s.iter()).collect();
+
+        for (position, slice) in slices.iter_mut().enumerate() {
+            if let Some(&key) = slice.next() {
+                heads.push(Reverse((Head::new(key, names), position)));
+            }
+        }
+
+        while let Some(Reverse((head, position))) = heads.pop() {
+            writer.write_key(&head.key, head.name)?;
+
+            if let Some(&key) = slices[position].next() {
+                heads.push(Reverse((Head::new(key, names), position)));
+            }
+        }
+
+        self.runs.push(writer.finish()?);
+        self.names.clear();
+        self.keys.clear();
+
+        Ok(())
+    }
+
+    fn next_run(&mut self) -> PathBuf {
+        self.created += 1;
+        self.spill.run(&format!("{}.{}", self.prefix, self.created))
+    }
+
+    /// Spill what is left and merge every run into one sorted stream.
+    fn finish(mut self) -> Result<Merged, PathoscopeError> {
+        if !self.keys.is_empty() || self.runs.is_empty() {
+            self.spill()?;
+        }
+
+        // Free the buffer before the merge starts reading.
+        self.names = Vec::new();
+        self.keys = Vec::new();
+
+        let mut runs = std::mem::take(&mut self.runs);
+
+        info!("{}: merging {} sorted runs", self.prefix, runs.len());
+
+        while runs.len() > MAX_FAN_IN {
+            let group: Vec<PathBuf> = runs.drain(..MAX_FAN_IN).collect();
+            let mut merged = Merged::open(group.clone())?;
+            let mut writer = RunWriter::create(self.next_run())?;
+
+            while let Some(entry) = merged.next_entry()? {
+                writer.write(&entry)?;
+            }
+
+            runs.push(writer.finish()?);
+
+            for run in group {
+                std::fs::remove_file(run)?;
+            }
+        }
+
+        Merged::open(runs)
+    }
+}
+
+/// A buffered key with its name, ordered as it is written to a run.
+struct Head<'a> {
+    key: Key,
+    name: &'a [u8],
+}
+
+impl<'a> Head<'a> {
+    fn new(key: Key, names: &'a [u8]) -> Self {
+        Head {
+            key,
+            name: &names[key.start..key.start + key.len as usize],
+        }
+    }
+}
+
+impl Ord for Head<'_> {
+    fn cmp(&self, other: &Self) -> Ordering {
+        self.key
+            .fingerprint
+            .cmp(&other.key.fingerprint)
+            .then_with(|| self.name.cmp(other.name))
+            .then(self.key.order.cmp(&other.key.order))
+    }
+}
+
+impl PartialOrd for Head<'_> {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl PartialEq for Head<'_> {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
+}
+
+impl Eq for Head<'_> {}
+
+/// Writes entries to a run: fingerprint, order, value and name length, then
+/// the name, all little-endian.
+struct RunWriter {
+    path: PathBuf,
+    writer: BufWriter<File>,
+}
+
+impl RunWriter {
+    fn create(path: PathBuf) -> Result<Self, PathoscopeError> {
+        let writer = BufWriter::new(File::create(&path)?);
+
+        Ok(RunWriter { path, writer })
+    }
+
+    fn write_key(&mut self, key: &Key, name: &[u8]) -> Result<(), PathoscopeError> {
+        self.writer.write_all(&key.fingerprint.to_le_bytes())?;
+        self.writer.write_all(&key.order.to_le_bytes())?;
+        self.writer.write_all(&key.value.to_le_bytes())?;
+        self.writer.write_all(&key.len.to_le_bytes())?;
+        self.writer.write_all(name)?;
+
+        Ok(())
+    }
+
+    fn write(&mut self, entry: &Entry) -> Result<(), PathoscopeError> {
+        let key = Key {
+            fingerprint: entry.fingerprint,
+            order: entry.order,
+            start: 0,
+            len: entry.name.len() as u32,
+            value: entry.value,
+        };
+
+        self.write_key(&key, &entry.name)
+    }
+
+    fn finish(mut self) -> Result<PathBuf, PathoscopeError> {
+        self.writer.flush()?;
+
+        Ok(self.path)
+    }
+}
+
+struct RunReader {
+    reader: BufReader<File>,
+}
+
+impl RunReader {
+    fn next_entry(&mut self) -> Result<Option<Entry>, PathoscopeError> {
+        let mut fixed = [0u8; 24];
+
+        // A run ends on an entry boundary, so EOF can only come first.
+        match self.reader.read_exact(&mut fixed[..8]) {
+            Ok(()) => {}
+            Err(err) if err.kind() == std::io::ErrorKind::UnexpectedEof => {
+                return Ok(None)
+            }
+            Err(err) => return Err(err.into()),
+        }
+
+        self.reader.read_exact(&mut fixed[8..])?;
+
+        let fingerprint = u64::from_le_bytes(fixed[0..8].try_into().unwrap());
+        let order = u64::from_le_bytes(fixed[8..16].try_into().unwrap());
+        let value = u32::from_le_bytes(fixed[16..20].try_into().unwrap());
+        let len = u32::from_le_bytes(fixed[20..24].try_into().unwrap());
+
+        let mut name = vec![0u8; len as usize];
+        self.reader.read_exact(&mut name)?;
+
+        Ok(Some(Entry {
+            fingerprint,
+            name,
+            order,
+            value,
+        }))
+    }
+}
+
+/// The entries of several sorted runs, in one sorted stream.
+struct Merged {
+    readers: Vec<RunReader>,
+    heads: BinaryHeap<Reverse<MergeHead>>,
+    pending: Option<Entry>,
+}
+
+struct MergeHead {
+    entry: Entry,
+    run: usize,
+}
+
+impl Ord for MergeHead {
+    fn cmp(&self, other: &Self) -> Ordering {
+        self.entry.run_cmp(&other.entry)
+    }
+}
+
+impl PartialOrd for MergeHead {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl PartialEq for MergeHead {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
+}
+
+impl Eq for MergeHead {}
+
+impl Merged {
+    fn open(runs: Vec<PathBuf>) -> Result<Self, PathoscopeError> {
+        let mut readers = Vec::with_capacity(runs.len());
+        let mut heads = BinaryHeap::with_capacity(runs.len());
+
+        for (run, path) in runs.iter().enumerate() {
+            let mut reader = RunReader {
+                reader: BufReader::new(File::open(path)?),
+            };
+
+            if let Some(entry) = reader.next_entry()? {
+                heads.push(Reverse(MergeHead { entry, run }));
+            }
+
+            readers.push(reader);
+        }
+
+        Ok(Merged {
+            readers,
+            heads,
+            pending: None,
+        })
+    }
+
+    fn next_entry(&mut self) -> Result<Option<Entry>, PathoscopeError> {
+        if let Some(entry) = self.pending.take() {
+            return Ok(Some(entry));
+        }
+
+        let Some(Reverse(MergeHead { entry, run })) = self.heads.pop() else {
+            return Ok(None);
+        };
+
+        if let Some(next) = self.readers[run].next_entry()? {
+            self.heads.push(Reverse(MergeHead { entry: next, run }));
+        }
+
+        Ok(Some(entry))
+    }
+
+    /// The last entry of the next run of entries with one name: the last
+    /// subtraction record for a read, whose score `subtraction.rs`'s map keeps.
+    fn next_group(&mut self) -> Result<Option<Entry>, PathoscopeError> {
+        let Some(mut last) = self.next_entry()? else {
+            return Ok(None);
+        };
+
+        while let Some(entry) = self.next_entry()? {
+            if entry.key_cmp(&last) != Ordering::Equal {
+                self.pending = Some(entry);
+                break;
+            }
+
+            last = entry;
+        }
+
+        Ok(Some(last))
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::subtraction::eliminate_subtraction;
+    use std::path::Path;
+
+    fn fixture(name: &str) -> String {
+        format!("{}/tests/fixtures/{name}", env!("CARGO_MANIFEST_DIR"))
+    }
+
+    const CASES: [(&str, &str, &str); 3] = [
+        (
+            "test_isolates_minimal.sam",
+            "test_subtraction_minimal.sam",
+            "subtraction_minimal_reads.fq",
+        ),
+        (
+            "to_subtraction.sam",
+            "test_subtraction_minimal.sam",
+            "to_subtraction_reads.fq",
+        ),
+        (
+            "test_isolates_minimal.sam",
+            "to_subtraction.sam",
+            "subtraction_minimal_reads.fq",
+        ),
+    ];
+
+    /// Every case, at budgets from one name per run to everything in one, and
+    /// with every name given the same fingerprint, writes exactly what the
+    /// frozen pass writes.
+    #[test]
+    fn test_matches_the_frozen_pass() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let path = |name: &str| temp.path().join(name).to_string_lossy().into_owned();
+
+        for (isolate, subtraction, fastq) in CASES {
+            let want = eliminate_subtraction(
+                &fixture(isolate),
+                &fixture(subtraction),
+                &path("want.bam"),
+                &fixture(fastq),
+                &path("want.fq"),
+                2,
+            )
+            .unwrap();
+
+            let collide: fn(&[u8]) -> u64 = |_| 7;
+
+            for (memory_limit, fingerprint) in [
+                (0, fingerprint as fn(&[u8]) -> u64),
+                (256, fingerprint),
+                (1 << 20, fingerprint),
+                (256, collide),
+            ] {
+                let got = eliminate(
+                    &Inputs {
+                        isolate: &fixture(isolate),
+                        subtraction: &fixture(subtraction),
+                        output_alignments: &path("got.bam"),
+                        input_fastq: &fixture(fastq),
+                        output_fastq: &path("got.fq"),
+                    },
+                    2,
+                    memory_limit,
+                    fingerprint,
+                )
+                .unwrap();
+
+                let case = format!("{isolate} - {subtraction} @ {memory_limit}");
+
+                assert_eq!(want, got, "{case}: subtracted count differs");
+                assert_eq!(
+                    std::fs::read(path("want.bam")).unwrap(),
+                    std::fs::read(path("got.bam")).unwrap(),
+                    "{case}: alignments differ"
+                );
+                assert_eq!(
+                    std::fs::read(path("want.fq")).unwrap(),
+                    std::fs::read(path("got.fq")).unwrap(),
+                    "{case}: FASTQ differs"
+                );
+                assert!(
+                    !Path::new(&format!("{}.spill", path("got.bam"))).exists(),
+                    "{case}: the spill directory was left behind"
+                );
+            }
+        }
+    }
+
+    /// A name spilled many times keeps its last value, across runs and across
+    /// the merge passes that more than `MAX_FAN_IN` runs need.
+    #[test]
+    fn test_merge_keeps_the_last_value_per_name() {
+        let temp = tempfile::TempDir::new().unwrap();
+        let spill =
+            SpillDir::create(&temp.path().join("spill").to_string_lossy()).unwrap();
+        let mut sorter = RunSorter::new(&spill, "test", 0, 3, fingerprint);
+
+        for order in 0..(MAX_FAN_IN as u64 * 3) {
+            let name = format!("read{}", order % 5);
+            sorter.push(name.as_bytes(), order, order as u32).unwrap();
+        }
+
+        let mut merged = sorter.finish().unwrap();
+        let mut groups = Vec::new();
+
+        while let Some(entry) = merged.next_group().unwrap() {
+            groups.push((String::from_utf8(entry.name).unwrap(), entry.value));
+        }
+
+        groups.sort();
+
+        let last = MAX_FAN_IN as u32 * 3 - 1;
+
+        assert_eq!(
+            groups,
+            (0..5)
+                .map(|read| {
+                    let value = last - (last - read) % 5;
+                    (format!("read{read}"), value)
+                })
+                .collect::<Vec<_>>()
+        );
+    }
+}
@@ -1,6 +1,13 @@
 use crate::PathoscopeError;
 use log::info;
 use std::collections::HashSet;
+use std::fs;
+use std::io::{self, BufRead, BufReader};
+use std::os::unix::process::CommandExt;
+use std::process::{Child, ChildStdout, Command, Stdio};
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::sync::Mutex;
+use std::thread;
 
 const AS_TAG_PREFIX: &str = "AS:i:";
 
@@ -94,14 +101,130 @@ pub fn find_candidate_otus_with_bowtie2(
     proc: u32,
     p_score_cutoff: f64,
 ) -> Result<HashSet<String>, PathoscopeError> {
-    use std::io::{BufRead, BufReader};
-    use std::process::{Command, Stdio};
+    find_candidate_otus_sharded(bowtie_index_path, read_paths, proc, p_score_cutoff, 1)
+}
+
+/// Extract candidate OTU reference IDs with up to `shards` bowtie2 processes at once
+///
+/// The read files are dealt round-robin into shards, each aligned by its own
+/// bowtie2 and parsed on its own thread, and the shards' candidates are merged
+/// into one set. The result is the set a single bowtie2 over every file finds:
+/// bowtie2 seeds its randomness per read, so which process aligns a read never
+/// changes where it aligns, and a union does not care which shard found what.
+///
+/// The shards share `proc` between them, so there are never more shards than
+/// threads or read files. With one shard this is exactly
+/// [`find_candidate_otus_with_bowtie2`].
+///
+/// Every bowtie2 SAM header lists every reference in the index. Once the set
+/// holds all of them no further read can change it, so every bowtie2 still
+/// running is killed and the set returned as it stands.
+///
+/// # Arguments
+/// * `bowtie_index_path` - Path to the bowtie2 index
+/// * `read_paths` - List of paths to the input read files
+/// * `proc` - Number of processor threads shared by every bowtie2
+/// * `p_score_cutoff` - Minimum score threshold (AS:i score + read length)
+/// * `shards` - The most bowtie2 processes to run at once
+///
+/// # Returns
+/// Set of reference IDs that have reads meeting the score cutoff
+pub fn find_candidate_otus_sharded(
+    bowtie_index_path: &str,
+    read_paths: Vec<String>,
+    proc: u32,
+    p_score_cutoff: f64,
+    shards: u32,
+) -> Result<HashSet<String>, PathoscopeError> {
+    let shards = partition_reads(&read_paths, proc, shards);
 
     info!(
-        "running bowtie2: index={}, reads={:?}, cutoff={}",
-        bowtie_index_path, read_paths, p_score_cutoff
+        "running bowtie2: index={}, reads={:?}, cutoff={}, shards={}",
+        bowtie_index_path,
+        read_paths,
+        p_score_cutoff,
+        shards.len()
     );
 
+    let mut children = Vec::with_capacity(shards.len());
+    let mut stdouts = Vec::with_capacity(shards.len());
+
+    for (reads, threads) in &shards {
+        info!(
+            "spawning bowtie2 process: reads={:?}, threads={}",
+            reads, threads
+        );
+
+        match bowtie2_command(bowtie_index_path, reads, *threads).spawn() {
+            Ok(mut child) => {
+                stdouts.push(child.stdout.take().unwrap());
+                children.push(Mutex::new(child));
+            }
+            Err(err) => {
+                for child in &children {
+                    let mut child = child.lock().unwrap();
+                    kill(&mut child);
+                    let _ = child.wait();
+                }
+
+                return Err(err.into());
+            }
+        }
+    }
+
+    let search = Search {
+        p_score_cutoff,
+        children: &children,
+        candidates: Mutex::new(HashSet::new()),
+        references: AtomicUsize::new(0),
+        stopped: AtomicBool::new(false),
+        error: Mutex::new(None),
+    };
+
+    let counts: Vec<(u64, u64)> = thread::scope(|scope| {
+        let readers: Vec<_> = stdouts
+            .into_iter()
+            .enumerate()
+            .map(|(shard, stdout)| {
+                let search = &search;
+                scope.spawn(move || read_shard(search, shard, stdout))
+            })
+            .collect();
+
+        readers
+            .into_iter()
+            .map(|reader| reader.join().expect("a shard reader panicked"))
+            .collect()
+    });
+
+    if let Some(err) = search.error.into_inner().unwrap() {
+        return Err(err);
+    }
+
+    let candidate_otus = search.candidates.into_inner().unwrap();
+    let (line_count, passing_count) = counts
+        .iter()
+        .fold((0, 0), |(lines, passing), (l, p)| (lines + l, passing + p));
+
+    info!(
+        "processed {} sam lines, {} passed cutoff, found {} unique otus",
+        line_count,
+        passing_count,
+        candidate_otus.len()
+    );
+
+    Ok(candidate_otus)
+}
+
+/// Build the bowtie2 invocation for one shard.
+///
+/// The alignment flags are part of what the golden `candidates` vectors pin;
+/// only `-p` and the read files vary between shards.
+fn bowtie2_command(
+    bowtie_index_path: &str,
+    read_paths: &[String],
+    proc: u32,
+) -> Command {
     let mut cmd = Command::new("bowtie2");
     cmd.arg("-p")
         .arg(proc.to_string())
@@ -120,56 +243,298 @@ pub fn find_candidate_otus_with_bowtie2(
         .stdout(Stdio::piped())
         .stderr(Stdio::piped());
 
-    info!("spawning bowtie2 process");
-    let mut child = cmd.spawn()?;
+    die_with_parent(&mut cmd);
+
+    cmd
+}
+
+/// Have the process `cmd` spawns killed when this one dies.
+///
+/// bowtie2 stays in this process's group, so the workflow, which cancels a
+/// run by signalling its whole group, stops bowtie2 with it. This covers a
+/// kill aimed at this process alone: the wrapper is killed with it, and the
+/// aligner then dies on its next write to the pipe no one reads.
+#[cfg(target_os = "linux")]
+fn die_with_parent(cmd: &mut Command) {
+    // SAFETY: `getpid` has no preconditions.
+    let parent = unsafe { libc::getpid() };
+
+    // SAFETY: the closure runs between fork and exec, and calls only `prctl`
+    // and `getppid`, which are async-signal-safe, and allocates nothing.
+    unsafe {
+        cmd.pre_exec(move || {
+            if libc::prctl(libc::PR_SET_PDEATHSIG, libc::SIGKILL) == -1 {
+                return Err(io::Error::last_os_error());
+            }
+
+            // This process died before the signal was asked for.
+            if libc::getppid() != parent {
+                return Err(io::Error::from_raw_os_error(libc::ESRCH));
+            }
+
+            Ok(())
+        });
+    }
+}
+
+#[cfg(not(target_os = "linux"))]
+fn die_with_parent(_cmd: &mut Command) {}
+
+/// Kill a bowtie2 that is still running, and everything it started.
+///
+/// `bowtie2` is a Perl wrapper around the aligner binary it spawns, and the
+/// aligner holds the SAM pipe open: killing the wrapper alone would leave the
+/// shard's reader blocked until the aligner finished anyway. bowtie2 shares
+/// this process's group, so the group cannot be signalled; the wrapper's
+/// descendants are killed by pid instead, then the wrapper. A child that has
+/// already been reaped is left alone, since its pid may be reused.
+fn kill(child: &mut Child) {
+    if let Ok(None) = child.try_wait() {
+        for pid in descendants(child.id()) {
+            // SAFETY: `kill` has no memory-safety preconditions. The wrapper
+            // is not reaped, so its descendants' pids are not yet reused.
+            unsafe {
+                libc::kill(pid as libc::pid_t, libc::SIGKILL);
+            }
+        }
+
+        let _ = child.kill();
+    }
+}
+
+/// Every process descended from `pid`, as `/proc` lists them.
+///
+/// Empty where there is no `/proc` to read, which leaves only the wrapper to
+/// be killed.
+fn descendants(pid: u32) -> Vec<u32> {
+    let Ok(entries) = fs::read_dir("/proc") else {
+        return Vec::new();
+    };
+
+    // (pid, parent pid) for every process. The parent is the second field
+    // after the command name, which is parenthesised and may hold spaces.
+    let processes: Vec<(u32, u32)> = entries
+        .filter_map(|entry| {
+            let pid: u32 = entry.ok()?.file_name().to_str()?.parse().ok()?;
+            let stat = fs::read_to_string(format!("/proc/{pid}/stat")).ok()?;
+            let parent = stat.rsplit_once(')')?.1.split_whitespace().nth(1)?;
+
+            Some((pid, parent.parse().ok()?))
+        })
+        .collect();
+
+    let mut found = vec![pid];
+    let mut next = 0;
+
+    while next < found.len() {
+        let parent = found[next];
+
+        found.extend(
+            processes
+                .iter()
+                .filter(|&&(_, ppid)| ppid == parent)
+                .map(|&(pid, _)| pid),
+        );
+        next += 1;
+    }
+
+    found.split_off(1)
+}
+
+/// Deal `read_paths` round-robin into shards, each with its share of `proc`.
+///
+/// There are at most as many shards as `shards`, read files and threads, and
+/// always at least one. Threads are split as evenly as they go, earlier shards
+/// taking the remainder.
+fn partition_reads(
+    read_paths: &[String],
+    proc: u32,
+    shards: u32,
+) -> Vec<(Vec<String>, u32)> {
+    let count = (shards as usize)
+        .min(read_paths.len())
+        .min(proc.max(1) as usize)
+        .max(1);
+
+    let mut partitions: Vec<(Vec<String>, u32)> = (0..count)
+        .map(|shard| {
+            let threads = proc.max(1) / count as u32
+                + u32::from((shard as u32) < proc.max(1) % count as u32);
+
+            (Vec::new(), threads)
+        })
+        .collect();
+
+    for (position, path) in read_paths.iter().enumerate() {
+        partitions[position % count].0.push(path.clone());
+    }
+
+    partitions
+}
+
+/// Read the reference name from an `@SQ` header line, if `line` is one.
+fn parse_sq_line(line: &str) -> Option<&str> {
+    line.strip_prefix("@SQ\t")?
+        .split('\t')
+        .find_map(|field| field.strip_prefix("SN:"))
+}
+
+/// The state one candidate search shares between its shards.
+struct Search<'a> {
+    p_score_cutoff: f64,
+    children: &'a [Mutex<Child>],
+    candidates: Mutex<HashSet<String>>,
 
-    let stdout = child.stdout.take().unwrap();
-    let reader = BufReader::new(stdout);
+    /// The number of references in the index, or zero until a shard has read
+    /// the whole of its SAM header.
+    references: AtomicUsize,
 
-    let mut candidate_otus = HashSet::new();
+    /// Set once every bowtie2 has been killed, whether because the set is
+    /// complete or because a shard failed.
+    stopped: AtomicBool,
+
+    /// The first failure, which is the search's result.
+    error: Mutex<Option<PathoscopeError>>,
+}
+
+impl Search<'_> {
+    /// Kill every bowtie2, so every shard reader reaches the end of its output.
+    fn stop(&self) {
+        self.stopped.store(true, Ordering::SeqCst);
+
+        for child in self.children {
+            kill(&mut child.lock().unwrap());
+        }
+    }
+
+    /// Stop once `candidates` holds every reference in the index.
+    fn stop_if_complete(&self, candidates: &HashSet<String>) {
+        let references = self.references.load(Ordering::SeqCst);
+
+        if references > 0 && candidates.len() >= references {
+            info!(
+                "all {} references are candidates; stopping bowtie2",
+                references
+            );
+            self.stop();
+        }
+    }
+
+    /// Record the number of references in the index from a shard's header.
+    fn publish_references(&self, references: usize) {
+        self.references.fetch_max(references, Ordering::SeqCst);
+        self.stop_if_complete(&self.candidates.lock().unwrap());
+    }
+
+    /// Merge one candidate into the shared set.
+    fn insert(&self, reference: String) {
+        let mut candidates = self.candidates.lock().unwrap();
+
+        if candidates.insert(reference) {
+            self.stop_if_complete(&candidates);
+        }
+    }
+
+    /// Fail the search with `err`, unless it has already stopped.
+    ///
+    /// A bowtie2 killed by [`Search::stop`] exits abnormally, and that is not a
+    /// failure: the set is complete, or another shard's failure is the result.
+    fn fail(&self, err: PathoscopeError) {
+        let mut error = self.error.lock().unwrap();
+
+        if error.is_none() && !self.stopped.load(Ordering::SeqCst) {
+            *error = Some(err);
+        }
+
+        drop(error);
+        self.stop();
+    }
+}
+
+/// Stream one shard's SAM output into the search, returning its line and
+/// passing counts.
+fn read_shard(search: &Search, shard: usize, stdout: ChildStdout) -> (u64, u64) {
     let mut line_count = 0u64;
     let mut passing_count = 0u64;
+    let mut references = 0usize;
+    let mut in_header = true;
+
+    // This shard's own candidates, so the shared set is locked once per new
+    // reference rather than once per passing line.
+    let mut found: HashSet<String> = HashSet::new();
 
-    for line_result in reader.lines() {
-        let line = line_result?;
+    for line_result in BufReader::new(stdout).lines() {
+        if search.stopped.load(Ordering::Relaxed) {
+            break;
+        }
+
+        let line = match line_result {
+            Ok(line) => line,
+            Err(err) => {
+                search.fail(err.into());
+                break;
+            }
+        };
 
         line_count += 1;
 
-        // Use the extracted SAM parsing function
-        if let Some(ref_name) = parse_sam_line(&line, p_score_cutoff) {
-            candidate_otus.insert(ref_name);
+        if in_header {
+            if parse_sq_line(&line).is_some() {
+                references += 1;
+                continue;
+            }
+
+            if !line.starts_with('@') {
+                in_header = false;
+                search.publish_references(references);
+            }
+        }
+
+        if let Some(ref_name) = parse_sam_line(&line, search.p_score_cutoff) {
             passing_count += 1;
+
+            if !found.contains(&ref_name) {
+                found.insert(ref_name.clone());
+                search.insert(ref_name);
+            }
         }
     }
 
-    // Wait for bowtie2 to finish and check exit status
-    let status = child.wait()?;
-
-    if !status.success() {
-        // Read stderr for error details
-        let stderr_output = if let Some(mut stderr) = child.stderr.take() {
-            let mut buf = String::new();
-            let _ = std::io::Read::read_to_string(&mut stderr, &mut buf);
-            buf
-        } else {
-            "Unknown error".to_string()
-        };
+    // Wait for bowtie2 to finish and check exit status. A reader that stopped
+    // early kills its own bowtie2 rather than wait for `stop` to reach it.
+    let mut child = search.children[shard].lock().unwrap();
 
-        return Err(PathoscopeError::Bowtie2(format!(
-            "bowtie2 failed with exit code {:?}: {}",
-            status.code(),
-            stderr_output
-        )));
+    if search.stopped.load(Ordering::SeqCst) {
+        kill(&mut child);
     }
 
-    info!(
-        "processed {} sam lines, {} passed cutoff, found {} unique otus",
-        line_count,
-        passing_count,
-        candidate_otus.len()
-    );
+    match child.wait() {
+        Ok(status) if !status.success() => {
+            // Read stderr for error details
+            let stderr_output = if let Some(mut stderr) = child.stderr.take() {
+                let mut buf = String::new();
+                let _ = std::io::Read::read_to_string(&mut stderr, &mut buf);
+                buf
+            } else {
+                "Unknown error".to_string()
+            };
+
+            drop(child);
+
+            search.fail(PathoscopeError::Bowtie2(format!(
+                "bowtie2 failed with exit code {:?}: {}",
+                status.code(),
+                stderr_output
+            )));
+        }
+        Ok(_) => {}
+        Err(err) => {
+            drop(child);
+            search.fail(err.into());
+        }
+    }
 
-    Ok(candidate_otus)
+    (line_count, passing_count)
 }
 
 #[cfg(test)]
@@ -220,4 +585,120 @@ mod tests {
         // Header line, should return None
         assert_eq!(result, None);
     }
+
+    #[test]
+    fn test_parse_sq_line() {
+        assert_eq!(parse_sq_line("@SQ\tSN:ref1\tLN:1000"), Some("ref1"));
+        assert_eq!(parse_sq_line("@SQ\tLN:1000\tSN:ref2"), Some("ref2"));
+        assert_eq!(parse_sq_line("@HD\tVN:1.0\tSO:unsorted"), None);
+        assert_eq!(parse_sq_line("read1\t0\tref1"), None);
+    }
+
+    fn paths(count: usize) -> Vec<String> {
+        (0..count)
+            .map(|index| format!("reads_{index}.fq"))
+            .collect()
+    }
+
+    #[test]
+    fn test_partition_reads_one_shard_takes_everything() {
+        assert_eq!(
+            partition_reads(&paths(3), 8, 1),
+            vec![(paths(3), 8)],
+            "one shard is the unsharded invocation"
+        );
+    }
+
+    #[test]
+    fn test_partition_reads_deals_round_robin() {
+        assert_eq!(
+            partition_reads(&paths(4), 8, 2),
+            vec![
+                (vec!["reads_0.fq".into(), "reads_2.fq".into()], 4),
+                (vec!["reads_1.fq".into(), "reads_3.fq".into()], 4),
+            ]
+        );
+    }
+
+    #[test]
+    fn test_partition_reads_splits_threads_with_remainder() {
+        let threads: Vec<u32> = partition_reads(&paths(3), 8, 3)
+            .into_iter()
+            .map(|(_, threads)| threads)
+            .collect();
+
+        assert_eq!(threads, vec![3, 3, 2]);
+    }
+
+    #[test]
+    fn test_partition_reads_is_bounded() {
+        for (files, proc, shards, expected) in [
+            (2, 8, 4, 2), // never more shards than read files
+            (4, 2, 4, 2), // never more shards than threads
+            (4, 8, 0, 1), // always at least one
+            (0, 8, 4, 1), // even with nothing to read
+        ] {
+            let partitions = partition_reads(&paths(files), proc, shards);
+
+            assert_eq!(
+                partitions.len(),
+                expected,
+                "{files} files, {proc} proc, {shards} shards"
+            );
+            assert!(partitions.iter().all(|(_, threads)| *threads >= 1));
+            assert_eq!(
+                partitions.iter().map(|(_, threads)| threads).sum::<u32>(),
+                proc
+            );
+        }
+    }
+
+    /// Whether `pid` is a process that has not exited. A zombie has.
+    fn running(pid: u32) -> bool {
+        fs::read_to_string(format!("/proc/{pid}/stat"))
+            .ok()
+            .and_then(|stat| {
+                let state = stat.rsplit_once(')')?.1.split_whitespace().next()?;
+                Some(state != "Z")
+            })
+            .unwrap_or(false)
+    }
+
+    #[test]
+    #[cfg(target_os = "linux")]
+    fn test_kill_stops_the_wrapper_and_what_it_started() {
+        // A wrapper that, like bowtie2's, runs the real work in a child.
+        let mut cmd = Command::new("sh");
+        cmd.args(["-c", "sleep 60 & echo $!; wait"])
+            .stdout(Stdio::piped());
+        die_with_parent(&mut cmd);
+
+        let mut child = cmd.spawn().unwrap();
+        let mut line = String::new();
+        BufReader::new(child.stdout.take().unwrap())
+            .read_line(&mut line)
+            .unwrap();
+        let sleeper: u32 = line.trim().parse().unwrap();
+
+        // SAFETY: `getpgid` has no memory-safety preconditions.
+        let (ours, theirs) =
+            unsafe { (libc::getpgid(0), libc::getpgid(child.id() as libc::pid_t)) };
+
+        assert_eq!(
+            ours, theirs,
+            "a group signal to this process must reach bowtie2"
+        );
+        assert_eq!(descendants(child.id()), [sleeper]);
+
+        kill(&mut child);
+        child.wait().unwrap();
+
+        let deadline = std::time::Instant::now() + std::time::Duration::from_secs(5);
+
+        while running(sleeper) && std::time::Instant::now() < deadline {
+            thread::sleep(std::time::Duration::from_millis(10));
+        }
+
+        assert!(!running(sleeper), "the wrapper's child outlived it");
+    }
 }
@@ -0,0 +1,259 @@
+//! Coverage written as runs of equal depth instead of one entry per position.
+//!
+//! An `em` results file carries a coverage array per reference, as long as the
+//! reference. On a 50 kb reference nearly all of it is zeros, so the file and
+//! the time to parse it grow with reference length rather than with the bases
+//! actually covered. With `--coverage-encoding intervals` each reference is
+//! written as its length and the runs of non-zero depth it holds:
+//!
+//! ```json
+//! {"length": 50000, "intervals": [[1200, 1275, 1], [1275, 1290, 2]]}
+//! ```
+//!
+//! Each interval is `[start, end, depth]`, zero-based and half-open, in
+//! ascending order and never overlapping. A position no interval covers has a
+//! depth of zero. Adjacent positions of equal depth always share an interval.
+//!
+//! The runs are found as each reference is written, straight from the dense
+//! array `calculate_coverage_from_bam` produced, so no encoded copy of the
+//! coverage is ever held. [`ReferenceIntervals::decode`]
+//! rebuilds that dense array exactly; the golden harness holds the decoded
+//! coverage of every `em` vector to the corpus.
+
+use crate::{PathoscopeError, PathoscopeResults};
+use rustc_hash::FxHashMap;
+use serde::ser::{SerializeMap, SerializeStruct};
+use serde::{Deserialize, Serialize, Serializer};
+
+/// The `em` results file with coverage written as intervals.
+///
+/// Every field but `coverage` is written as [`PathoscopeResults`] writes it.
+/// `coverage_encoding` marks the file so a reader cannot mistake it for a
+/// dense one.
+#[derive(Serialize)]
+pub struct IntervalResults<'a> {
+    best_hit_initial_reads: &'a [f64],
+    best_hit_initial: &'a [f64],
+    level_1_initial: &'a [f64],
+    level_2_initial: &'a [f64],
+    best_hit_final_reads: &'a [f64],
+    best_hit_final: &'a [f64],
+    level_1_final: &'a [f64],
+    level_2_final: &'a [f64],
+    init_pi: &'a [f64],
+    pi: &'a [f64],
+    refs: &'a [String],
+    read_count: usize,
+    coverage_encoding: &'static str,
+    coverage: IntervalCoverage<'a>,
+}
+
+impl<'a> IntervalResults<'a> {
+    pub fn new(results: &'a PathoscopeResults) -> Self {
+        IntervalResults {
+            best_hit_initial_reads: &results.best_hit_initial_reads,
+            best_hit_initial: &results.best_hit_initial,
+            level_1_initial: &results.level_1_initial,
+            level_2_initial: &results.level_2_initial,
+            best_hit_final_reads: &results.best_hit_final_reads,
+            best_hit_final: &results.best_hit_final,
+            level_1_final: &results.level_1_final,
+            level_2_final: &results.level_2_final,
+            init_pi: &results.init_pi,
+            pi: &results.pi,
+            refs: &results.refs,
+            read_count: results.read_count,
+            coverage_encoding: "intervals",
+            coverage: IntervalCoverage(&results.coverage),
+        }
+    }
+}
+
+/// Every reference's coverage, encoded as it is written.
+struct IntervalCoverage<'a>(&'a FxHashMap<String, Vec<usize>>);
+
+impl Serialize for IntervalCoverage<'_> {
+    fn serialize<S: Serializer>(&self, serializer: S) -> Result<S::Ok, S::Error> {
+        let mut map = serializer.serialize_map(Some(self.0.len()))?;
+
+        for (reference, values) in self.0 {
+            map.serialize_entry(reference, &EncodedReference(values))?;
+        }
+
+        map.end()
+    }
+}
+
+/// One reference's dense coverage, written as a [`ReferenceIntervals`].
+struct EncodedReference<'a>(&'a [usize]);
+
+impl Serialize for EncodedReference<'_> {
+    fn serialize<S: Serializer>(&self, serializer: S) -> Result<S::Ok, S::Error> {
+        let mut reference = serializer.serialize_struct("ReferenceIntervals", 2)?;
+
+        reference.serialize_field("length", &self.0.len())?;
+        reference.serialize_field("intervals", &EncodedRuns(self.0))?;
+        reference.end()
+    }
+}
+
+struct EncodedRuns<'a>(&'a [usize]);
+
+impl Serialize for EncodedRuns<'_> {
+    fn serialize<S: Serializer>(&self, serializer: S) -> Result<S::Ok, S::Error> {
+        serializer.collect_seq(Runs {
+            values: self.0,
+            position: 0,
+        })
+    }
+}
+
+/// The `(start, end, depth)` runs of non-zero depth in a dense array.
+struct Runs<'a> {
+    values: &'a [usize],
+    position: usize,
+}
+
+impl Iterator for Runs<'_> {
+    type Item = (usize, usize, usize);
+
+    fn next(&mut self) -> Option<Self::Item> {
+        let start = self.position
+            + self.values[self.position..]
+                .iter()
+                .position(|&depth| depth != 0)?;
+        let depth = self.values[start];
+        let end = self.values[start..]
+            .iter()
+            .position(|&value| value != depth)
+            .map_or(self.values.len(), |offset| start + offset);
+
+        self.position = end;
+
+        Some((start, end, depth))
+    }
+}
+
+/// One reference's coverage as it is written with `--coverage-encoding
+/// intervals`.
+#[derive(Debug, Clone, PartialEq, Deserialize)]
+#[serde(deny_unknown_fields)]
+pub struct ReferenceIntervals {
+    pub length: usize,
+    pub intervals: Vec<(usize, usize, usize)>,
+}
+
+impl ReferenceIntervals {
+    /// Encode a dense coverage array.
+    pub fn encode(values: &[usize]) -> Self {
+        ReferenceIntervals {
+            length: values.len(),
+            intervals: Runs {
+                values,
+                position: 0,
+            }
+            .collect(),
+        }
+    }
+
+    /// Rebuild the dense coverage array these intervals were encoded from.
+    ///
+    /// Intervals that are empty, out of order, overlapping, past `length` or
+    /// of zero depth are rejected rather than decoded into a wrong array.
+    pub fn decode(&self) -> Result<Vec<usize>, PathoscopeError> {
+        let mut dense = vec![0; self.length];
+        let mut covered_to = 0;
+
+        for &(start, end, depth) in &self.intervals {
+            if start < covered_to || start >= end || end > self.length || depth == 0 {
+                return Err(PathoscopeError::Parse(format!(
+                    "invalid coverage interval [{start}, {end}, {depth}] for a \
+                     reference of length {}",
+                    self.length
+                )));
+            }
+
+            dense[start..end].fill(depth);
+            covered_to = end;
+        }
+
+        Ok(dense)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_encode_round_trips() {
+        for dense in [
+            vec![],
+            vec![0, 0, 0],
+            vec![3],
+            vec![1, 1, 2, 2, 2, 0, 0, 1],
+            vec![0, 5, 5, 0, 5, 4, 4, 4],
+        ] {
+            let encoded = ReferenceIntervals::encode(&dense);
+
+            assert!(encoded.intervals.iter().all(|&(_, _, depth)| depth != 0));
+            assert_eq!(encoded.decode().unwrap(), dense);
+        }
+
+        assert_eq!(
+            ReferenceIntervals::encode(&[0, 5, 5, 0, 5, 4, 4, 4]).intervals,
+            [(1, 3, 5), (4, 5, 5), (5, 8, 4)]
+        );
+    }
+
+    #[test]
+    fn test_decode_rejects_malformed_intervals() {
+        for intervals in [
+            vec![(2, 2, 1)],
+            vec![(0, 5, 1)],
+            vec![(0, 2, 0)],
+            vec![(2, 3, 1), (0, 1, 1)],
+            vec![(0, 2, 1), (1, 3, 1)],
+        ] {
+            let encoded = ReferenceIntervals {
+                length: 4,
+                intervals,
+            };
+
+            assert!(matches!(encoded.decode(), Err(PathoscopeError::Parse(_))));
+        }
+    }
+
+    #[test]
+    fn test_written_like_the_dense_results_but_for_coverage() {
+        let path = format!(
+            "{}/tests/fixtures/test_em_with_multimapping.sam",
+            env!("CARGO_MANIFEST_DIR")
+        );
+        let results = crate::run_expectation_maximization(&path, 0.01).unwrap();
+
+        let mut dense = serde_json::to_value(&results).unwrap();
+        let mut encoded = serde_json::to_value(IntervalResults::new(&results)).unwrap();
+
+        assert_eq!(encoded["coverage_encoding"], "intervals");
+
+        let coverage: FxHashMap<String, ReferenceIntervals> =
+            serde_json::from_value(encoded["coverage"].take()).unwrap();
+
+        assert!(!coverage.is_empty());
+
+        for (reference, intervals) in &coverage {
+            assert_eq!(
+                intervals.decode().unwrap(),
+                results.coverage[reference],
+                "{reference}"
+            );
+        }
+
+        dense.as_object_mut().unwrap().remove("coverage");
+        encoded.as_object_mut().unwrap().remove("coverage");
+        encoded.as_object_mut().unwrap().remove("coverage_encoding");
+
+        assert_eq!(dense, encoded);
+    }
+}
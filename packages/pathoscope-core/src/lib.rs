@@ -1,5 +1,9 @@
+mod alignments;
+pub mod batch;
+mod bounded_subtraction;
 pub mod candidates;
 mod coverage;
+pub mod coverage_intervals;
 mod em;
 mod matrix;
 mod sam;
@@ -7,7 +11,7 @@ pub mod subtraction;
 
 use em::{compute_best_hit, em};
 use log::info;
-use serde::Serialize;
+use serde::{Deserialize, Serialize};
 use thiserror::Error;
 
 use rustc_hash::FxHashMap;
@@ -29,9 +33,15 @@ pub enum PathoscopeError {
 
     #[error("bowtie2 error: {0}")]
     Bowtie2(String),
+
+    #[error("Batch error: {0}")]
+    Batch(String),
 }
 
 use std::collections::HashSet;
+use std::fs::File;
+use std::io::{BufWriter, Write};
+use std::path::Path;
 
 use crate::coverage::calculate_coverage_from_bam;
 
@@ -71,6 +81,54 @@ pub struct PathoscopeResults {
     pub coverage: FxHashMap<String, Vec<usize>>,
 }
 
+/// The `eliminate-subtraction` results file.
+#[derive(Serialize)]
+pub struct SubtractionSummary {
+    pub subtracted: usize,
+}
+
+/// How an `em` results file writes `coverage`.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq, Deserialize)]
+#[serde(rename_all = "snake_case")]
+pub enum CoverageEncoding {
+    /// One depth per position of each reference, as [`PathoscopeResults`]
+    /// serializes it.
+    #[default]
+    Dense,
+
+    /// Runs of non-zero depth per reference, as
+    /// [`coverage_intervals::ReferenceIntervals`].
+    Intervals,
+}
+
+/// Write `em` results to `path` with their coverage encoded as `encoding`.
+pub fn write_results(
+    path: &Path,
+    results: &PathoscopeResults,
+    encoding: CoverageEncoding,
+) -> Result<(), PathoscopeError> {
+    match encoding {
+        CoverageEncoding::Dense => write_json(path, results),
+        CoverageEncoding::Intervals => {
+            write_json(path, &coverage_intervals::IntervalResults::new(results))
+        }
+    }
+}
+
+/// Write `value` to `path` as one line of JSON, the form of every results file.
+pub fn write_json<T: Serialize>(path: &Path, value: &T) -> Result<(), PathoscopeError> {
+    let file = File::create(path)?;
+    let mut writer = BufWriter::new(file);
+
+    serde_json::to_writer(&mut writer, value)
+        .map_err(|err| PathoscopeError::Parse(err.to_string()))?;
+
+    writer.write_all(b"\n")?;
+    writer.flush()?;
+
+    Ok(())
+}
+
 /// Run expectation maximization algorithm
 ///
 /// # Arguments
@@ -87,6 +145,83 @@ pub fn run_expectation_maximization(
 
     let matrix = matrix::build_matrix(alignment_path, Some(p_score_cutoff))?;
 
+    assemble_results(matrix, |updated_matrix| {
+        calculate_coverage_from_bam(alignment_path, updated_matrix, p_score_cutoff)
+    })
+}
+
+/// Run expectation maximization at each of several cutoffs, reading the
+/// alignment file once
+///
+/// Each result is bit-identical to the one [`run_expectation_maximization`]
+/// gives at that cutoff, and is handed to `emit` with the cutoff's position as
+/// soon as it is ready, so only one is held at a time.
+///
+/// # Arguments
+/// * `alignment_path` - Path to the SAM/BAM file
+/// * `p_score_cutoffs` - Minimum score thresholds, one run each
+/// * `matrix_cache` - Optional path of a matrix cache to load the alignments
+///   from, or to write them to when it is missing or stale
+/// * `emit` - Called with each cutoff's position and results
+pub fn run_expectation_maximization_sweep<F>(
+    alignment_path: &str,
+    p_score_cutoffs: &[f64],
+    matrix_cache: Option<&str>,
+    mut emit: F,
+) -> Result<(), PathoscopeError>
+where
+    F: FnMut(usize, PathoscopeResults) -> Result<(), PathoscopeError>,
+{
+    let alignments = alignments::ParsedAlignments::load_or_parse(
+        alignment_path,
+        matrix_cache,
+        &alignments::ReferenceRegistry::default(),
+    )?;
+
+    for (position, &p_score_cutoff) in p_score_cutoffs.iter().enumerate() {
+        emit(
+            position,
+            run_parsed_expectation_maximization(
+                alignment_path,
+                &alignments,
+                p_score_cutoff,
+            )?,
+        )?;
+    }
+
+    Ok(())
+}
+
+/// Run expectation maximization over alignments already read from `alignment_path`.
+fn run_parsed_expectation_maximization(
+    alignment_path: &str,
+    alignments: &alignments::ParsedAlignments,
+    p_score_cutoff: f64,
+) -> Result<PathoscopeResults, PathoscopeError> {
+    info!(
+        "starting em algorithm: file={}, cutoff={}",
+        alignment_path, p_score_cutoff
+    );
+
+    let matrix = alignments.build_matrix(p_score_cutoff);
+
+    assemble_results(matrix, |updated_matrix| {
+        Ok(alignments.coverage(updated_matrix, p_score_cutoff))
+    })
+}
+
+/// Run EM over a built matrix and gather its results.
+///
+/// `coverage` is handed the matrix EM updated.
+fn assemble_results<F>(
+    matrix: matrix::PathoscopeMatrix,
+    coverage: F,
+) -> Result<PathoscopeResults, PathoscopeError>
+where
+    F: FnOnce(
+        &matrix::PathoscopeMatrix,
+    ) -> Result<FxHashMap<String, Vec<usize>>, PathoscopeError>,
+{
     // Calculate initial best hit statistics using the matrix
     let initial_best_hit = compute_best_hit(&matrix);
 
@@ -97,11 +232,7 @@ pub fn run_expectation_maximization(
     let final_best_hit = compute_best_hit(&em_results.updated_matrix);
 
     // Calculate coverage using the matrix
-    let coverage = calculate_coverage_from_bam(
-        alignment_path,
-        &em_results.updated_matrix,
-        p_score_cutoff,
-    )?;
+    let coverage = coverage(&em_results.updated_matrix)?;
 
     let read_count = matrix.reads.len();
 
@@ -137,6 +268,24 @@ pub fn find_candidate_otus_with_bowtie2(
     )
 }
 
+/// Extract candidate OTU reference IDs with the read files split across several
+/// concurrent bowtie2 processes
+pub fn find_candidate_otus_sharded(
+    bowtie_index_path: &str,
+    read_paths: Vec<String>,
+    proc: u32,
+    p_score_cutoff: f64,
+    shards: u32,
+) -> Result<HashSet<String>, PathoscopeError> {
+    candidates::find_candidate_otus_sharded(
+        bowtie_index_path,
+        read_paths,
+        proc,
+        p_score_cutoff,
+        shards,
+    )
+}
+
 /// Eliminate subtraction reads from BAM and filter the input FASTQ file.
 ///
 /// # Arguments
@@ -167,6 +316,31 @@ pub fn run_eliminate_subtraction(
     )
 }
 
+/// Eliminate subtraction reads as [`run_eliminate_subtraction`] does, buffering
+/// at most `memory_limit_mb` of read names and spilling the rest to disk.
+///
+/// The output files and the count are identical. The spilled runs go in a
+/// directory beside `output_alignment_path`, removed when this returns.
+pub fn run_eliminate_subtraction_bounded(
+    isolate_alignment_path: &str,
+    subtraction_alignment_path: &str,
+    output_alignment_path: &str,
+    input_fastq_path: &str,
+    output_fastq_path: &str,
+    proc: u32,
+    memory_limit_mb: u32,
+) -> Result<usize, PathoscopeError> {
+    bounded_subtraction::eliminate_subtraction_bounded(
+        isolate_alignment_path,
+        subtraction_alignment_path,
+        output_alignment_path,
+        input_fastq_path,
+        output_fastq_path,
+        proc as usize,
+        memory_limit_mb as usize * 1024 * 1024,
+    )
+}
+
 /// Tests
 #[cfg(test)]
 mod tests {
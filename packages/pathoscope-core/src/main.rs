@@ -1,24 +1,27 @@
 //! The `pathoscope-core` command line interface.
 //!
-//! Three subcommands, one per stage of the analysis. The TypeScript workflow
-//! invokes this binary as a subprocess.
+//! Three subcommands, one per stage of the analysis, and `batch`, which runs
+//! the `em` and `eliminate-subtraction` stages for many samples in one
+//! process. The TypeScript workflow invokes this binary as a subprocess.
 //!
 //! Results are written to the file named by `--output`, never to stdout, so a
 //! stray `println!` cannot corrupt a result. stdout carries nothing at all;
 //! diagnostics go to stderr as JSON lines.
 
-use std::fs::File;
-use std::io::{BufWriter, Write};
+use std::io::Write;
 use std::path::PathBuf;
 use std::process::ExitCode;
 
-use clap::{Args, Parser, Subcommand, ValueEnum};
+use clap::error::ErrorKind;
+use clap::{Args, CommandFactory, Parser, Subcommand, ValueEnum};
 use log::LevelFilter;
+use pathoscope_core::batch::{run_batch, Manifest};
 use pathoscope_core::{
-    find_candidate_otus_with_bowtie2, run_eliminate_subtraction,
-    run_expectation_maximization, PathoscopeError,
+    find_candidate_otus_sharded, run_eliminate_subtraction,
+    run_eliminate_subtraction_bounded, run_expectation_maximization,
+    run_expectation_maximization_sweep, write_json, write_results, CoverageEncoding,
+    PathoscopeError, SubtractionSummary,
 };
-use serde::Serialize;
 
 #[derive(Parser)]
 #[command(name = "pathoscope-core", version, about, long_about = None)]
@@ -60,6 +63,8 @@ enum Command {
     Candidates(CandidatesArgs),
     /// Eliminate subtraction reads from an alignment and its FASTQ.
     EliminateSubtraction(EliminateSubtractionArgs),
+    /// Run eliminate-subtraction and em for every sample in a manifest.
+    Batch(BatchArgs),
 }
 
 #[derive(Args)]
@@ -68,13 +73,40 @@ struct EmArgs {
     #[arg(long)]
     alignment: PathBuf,
 
-    /// Minimum score threshold for alignments.
-    #[arg(long)]
-    p_score_cutoff: f64,
+    /// Minimum score threshold for alignments. Repeat to run at several
+    /// cutoffs from one read of the alignment file.
+    #[arg(long, required = true)]
+    p_score_cutoff: Vec<f64>,
 
-    /// Path to write the JSON results to.
+    /// Path to write the JSON results to. Repeat once per --p-score-cutoff,
+    /// in the same order.
+    #[arg(long, required = true)]
+    output: Vec<PathBuf>,
+
+    /// Path of a matrix cache to load the alignments from instead of reading
+    /// the alignment file, written when it is missing or stale.
     #[arg(long)]
-    output: PathBuf,
+    matrix_cache: Option<PathBuf>,
+
+    /// How to write each reference's coverage: a depth per position, or the
+    /// runs of non-zero depth as [start, end, depth] intervals.
+    #[arg(long, value_enum, default_value_t = CoverageEncodingArg::Dense)]
+    coverage_encoding: CoverageEncodingArg,
+}
+
+#[derive(Copy, Clone, PartialEq, Eq, ValueEnum)]
+enum CoverageEncodingArg {
+    Dense,
+    Intervals,
+}
+
+impl From<CoverageEncodingArg> for CoverageEncoding {
+    fn from(encoding: CoverageEncodingArg) -> Self {
+        match encoding {
+            CoverageEncodingArg::Dense => CoverageEncoding::Dense,
+            CoverageEncodingArg::Intervals => CoverageEncoding::Intervals,
+        }
+    }
 }
 
 #[derive(Args)]
@@ -95,6 +127,11 @@ struct CandidatesArgs {
     #[arg(long)]
     p_score_cutoff: f64,
 
+    /// Most bowtie2 processes to run at once, each over its share of the read
+    /// files and of `--proc`. Must be at least 1.
+    #[arg(long, default_value_t = 1, value_parser = clap::value_parser!(u32).range(1..))]
+    shards: u32,
+
     /// Path to write the JSON results to.
     #[arg(long)]
     output: PathBuf,
@@ -126,15 +163,29 @@ struct EliminateSubtractionArgs {
     #[arg(long, value_parser = clap::value_parser!(u32).range(1..))]
     proc: u32,
 
+    /// Buffer at most this many MB of read names, spilling the rest to sorted
+    /// runs beside --output-alignments. Without it every name is held in memory.
+    #[arg(long, value_parser = clap::value_parser!(u32).range(1..))]
+    memory_limit_mb: Option<u32>,
+
     /// Path to write the JSON results to.
     #[arg(long)]
     output: PathBuf,
 }
 
-/// The `eliminate-subtraction` results file.
-#[derive(Serialize)]
-struct SubtractionSummary {
-    subtracted: usize,
+#[derive(Args)]
+struct BatchArgs {
+    /// Path to the JSON manifest of samples.
+    #[arg(long)]
+    manifest: PathBuf,
+
+    /// Most samples to run at once. Must be at least 1.
+    #[arg(long, value_parser = clap::value_parser!(u32).range(1..))]
+    jobs: u32,
+
+    /// Path to write the JSON summary of every sample's outcome to.
+    #[arg(long)]
+    output: PathBuf,
 }
 
 /// Emit structured logs to stderr as JSON lines.
@@ -168,19 +219,6 @@ fn init_logging(level: LevelFilter) {
     builder.init();
 }
 
-fn write_json<T: Serialize>(path: &PathBuf, value: &T) -> Result<(), PathoscopeError> {
-    let file = File::create(path)?;
-    let mut writer = BufWriter::new(file);
-
-    serde_json::to_writer(&mut writer, value)
-        .map_err(|err| PathoscopeError::Parse(err.to_string()))?;
-
-    writer.write_all(b"\n")?;
-    writer.flush()?;
-
-    Ok(())
-}
-
 fn to_strings(paths: &[PathBuf]) -> Vec<String> {
     paths
         .iter()
@@ -191,19 +229,43 @@ fn to_strings(paths: &[PathBuf]) -> Vec<String> {
 fn run(command: Command) -> Result<(), PathoscopeError> {
     match command {
         Command::Em(args) => {
-            let results = run_expectation_maximization(
-                &args.alignment.to_string_lossy(),
-                args.p_score_cutoff,
-            )?;
-
-            write_json(&args.output, &results)
+            let alignment = args.alignment.to_string_lossy();
+            let encoding = args.coverage_encoding.into();
+
+            // One cutoff without a cache is the run the golden corpus was
+            // captured from, and it still takes that path.
+            if let ([p_score_cutoff], [output], None) = (
+                args.p_score_cutoff.as_slice(),
+                args.output.as_slice(),
+                &args.matrix_cache,
+            ) {
+                let results =
+                    run_expectation_maximization(&alignment, *p_score_cutoff)?;
+
+                return write_results(output, &results, encoding);
+            }
+
+            let matrix_cache = args
+                .matrix_cache
+                .as_ref()
+                .map(|path| path.to_string_lossy().into_owned());
+
+            run_expectation_maximization_sweep(
+                &alignment,
+                &args.p_score_cutoff,
+                matrix_cache.as_deref(),
+                |position, results| {
+                    write_results(&args.output[position], &results, encoding)
+                },
+            )
         }
         Command::Candidates(args) => {
-            let found = find_candidate_otus_with_bowtie2(
+            let found = find_candidate_otus_sharded(
                 &args.index.to_string_lossy(),
                 to_strings(&args.reads),
                 args.proc,
                 args.p_score_cutoff,
+                args.shards,
             )?;
 
             // Sorted so the results file is stable across runs; the underlying
@@ -214,23 +276,63 @@ fn run(command: Command) -> Result<(), PathoscopeError> {
             write_json(&args.output, &candidates)
         }
         Command::EliminateSubtraction(args) => {
-            let subtracted = run_eliminate_subtraction(
-                &args.isolate_alignments.to_string_lossy(),
-                &args.subtraction_alignments.to_string_lossy(),
-                &args.output_alignments.to_string_lossy(),
-                &args.input_fastq.to_string_lossy(),
-                &args.output_fastq.to_string_lossy(),
-                args.proc,
-            )?;
+            let subtracted = match args.memory_limit_mb {
+                Some(memory_limit_mb) => run_eliminate_subtraction_bounded(
+                    &args.isolate_alignments.to_string_lossy(),
+                    &args.subtraction_alignments.to_string_lossy(),
+                    &args.output_alignments.to_string_lossy(),
+                    &args.input_fastq.to_string_lossy(),
+                    &args.output_fastq.to_string_lossy(),
+                    args.proc,
+                    memory_limit_mb,
+                )?,
+                None => run_eliminate_subtraction(
+                    &args.isolate_alignments.to_string_lossy(),
+                    &args.subtraction_alignments.to_string_lossy(),
+                    &args.output_alignments.to_string_lossy(),
+                    &args.input_fastq.to_string_lossy(),
+                    &args.output_fastq.to_string_lossy(),
+                    args.proc,
+                )?,
+            };
 
             write_json(&args.output, &SubtractionSummary { subtracted })
         }
+        Command::Batch(args) => {
+            let manifest = Manifest::from_path(&args.manifest)?;
+            let outcomes = run_batch(&manifest, args.jobs);
+
+            write_json(&args.output, &outcomes)?;
+
+            let failed = outcomes.iter().filter(|outcome| !outcome.ok).count();
+
+            if failed > 0 {
+                return Err(PathoscopeError::Batch(format!(
+                    "{} of {} samples failed",
+                    failed,
+                    outcomes.len()
+                )));
+            }
+
+            Ok(())
+        }
     }
 }
 
 fn main() -> ExitCode {
     let cli = Cli::parse();
 
+    if let Command::Em(args) = &cli.command {
+        if args.output.len() != args.p_score_cutoff.len() {
+            Cli::command()
+                .error(
+                    ErrorKind::WrongNumberOfValues,
+                    "em takes one --output per --p-score-cutoff",
+                )
+                .exit();
+        }
+    }
+
     init_logging(cli.log_level.into());
 
     match run(cli.command) {
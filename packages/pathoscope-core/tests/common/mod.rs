@@ -0,0 +1,235 @@
+//! Read `tests/golden/vectors.bin` one vector at a time.
+//!
+//! The layout is documented in `tests/golden/binary_corpus.py`, which writes
+//! it. Only the header and index are read up front; each vector's section is
+//! read when it is asked for, so a test never parses the vectors it does not
+//! check. `tests/golden_binary.rs` holds the file to `vectors.json`.
+
+#![allow(dead_code)]
+
+use std::collections::BTreeMap;
+use std::fs::File;
+use std::io::{BufReader, Read, Seek, SeekFrom};
+use std::path::{Path, PathBuf};
+
+use serde_json::{json, Value};
+
+const MAGIC: &[u8; 4] = b"PSGV";
+const VERSION: u32 = 1;
+
+pub fn golden(file: &str) -> PathBuf {
+    Path::new(env!("CARGO_MANIFEST_DIR"))
+        .join("tests/golden")
+        .join(file)
+}
+
+/// One vector's section, decoded.
+pub struct Section {
+    /// Everything but the bulk data, as the JSON vector would have it.
+    pub meta: Value,
+    /// The result's float arrays, as raw bits.
+    pub arrays: BTreeMap<String, Vec<u64>>,
+    /// Per reference: its length and `(start, end, value)` runs.
+    pub coverage: BTreeMap<String, (u64, Vec<(u64, u64, u64)>)>,
+}
+
+impl Section {
+    /// The vector as `vectors.json` holds it, except that each reference's
+    /// coverage is `{"length", "intervals": [[start, end, value], ...]}`, the
+    /// form `em --coverage-encoding intervals` writes.
+    ///
+    /// Floats are rebuilt from their bits, so they are exactly the corpus's.
+    pub fn into_vector(self) -> Value {
+        let mut vector = self.meta;
+
+        if self.arrays.is_empty() && self.coverage.is_empty() {
+            return vector;
+        }
+
+        let result = vector["result"]
+            .as_object_mut()
+            .expect("a section with bulk data has a result object");
+
+        for (field, bits) in self.arrays {
+            let values: Vec<f64> = bits.into_iter().map(f64::from_bits).collect();
+            result.insert(field, values.into());
+        }
+
+        let coverage: serde_json::Map<String, Value> = self
+            .coverage
+            .into_iter()
+            .map(|(reference, (length, runs))| {
+                let intervals: Vec<Value> = runs
+                    .into_iter()
+                    .map(|(start, end, value)| json!([start, end, value]))
+                    .collect();
+
+                (reference, json!({"length": length, "intervals": intervals}))
+            })
+            .collect();
+
+        result.insert("coverage".into(), coverage.into());
+
+        vector
+    }
+}
+
+/// A cursor over one section's bytes.
+struct Cursor<'a> {
+    bytes: &'a [u8],
+}
+
+impl<'a> Cursor<'a> {
+    fn take(&mut self, count: usize) -> &'a [u8] {
+        assert!(count <= self.bytes.len(), "section is truncated");
+
+        let (head, tail) = self.bytes.split_at(count);
+        self.bytes = tail;
+
+        head
+    }
+
+    fn u16(&mut self) -> u16 {
+        u16::from_le_bytes(self.take(2).try_into().unwrap())
+    }
+
+    fn u32(&mut self) -> u32 {
+        u32::from_le_bytes(self.take(4).try_into().unwrap())
+    }
+
+    fn u64(&mut self) -> u64 {
+        u64::from_le_bytes(self.take(8).try_into().unwrap())
+    }
+
+    fn name(&mut self) -> String {
+        let length = self.u16() as usize;
+
+        String::from_utf8(self.take(length).to_vec()).expect("name is not UTF-8")
+    }
+}
+
+/// The binary corpus, with only its header and index in memory.
+pub struct BinaryCorpus {
+    reader: BufReader<File>,
+    /// Vector names with their section's offset and length, in corpus order.
+    pub index: Vec<(String, u64, u64)>,
+}
+
+impl BinaryCorpus {
+    pub fn open(path: &Path) -> Self {
+        let file = File::open(path)
+            .unwrap_or_else(|err| panic!("opening {}: {err}", path.display()));
+        let mut reader = BufReader::new(file);
+
+        let mut header = [0u8; 12];
+        reader.read_exact(&mut header).expect("reading header");
+
+        assert_eq!(&header[..4], MAGIC, "vectors.bin has the wrong magic");
+
+        let version = u32::from_le_bytes(header[4..8].try_into().unwrap());
+        let count = u32::from_le_bytes(header[8..12].try_into().unwrap());
+
+        assert_eq!(version, VERSION, "vectors.bin is version {version}");
+
+        let mut index = Vec::with_capacity(count as usize);
+
+        for _ in 0..count {
+            let mut length = [0u8; 2];
+            reader.read_exact(&mut length).expect("reading index");
+
+            let mut entry = vec![0u8; u16::from_le_bytes(length) as usize + 16];
+            reader.read_exact(&mut entry).expect("reading index");
+
+            let (name, span) = entry.split_at(entry.len() - 16);
+
+            index.push((
+                String::from_utf8(name.to_vec()).expect("name is not UTF-8"),
+                u64::from_le_bytes(span[..8].try_into().unwrap()),
+                u64::from_le_bytes(span[8..].try_into().unwrap()),
+            ));
+        }
+
+        Self { reader, index }
+    }
+
+    /// The vectors' names, in corpus order.
+    pub fn names(&self) -> Vec<String> {
+        self.index.iter().map(|entry| entry.0.clone()).collect()
+    }
+
+    /// Read and decode one vector's section, touching no other.
+    pub fn section(&mut self, name: &str) -> Option<Section> {
+        let &(_, offset, length) = self.index.iter().find(|entry| entry.0 == name)?;
+
+        let mut bytes = vec![0u8; length as usize];
+
+        self.reader
+            .seek(SeekFrom::Start(offset))
+            .expect("seeking to section");
+        self.reader.read_exact(&mut bytes).expect("reading section");
+
+        let mut cursor = Cursor { bytes: &bytes };
+
+        let meta_length = cursor.u32() as usize;
+        let meta = serde_json::from_slice(cursor.take(meta_length))
+            .expect("section meta is not valid JSON");
+
+        let mut arrays = BTreeMap::new();
+
+        for _ in 0..cursor.u16() {
+            let field = cursor.name();
+            let count = cursor.u32();
+            let bits = (0..count).map(|_| cursor.u64()).collect();
+
+            arrays.insert(field, bits);
+        }
+
+        let mut coverage = BTreeMap::new();
+
+        for _ in 0..cursor.u32() {
+            let reference = cursor.name();
+            let length = cursor.u64();
+            let runs = (0..cursor.u32())
+                .map(|_| (cursor.u64(), cursor.u64(), cursor.u64()))
+                .collect();
+
+            coverage.insert(reference, (length, runs));
+        }
+
+        assert!(
+            cursor.bytes.is_empty(),
+            "{name}: section has trailing bytes"
+        );
+
+        Some(Section {
+            meta,
+            arrays,
+            coverage,
+        })
+    }
+
+    /// One vector, as [`Section::into_vector`] gives it.
+    pub fn vector(&mut self, name: &str) -> Option<Value> {
+        self.section(name).map(Section::into_vector)
+    }
+
+    /// Every vector, in corpus order.
+    pub fn vectors(&mut self) -> Vec<Value> {
+        self.names()
+            .iter()
+            .map(|name| self.vector(name).expect("an indexed vector"))
+            .collect()
+    }
+}
+
+/// Expand interval-encoded coverage to a dense array.
+pub fn expand(length: u64, runs: &[(u64, u64, u64)]) -> Vec<u64> {
+    let mut dense = vec![0u64; length as usize];
+
+    for &(start, end, value) in runs {
+        assert!(value != 0, "a run records zero depth");
+        dense[start as usize..end as usize].fill(value);
+    }
+
+    dense
+}
@@ -0,0 +1,232 @@
+"""Pack the golden corpus into `vectors.bin`, a binary companion to `vectors.json`.
+
+`vectors.json` is one document: a reader has to parse all of it before it can
+look at any vector, and at production reference sizes the sparse coverage
+dicts dominate both the parse and the write. `vectors.bin` holds the same
+vectors in a form that is read one vector at a time:
+
+    file     := header index section*
+    header   := b"PSGV" u32:version u32:count
+    index    := count * (u16:name_len name u64:offset u64:length)
+    section  := u32:meta_len meta
+                u16:array_count  array_count * (u16:field_len field u32:n n * f64)
+                u32:ref_count    ref_count * (u16:ref_len ref u64:length
+                                              u32:run_count run_count * run)
+    run      := u64:start u64:end u64:value
+
+Every integer and float is little-endian, and offsets count from the start of
+the file, so a reader loads the header and index and then seeks straight to the
+one section it wants. Sections are in corpus order.
+
+* `meta` is the vector as compact, key-sorted JSON with the result's float
+  arrays and coverage taken out — names, args, refs, hashes, everything that
+  is not bulk data.
+* Each float array is the f64 values' raw bits, so they round-trip exactly
+  without going through a decimal formatter at all.
+* Coverage is interval-encoded: one `[start, end)` run per stretch of equal
+  non-zero depth. Reads cover contiguous positions, so this is smaller again
+  than the sparse JSON encoding, which spends a key on every covered base.
+
+`vectors.json` stays the source of truth. On a capture `generate.py` writes
+both files from the same `CoverageRuns`, found in one pass over each dense
+array; this script rebuilds `vectors.bin` from `vectors.json` alone. Neither
+comes from the code under test, and `tests/golden_binary.rs` asserts the two
+decode to bit-identical vectors:
+
+    python3 binary_corpus.py    # vectors.json -> vectors.bin
+"""
+
+import json
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from itertools import groupby
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+MAGIC = b"PSGV"
+VERSION = 1
+
+FLOAT_FIELDS = (
+    "best_hit_initial_reads",
+    "best_hit_initial",
+    "level_1_initial",
+    "level_2_initial",
+    "best_hit_final_reads",
+    "best_hit_final",
+    "level_1_final",
+    "level_2_final",
+    "init_pi",
+    "pi",
+)
+
+
+@dataclass(frozen=True)
+class CoverageRuns:
+    """One reference's coverage: its length and `(start, end, value)` runs.
+
+    A run is a `[start, end)` stretch of equal non-zero depth; positions no run
+    covers are zero.
+    """
+
+    length: int
+    runs: tuple[tuple[int, int, int], ...]
+
+    @classmethod
+    def from_dense(cls, values: list[int]) -> "CoverageRuns":
+        """Find the runs in a dense coverage array in one pass.
+
+        `groupby` walks the array in C, so Python code runs once per run of
+        equal depth rather than once per position — on a 50 kb reference, a
+        few hundred times rather than 50,000.
+        """
+        runs = []
+        start = 0
+
+        for value, group in groupby(values):
+            end = start + len(list(group))
+
+            if value != 0:
+                runs.append((start, end, value))
+
+            start = end
+
+        return cls(start, tuple(runs))
+
+    @classmethod
+    def from_sparse(cls, sparse: dict) -> "CoverageRuns":
+        """Merge `vectors.json`'s sparse encoding into runs."""
+        positions = sorted(
+            (int(key), value) for key, value in sparse["nonzero"].items()
+        )
+        runs = []
+
+        for index, value in positions:
+            if runs and runs[-1][1] == index and runs[-1][2] == value:
+                runs[-1] = (runs[-1][0], index + 1, value)
+            else:
+                runs.append((index, index + 1, value))
+
+        return cls(sparse["length"], tuple(runs))
+
+    def sparse(self) -> dict:
+        """Encode as `vectors.json` does: the length and non-zero positions.
+
+        Coverage arrays are sized to the reference, so a vector over a 50 kb
+        reference is 50,000 entries of which ~200 are non-zero. Storing them
+        densely made the corpus 1.3 MB, 98% of it zeros. This is lossless — the
+        harness rebuilds the dense array and compares element by element.
+        """
+        return {
+            "length": self.length,
+            "nonzero": {
+                str(index): value
+                for start, end, value in self.runs
+                for index in range(start, end)
+            },
+        }
+
+
+def json_default(value: object) -> dict:
+    """Let `json.dumps` write a `CoverageRuns` in `vectors.json`'s encoding."""
+    if isinstance(value, CoverageRuns):
+        return value.sparse()
+
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def packed_name(name: str, width: str) -> bytes:
+    encoded = name.encode()
+
+    return struct.pack(f"<{width}", len(encoded)) + encoded
+
+
+def packed_floats(values: list[float]) -> bytes:
+    """Pack `values` as raw f64 bits in one pass, whatever the host's byte order."""
+    packed = array("d", map(float, values))
+
+    if sys.byteorder == "big":
+        packed.byteswap()
+
+    return struct.pack("<I", len(packed)) + packed.tobytes()
+
+
+def pack_section(vector: dict) -> bytes:
+    result = vector.get("result")
+    arrays = {}
+    coverage = {}
+
+    if isinstance(result, dict) and "coverage" in result:
+        arrays = {field: result[field] for field in FLOAT_FIELDS}
+        coverage = result["coverage"]
+
+        vector = {
+            **vector,
+            "result": {
+                key: value
+                for key, value in result.items()
+                if key not in FLOAT_FIELDS and key != "coverage"
+            },
+        }
+
+    meta = json.dumps(
+        vector, sort_keys=True, separators=(",", ":"), default=json_default
+    ).encode()
+
+    parts = [struct.pack("<I", len(meta)), meta, struct.pack("<H", len(arrays))]
+
+    for field, values in arrays.items():
+        parts += [packed_name(field, "H"), packed_floats(values)]
+
+    parts.append(struct.pack("<I", len(coverage)))
+
+    for ref, encoded in sorted(coverage.items()):
+        if not isinstance(encoded, CoverageRuns):
+            encoded = CoverageRuns.from_sparse(encoded)
+
+        flat = array("Q", (number for run in encoded.runs for number in run))
+
+        if sys.byteorder == "big":
+            flat.byteswap()
+
+        parts += [
+            packed_name(ref, "H"),
+            struct.pack("<QI", encoded.length, len(encoded.runs)),
+            flat.tobytes(),
+        ]
+
+    return b"".join(parts)
+
+
+def pack_corpus(corpus: dict) -> bytes:
+    """Pack a corpus whose coverage is `CoverageRuns` or sparse dicts."""
+    sections = [(vector["name"], pack_section(vector)) for vector in corpus["vectors"]]
+
+    index_size = sum(2 + len(name.encode()) + 16 for name, _ in sections)
+    offset = len(MAGIC) + 8 + index_size
+
+    index = []
+
+    for name, section in sections:
+        index += [packed_name(name, "H"), struct.pack("<QQ", offset, len(section))]
+        offset += len(section)
+
+    return b"".join(
+        [MAGIC, struct.pack("<II", VERSION, len(sections)), *index]
+        + [section for _, section in sections]
+    )
+
+
+def main() -> None:
+    corpus = json.loads((HERE / "vectors.json").read_text())
+    out = HERE / "vectors.bin"
+
+    out.write_bytes(pack_corpus(corpus))
+
+    print(f"wrote {len(corpus['vectors'])} vectors to {out}")
+
+
+if __name__ == "__main__":
+    main()
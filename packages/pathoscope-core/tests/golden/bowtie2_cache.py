@@ -0,0 +1,232 @@
+"""An on-disk cache of bowtie2 indexes, addressed by what they were built from.
+
+`bowtie2-build` is deterministic: the same FASTA through the same version
+gives the same shards. So an index is keyed by the SHA-256 of the FASTA's bytes
+and the `bowtie2-build` version, and any run that needs one reuses it rather
+than spending minutes rebuilding it. The three `CANDIDATE_CASES` share one
+reference and now share one index.
+
+Layout, under the cache directory:
+
+    <key>/reference.*.bt2    one complete index per key
+    .locks/<key>             flock target for that key, removed with it
+    .lock                    held while evicting
+    .build-*/                an index being built, renamed to <key>/ when done
+
+Concurrency is handled with `flock`, so several processes — the pool workers
+in `generate.py`, or several generators sharing a cache — can use one
+directory:
+
+* A key's lock is held exclusively while it is looked up or built, so two
+  processes wanting the same missing index build it once; the second waits and
+  then hits.
+* It is held shared for as long as the caller uses the index, and eviction
+  skips any key it cannot lock exclusively, so an index is never deleted out
+  from under a running bowtie2.
+* A build writes into a private directory and is renamed into place, so a
+  crashed build leaves a `.build-*` directory behind, never a half-written
+  entry that looks complete.
+* Eviction deletes a key's lock file along with its entry, while holding it,
+  so lock files do not outlive their entries. A process that was waiting on
+  the deleted file then holds a lock nobody else can reach, so after taking a
+  key's lock it checks the file is still the one at `.locks/<key>` and starts
+  over on the new one if not.
+
+Eviction is least-recently-used by total size. Every hit touches the entry's
+mtime, and after each build the oldest entries are removed until the cache
+fits `max_bytes`. The entry just built is never evicted, even if it alone is
+over the limit.
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO
+
+DEFAULT_CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "pathoscope-core"
+    / "bowtie2"
+)
+
+DEFAULT_MAX_BYTES = 20 * 1024**3
+
+# The shard prefix inside every entry. Fixed, so a key names one index path.
+PREFIX = "reference"
+
+
+def bowtie2_build_version() -> str:
+    """Read `bowtie2-build`'s version, which is part of every key.
+
+    :raises RuntimeError: when the output carries no recognisable version
+    """
+    out = subprocess.run(
+        ["bowtie2-build", "--version"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    match = re.search(r"\bversion\s+(\S+)", out)
+
+    if match is None:
+        raise RuntimeError("could not parse bowtie2-build version")
+
+    return match.group(1)
+
+
+def index_key(fasta: Path, version: str) -> str:
+    """Derive the cache key for `fasta` built by bowtie2 `version`.
+
+    The FASTA is hashed in chunks rather than read whole: production
+    references run to gigabytes.
+    """
+    digest = hashlib.sha256()
+
+    with fasta.open("rb") as fh:
+        while chunk := fh.read(1 << 20):
+            digest.update(chunk)
+
+    return hashlib.sha256(f"{digest.hexdigest()}:{version}".encode()).hexdigest()
+
+
+def entry_size(entry: Path) -> int:
+    return sum(path.stat().st_size for path in entry.iterdir())
+
+
+@contextmanager
+def key_lock(cache: Path, key: str) -> Iterator[IO[str]]:
+    """Hold `key`'s lock exclusively, on the lock file that is current.
+
+    Eviction unlinks a lock file while holding it, so a lock won on a file
+    that has since been unlinked guards nothing; it is dropped and the file
+    now at the path is locked instead.
+    """
+    path = cache / ".locks" / key
+
+    while True:
+        lock = path.open("a")
+
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                current = os.path.samestat(os.fstat(lock.fileno()), os.stat(path))
+            except FileNotFoundError:
+                current = False
+        except BaseException:
+            lock.close()
+            raise
+
+        if current:
+            break
+
+        lock.close()
+
+    with lock:
+        yield lock
+
+
+def evict(cache: Path, max_bytes: int, keep: str) -> None:
+    """Remove least-recently-used entries until the cache fits `max_bytes`.
+
+    `keep` is never removed, and neither is any entry another process holds.
+    An evicted entry's lock file is removed with it.
+    """
+    with (cache / ".lock").open("a") as global_lock:
+        fcntl.flock(global_lock, fcntl.LOCK_EX)
+
+        entries = sorted(
+            (entry for entry in cache.iterdir() if not entry.name.startswith(".")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+
+        sizes = {entry.name: entry_size(entry) for entry in entries}
+        total = sum(sizes.values())
+
+        for entry in entries:
+            if total <= max_bytes:
+                break
+
+            if entry.name == keep:
+                continue
+
+            lock_path = cache / ".locks" / entry.name
+
+            with lock_path.open("a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                shutil.rmtree(entry)
+                total -= sizes[entry.name]
+
+                # Only evictors unlink lock files, and they hold the global
+                # lock, so this is still the file at `lock_path`.
+                lock_path.unlink()
+
+
+def build_into(fasta: Path, cache: Path, key: str, threads: int) -> None:
+    build = Path(tempfile.mkdtemp(prefix=".build-", dir=cache))
+
+    try:
+        subprocess.run(
+            [
+                "bowtie2-build",
+                "--threads",
+                str(threads),
+                str(fasta),
+                str(build / PREFIX),
+            ],
+            check=True,
+            capture_output=True,
+        )
+
+        build.rename(cache / key)
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+
+
+@contextmanager
+def cached_index(
+    fasta: Path,
+    cache: Path = DEFAULT_CACHE,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    threads: int = 1,
+    version: str | None = None,
+) -> Iterator[Path]:
+    """Yield a bowtie2 index prefix for `fasta`, building it on a miss.
+
+    The index stays valid, and safe from eviction, until the block exits.
+    Pass `version` to skip running `bowtie2-build --version` per call.
+    """
+    if version is None:
+        version = bowtie2_build_version()
+
+    key = index_key(fasta, version)
+    entry = cache / key
+
+    (cache / ".locks").mkdir(parents=True, exist_ok=True)
+
+    with key_lock(cache, key) as lock:
+        if entry.exists():
+            os.utime(entry)
+        else:
+            build_into(fasta, cache, key, threads)
+            evict(cache, max_bytes, keep=key)
+
+        # flock converts a lock in place but not atomically, so an evictor could
+        # take this one in the gap. The touch or build just above made the entry
+        # the newest in the cache, the last one an evictor would reach.
+        fcntl.flock(lock, fcntl.LOCK_SH)
+
+        yield entry / PREFIX
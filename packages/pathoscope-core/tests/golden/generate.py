@@ -9,24 +9,40 @@ behaviour-affecting change:
 
     PYTHONPATH=/path/to/workflow-pathoscope/python \
     PATH=/path/to/bowtie2:$PATH \
-    python3 generate.py
+    python3 generate.py [--workers N]
+
+Cases run on a process pool, `--workers` CPUs wide (all of them by default).
+A case that takes `proc` holds that many of those CPUs while it runs. Cases
+finish in any order but are written back in declaration order, and the corpus
+is dumped with sorted keys, so the output does not depend on `--workers`.
+
+Candidate cases take their bowtie2 index from `bowtie2_cache`, keyed by the
+reference's SHA-256 and the bowtie2 version, so the three cases build the
+shared reference once and later runs build it not at all. `--index-cache`
+moves the cache from its default under `~/.cache`.
 
 Floats are written as ordinary JSON numbers. Both Python's `json` and Rust's
 `serde_json` emit the shortest representation that round-trips, so parsing a
-vector back on either side yields the bit-identical f64. The comparison
+vector back on either side yields the bit-identical f64 — on the Rust side only
+with `serde_json`'s `float_roundtrip` feature, which the tests enable. The comparison
 harness compares `f64::to_bits()`, not text, so a formatting difference
 between the two emitters cannot mask or manufacture a mismatch.
 """
 
+import argparse
 import hashlib
 import json
+import os
 import random
 import shutil
-import subprocess
 import sys
 import tempfile
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
+from binary_corpus import CoverageRuns, json_default, pack_corpus
+from bowtie2_cache import DEFAULT_CACHE, bowtie2_build_version, cached_index
 from workflow_pathoscope.rust import (
     find_candidate_otus_with_bowtie2,
     run_eliminate_subtraction,
@@ -117,20 +133,6 @@ def sha256(path: Path) -> str:
     return hashlib.sha256(path.read_bytes()).hexdigest()
 
 
-def sparse_coverage(values: list[int]) -> dict:
-    """Encode a coverage array as its length plus its non-zero positions.
-
-    Coverage arrays are sized to the reference, so a vector over a 50 kb
-    reference is 50,000 entries of which ~200 are non-zero. Storing them
-    densely made the corpus 1.3 MB, 98% of it zeros. This is lossless — the
-    harness rebuilds the dense array and compares element by element.
-    """
-    return {
-        "length": len(values),
-        "nonzero": {str(i): v for i, v in enumerate(values) if v != 0},
-    }
-
-
 def write_candidate_fixtures() -> None:
     """Write the synthetic reference and reads the `candidates` vectors use.
 
@@ -196,131 +198,221 @@ def write_read_fastq(sam: Path, out: Path) -> None:
             fh.write(f"@{name}\n{seq}\n+\n{qual}\n")
 
 
-def build_em_vectors() -> list[dict]:
-    vectors = []
+def em_vector(name: str, fixture: str, cutoff: float) -> tuple[dict, str]:
+    results = run_expectation_maximization(str(FIXTURES / fixture), cutoff)
+
+    vector = {
+        "name": name,
+        "subcommand": "em",
+        "args": {"alignment": fixture, "p_score_cutoff": cutoff},
+        "result": {
+            **{field: list(getattr(results, field)) for field in RESULT_FIELDS},
+            # Written sparse to vectors.json and as runs to vectors.bin.
+            "coverage": {
+                key: CoverageRuns.from_dense(value)
+                for key, value in results.coverage.items()
+            },
+        },
+    }
+
+    return vector, f"{len(results.refs)} refs, {len(results.reads)} reads"
+
 
-    for name, fixture, cutoff in EM_CASES:
-        path = FIXTURES / fixture
-        results = run_expectation_maximization(str(path), cutoff)
-
-        vectors.append(
-            {
-                "name": name,
-                "subcommand": "em",
-                "args": {"alignment": fixture, "p_score_cutoff": cutoff},
-                "result": {
-                    **{field: list(getattr(results, field)) for field in RESULT_FIELDS},
-                    "coverage": {
-                        key: sparse_coverage(value)
-                        for key, value in results.coverage.items()
-                    },
-                },
-            }
+def em_error_vector(name: str, fixture: str, cutoff: float) -> tuple[dict | None, str]:
+    """Vector an EM input that must fail, or return `None` if it parsed.
+
+    `sys.exit` is left to the parent: raised in a pool worker it would surface
+    as an opaque `BrokenProcessPool` rather than naming the case.
+    """
+    try:
+        run_expectation_maximization(str(FIXTURES / fixture), cutoff)
+    except Exception:
+        vector = {
+            "name": name,
+            "subcommand": "em",
+            "args": {"alignment": fixture, "p_score_cutoff": cutoff},
+            "expect_failure": True,
+        }
+
+        return vector, "fails as expected"
+
+    return None, "did not fail"
+
+
+def subtraction_vector(
+    name: str, isolate: str, subtraction: str, fastq: str, proc: int
+) -> tuple[dict, str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        out_alignments = tmp_path / "subtracted.bam"
+        out_fastq = tmp_path / "subtracted.fq"
+
+        subtracted = run_eliminate_subtraction(
+            str(FIXTURES / isolate),
+            str(FIXTURES / subtraction),
+            str(out_alignments),
+            str(FIXTURES / fastq),
+            str(out_fastq),
+            proc,
+        )
+
+        vector = {
+            "name": name,
+            "subcommand": "eliminate-subtraction",
+            "args": {
+                "isolate_alignments": isolate,
+                "subtraction_alignments": subtraction,
+                "input_fastq": fastq,
+                "proc": proc,
+            },
+            "result": {"subtracted": subtracted},
+            "output_fastq_sha256": sha256(out_fastq),
+            "output_alignments_sha256": sha256(out_alignments),
+        }
+
+    return vector, f"subtracted {subtracted}"
+
+
+def candidate_vector(
+    name: str,
+    reference: str,
+    reads: str,
+    proc: int,
+    cutoff: float,
+    cache: Path,
+    version: str,
+) -> tuple[dict, str]:
+    with cached_index(
+        FIXTURES / reference, cache, threads=proc, version=version
+    ) as index:
+        found = find_candidate_otus_with_bowtie2(
+            str(index),
+            [str(FIXTURES / reads)],
+            proc,
+            cutoff,
         )
 
-        print(f"  {name}: {len(results.refs)} refs, {len(results.reads)} reads")
-
-    for name, fixture, cutoff in EM_ERROR_CASES:
-        try:
-            run_expectation_maximization(str(FIXTURES / fixture), cutoff)
-        except Exception:
-            vectors.append(
-                {
-                    "name": name,
-                    "subcommand": "em",
-                    "args": {"alignment": fixture, "p_score_cutoff": cutoff},
-                    "expect_failure": True,
-                }
-            )
-            print(f"  {name}: fails as expected")
-        else:
+    vector = {
+        "name": name,
+        "subcommand": "candidates",
+        "args": {
+            "reference": reference,
+            "reads": reads,
+            "proc": proc,
+            "p_score_cutoff": cutoff,
+        },
+        "result": sorted(found),
+    }
+
+    return vector, str(sorted(found))
+
+
+def run_cases(jobs: list[tuple[Callable, tuple, int]], workers: int) -> list:
+    """Run `(builder, args, proc)` jobs on a process pool, in job order.
+
+    `workers` is a CPU budget as well as the pool size. A job holds `proc` of
+    those CPUs while it runs — its bowtie2 or subtraction threads — so two
+    `proc=4` cases never share a four-CPU budget. A job asking for more than
+    the whole budget is clamped to it and runs alone rather than never
+    starting. Jobs start in order, so the schedule is deterministic even
+    though completion order is not; results are reassembled by position.
+    """
+    results = [None] * len(jobs)
+    pending = list(enumerate(jobs))
+    running = {}
+    free = workers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            while pending:
+                position, (builder, args, proc) = pending[0]
+                cost = min(proc, workers)
+
+                if cost > free:
+                    break
+
+                pending.pop(0)
+                free -= cost
+                running[pool.submit(builder, *args)] = (position, cost)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                position, cost = running.pop(future)
+                free += cost
+                results[position] = future.result()
+
+    return results
+
+
+def build_em_vectors(workers: int) -> list[dict]:
+    jobs = [(em_vector, case, 1) for case in EM_CASES]
+    jobs += [(em_error_vector, case, 1) for case in EM_ERROR_CASES]
+
+    names = [name for name, *_ in EM_CASES + EM_ERROR_CASES]
+
+    vectors = []
+
+    for name, (vector, summary) in zip(names, run_cases(jobs, workers), strict=True):
+        if vector is None:
             sys.exit(f"{name} was expected to fail but did not")
 
+        vectors.append(vector)
+        print(f"  {name}: {summary}")
+
     return vectors
 
 
-def build_subtraction_vectors() -> list[dict]:
+def build_subtraction_vectors(workers: int) -> list[dict]:
+    jobs = [(subtraction_vector, case, case[4]) for case in SUBTRACTION_CASES]
+
     vectors = []
 
-    for name, isolate, subtraction, fastq, proc in SUBTRACTION_CASES:
-        with tempfile.TemporaryDirectory() as tmp:
-            tmp_path = Path(tmp)
-            out_alignments = tmp_path / "subtracted.bam"
-            out_fastq = tmp_path / "subtracted.fq"
-
-            subtracted = run_eliminate_subtraction(
-                str(FIXTURES / isolate),
-                str(FIXTURES / subtraction),
-                str(out_alignments),
-                str(FIXTURES / fastq),
-                str(out_fastq),
-                proc,
-            )
-
-            vectors.append(
-                {
-                    "name": name,
-                    "subcommand": "eliminate-subtraction",
-                    "args": {
-                        "isolate_alignments": isolate,
-                        "subtraction_alignments": subtraction,
-                        "input_fastq": fastq,
-                        "proc": proc,
-                    },
-                    "result": {"subtracted": subtracted},
-                    "output_fastq_sha256": sha256(out_fastq),
-                    "output_alignments_sha256": sha256(out_alignments),
-                }
-            )
-
-            print(f"  {name}: subtracted {subtracted}")
+    for vector, summary in run_cases(jobs, workers):
+        vectors.append(vector)
+        print(f"  {vector['name']}: {summary}")
 
     return vectors
 
 
-def build_candidate_vectors() -> list[dict]:
+def build_candidate_vectors(workers: int, cache: Path) -> list[dict]:
     if shutil.which("bowtie2-build") is None or shutil.which("bowtie2") is None:
         sys.exit("bowtie2 and bowtie2-build must be on PATH to generate candidates")
 
+    version = bowtie2_build_version()
+
+    jobs = [
+        (candidate_vector, (*case, cache, version), case[3]) for case in CANDIDATE_CASES
+    ]
+
     vectors = []
 
-    for name, reference, reads, proc, cutoff in CANDIDATE_CASES:
-        with tempfile.TemporaryDirectory() as tmp:
-            index = Path(tmp) / "reference"
-
-            subprocess.run(
-                ["bowtie2-build", str(FIXTURES / reference), str(index)],
-                check=True,
-                capture_output=True,
-            )
-
-            found = find_candidate_otus_with_bowtie2(
-                str(index),
-                [str(FIXTURES / reads)],
-                proc,
-                cutoff,
-            )
-
-            vectors.append(
-                {
-                    "name": name,
-                    "subcommand": "candidates",
-                    "args": {
-                        "reference": reference,
-                        "reads": reads,
-                        "proc": proc,
-                        "p_score_cutoff": cutoff,
-                    },
-                    "result": sorted(found),
-                }
-            )
-
-            print(f"  {name}: {sorted(found)}")
+    for vector, summary in run_cases(jobs, workers):
+        vectors.append(vector)
+        print(f"  {vector['name']}: {summary}")
 
     return vectors
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="CPUs to spread cases over; each case holds its own `proc` of them",
+    )
+    parser.add_argument(
+        "--index-cache",
+        type=Path,
+        default=DEFAULT_CACHE,
+        help="directory of bowtie2 indexes reused across cases and runs",
+    )
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
     write_candidate_fixtures()
     write_read_fastq(
         FIXTURES / "test_isolates_minimal.sam",
@@ -332,13 +424,13 @@ def main() -> None:
     )
 
     print("em:")
-    em = build_em_vectors()
+    em = build_em_vectors(args.workers)
 
     print("eliminate-subtraction:")
-    subtraction = build_subtraction_vectors()
+    subtraction = build_subtraction_vectors(args.workers)
 
     print("candidates:")
-    candidates = build_candidate_vectors()
+    candidates = build_candidate_vectors(args.workers, args.index_cache)
 
     corpus = {
         "note": (
@@ -350,9 +442,12 @@ def main() -> None:
     }
 
     out = HERE / "vectors.json"
-    out.write_text(json.dumps(corpus, indent=2, sort_keys=True) + "\n")
+    out.write_text(
+        json.dumps(corpus, indent=2, sort_keys=True, default=json_default) + "\n"
+    )
+    (HERE / "vectors.bin").write_bytes(pack_corpus(corpus))
 
-    print(f"\nwrote {len(corpus['vectors'])} vectors to {out}")
+    print(f"\nwrote {len(corpus['vectors'])} vectors to {out} and vectors.bin")
 
 
 if __name__ == "__main__":
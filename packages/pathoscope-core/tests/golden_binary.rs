@@ -0,0 +1,108 @@
+//! Assert `tests/golden/vectors.bin` holds exactly the vectors in `vectors.json`.
+//!
+//! The binary corpus is a companion to the JSON one, written alongside it by
+//! `tests/golden/generate.py`; `tests/golden/binary_corpus.py` documents the
+//! layout. `golden_vectors.rs` seeks to one vector at a time in it instead of
+//! parsing the whole corpus. That is only safe while the two agree, so every
+//! vector is decoded from both and compared: floats by `f64::to_bits`, coverage
+//! position by position, and the remaining fields as JSON values.
+
+mod common;
+
+use common::{expand, golden, BinaryCorpus};
+use serde_json::Value;
+
+/// Rebuild a dense coverage array from the JSON corpus's sparse encoding.
+fn dense_coverage(sparse: &Value) -> Vec<u64> {
+    let length = sparse["length"].as_u64().expect("coverage length") as usize;
+    let mut dense = vec![0u64; length];
+
+    for (index, value) in sparse["nonzero"].as_object().expect("coverage nonzero") {
+        let index: usize = index.parse().expect("coverage index is not an integer");
+        dense[index] = value.as_u64().expect("coverage value is not an integer");
+    }
+
+    dense
+}
+
+#[test]
+fn binary_corpus_matches_json_corpus() {
+    let text = std::fs::read_to_string(golden("vectors.json")).expect("vectors.json");
+    let corpus: Value = serde_json::from_str(&text).expect("vectors.json is not JSON");
+    let vectors = corpus["vectors"].as_array().expect("vectors array");
+
+    let mut binary = BinaryCorpus::open(&golden("vectors.bin"));
+
+    assert_eq!(
+        binary
+            .index
+            .iter()
+            .map(|entry| entry.0.as_str())
+            .collect::<Vec<_>>(),
+        vectors
+            .iter()
+            .map(|vector| vector["name"].as_str().unwrap())
+            .collect::<Vec<_>>(),
+        "vectors.bin and vectors.json list different vectors"
+    );
+
+    // Walk backwards so every read is a real seek rather than the next bytes.
+    for vector in vectors.iter().rev() {
+        let name = vector["name"].as_str().unwrap();
+        let section = binary.section(name).unwrap();
+
+        let mut expected_meta = vector.clone();
+
+        if let Some(result) = expected_meta
+            .get_mut("result")
+            .and_then(Value::as_object_mut)
+            .filter(|result| result.contains_key("coverage"))
+        {
+            let expected_coverage = result.remove("coverage").unwrap();
+
+            assert_eq!(
+                expected_coverage.as_object().unwrap().len(),
+                section.coverage.len(),
+                "{name}: coverage is keyed by different references"
+            );
+
+            for (reference, sparse) in expected_coverage.as_object().unwrap() {
+                let (length, runs) = &section.coverage[reference];
+
+                assert_eq!(
+                    dense_coverage(sparse),
+                    expand(*length, runs),
+                    "{name}: coverage[{reference}] differs"
+                );
+            }
+
+            for (field, bits) in &section.arrays {
+                let expected: Vec<u64> = result
+                    .remove(field)
+                    .unwrap_or_else(|| panic!("{name}: {field} is not in vectors.json"))
+                    .as_array()
+                    .unwrap()
+                    .iter()
+                    .map(|entry| entry.as_f64().unwrap().to_bits())
+                    .collect();
+
+                assert_eq!(&expected, bits, "{name}: {field} differs bitwise");
+            }
+        } else {
+            assert!(
+                section.arrays.is_empty() && section.coverage.is_empty(),
+                "{name}: carries bulk data vectors.json does not"
+            );
+        }
+
+        assert_eq!(
+            expected_meta, section.meta,
+            "{name}: remaining fields differ"
+        );
+    }
+
+    assert!(
+        binary.section("no_such_vector").is_none(),
+        "an unknown name must not resolve to a section"
+    );
+}
@@ -10,11 +10,20 @@
 //! text. "Equivalent within tolerance" is not the bar for a diagnostic
 //! workflow, and comparing the rendered text would fail on a harmless
 //! difference between float formatters while saying nothing about the values.
+//!
+//! The vectors are read from `tests/golden/vectors.bin`, which
+//! `generate.py` writes from the same capture as `vectors.json`: each test
+//! seeks to the sections it needs instead of parsing the whole corpus, and
+//! `golden_binary.rs` holds the two files to each other.
+
+mod common;
 
 use std::collections::BTreeMap;
 use std::path::{Path, PathBuf};
 use std::process::Command;
 
+use common::{golden, BinaryCorpus};
+use pathoscope_core::coverage_intervals::ReferenceIntervals;
 use serde_json::Value;
 use sha2::{Digest, Sha256};
 
@@ -24,12 +33,8 @@ fn fixtures() -> PathBuf {
     Path::new(env!("CARGO_MANIFEST_DIR")).join("tests/fixtures")
 }
 
-fn corpus() -> Value {
-    let path = Path::new(env!("CARGO_MANIFEST_DIR")).join("tests/golden/vectors.json");
-    let text = std::fs::read_to_string(&path)
-        .unwrap_or_else(|err| panic!("reading {}: {err}", path.display()));
-
-    serde_json::from_str(&text).expect("vectors.json is not valid JSON")
+fn corpus() -> BinaryCorpus {
+    BinaryCorpus::open(&golden("vectors.bin"))
 }
 
 fn sha256(path: &Path) -> String {
@@ -82,17 +87,17 @@ fn assert_floats_identical(name: &str, field: &str, expected: &[f64], actual: &[
     }
 }
 
-/// Rebuild a dense coverage array from the corpus's sparse encoding.
-fn dense_coverage(sparse: &Value) -> Vec<u64> {
-    let length = sparse["length"].as_u64().expect("coverage length") as usize;
-    let mut dense = vec![0u64; length];
+/// Rebuild a dense coverage array from the corpus's interval encoding.
+fn dense_coverage(encoded: &Value) -> Vec<u64> {
+    let intervals: ReferenceIntervals =
+        serde_json::from_value(encoded.clone()).expect("coverage intervals");
 
-    for (index, value) in sparse["nonzero"].as_object().expect("coverage nonzero") {
-        let index: usize = index.parse().expect("coverage index is not an integer");
-        dense[index] = value.as_u64().expect("coverage value is not an integer");
-    }
-
-    dense
+    intervals
+        .decode()
+        .expect("corpus coverage decodes")
+        .into_iter()
+        .map(|depth| depth as u64)
+        .collect()
 }
 
 fn run(args: &[String]) -> std::process::Output {
@@ -110,10 +115,40 @@ fn assert_stdout_empty(name: &str, output: &std::process::Output) {
     );
 }
 
-fn check_em(name: &str, vector: &Value, out_dir: &Path) {
+/// Replace an interval-encoded results file's coverage with the dense arrays
+/// its decoder rebuilds, so it can be held to the corpus as a dense one is.
+fn decode_coverage(name: &str, mut results: Value) -> Value {
+    assert_eq!(
+        results["coverage_encoding"], "intervals",
+        "{name}: results are not marked as interval-encoded"
+    );
+
+    let encoded: BTreeMap<String, ReferenceIntervals> =
+        serde_json::from_value(results["coverage"].take())
+            .unwrap_or_else(|err| panic!("{name}: coverage intervals: {err}"));
+
+    let dense: serde_json::Map<String, Value> = encoded
+        .into_iter()
+        .map(|(reference, intervals)| {
+            let values = intervals
+                .decode()
+                .unwrap_or_else(|err| panic!("{name}: coverage[{reference}]: {err}"));
+
+            (reference, values.into())
+        })
+        .collect();
+
+    results["coverage"] = dense.into();
+    results
+}
+
+/// Run an `em` vector and hold its results to the vector, decoding them first
+/// when `coverage_encoding` is `intervals`.
+fn check_em(name: &str, vector: &Value, out_dir: &Path, coverage_encoding: &str) {
     let alignment = fixtures().join(vector["args"]["alignment"].as_str().unwrap());
     let cutoff = vector["args"]["p_score_cutoff"].as_f64().unwrap();
-    let output = out_dir.join(format!("{name}.json"));
+    let output = out_dir.join(format!("{name}.{coverage_encoding}.json"));
+    let name = &format!("{name} (--coverage-encoding {coverage_encoding})");
 
     let result = run(&[
         "em".into(),
@@ -123,6 +158,8 @@ fn check_em(name: &str, vector: &Value, out_dir: &Path) {
         cutoff.to_string(),
         "--output".into(),
         output.to_string_lossy().into_owned(),
+        "--coverage-encoding".into(),
+        coverage_encoding.into(),
     ]);
 
     assert_stdout_empty(name, &result);
@@ -143,11 +180,20 @@ fn check_em(name: &str, vector: &Value, out_dir: &Path) {
         String::from_utf8_lossy(&result.stderr)
     );
 
-    let actual: Value =
-        serde_json::from_str(&std::fs::read_to_string(&output).expect("results file"))
-            .expect("results file is not valid JSON");
-    let expected = &vector["result"];
+    let results = match coverage_encoding {
+        "intervals" => decode_coverage(name, read_results(&output)),
+        _ => read_results(&output),
+    };
 
+    assert_em_result(name, &vector["result"], &results);
+}
+
+fn read_results(path: &Path) -> Value {
+    serde_json::from_str(&std::fs::read_to_string(path).expect("results file"))
+        .expect("results file is not valid JSON")
+}
+
+fn assert_em_result(name: &str, expected: &Value, actual: &Value) {
     for field in [
         "best_hit_initial_reads",
         "best_hit_initial",
@@ -164,7 +210,7 @@ fn check_em(name: &str, vector: &Value, out_dir: &Path) {
             name,
             field,
             &floats(expected, field),
-            &floats(&actual, field),
+            &floats(actual, field),
         );
     }
 
@@ -192,8 +238,8 @@ fn check_em(name: &str, vector: &Value, out_dir: &Path) {
         "{name}: coverage is keyed by different references"
     );
 
-    for (reference, sparse) in expected_coverage {
-        let want = dense_coverage(sparse);
+    for (reference, encoded) in expected_coverage {
+        let want = dense_coverage(encoded);
         let got: Vec<u64> = actual_coverage[reference]
             .as_array()
             .expect("coverage array")
@@ -218,13 +264,102 @@ fn check_em(name: &str, vector: &Value, out_dir: &Path) {
     }
 }
 
-fn check_eliminate_subtraction(name: &str, vector: &Value, out_dir: &Path) {
-    let args = &vector["args"];
-    let out_alignments = out_dir.join(format!("{name}.bam"));
-    let out_fastq = out_dir.join(format!("{name}.fq"));
-    let output = out_dir.join(format!("{name}.json"));
+/// Run every cutoff vectored for one alignment fixture in a single `em`.
+///
+/// The first run writes a matrix cache and the second loads it, so both the
+/// sweep and the cache are held to the same vectors as a run per cutoff.
+fn check_em_sweep(alignment: &str, vectors: &[&Value], out_dir: &Path) {
+    let cache = out_dir.join(format!("{alignment}.matrix"));
+    let failing = vectors.iter().any(|vector| {
+        vector.get("expect_failure").and_then(Value::as_bool) == Some(true)
+    });
+
+    for pass in ["writing", "loading"] {
+        let mut args = vec![
+            "em".to_string(),
+            "--alignment".into(),
+            fixtures().join(alignment).to_string_lossy().into_owned(),
+            "--matrix-cache".into(),
+            cache.to_string_lossy().into_owned(),
+        ];
+
+        for vector in vectors {
+            let name = vector["name"].as_str().unwrap();
+
+            args.push("--p-score-cutoff".into());
+            args.push(
+                vector["args"]["p_score_cutoff"]
+                    .as_f64()
+                    .unwrap()
+                    .to_string(),
+            );
+            args.push("--output".into());
+            args.push(
+                out_dir
+                    .join(format!("{name}.sweep.json"))
+                    .to_string_lossy()
+                    .into_owned(),
+            );
+        }
 
-    let result = run(&[
+        let result = run(&args);
+
+        assert_stdout_empty(alignment, &result);
+
+        if failing {
+            assert!(
+                !result.status.success(),
+                "{alignment}: expected the sweep to fail on a malformed input"
+            );
+            assert!(
+                !cache.exists(),
+                "{alignment}: a failed parse must not leave a matrix cache"
+            );
+
+            return;
+        }
+
+        assert!(
+            result.status.success(),
+            "{alignment}: sweep {pass} the cache exited {:?}\nstderr: {}",
+            result.status.code(),
+            String::from_utf8_lossy(&result.stderr)
+        );
+        assert!(cache.exists(), "{alignment}: no matrix cache was written");
+
+        for vector in vectors {
+            let name = vector["name"].as_str().unwrap();
+
+            assert_em_result(
+                &format!("{name} (sweep, {pass} the cache)"),
+                &vector["result"],
+                &read_results(&out_dir.join(format!("{name}.sweep.json"))),
+            );
+        }
+    }
+}
+
+/// Run an `eliminate-subtraction` vector and hold its outputs to the vector,
+/// through the bounded-memory pass when `memory_limit_mb` is given.
+fn check_eliminate_subtraction(
+    name: &str,
+    vector: &Value,
+    out_dir: &Path,
+    memory_limit_mb: Option<u32>,
+) {
+    let args = &vector["args"];
+    let (name, stem) = match memory_limit_mb {
+        Some(limit) => (
+            format!("{name} (--memory-limit-mb {limit})"),
+            format!("{name}.bounded"),
+        ),
+        None => (name.to_string(), name.to_string()),
+    };
+    let out_alignments = out_dir.join(format!("{stem}.bam"));
+    let out_fastq = out_dir.join(format!("{stem}.fq"));
+    let output = out_dir.join(format!("{stem}.json"));
+
+    let mut command = vec![
         "eliminate-subtraction".into(),
         "--isolate-alignments".into(),
         fixtures()
@@ -249,19 +384,37 @@ fn check_eliminate_subtraction(name: &str, vector: &Value, out_dir: &Path) {
         args["proc"].as_u64().unwrap().to_string(),
         "--output".into(),
         output.to_string_lossy().into_owned(),
-    ]);
+    ];
 
-    assert_stdout_empty(name, &result);
+    if let Some(limit) = memory_limit_mb {
+        command.extend(["--memory-limit-mb".into(), limit.to_string()]);
+    }
+
+    let result = run(&command);
+
+    assert_stdout_empty(&name, &result);
     assert!(
         result.status.success(),
         "{name}: exited {:?}\nstderr: {}",
         result.status.code(),
         String::from_utf8_lossy(&result.stderr)
     );
+    assert!(
+        !out_alignments.with_extension("bam.spill").exists(),
+        "{name}: spill directory left behind"
+    );
 
-    let actual: Value =
-        serde_json::from_str(&std::fs::read_to_string(&output).expect("results file"))
-            .expect("results file is not valid JSON");
+    assert_subtraction_result(&name, vector, &output, &out_fastq, &out_alignments);
+}
+
+fn assert_subtraction_result(
+    name: &str,
+    vector: &Value,
+    output: &Path,
+    out_fastq: &Path,
+    out_alignments: &Path,
+) {
+    let actual = read_results(output);
 
     assert_eq!(
         vector["result"]["subtracted"].as_u64(),
@@ -271,17 +424,135 @@ fn check_eliminate_subtraction(name: &str, vector: &Value, out_dir: &Path) {
 
     assert_eq!(
         vector["output_fastq_sha256"].as_str().unwrap(),
-        sha256(&out_fastq),
+        sha256(out_fastq),
         "{name}: filtered FASTQ differs from the recorded one"
     );
 
     assert_eq!(
         vector["output_alignments_sha256"].as_str().unwrap(),
-        sha256(&out_alignments),
+        sha256(out_alignments),
         "{name}: filtered alignments differ from the recorded ones"
     );
 }
 
+/// Run every `em` and `eliminate-subtraction` vector as one sample of a single
+/// `batch`, and hold each sample's results file to its vector.
+///
+/// Vectors that must fail are in the batch too: they fail their own sample,
+/// the batch exits non-zero for them, and every other sample still succeeds.
+fn check_batch(vectors: &[&Value], out_dir: &Path) {
+    let fixture = |vector: &Value, arg: &str| {
+        fixtures().join(vector["args"][arg].as_str().unwrap())
+    };
+    let out =
+        |name: &str, extension: &str| out_dir.join(format!("{name}.batch.{extension}"));
+
+    let samples: Vec<Value> = vectors
+        .iter()
+        .map(|vector| {
+            let name = vector["name"].as_str().unwrap();
+
+            match vector["subcommand"].as_str().unwrap() {
+                "em" => serde_json::json!({
+                    "name": name,
+                    "em": {
+                        "alignment": fixture(vector, "alignment"),
+                        "p_score_cutoff": vector["args"]["p_score_cutoff"],
+                        "output": out(name, "json"),
+                    },
+                }),
+                _ => serde_json::json!({
+                    "name": name,
+                    "eliminate_subtraction": {
+                        "isolate_alignments": fixture(vector, "isolate_alignments"),
+                        "subtraction_alignments": fixture(vector, "subtraction_alignments"),
+                        "output_alignments": out(name, "bam"),
+                        "input_fastq": fixture(vector, "input_fastq"),
+                        "output_fastq": out(name, "fq"),
+                        "proc": vector["args"]["proc"],
+                        "output": out(name, "json"),
+                    },
+                }),
+            }
+        })
+        .collect();
+
+    let manifest = out_dir.join("batch.manifest.json");
+    let summary = out_dir.join("batch.summary.json");
+
+    std::fs::write(
+        &manifest,
+        serde_json::json!({ "samples": samples }).to_string(),
+    )
+    .expect("writing the manifest");
+
+    let result = run(&[
+        "batch".into(),
+        "--manifest".into(),
+        manifest.to_string_lossy().into_owned(),
+        "--jobs".into(),
+        "3".into(),
+        "--output".into(),
+        summary.to_string_lossy().into_owned(),
+    ]);
+
+    assert_stdout_empty("batch", &result);
+
+    let failing = |vector: &Value| {
+        vector.get("expect_failure").and_then(Value::as_bool) == Some(true)
+    };
+
+    assert_eq!(
+        result.status.success(),
+        !vectors.iter().any(|vector| failing(vector)),
+        "batch: exited {:?}\nstderr: {}",
+        result.status.code(),
+        String::from_utf8_lossy(&result.stderr)
+    );
+
+    let outcomes = read_results(&summary);
+    let outcomes = outcomes.as_array().expect("summary array");
+
+    assert_eq!(
+        outcomes.len(),
+        vectors.len(),
+        "batch: one outcome per sample"
+    );
+
+    for (vector, outcome) in vectors.iter().zip(outcomes) {
+        let name = vector["name"].as_str().unwrap();
+
+        assert_eq!(
+            outcome["name"], name,
+            "batch: outcomes out of manifest order"
+        );
+        assert_eq!(
+            outcome["ok"].as_bool(),
+            Some(!failing(vector)),
+            "{name} (batch): {outcome}"
+        );
+
+        if failing(vector) {
+            continue;
+        }
+
+        match vector["subcommand"].as_str().unwrap() {
+            "em" => assert_em_result(
+                &format!("{name} (batch)"),
+                &vector["result"],
+                &read_results(&out(name, "json")),
+            ),
+            _ => assert_subtraction_result(
+                &format!("{name} (batch)"),
+                vector,
+                &out(name, "json"),
+                &out(name, "fq"),
+                &out(name, "bam"),
+            ),
+        }
+    }
+}
+
 fn have_bowtie2() -> bool {
     ["bowtie2", "bowtie2-build"].iter().all(|program| {
         Command::new(program)
@@ -344,14 +615,61 @@ fn check_candidates(name: &str, vector: &Value, out_dir: &Path) {
         actual.as_array().unwrap(),
         "{name}: candidate set differs"
     );
+
+    // Sharded, the same reads split across two bowtie2 processes must merge to
+    // the same set. Every vector names one read file, so it is passed twice to
+    // give the second shard something to align; duplicate reads cannot add a
+    // candidate.
+    let reads = fixtures()
+        .join(args["reads"].as_str().unwrap())
+        .to_string_lossy()
+        .into_owned();
+    let sharded_output = out_dir.join(format!("{name}_sharded.json"));
+
+    let result = run(&[
+        "candidates".into(),
+        "--index".into(),
+        index.to_string_lossy().into_owned(),
+        "--reads".into(),
+        reads.clone(),
+        "--reads".into(),
+        reads,
+        "--proc".into(),
+        "2".into(),
+        "--shards".into(),
+        "2".into(),
+        "--p-score-cutoff".into(),
+        args["p_score_cutoff"].as_f64().unwrap().to_string(),
+        "--output".into(),
+        sharded_output.to_string_lossy().into_owned(),
+    ]);
+
+    assert_stdout_empty(name, &result);
+    assert!(
+        result.status.success(),
+        "{name}: sharded run exited {:?}\nstderr: {}",
+        result.status.code(),
+        String::from_utf8_lossy(&result.stderr)
+    );
+
+    let sharded: Value = serde_json::from_str(
+        &std::fs::read_to_string(&sharded_output).expect("results file"),
+    )
+    .expect("results file is not valid JSON");
+
+    assert_eq!(
+        vector["result"].as_array().unwrap(),
+        sharded.as_array().unwrap(),
+        "{name}: sharded candidate set differs"
+    );
 }
 
 #[test]
 fn reproduces_every_golden_vector() {
-    let corpus = corpus();
-    let vectors = corpus["vectors"].as_array().expect("vectors array");
+    let mut corpus = corpus();
+    let names = corpus.names();
 
-    assert!(!vectors.is_empty(), "the golden corpus is empty");
+    assert!(!names.is_empty(), "the golden corpus is empty");
 
     let temp = tempfile::TempDir::new().expect("temp dir");
     let bowtie2 = have_bowtie2();
@@ -371,16 +689,23 @@ fn reproduces_every_golden_vector() {
         );
     }
 
-    let mut checked: BTreeMap<&str, usize> = BTreeMap::new();
+    let mut checked: BTreeMap<String, usize> = BTreeMap::new();
 
-    for vector in vectors {
-        let name = vector["name"].as_str().expect("vector name");
+    for name in &names {
+        // Only this vector's section is read, and it is dropped once checked.
+        let vector = &corpus.vector(name).expect("an indexed vector");
         let subcommand = vector["subcommand"].as_str().expect("vector subcommand");
 
         match subcommand {
-            "em" => check_em(name, vector, temp.path()),
+            "em" => {
+                // Decoded intervals must be exactly the dense coverage.
+                check_em(name, vector, temp.path(), "dense");
+                check_em(name, vector, temp.path(), "intervals");
+            }
             "eliminate-subtraction" => {
-                check_eliminate_subtraction(name, vector, temp.path())
+                // The bounded pass must write exactly what the default one does.
+                check_eliminate_subtraction(name, vector, temp.path(), None);
+                check_eliminate_subtraction(name, vector, temp.path(), Some(1));
             }
             "candidates" => {
                 if !bowtie2 {
@@ -392,7 +717,7 @@ fn reproduces_every_golden_vector() {
             other => panic!("{name}: unknown subcommand {other}"),
         }
 
-        *checked.entry(subcommand).or_default() += 1;
+        *checked.entry(subcommand.to_string()).or_default() += 1;
     }
 
     eprintln!("verified golden vectors: {checked:?}");
@@ -403,3 +728,40 @@ fn reproduces_every_golden_vector() {
         "the corpus must cover em and eliminate-subtraction"
     );
 }
+
+#[test]
+fn reproduces_every_em_vector_from_one_parse() {
+    let vectors = corpus().vectors();
+    let mut by_alignment: BTreeMap<&str, Vec<&Value>> = BTreeMap::new();
+
+    for vector in &vectors {
+        if vector["subcommand"] == "em" {
+            let alignment = vector["args"]["alignment"].as_str().expect("alignment");
+            by_alignment.entry(alignment).or_default().push(vector);
+        }
+    }
+
+    let temp = tempfile::TempDir::new().expect("temp dir");
+
+    for (alignment, vectors) in &by_alignment {
+        check_em_sweep(alignment, vectors, temp.path());
+    }
+
+    assert!(
+        by_alignment.values().any(|vectors| vectors.len() > 1),
+        "no fixture is vectored at more than one cutoff, so nothing was swept"
+    );
+}
+
+#[test]
+fn reproduces_every_golden_vector_in_one_batch() {
+    let corpus = corpus().vectors();
+    let vectors: Vec<&Value> = corpus
+        .iter()
+        .filter(|vector| vector["subcommand"] != "candidates")
+        .collect();
+
+    let temp = tempfile::TempDir::new().expect("temp dir");
+
+    check_batch(&vectors, temp.path());
+}
@@ -0,0 +1,376 @@
+"""Record and check a performance baseline for every golden vector.
+
+    cargo build --release
+    python3 baseline.py record
+    python3 baseline.py check [--threshold 0.25]
+
+`tests/golden_vectors.rs` proves a change leaves every result bit-identical;
+it cannot tell that the change made a run ten times slower. This is the
+matching gate for speed. It runs the release binary over each vector in
+`vectors.json` exactly as the harness does, and over scaled-up variants of it,
+and measures wall time, CPU time and peak RSS for each.
+
+A variant at scale N feeds the binary N copies of the vector's inputs. Copy 0
+is the fixture byte for byte; every later copy repeats its alignment and FASTQ
+records with `.<copy>` appended to each read name, so reads stay distinct
+and an isolate alignment, its subtraction alignment and its FASTQ still name
+the same reads. Headers and anything else that is not a record appear once.
+Vectors that must fail are measured failing, at every scale. `candidates`
+vectors need bowtie2 and an index from the golden generator's index cache, and
+are skipped with a note when bowtie2 is missing; building the index is not
+part of what is measured.
+
+`record` writes `baselines.json` beside this script, keyed by vector and
+scale, along with the machine it was recorded on. `check` reruns everything
+and exits non-zero when any figure exceeds its baseline by more than
+`--threshold` (a fraction, 0.25 by default) *and* by more than an absolute
+floor — `--min-seconds` for the two times, `--min-rss-mb` for memory — so a
+vector that takes four milliseconds cannot fail the gate by taking six.
+Each variant is run `--repeat` times and the least of each figure kept, which
+is the run least disturbed by whatever else the machine was doing.
+
+The baseline describes the machine as much as the code. `check` warns when
+it runs somewhere other than where the baseline was recorded; re-record on the
+machine that gates rather than widening the threshold. Unlike `vectors.json`
+this file is this implementation's own and is meant to be re-recorded — after
+a change that is *meant* to move a figure, with the new figure reviewed like
+the code that moved it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from contextlib import ExitStack
+from datetime import UTC, datetime
+from pathlib import Path
+
+# `bench` puts the golden directory, and so `bowtie2_cache`, on the path.
+from bench import CRATE, HERE, measure
+from bowtie2_cache import DEFAULT_CACHE, cached_index
+
+FIXTURES = CRATE / "tests" / "fixtures"
+VECTORS = CRATE / "tests" / "golden" / "vectors.json"
+DEFAULT_BASELINES = HERE / "baselines.json"
+
+DEFAULT_SCALES = (1, 100, 10_000)
+
+METRICS = ("wall_seconds", "cpu_seconds", "peak_rss_mb")
+
+# The input arguments of each subcommand, which are the files a variant scales.
+INPUTS = {
+    "em": ("alignment",),
+    "eliminate-subtraction": (
+        "isolate_alignments",
+        "subtraction_alignments",
+        "input_fastq",
+    ),
+    "candidates": ("reads",),
+}
+
+
+def machine() -> dict:
+    """Describe the machine a baseline is recorded or checked on."""
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def replicate(source: Path, target: Path, copies: int) -> None:
+    """Write `copies` copies of the SAM or FASTQ `source`'s records to `target`.
+
+    :raises ValueError: when `source` is neither SAM nor FASTQ
+    """
+    lines = source.read_text().splitlines(keepends=True)
+
+    with target.open("w") as fh:
+        fh.writelines(lines)
+
+        for copy in range(1, copies):
+            if source.suffix == ".sam":
+                for line in lines:
+                    fields = line.split("\t")
+
+                    if line.startswith("@") or len(fields) < 11:
+                        continue
+
+                    fh.write(f"{fields[0]}.{copy}\t" + "\t".join(fields[1:]))
+            elif source.suffix in (".fq", ".fastq"):
+                for position, line in enumerate(lines):
+                    if position % 4 == 0:
+                        name, space, rest = line[1:].partition(" ")
+                        line = (
+                            f"@{name.rstrip()}.{copy}{space}{rest}"
+                            if space
+                            else f"@{name.rstrip()}.{copy}\n"
+                        )
+
+                    fh.write(line)
+            else:
+                raise ValueError(f"cannot replicate {source.name}")
+
+
+def command(
+    binary: Path, vector: dict, inputs: dict[str, Path], out: Path, index: Path | None
+) -> list[str]:
+    """Build the invocation `tests/golden_vectors.rs` makes for `vector`."""
+    args = vector["args"]
+    name = vector["name"]
+
+    match vector["subcommand"]:
+        case "em":
+            return [
+                str(binary),
+                "em",
+                "--alignment",
+                str(inputs["alignment"]),
+                "--p-score-cutoff",
+                str(args["p_score_cutoff"]),
+                "--output",
+                str(out / f"{name}.json"),
+            ]
+        case "eliminate-subtraction":
+            return [
+                str(binary),
+                "eliminate-subtraction",
+                "--isolate-alignments",
+                str(inputs["isolate_alignments"]),
+                "--subtraction-alignments",
+                str(inputs["subtraction_alignments"]),
+                "--output-alignments",
+                str(out / f"{name}.bam"),
+                "--input-fastq",
+                str(inputs["input_fastq"]),
+                "--output-fastq",
+                str(out / f"{name}.fq"),
+                "--proc",
+                str(args["proc"]),
+                "--output",
+                str(out / f"{name}.json"),
+            ]
+        case "candidates":
+            return [
+                str(binary),
+                "candidates",
+                "--index",
+                str(index),
+                "--reads",
+                str(inputs["reads"]),
+                "--proc",
+                str(args["proc"]),
+                "--p-score-cutoff",
+                str(args["p_score_cutoff"]),
+                "--output",
+                str(out / f"{name}.json"),
+            ]
+        case other:
+            raise ValueError(f"{name}: unknown subcommand {other}")
+
+
+def run(
+    binary: Path,
+    vectors: list[dict],
+    scales: tuple[int, ...],
+    repeat: int,
+    cache: Path | None,
+) -> dict[str, dict[str, dict[str, float]]]:
+    """Measure every vector at every scale, returning `{name: {scale: figures}}`."""
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        tmp_path = Path(tmp)
+        indexes = {}
+
+        for vector in vectors:
+            name = vector["name"]
+            subcommand = vector["subcommand"]
+            index = None
+
+            if subcommand == "candidates":
+                if cache is None:
+                    continue
+
+                reference = vector["args"]["reference"]
+
+                if reference not in indexes:
+                    indexes[reference] = stack.enter_context(
+                        cached_index(FIXTURES / reference, cache)
+                    )
+
+                index = indexes[reference]
+
+            results[name] = {}
+
+            for scale in scales:
+                inputs = {}
+
+                for arg in INPUTS[subcommand]:
+                    fixture = vector["args"][arg]
+
+                    if scale == 1:
+                        inputs[arg] = FIXTURES / fixture
+                        continue
+
+                    # Vectors share fixtures, so each is scaled once.
+                    inputs[arg] = tmp_path / f"x{scale}" / fixture
+
+                    if not inputs[arg].exists():
+                        inputs[arg].parent.mkdir(exist_ok=True)
+                        replicate(FIXTURES / fixture, inputs[arg], scale)
+
+                invocation = command(binary, vector, inputs, tmp_path, index)
+                runs = [
+                    measure(invocation, check=not vector.get("expect_failure"))
+                    for _ in range(repeat)
+                ]
+
+                figures = dict(zip(METRICS, map(min, zip(*runs)), strict=True))
+                results[name][str(scale)] = figures
+
+                print(
+                    f"{name:<32} {scale:>7} {figures['wall_seconds']:>9.3f} "
+                    f"{figures['cpu_seconds']:>9.3f} {figures['peak_rss_mb']:>9.1f}"
+                )
+
+    return results
+
+
+def regressions(
+    baselines: dict,
+    current: dict,
+    threshold: float,
+    min_seconds: float,
+    min_rss_mb: float,
+) -> list[str]:
+    """Describe every figure in `current` that regressed against `baselines`."""
+    found = []
+
+    for name, scales in current.items():
+        for scale, figures in scales.items():
+            recorded = baselines.get(name, {}).get(scale)
+
+            if recorded is None:
+                print(f"WARNING: {name} x{scale} has no baseline", file=sys.stderr)
+                continue
+
+            for metric in METRICS:
+                before = recorded[metric]
+                after = figures[metric]
+                floor = min_rss_mb if metric == "peak_rss_mb" else min_seconds
+
+                if after > before * (1 + threshold) and after - before > floor:
+                    ratio = f"{after / before:.2f}x" if before else "from zero"
+                    found.append(
+                        f"{name} x{scale}: {metric} {after:.3f} against "
+                        f"{before:.3f} ({ratio})"
+                    )
+
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=("record", "check"))
+    parser.add_argument(
+        "--binary",
+        type=Path,
+        default=CRATE / "target" / "release" / "pathoscope-core",
+    )
+    parser.add_argument("--baselines", type=Path, default=DEFAULT_BASELINES)
+    parser.add_argument(
+        "--scales",
+        type=lambda value: tuple(int(scale) for scale in value.split(",")),
+        default=DEFAULT_SCALES,
+        help="comma-separated copy counts; 1 is the vector as recorded",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    parser.add_argument("--min-rss-mb", type=float, default=8.0)
+    parser.add_argument("--index-cache", type=Path, default=DEFAULT_CACHE)
+    args = parser.parse_args()
+
+    if not args.binary.exists():
+        sys.exit(f"{args.binary} does not exist; run `cargo build --release` first")
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    if any(scale < 1 for scale in args.scales):
+        parser.error("--scales must all be at least 1")
+
+    if args.threshold < 0:
+        parser.error("--threshold must not be negative")
+
+    cache = args.index_cache
+
+    if shutil.which("bowtie2") is None or shutil.which("bowtie2-build") is None:
+        print("bowtie2 is not on PATH; skipping candidates", file=sys.stderr)
+        cache = None
+
+    baselines = None
+
+    if args.mode == "check":
+        if not args.baselines.exists():
+            sys.exit(f"{args.baselines} does not exist; run `baseline.py record` first")
+
+        baselines = json.loads(args.baselines.read_text())
+
+        if baselines["machine"] != machine():
+            print(
+                "WARNING: the baseline was recorded on a different machine "
+                f"({baselines['machine']}); the comparison measures the hardware "
+                "as well as the code",
+                file=sys.stderr,
+            )
+
+    vectors = json.loads(VECTORS.read_text())["vectors"]
+
+    print(f"{'vector':<32} {'scale':>7} {'seconds':>9} {'CPU s':>9} {'RSS MB':>9}")
+
+    current = run(args.binary, vectors, args.scales, args.repeat, cache)
+
+    if args.mode == "record":
+        document = {
+            "note": "Recorded by tests/scale/baseline.py; re-record, never hand-edit.",
+            "recorded_at": datetime.now(UTC).isoformat(timespec="seconds"),
+            "machine": machine(),
+            "repeat": args.repeat,
+            "baselines": current,
+        }
+
+        args.baselines.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+        print(f"wrote {args.baselines}")
+
+        return
+
+    found = regressions(
+        baselines["baselines"],
+        current,
+        args.threshold,
+        args.min_seconds,
+        args.min_rss_mb,
+    )
+
+    if found:
+        print(
+            f"{len(found)} figures regressed by more than {args.threshold:.0%}:",
+            file=sys.stderr,
+        )
+
+        for line in found:
+            print(f"  {line}", file=sys.stderr)
+
+        sys.exit(1)
+
+    print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
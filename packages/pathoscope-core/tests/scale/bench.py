@@ -0,0 +1,214 @@
+"""Time the pathoscope-core subcommands over workloads from `generate.py`.
+
+    cargo build --release
+    python3 bench.py /tmp/pathoscope-scale
+
+Runs `em`, `candidates` and `eliminate-subtraction` over every scale under the
+directory and reports wall and CPU time, reads per second and peak RSS for
+each. Reads per second is over `workload.json`'s total read count for all
+three, so rows compare across subcommands.
+
+Each invocation's RSS comes from `wait4` on that process alone, so one run's
+high-water mark never leaks into the next. Linux folds waited-for descendants
+into it, which makes `candidates`' figure the larger of the binary and the
+bowtie2 it spawns.
+
+`candidates` needs bowtie2 on PATH and an index of `reference.fa`, which comes
+from the golden generator's index cache and is built once per reference; it is
+skipped, with a note, when bowtie2 is missing. `--json` appends every row to a
+JSON-lines file, so results from several machines or commits can be collected
+in one place.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+CRATE = HERE.parent.parent
+
+sys.path.insert(0, str(HERE.parent / "golden"))
+
+from bowtie2_cache import DEFAULT_CACHE, cached_index  # noqa: E402
+
+
+def measure(command: list[str], check: bool = True) -> tuple[float, float, float]:
+    """Run `command` to completion, returning its wall and CPU seconds and peak RSS.
+
+    CPU is user plus system time over the process and every descendant it
+    waited for, and peak RSS is in MB. With `check` false a non-zero exit is
+    measured like any other.
+
+    :raises subprocess.CalledProcessError: when it exits non-zero and `check` is set
+    """
+    start = time.perf_counter()
+
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    # Read stderr before reaping, or a chatty run fills the pipe and stalls.
+    stderr = process.stderr.read()
+    process.stderr.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+    # Kilobytes on Linux.
+    return seconds, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+def commands(
+    binary: Path, workload: Path, tmp: Path, index: Path | None, fmt: str, proc: int
+) -> dict[str, list[str]]:
+    isolates = str(workload / f"isolates.{fmt}")
+    subtraction = str(workload / f"subtraction.{fmt}")
+
+    runs = {
+        "em": [
+            str(binary),
+            "em",
+            "--alignment",
+            isolates,
+            "--p-score-cutoff",
+            "0.01",
+            "--output",
+            str(tmp / "em.json"),
+        ],
+        "eliminate-subtraction": [
+            str(binary),
+            "eliminate-subtraction",
+            "--isolate-alignments",
+            isolates,
+            "--subtraction-alignments",
+            subtraction,
+            "--output-alignments",
+            str(tmp / "subtracted.bam"),
+            "--input-fastq",
+            str(workload / "reads.fq"),
+            "--output-fastq",
+            str(tmp / "subtracted.fq"),
+            "--proc",
+            str(proc),
+            "--output",
+            str(tmp / "subtraction.json"),
+        ],
+    }
+
+    if index is not None:
+        runs["candidates"] = [
+            str(binary),
+            "candidates",
+            "--index",
+            str(index),
+            "--reads",
+            str(workload / "reads.fq"),
+            "--proc",
+            str(proc),
+            "--p-score-cutoff",
+            "0.01",
+            "--output",
+            str(tmp / "candidates.json"),
+        ]
+
+    return runs
+
+
+def bench(
+    workload: Path, binary: Path, fmt: str, proc: int, cache: Path | None
+) -> list[dict]:
+    meta = json.loads((workload / "workload.json").read_text())
+    rows = []
+
+    if cache is None:
+        index_context = nullcontext()
+    else:
+        index_context = cached_index(workload / "reference.fa", cache, threads=proc)
+
+    with tempfile.TemporaryDirectory() as tmp, index_context as index:
+        for subcommand, command in commands(
+            binary, workload, Path(tmp), index, fmt, proc
+        ).items():
+            seconds, cpu_seconds, peak_rss_mb = measure(command)
+
+            rows.append(
+                {
+                    "scale": meta["scale"],
+                    "subcommand": subcommand,
+                    "format": fmt,
+                    "proc": proc,
+                    "reads": meta["reads"],
+                    "alignments": meta["alignments"],
+                    "references": meta["references"],
+                    "seconds": seconds,
+                    "cpu_seconds": cpu_seconds,
+                    "reads_per_second": meta["reads"] / seconds,
+                    "peak_rss_mb": peak_rss_mb,
+                }
+            )
+
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=Path)
+    parser.add_argument(
+        "--binary",
+        type=Path,
+        default=CRATE / "target" / "release" / "pathoscope-core",
+    )
+    parser.add_argument("--format", choices=("sam", "bam"), default="sam")
+    parser.add_argument("--proc", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--index-cache", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument("--json", type=Path, help="append rows to this JSON-lines file")
+    args = parser.parse_args()
+
+    if not args.binary.exists():
+        sys.exit(f"{args.binary} does not exist; run `cargo build --release` first")
+
+    if args.proc < 1:
+        parser.error("--proc must be at least 1")
+
+    cache = args.index_cache
+
+    if shutil.which("bowtie2") is None or shutil.which("bowtie2-build") is None:
+        print("bowtie2 is not on PATH; skipping candidates", file=sys.stderr)
+        cache = None
+
+    workloads = sorted(path.parent for path in args.directory.glob("*/workload.json"))
+
+    if not workloads:
+        sys.exit(f"no workloads under {args.directory}; write some with generate.py")
+
+    print(
+        f"{'scale':<8} {'subcommand':<22} {'seconds':>9} {'CPU s':>9} "
+        f"{'reads/s':>12} {'peak RSS MB':>12}"
+    )
+
+    for workload in workloads:
+        for row in bench(workload, args.binary, args.format, args.proc, cache):
+            print(
+                f"{row['scale']:<8} {row['subcommand']:<22} {row['seconds']:>9.2f} "
+                f"{row['cpu_seconds']:>9.2f} {row['reads_per_second']:>12,.0f} "
+                f"{row['peak_rss_mb']:>12.1f}"
+            )
+
+            if args.json is not None:
+                with args.json.open("a") as fh:
+                    fh.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
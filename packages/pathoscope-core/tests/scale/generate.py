@@ -0,0 +1,288 @@
+"""Write seeded, production-shaped workloads for benchmarking pathoscope-core.
+
+The fixtures under `tests/fixtures` are a few dozen reads — enough to pin
+behaviour, far too few to say anything about speed or memory. This writes
+workloads shaped like a real sample instead:
+
+    python3 generate.py /tmp/pathoscope-scale --scale small --scale medium
+
+Each scale is a directory holding everything the three subcommands need:
+
+    reference.fa       the references, which `candidates` indexes
+    reads.fq           every read, aligned or not
+    isolates.sam       reads aligned to the references, `bowtie2 -k` style
+    subtraction.sam    the reads that also align to the host
+    workload.json      the parameters, the seed, and what was written
+
+`--bam` also writes `isolates.bam` and `subtraction.bam` with samtools, since
+the workflow passes BAM at every alignment position.
+
+What makes the shape realistic, and what each knob controls:
+
+* References come in clusters — isolates of one OTU — and a read's secondary
+  alignments land in its own cluster, the way near-identical isolates attract
+  the same reads. `--fanout` is the mean number of secondary alignments.
+* Abundance is heavy-tailed: a Zipf draw over the clusters, so a handful of
+  references take most reads and most take none.
+* Reads are substrings of their reference with up to three mismatches, and
+  the primary alignment's `AS:i` is bowtie2's local-mode score for that many
+  mismatches. Primary alignments are therefore consistent with `reference.fa`,
+  and bowtie2 over `reads.fq` finds the same primary references. Secondary
+  and host alignments are not: they sit at random positions with scores drawn
+  near the primary's, which is all `em` and `eliminate-subtraction` read.
+* `--unaligned` of the reads are noise that appear in the FASTQ only.
+* `--host-overlap` of the aligned reads also align to a host. Their host score
+  is within ten of their best isolate score either way, so roughly half of them
+  are subtracted.
+
+Everything is drawn from one `random.Random` seeded with `--seed` and the
+scale's name, so a scale's files are identical across runs and machines.
+Records are streamed as they are drawn; only the references are held in
+memory.
+"""
+
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import sys
+from itertools import accumulate
+from pathlib import Path
+
+# name -> (reads, references)
+SCALES = {
+    "small": (100_000, 200),
+    "medium": (1_000_000, 1_000),
+    "large": (5_000_000, 5_000),
+}
+
+READ_LENGTH = 100
+
+# bowtie2 --local: +2 per matching base, -6 per mismatch at full quality.
+MATCH_BONUS = 2
+MISMATCH_PENALTY = 6
+
+HOST_REFERENCES = 25
+HOST_LENGTH = 1_000_000
+
+
+def random_seq(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices("ACGT", k=length))
+
+
+def mutate(rng: random.Random, seq: str, mismatches: int) -> str:
+    bases = list(seq)
+
+    for position in rng.sample(range(len(bases)), mismatches):
+        bases[position] = rng.choice("ACGT".replace(bases[position], ""))
+
+    return "".join(bases)
+
+
+def alignment_score(mismatches: int) -> int:
+    return (READ_LENGTH - mismatches) * MATCH_BONUS - mismatches * MISMATCH_PENALTY
+
+
+def sam_record(name: str, flag: int, ref: str, pos: int, seq: str, score: int) -> str:
+    return (
+        f"{name}\t{flag}\t{ref}\t{pos}\t{1 if flag & 256 else 42}\t{len(seq)}M"
+        f"\t*\t0\t0\t{seq}\t{'I' * len(seq)}\tAS:i:{score}\n"
+    )
+
+
+def sam_header(references: dict[str, int]) -> str:
+    lines = ["@HD\tVN:1.6\tSO:unsorted\n"]
+    lines += [f"@SQ\tSN:{name}\tLN:{length}\n" for name, length in references.items()]
+    lines.append("@PG\tID:generate\tPN:generate.py\tVN:1.0\n")
+
+    return "".join(lines)
+
+
+def generate(
+    out: Path,
+    name: str,
+    reads: int,
+    references: int,
+    cluster_size: int,
+    reference_length: int,
+    fanout: float,
+    unaligned: float,
+    host_overlap: float,
+    seed: int,
+) -> dict:
+    rng = random.Random(f"pathoscope-scale:{seed}:{name}")
+    out.mkdir(parents=True, exist_ok=True)
+
+    refs = {
+        f"ref{i:06d}": random_seq(
+            rng, rng.randint(reference_length // 2, reference_length * 3 // 2)
+        )
+        for i in range(references)
+    }
+
+    names = list(refs)
+    clusters = [names[i : i + cluster_size] for i in range(0, references, cluster_size)]
+
+    # Zipf over clusters, shuffled so the abundant ones are not all at the front
+    # of the header.
+    weights = [1 / rank for rank in range(1, len(clusters) + 1)]
+    rng.shuffle(weights)
+    cumulative = list(accumulate(weights))
+
+    hosts = {f"host{i:03d}": HOST_LENGTH for i in range(HOST_REFERENCES)}
+
+    with (out / "reference.fa").open("w") as fh:
+        for ref, seq in refs.items():
+            fh.write(f">{ref}\n")
+
+            for start in range(0, len(seq), 60):
+                fh.write(seq[start : start + 60] + "\n")
+
+    alignments = 0
+    aligned = 0
+    host_aligned = 0
+
+    with (
+        (out / "reads.fq").open("w") as fastq,
+        (out / "isolates.sam").open("w") as isolates,
+        (out / "subtraction.sam").open("w") as subtraction,
+    ):
+        isolates.write(sam_header({ref: len(seq) for ref, seq in refs.items()}))
+        subtraction.write(sam_header(hosts))
+
+        for index in range(reads):
+            read = f"read{index:09d}"
+
+            if rng.random() < unaligned:
+                fastq.write(f"@{read}\n{random_seq(rng, READ_LENGTH)}\n+\n")
+                fastq.write("I" * READ_LENGTH + "\n")
+                continue
+
+            [cluster] = rng.choices(clusters, cum_weights=cumulative)
+            ref = rng.choice(cluster)
+            pos = rng.randint(0, len(refs[ref]) - READ_LENGTH)
+            mismatches = rng.randint(0, 3)
+            seq = mutate(rng, refs[ref][pos : pos + READ_LENGTH], mismatches)
+            score = alignment_score(mismatches)
+
+            fastq.write(f"@{read}\n{seq}\n+\n{'I' * READ_LENGTH}\n")
+            isolates.write(sam_record(read, 0, ref, pos + 1, seq, score))
+
+            others = [other for other in cluster if other != ref]
+            drawn = int(rng.expovariate(1 / fanout)) if fanout > 0 else 0
+            secondaries = min(len(others), drawn)
+
+            for other in rng.sample(others, secondaries):
+                isolates.write(
+                    sam_record(
+                        read,
+                        256,
+                        other,
+                        rng.randint(1, len(refs[other]) - READ_LENGTH + 1),
+                        seq,
+                        score - MISMATCH_PENALTY * rng.randint(0, 3),
+                    )
+                )
+
+            aligned += 1
+            alignments += 1 + secondaries
+
+            if rng.random() < host_overlap:
+                subtraction.write(
+                    sam_record(
+                        read,
+                        0,
+                        rng.choice(list(hosts)),
+                        rng.randint(1, HOST_LENGTH - READ_LENGTH + 1),
+                        seq,
+                        min(alignment_score(0), score + rng.randint(-10, 10)),
+                    )
+                )
+                host_aligned += 1
+
+    workload = {
+        "scale": name,
+        "seed": seed,
+        "reads": reads,
+        "aligned_reads": aligned,
+        "alignments": alignments,
+        "host_aligned_reads": host_aligned,
+        "references": references,
+        "cluster_size": cluster_size,
+        "reference_length": reference_length,
+        "read_length": READ_LENGTH,
+        "fanout": fanout,
+        "unaligned": unaligned,
+        "host_overlap": host_overlap,
+    }
+
+    (out / "workload.json").write_text(json.dumps(workload, indent=2) + "\n")
+
+    return workload
+
+
+def write_bam(out: Path) -> None:
+    for stem in ("isolates", "subtraction"):
+        sam = out / f"{stem}.sam"
+        bam = out / f"{stem}.bam"
+
+        subprocess.run(["samtools", "view", "-b", "-o", str(bam), str(sam)], check=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=Path)
+    parser.add_argument(
+        "--scale",
+        action="append",
+        choices=SCALES,
+        help="preset to write; repeat for several (default: small)",
+    )
+    parser.add_argument("--reads", type=int, help="override the preset's read count")
+    parser.add_argument(
+        "--references", type=int, help="override the preset's reference count"
+    )
+    parser.add_argument("--cluster-size", type=int, default=5)
+    parser.add_argument("--reference-length", type=int, default=2_000)
+    parser.add_argument("--fanout", type=float, default=1.5)
+    parser.add_argument("--unaligned", type=float, default=0.05)
+    parser.add_argument("--host-overlap", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=2852)
+    parser.add_argument("--bam", action="store_true")
+    args = parser.parse_args()
+
+    if args.reference_length < READ_LENGTH * 2:
+        parser.error(f"--reference-length must be at least {READ_LENGTH * 2}")
+
+    if args.bam and shutil.which("samtools") is None:
+        sys.exit("samtools must be on PATH to write BAM")
+
+    for name in args.scale or ["small"]:
+        reads, references = SCALES[name]
+        out = args.directory / name
+
+        workload = generate(
+            out,
+            name,
+            args.reads or reads,
+            args.references or references,
+            args.cluster_size,
+            args.reference_length,
+            args.fanout,
+            args.unaligned,
+            args.host_overlap,
+            args.seed,
+        )
+
+        if args.bam:
+            write_bam(out)
+
+        print(
+            f"{name}: {workload['reads']:,} reads, {workload['alignments']:,} "
+            f"alignments over {workload['references']:,} references -> {out}"
+        )
+
+
+if __name__ == "__main__":
+    main()
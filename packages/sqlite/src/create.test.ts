@@ -1,23 +1,25 @@
-import { chmod, mkdir, mkdtemp, readFile, rm } from "node:fs/promises";
+import { createHash } from "node:crypto";
+import { chmod, mkdir, mkdtemp, readFile, rm, stat } from "node:fs/promises";
 import { tmpdir } from "node:os";
 import { dirname, join } from "node:path";
 import { DatabaseSync } from "node:sqlite";
 import { fileURLToPath } from "node:url";
 import { afterEach, beforeEach, describe, expect, it } from "vitest";
-import { createIndexArtifact } from "./create";
-import { IndexOtuIntegrityError } from "./errors";
+import { createDeltaIndexArtifact, createIndexArtifact } from "./create";
+import { IndexArtifactError, IndexOtuIntegrityError } from "./errors";
+import { writeFasta } from "./fasta";
 import golden from "./fixtures/golden.json" with { type: "json" };
 import {
 	type IndexOtu,
 	type IndexReference,
 	openWorkflowIndex,
-	writeFasta,
 } from "./queries";
 import {
 	INDEX_SQLITE_FILE_NAME,
 	REFERENCE_SQLITE_FILE_NAME,
 	REFERENCE_SQLITE_FORMAT,
 	REFERENCE_SQLITE_FORMAT_VERSION,
+	REFERENCE_SQLITE_PACKED_FORMAT_VERSION,
 } from "./schema";
 
 const FIXTURES = join(dirname(fileURLToPath(import.meta.url)), "fixtures");
@@ -252,6 +254,484 @@ describe("createIndexArtifact", () => {
 	});
 });
 
+describe("createIndexArtifact with bulkLoad", () => {
+	async function* stream() {
+		for (const otu of OTUS) {
+			yield otu;
+		}
+	}
+
+	it("round-trips every query through a written artifact", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, stream(), { bulkLoad: true });
+
+		const index = openWorkflowIndex({ id: 1, path });
+
+		expect(await index.getReferenceMetadata()).toEqual(
+			golden.referenceMetadata,
+		);
+		expect(await collect(index.iterOtus())).toEqual(golden.otus);
+		expect(await collect(index.iterSequences())).toEqual(golden.sequences);
+		expect(await collect(index.iterDefaultSequences())).toEqual(
+			golden.defaultSequences,
+		);
+		expect(
+			await collect(index.iterOtuSequences(golden.otuSequences.otuIds)),
+		).toEqual(golden.otuSequences.result);
+		expect(
+			await index.getOtuRefsBySequenceIds(
+				golden.otuRefsBySequenceId.sequenceIds,
+			),
+		).toEqual(golden.otuRefsBySequenceId.result);
+
+		index.close();
+	});
+
+	it("writes a FASTA byte-identical to the golden", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const fastaPath = join(workPath, "reference.fa");
+
+		await createIndexArtifact(path, REFERENCE, OTUS, { bulkLoad: true });
+
+		const index = openWorkflowIndex({ id: 1, path });
+
+		await writeFasta(fastaPath, index.iterDefaultSequences());
+
+		index.close();
+
+		expect(await readFile(fastaPath, "utf8")).toBe(
+			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		);
+	});
+
+	it("writes a schema matching the fixture artifact", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, OTUS, { bulkLoad: true });
+
+		expect(readSchema(path)).toEqual(
+			readSchema(join(FIXTURES, REFERENCE_SQLITE_FILE_NAME)),
+		);
+	});
+
+	it("leaves a file in rollback-journal mode", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, OTUS, { bulkLoad: true });
+
+		const database = new DatabaseSync(path, { readOnly: true });
+		const row = database.prepare("PRAGMA journal_mode").get();
+
+		database.close();
+
+		expect(row?.journal_mode).toBe("delete");
+	});
+
+	it("deletes the file when a row is bad", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		const duplicated = [...OTUS.slice(0, 1), ...OTUS.slice(0, 1)];
+
+		await expect(
+			createIndexArtifact(path, REFERENCE, duplicated, { bulkLoad: true }),
+		).rejects.toThrow();
+
+		await expect(stat(path)).rejects.toThrow(/ENOENT/);
+	});
+
+	it("deletes the file and closes the source when the source fails", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		let closed = false;
+
+		async function* failing() {
+			try {
+				yield takeOtu();
+				throw new Error("source failed");
+			} finally {
+				closed = true;
+			}
+		}
+
+		await expect(
+			createIndexArtifact(path, REFERENCE, failing(), { bulkLoad: true }),
+		).rejects.toThrow("source failed");
+
+		expect(closed).toBe(true);
+		await expect(stat(path)).rejects.toThrow(/ENOENT/);
+	});
+
+	it("keeps the source's error when the file is already gone", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		async function* failing() {
+			yield takeOtu();
+			await rm(path);
+			throw new Error("source failed");
+		}
+
+		await expect(
+			createIndexArtifact(path, REFERENCE, failing(), { bulkLoad: true }),
+		).rejects.toThrow("source failed");
+	});
+
+	it("refuses an OTU with no isolates", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const otu = takeOtu();
+
+		await expect(
+			createIndexArtifact(path, REFERENCE, [{ ...otu, isolates: [] }], {
+				bulkLoad: true,
+			}),
+		).rejects.toThrow(IndexOtuIntegrityError);
+	});
+});
+
+describe("createIndexArtifact with packSequences", () => {
+	it.each([
+		["in one transaction", false],
+		["with bulkLoad", true],
+	])("round-trips every query written %s", async (_name, bulkLoad) => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, OTUS, {
+			bulkLoad,
+			packSequences: true,
+		});
+
+		const index = openWorkflowIndex({ id: 1, path });
+
+		expect(await collect(index.iterOtus())).toEqual(golden.otus);
+		expect(await collect(index.iterSequences())).toEqual(golden.sequences);
+		expect(await collect(index.iterDefaultSequences())).toEqual(
+			golden.defaultSequences,
+		);
+		expect(
+			await collect(index.iterOtuSequences(golden.otuSequences.otuIds)),
+		).toEqual(golden.otuSequences.result);
+		expect(
+			await index.getOtuRefsBySequenceIds(
+				golden.otuRefsBySequenceId.sequenceIds,
+			),
+		).toEqual(golden.otuRefsBySequenceId.result);
+
+		index.close();
+	});
+
+	it("writes a FASTA byte-identical to the golden, on reader threads", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const fastaPath = join(workPath, "reference.fa");
+
+		await createIndexArtifact(path, REFERENCE, OTUS, { packSequences: true });
+
+		const index = openWorkflowIndex({ id: 1, path }, { readerThreads: 1 });
+
+		await writeFasta(fastaPath, index.iterDefaultSequences());
+
+		index.close();
+
+		expect(await readFile(fastaPath, "utf8")).toBe(
+			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		);
+	});
+
+	it("stamps the packed format version and stores blobs", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, OTUS, { packSequences: true });
+
+		const database = new DatabaseSync(path, { readOnly: true });
+
+		const version = database
+			.prepare(`SELECT value FROM metadata WHERE key = 'format_version'`)
+			.get();
+
+		const types = database
+			.prepare("SELECT DISTINCT typeof(sequence) AS type FROM sequences")
+			.all();
+
+		database.close();
+
+		expect(version?.value).toBe(REFERENCE_SQLITE_PACKED_FORMAT_VERSION);
+		expect(types).toEqual([{ type: "blob" }]);
+	});
+
+	it("writes a smaller artifact than text", async () => {
+		const textPath = join(workPath, "text.sqlite");
+		const packedPath = join(workPath, "packed.sqlite");
+
+		const otus = OTUS.map((otu) => ({
+			...otu,
+			isolates: otu.isolates.map((isolate) => ({
+				...isolate,
+				sequences: isolate.sequences.map((sequence) => ({
+					...sequence,
+					sequence: sequence.sequence.repeat(10_000),
+				})),
+			})),
+		}));
+
+		await createIndexArtifact(textPath, REFERENCE, otus);
+		await createIndexArtifact(packedPath, REFERENCE, otus, {
+			packSequences: true,
+		});
+
+		const [text, packed] = await Promise.all([
+			stat(textPath),
+			stat(packedPath),
+		]);
+
+		expect(packed.size).toBeLessThan(text.size / 2);
+	});
+});
+
+describe("createIndexArtifact with embedDefaultFasta", () => {
+	it("adds only the FASTA table and its metadata", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createIndexArtifact(path, REFERENCE, OTUS, {
+			embedDefaultFasta: true,
+		});
+
+		const fixture = readSchema(join(FIXTURES, REFERENCE_SQLITE_FILE_NAME));
+
+		expect(readSchema(path).filter((item) => !fixture.includes(item))).toEqual(
+			[
+				"table default_fasta on default_fasta: CREATE TABLE default_fasta ( position INTEGER NOT NULL, chunk BLOB NOT NULL, PRIMARY KEY (position) )",
+			],
+		);
+
+		const index = openWorkflowIndex({ id: 1, path });
+		const fasta = await index.getDefaultFasta();
+
+		index.close();
+
+		const expected = await readFile(join(FIXTURES, "default.fa"));
+
+		expect(fasta?.bytes).toBe(expected.length);
+		expect(fasta?.sha256).toBe(
+			createHash("sha256").update(expected).digest("hex"),
+		);
+	});
+});
+
+describe("createDeltaIndexArtifact", () => {
+	const [alpha, mu, zeta] = OTUS as [IndexOtu, IndexOtu, IndexOtu];
+
+	/** A copy of `otu` under new ids, so it can sit beside the original. */
+	function renamed(otu: IndexOtu, suffix: string): IndexOtu {
+		return {
+			...otu,
+			id: `${otu.id}_${suffix}`,
+			isolates: otu.isolates.map((isolate) => ({
+				...isolate,
+				sequences: isolate.sequences.map((sequence) => ({
+					...sequence,
+					id: `${sequence.id}_${suffix}`,
+				})),
+			})),
+		};
+	}
+
+	/**
+	 * The fixture as an earlier build had it: `alpha` a version behind and
+	 * renamed, `zeta` not yet added, and an OTU since removed.
+	 */
+	const PREVIOUS_OTUS = [
+		{ ...alpha, name: "Stale alpha", version: alpha.version - 1 },
+		renamed(mu, "removed"),
+		mu,
+	];
+
+	async function writePrevious(packSequences = false) {
+		const path = join(workPath, "previous.sqlite");
+
+		await createIndexArtifact(path, REFERENCE, PREVIOUS_OTUS, {
+			packSequences,
+		});
+
+		return { id: 1, path };
+	}
+
+	it("round-trips every query as a full rebuild would", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createDeltaIndexArtifact(
+			path,
+			await writePrevious(),
+			REFERENCE,
+			[zeta, alpha],
+			{ removed: ["otu_mu_removed"] },
+		);
+
+		const index = openWorkflowIndex({ id: 1, path });
+
+		expect(await index.getReferenceMetadata()).toEqual(
+			golden.referenceMetadata,
+		);
+		expect(await collect(index.iterOtus())).toEqual(golden.otus);
+		expect(await collect(index.iterSequences())).toEqual(golden.sequences);
+		expect(await collect(index.iterDefaultSequences())).toEqual(
+			golden.defaultSequences,
+		);
+		expect(
+			await collect(index.iterOtuSequences(golden.otuSequences.otuIds)),
+		).toEqual(golden.otuSequences.result);
+		expect(
+			await index.getOtuRefsBySequenceIds(
+				golden.otuRefsBySequenceId.sequenceIds,
+			),
+		).toEqual(golden.otuRefsBySequenceId.result);
+
+		index.close();
+	});
+
+	it("leaves the previous artifact byte for byte as it was", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const previous = await writePrevious();
+		const before = await readFile(previous.path);
+
+		await createDeltaIndexArtifact(path, previous, REFERENCE, [zeta, alpha], {
+			removed: ["otu_mu_removed"],
+			embedDefaultFasta: true,
+		});
+
+		expect((await readFile(previous.path)).equals(before)).toBe(true);
+	});
+
+	it("writes a schema matching the fixture artifact", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createDeltaIndexArtifact(path, await writePrevious(), REFERENCE, [
+			alpha,
+		]);
+
+		expect(readSchema(path)).toEqual(
+			readSchema(join(FIXTURES, REFERENCE_SQLITE_FILE_NAME)),
+		);
+	});
+
+	it("keeps the isolate order of a copied OTU", async () => {
+		const previousPath = join(workPath, "previous.sqlite");
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		// Written in reverse, so only insertion order puts them back this way.
+		const reversed = { ...alpha, isolates: [...alpha.isolates].reverse() };
+
+		await createIndexArtifact(previousPath, REFERENCE, [reversed, mu]);
+		await createDeltaIndexArtifact(
+			path,
+			{ id: 1, path: previousPath },
+			REFERENCE,
+			[mu],
+		);
+
+		const index = openWorkflowIndex({ id: 1, path });
+		const [copied] = await collect(index.iterOtus());
+
+		index.close();
+
+		expect(copied?.isolates.map(({ id }) => id)).toEqual(
+			reversed.isolates.map(({ id }) => id),
+		);
+	});
+
+	it("writes a FASTA byte-identical to the golden from a packed artifact", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const fastaPath = join(workPath, "reference.fa");
+
+		await createDeltaIndexArtifact(
+			path,
+			await writePrevious(true),
+			REFERENCE,
+			[alpha, zeta],
+			{ removed: ["otu_mu_removed"] },
+		);
+
+		const index = openWorkflowIndex({ id: 1, path });
+
+		await writeFasta(fastaPath, index.iterDefaultSequences());
+
+		index.close();
+
+		const database = new DatabaseSync(path, { readOnly: true });
+		const version = database
+			.prepare(`SELECT value FROM metadata WHERE "key" = 'format_version'`)
+			.get();
+
+		database.close();
+
+		expect(version?.value).toBe(REFERENCE_SQLITE_PACKED_FORMAT_VERSION);
+		expect(await readFile(fastaPath, "utf8")).toBe(
+			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		);
+	});
+
+	it("embeds the default FASTA of the new OTUs", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		await createDeltaIndexArtifact(
+			path,
+			await writePrevious(),
+			REFERENCE,
+			[alpha, zeta],
+			{ removed: ["otu_mu_removed"], embedDefaultFasta: true },
+		);
+
+		const index = openWorkflowIndex({ id: 1, path });
+		const fasta = await index.getDefaultFasta();
+
+		index.close();
+
+		expect(fasta?.sha256).toBe(
+			createHash("sha256")
+				.update(await readFile(join(FIXTURES, "default.fa")))
+				.digest("hex"),
+		);
+	});
+
+	it("refuses to build an artifact from itself", async () => {
+		const previous = await writePrevious();
+
+		await expect(
+			createDeltaIndexArtifact(previous.path, previous, REFERENCE, [alpha]),
+		).rejects.toThrow(IndexArtifactError);
+
+		expect((await stat(previous.path)).size).toBeGreaterThan(0);
+	});
+
+	it("deletes the file when a changed OTU collides with a copied one", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+
+		// A new OTU reusing a sequence id `mu` still holds.
+		const colliding = { ...renamed(mu, "new"), isolates: mu.isolates };
+
+		await expect(
+			createDeltaIndexArtifact(path, await writePrevious(), REFERENCE, [
+				colliding,
+			]),
+		).rejects.toThrow();
+
+		await expect(stat(path)).rejects.toThrow(/ENOENT/);
+	});
+
+	it("keeps the source's error when the file is already gone", async () => {
+		const path = join(workPath, INDEX_SQLITE_FILE_NAME);
+		const previous = await writePrevious();
+
+		async function* failing() {
+			yield alpha;
+			await rm(path);
+			throw new Error("source failed");
+		}
+
+		await expect(
+			createDeltaIndexArtifact(path, previous, REFERENCE, failing()),
+		).rejects.toThrow("source failed");
+	});
+});
+
 function readSchema(path: string): string[] {
 	const database = new DatabaseSync(path, { readOnly: true });
 
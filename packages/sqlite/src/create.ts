@@ -7,15 +7,111 @@
  * it then reads back through {@link openWorkflowIndex}.
  */
 
+import { createHash } from "node:crypto";
 import { unlink } from "node:fs/promises";
+import { resolve } from "node:path";
 import type { DatabaseSync } from "node:sqlite";
-import { IndexOtuIntegrityError } from "./errors";
-import type { IndexOtu, IndexReference } from "./queries";
-import { createIndexArtifactSchema } from "./schema";
+import { setImmediate } from "node:timers/promises";
+import { pathToFileURL } from "node:url";
+import { IndexArtifactError, IndexOtuIntegrityError } from "./errors";
+import { packSequence, unpackSequence } from "./nucleotides";
+import { type IndexOtu, type IndexReference, SEQUENCE_ORDER } from "./queries";
+import {
+	createIndexArtifactDefaultFasta,
+	createIndexArtifactIndexes,
+	createIndexArtifactSchema,
+	type IndexArtifactSource,
+	openIndexArtifact,
+	REFERENCE_SQLITE_PACKED_FORMAT_VERSION,
+} from "./schema";
 
 /** The reference metadata to record, if the source has any. */
 export type CreateIndexReference = IndexReference;
 
+/**
+ * OTUs a bulk load writes per transaction.
+ *
+ * Large enough that commits are a rounding error next to the inserts, small
+ * enough that SQLite's dirty pages for one batch stay inside its cache.
+ */
+const BULK_LOAD_BATCH_SIZE = 1000;
+
+/**
+ * Connection settings for a bulk load, which last only as long as the handle.
+ *
+ * No rollback journal and no fsyncs: a bulk-loaded file is deleted whenever the
+ * load fails, so neither would ever be used. The larger cache (in KiB, hence
+ * negative) keeps a batch's pages in memory until its commit.
+ */
+const BULK_LOAD_PRAGMAS = `
+PRAGMA journal_mode = OFF;
+PRAGMA synchronous = OFF;
+PRAGMA locking_mode = EXCLUSIVE;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -262144;
+`;
+
+/**
+ * Bytes of FASTA stored per `default_fasta` row, give or take a record.
+ *
+ * Matches the buffers `writeFasta` writes in, so copying one out is one write.
+ */
+const DEFAULT_FASTA_CHUNK_SIZE = 4 * 1024 * 1024;
+
+/**
+ * The default-isolate sequences, in the order `iterDefaultSequences` yields
+ * them.
+ *
+ * Only the two columns a FASTA record needs, run on the handle still writing
+ * the artifact, but sorted by the reader's own {@link SEQUENCE_ORDER} so the
+ * two cannot drift apart. The tests hold both to `default.fa`.
+ */
+const SELECT_DEFAULT_FASTA_RECORDS = `
+	SELECT sequences.id AS id, sequences.sequence AS sequence
+	FROM sequences
+	JOIN isolates ON sequences.isolate_id = isolates.id
+	WHERE isolates.is_default = 1
+	${SEQUENCE_ORDER}
+`;
+
+/** Options for {@link createIndexArtifact}. */
+export type CreateIndexArtifactOptions = {
+	/**
+	 * Trade atomicity for speed when building a large artifact.
+	 *
+	 * OTUs are committed in batches without a rollback journal, the secondary
+	 * indexes are built once after the last row, and the next OTU is requested
+	 * from `otus` before the current one is written, so a source that does I/O
+	 * fetches while SQLite inserts. The file is schema-identical to one written
+	 * without this option.
+	 *
+	 * What is given up is the empty artifact a failed default write leaves
+	 * behind: a failed bulk load deletes the file instead. Only use it for an
+	 * artifact that is thrown away when its build fails.
+	 */
+	bulkLoad?: boolean;
+
+	/**
+	 * Write the sequences 2-bit packed, as a `format_version` 2 artifact.
+	 *
+	 * A reference that is almost all `ACGT` comes out at a little over a
+	 * quarter of the size, and so downloads and decompresses in a fraction of
+	 * the time. Only this package's reader opens one so far, so leave it off
+	 * for anything the other implementation reads.
+	 */
+	packSequences?: boolean;
+
+	/**
+	 * Precompute the default-isolate FASTA and store it in the artifact.
+	 *
+	 * Every workflow mapping against the index writes that FASTA before it
+	 * starts, and with it embedded `writeDefaultFasta` copies it out instead of
+	 * formatting every sequence again. It costs about the sequences' size again,
+	 * so it is for a snapshot many jobs read, not an artifact read once.
+	 */
+	embedDefaultFasta?: boolean;
+};
+
 /**
  * Write a SQLite artifact at `path` holding `otus`, replacing any file there.
  *
@@ -30,6 +126,11 @@ export async function createIndexArtifact(
 	path: string,
 	reference: CreateIndexReference | null,
 	otus: AsyncIterable<IndexOtu> | Iterable<IndexOtu>,
+	{
+		bulkLoad = false,
+		packSequences = false,
+		embedDefaultFasta = false,
+	}: CreateIndexArtifactOptions = {},
 ): Promise<void> {
 	// Only an absent file is unremarkable. A path that cannot be unlinked is
 	// reported here rather than swallowed, because the DDL would otherwise run
@@ -41,101 +142,486 @@ export async function createIndexArtifact(
 		}
 	});
 
-	const database = createIndexArtifactSchema(path);
+	if (bulkLoad) {
+		return bulkLoadIndexArtifact(
+			path,
+			reference,
+			otus,
+			packSequences,
+			embedDefaultFasta,
+		);
+	}
+
+	const database = createIndexArtifactSchema(path, { packSequences });
 
 	try {
 		database.exec("BEGIN");
 
 		try {
-			const referenceId =
-				reference === null ? null : insertReference(database, reference);
+			const writeOtu = prepareOtuWriter(database, reference, packSequences);
 
-			const insertOtu = database.prepare(
-				`INSERT INTO otus (id, reference_id, abbreviation, name, taxid, version)
-					VALUES (?, ?, ?, ?, ?, ?)`,
-			);
+			for await (const otu of otus) {
+				writeOtu(otu);
+			}
 
-			const insertSchemaItem = database.prepare(
-				`INSERT INTO otu_schema (otu_id, name, molecule, required) VALUES (?, ?, ?, ?)`,
-			);
+			if (embedDefaultFasta) {
+				await storeDefaultFasta(database);
+			}
+
+			database.exec("COMMIT");
+		} catch (error) {
+			database.exec("ROLLBACK");
+
+			throw error;
+		}
+	} finally {
+		database.close();
+	}
+}
+
+async function bulkLoadIndexArtifact(
+	path: string,
+	reference: CreateIndexReference | null,
+	otus: AsyncIterable<IndexOtu> | Iterable<IndexOtu>,
+	packSequences: boolean,
+	embedDefaultFasta: boolean,
+): Promise<void> {
+	const database = createIndexArtifactSchema(path, {
+		deferIndexes: true,
+		packSequences,
+	});
+
+	try {
+		database.exec(BULK_LOAD_PRAGMAS);
+		database.exec("BEGIN");
+
+		await bulkLoadOtus(database, reference, otus, packSequences);
+
+		createIndexArtifactIndexes(database);
+
+		// After the indexes, which the FASTA's ordering reads through.
+		if (embedDefaultFasta) {
+			await storeDefaultFasta(database);
+		}
+
+		database.exec("COMMIT");
+	} catch (error) {
+		// Without a journal there is nothing to roll back to, so the only
+		// consistent state left is no file at all. Failing to delete it must not
+		// replace the error that explains why the build stopped.
+		database.close();
+		await unlink(path).catch(() => {});
+
+		throw error;
+	}
+
+	database.close();
+}
+
+/** Write `otus` in batched transactions, fetching each while the last is written. */
+async function bulkLoadOtus(
+	database: DatabaseSync,
+	reference: CreateIndexReference | null,
+	otus: AsyncIterable<IndexOtu> | Iterable<IndexOtu>,
+	packSequences: boolean,
+): Promise<void> {
+	const writeOtu = prepareOtuWriter(database, reference, packSequences);
+
+	const iterator =
+		Symbol.asyncIterator in otus
+			? otus[Symbol.asyncIterator]()
+			: otus[Symbol.iterator]();
+
+	// Always one request ahead of the OTU being written, so the source's next
+	// fetch is in flight for the whole of the synchronous insert.
+	let pending = Promise.resolve(iterator.next());
+	let batched = 0;
+
+	try {
+		for (let result = await pending; !result.done; result = await pending) {
+			pending = Promise.resolve(iterator.next());
+
+			writeOtu(result.value);
+			batched += 1;
+
+			if (batched === BULK_LOAD_BATCH_SIZE) {
+				database.exec("COMMIT");
+				database.exec("BEGIN");
+				batched = 0;
+			}
+		}
+	} catch (error) {
+		// The request already in flight is abandoned. Observe it so a source
+		// that fails after the write did is not reported as unhandled, then let
+		// the source release whatever it holds, as `for await` would.
+		pending.catch(() => {});
+		await iterator.return?.();
+
+		throw error;
+	}
+}
+
+/**
+ * Prepare the inserts once and return a function writing one OTU with them.
+ *
+ * The reference row, if there is one, is written here, so call this inside the
+ * transaction that writes the OTUs. `packSequences` has to match the schema
+ * the artifact was created with.
+ */
+function prepareOtuWriter(
+	database: DatabaseSync,
+	reference: CreateIndexReference | null,
+	packSequences: boolean,
+): (otu: IndexOtu) => void {
+	const referenceId =
+		reference === null ? null : insertReference(database, reference);
+
+	const insertOtu = database.prepare(
+		`INSERT INTO otus (id, reference_id, abbreviation, name, taxid, version)
+			VALUES (?, ?, ?, ?, ?, ?)`,
+	);
+
+	const insertSchemaItem = database.prepare(
+		`INSERT INTO otu_schema (otu_id, name, molecule, required) VALUES (?, ?, ?, ?)`,
+	);
 
-			const insertIsolate = database.prepare(
-				`INSERT INTO isolates (virtool_id, otu_id, source_type, source_name, is_default)
-					VALUES (?, ?, ?, ?, ?) RETURNING id`,
+	const insertIsolate = database.prepare(
+		`INSERT INTO isolates (virtool_id, otu_id, source_type, source_name, is_default)
+			VALUES (?, ?, ?, ?, ?) RETURNING id`,
+	);
+
+	const insertSequence = database.prepare(
+		`INSERT INTO sequences (id, isolate_id, accession, definition, host, segment, sequence)
+			VALUES (?, ?, ?, ?, ?, ?, ?)`,
+	);
+
+	return (otu) => {
+		checkOtuIntegrity(otu);
+
+		insertOtu.run(
+			otu.id,
+			referenceId,
+			otu.abbreviation,
+			otu.name,
+			otu.taxid,
+			otu.version,
+		);
+
+		for (const item of otu.schema) {
+			insertSchemaItem.run(
+				otu.id,
+				item.name,
+				item.molecule,
+				item.required ? 1 : 0,
 			);
+		}
 
-			const insertSequence = database.prepare(
-				`INSERT INTO sequences (id, isolate_id, accession, definition, host, segment, sequence)
-					VALUES (?, ?, ?, ?, ?, ?, ?)`,
+		for (const isolate of otu.isolates) {
+			const row = insertIsolate.get(
+				isolate.id,
+				otu.id,
+				isolate.source_type,
+				isolate.source_name,
+				isolate.default ? 1 : 0,
 			);
 
-			for await (const otu of otus) {
-				checkOtuIntegrity(otu);
-
-				insertOtu.run(
-					otu.id,
-					referenceId,
-					otu.abbreviation,
-					otu.name,
-					otu.taxid,
-					otu.version,
+			const isolateId = Number(row?.id);
+
+			// `INSERT … RETURNING` either throws or hands back the row, so this
+			// cannot fire today. It is here because the alternative to checking
+			// is writing `NaN` into every one of the isolate's sequences, and the
+			// rowid is what ties them to their OTU.
+			if (!Number.isInteger(isolateId)) {
+				throw new Error(
+					`Inserting isolate ${isolate.id} of OTU ${otu.id} returned no rowid`,
 				);
+			}
 
-				for (const item of otu.schema) {
-					insertSchemaItem.run(
-						otu.id,
-						item.name,
-						item.molecule,
-						item.required ? 1 : 0,
-					);
-				}
-
-				for (const isolate of otu.isolates) {
-					const row = insertIsolate.get(
-						isolate.id,
-						otu.id,
-						isolate.source_type,
-						isolate.source_name,
-						isolate.default ? 1 : 0,
-					);
-
-					const isolateId = Number(row?.id);
-
-					// `INSERT … RETURNING` either throws or hands back the row, so
-					// this cannot fire today. It is here because the alternative to
-					// checking is writing `NaN` into every one of the isolate's
-					// sequences, and the rowid is what ties them to their OTU.
-					if (!Number.isInteger(isolateId)) {
-						throw new Error(
-							`Inserting isolate ${isolate.id} of OTU ${otu.id} returned no rowid`,
-						);
-					}
-
-					for (const sequence of isolate.sequences) {
-						insertSequence.run(
-							sequence.id,
-							isolateId,
-							sequence.accession,
-							sequence.definition,
-							sequence.host,
-							sequence.segment,
-							sequence.sequence,
-						);
-					}
-				}
+			for (const sequence of isolate.sequences) {
+				insertSequence.run(
+					sequence.id,
+					isolateId,
+					sequence.accession,
+					sequence.definition,
+					sequence.host,
+					sequence.segment,
+					packSequences
+						? packSequence(sequence.sequence)
+						: sequence.sequence,
+				);
 			}
+		}
+	};
+}
 
-			database.exec("COMMIT");
-		} catch (error) {
-			database.exec("ROLLBACK");
+/** Options for {@link createDeltaIndexArtifact}. */
+export type CreateDeltaIndexArtifactOptions = {
+	/**
+	 * Ids of OTUs in the previous artifact that the new one leaves out.
+	 *
+	 * Ids the previous artifact does not hold are ignored, as is any id also
+	 * among the changed OTUs, which are written whatever this says.
+	 */
+	removed?: Iterable<string>;
+
+	/** As for {@link createIndexArtifact}. */
+	embedDefaultFasta?: boolean;
+};
 
+/**
+ * Write a SQLite artifact at `path` from the `previous` artifact and the OTUs
+ * that changed since it was built, replacing any file at `path`.
+ *
+ * `otus` holds every OTU added or modified since, whole, and is written as
+ * {@link createIndexArtifact} writes it. Every other OTU of the previous
+ * artifact, less `removed`, is then copied across in one `INSERT … SELECT` per
+ * table, without being read into JavaScript at all. A rebuild that touches a
+ * handful of OTUs out of thousands costs the handful plus a copy.
+ *
+ * Every query returns what it would from a full rebuild with the same OTUs.
+ * Isolate rowids differ, as they would between any two builds, but copied
+ * isolates and sequences keep their order within each OTU, which is all the
+ * queries read them by. The new artifact is written in the previous one's
+ * format version, since its sequences are copied as they are stored.
+ *
+ * Always loaded as `bulkLoad` loads, so a failed build deletes the file.
+ *
+ * @throws {IndexArtifactMissingError} when there is no `previous` artifact.
+ * @throws {IndexArtifactFormatError} when `previous` is not an artifact.
+ */
+export async function createDeltaIndexArtifact(
+	path: string,
+	previous: IndexArtifactSource,
+	reference: CreateIndexReference | null,
+	otus: AsyncIterable<IndexOtu> | Iterable<IndexOtu>,
+	{
+		removed = [],
+		embedDefaultFasta = false,
+	}: CreateDeltaIndexArtifactOptions = {},
+): Promise<void> {
+	// Unlinking the target first would delete the only copy of the source.
+	if (resolve(path) === resolve(previous.path)) {
+		throw new IndexArtifactError(
+			`Cannot build ${path} from itself; write the new artifact elsewhere`,
+		);
+	}
+
+	const packSequences =
+		readFormatVersion(previous) === REFERENCE_SQLITE_PACKED_FORMAT_VERSION;
+
+	await unlink(path).catch((error: NodeJS.ErrnoException) => {
+		if (error.code !== "ENOENT") {
 			throw error;
 		}
+	});
+
+	const database = createIndexArtifactSchema(path, {
+		deferIndexes: true,
+		packSequences,
+	});
+
+	try {
+		database.exec(BULK_LOAD_PRAGMAS);
+
+		// The pragmas above reach databases attached later, so a writable
+		// `previous` would be the only copy of the source, unjournaled. A
+		// `mode=ro` URI, which `node:sqlite` opens with URI filenames enabled,
+		// makes any write through it fail instead.
+		database
+			.prepare("ATTACH DATABASE ? AS previous")
+			.run(`${pathToFileURL(previous.path).href}?mode=ro`);
+		database.exec("BEGIN");
+
+		await bulkLoadOtus(database, reference, otus, packSequences);
+
+		copyUnchangedOtus(database, reference, removed);
+
+		createIndexArtifactIndexes(database);
+
+		if (embedDefaultFasta) {
+			await storeDefaultFasta(database);
+		}
+
+		database.exec("COMMIT");
+		database.exec("DETACH DATABASE previous");
+	} catch (error) {
+		// As in a bulk load, a failed delete must not hide why the build stopped.
+		database.close();
+		await unlink(path).catch(() => {});
+
+		throw error;
+	}
+
+	database.close();
+}
+
+/**
+ * Copy every OTU of the attached `previous` artifact that is neither already
+ * written nor in `removed`, with its schema, isolates and sequences.
+ *
+ * Copied isolates keep their previous rowids shifted past the highest one
+ * written so far, so they cannot collide with a changed OTU's and keep their
+ * relative order, and each copied sequence follows its isolate by the same
+ * shift.
+ */
+function copyUnchangedOtus(
+	database: DatabaseSync,
+	reference: CreateIndexReference | null,
+	removed: Iterable<string>,
+): void {
+	database.exec(`
+		CREATE TEMP TABLE removed_otus (id TEXT NOT NULL, PRIMARY KEY (id));
+		CREATE TEMP TABLE kept_otus (id TEXT NOT NULL, PRIMARY KEY (id));
+	`);
+
+	const insertRemoved = database.prepare(
+		"INSERT OR IGNORE INTO removed_otus (id) VALUES (?)",
+	);
+
+	for (const id of removed) {
+		insertRemoved.run(id);
+	}
+
+	database.exec(`
+		INSERT INTO kept_otus (id)
+		SELECT id FROM previous.otus
+		EXCEPT SELECT id FROM main.otus
+		EXCEPT SELECT id FROM removed_otus
+	`);
+
+	const offset = Number(
+		database
+			.prepare("SELECT coalesce(max(id), 0) AS top FROM main.isolates")
+			.get()?.top,
+	);
+
+	database
+		.prepare(
+			`INSERT INTO main.otus (id, reference_id, abbreviation, name, taxid, version)
+				SELECT otus.id, ?, otus.abbreviation, otus.name, otus.taxid, otus.version
+				FROM previous.otus AS otus
+				JOIN kept_otus ON kept_otus.id = otus.id
+				ORDER BY otus.id`,
+		)
+		.run(reference === null ? null : reference.id);
+
+	database.exec(`
+		INSERT INTO main.otu_schema (otu_id, name, molecule, required)
+			SELECT otu_schema.otu_id, otu_schema.name, otu_schema.molecule, otu_schema.required
+			FROM previous.otu_schema AS otu_schema
+			JOIN kept_otus ON kept_otus.id = otu_schema.otu_id
+			ORDER BY otu_schema.rowid
+	`);
+
+	database
+		.prepare(
+			`INSERT INTO main.isolates (id, virtool_id, otu_id, source_type, source_name, is_default)
+				SELECT isolates.id + :offset, isolates.virtool_id, isolates.otu_id,
+					isolates.source_type, isolates.source_name, isolates.is_default
+				FROM previous.isolates AS isolates
+				JOIN kept_otus ON kept_otus.id = isolates.otu_id
+				ORDER BY isolates.id`,
+		)
+		.run({ offset });
+
+	database
+		.prepare(
+			`INSERT INTO main.sequences (id, isolate_id, accession, definition, host, segment, sequence)
+				SELECT sequences.id, sequences.isolate_id + :offset, sequences.accession,
+					sequences.definition, sequences.host, sequences.segment, sequences.sequence
+				FROM previous.sequences AS sequences
+				JOIN previous.isolates AS isolates ON isolates.id = sequences.isolate_id
+				JOIN kept_otus ON kept_otus.id = isolates.otu_id
+				ORDER BY sequences.rowid`,
+		)
+		.run({ offset });
+
+	database.exec(`
+		DROP TABLE removed_otus;
+		DROP TABLE kept_otus;
+	`);
+}
+
+/** Validate the artifact at `source` and return its `format_version`. */
+function readFormatVersion(source: IndexArtifactSource): string {
+	const database = openIndexArtifact(source);
+
+	try {
+		const row = database
+			.prepare(`SELECT value FROM metadata WHERE "key" = 'format_version'`)
+			.get();
+
+		return String(row?.value);
 	} finally {
 		database.close();
 	}
 }
 
+/**
+ * Format the default-isolate FASTA from the sequences already written and store
+ * it, with its size and checksum, as `schema.ts` lays out.
+ *
+ * Records are formatted exactly as `writeFasta` formats them, so copying the
+ * chunks out gives the same bytes as writing the FASTA from the sequences. The
+ * event loop gets a turn between chunks.
+ */
+async function storeDefaultFasta(database: DatabaseSync): Promise<void> {
+	createIndexArtifactDefaultFasta(database);
+
+	const insertChunk = database.prepare(
+		"INSERT INTO default_fasta (position, chunk) VALUES (?, ?)",
+	);
+
+	const hash = createHash("sha256");
+
+	const pieces: string[] = [];
+	let pending = 0;
+	let position = 0;
+	let bytes = 0;
+	let records = 0;
+
+	async function flush(): Promise<void> {
+		const chunk = Buffer.from(pieces.join(""));
+
+		hash.update(chunk);
+		insertChunk.run(position, chunk);
+
+		position += 1;
+		bytes += chunk.length;
+		pieces.length = 0;
+		pending = 0;
+
+		await setImmediate();
+	}
+
+	for (const row of database.prepare(SELECT_DEFAULT_FASTA_RECORDS).iterate()) {
+		const sequence =
+			row.sequence instanceof Uint8Array
+				? unpackSequence(row.sequence)
+				: String(row.sequence);
+
+		pieces.push(`>${String(row.id)}\n`, sequence, "\n");
+		pending += sequence.length;
+		records += 1;
+
+		if (pending >= DEFAULT_FASTA_CHUNK_SIZE) {
+			await flush();
+		}
+	}
+
+	if (pending > 0) {
+		await flush();
+	}
+
+	const insert = database.prepare(
+		"INSERT INTO metadata (key, value) VALUES (?, ?)",
+	);
+
+	insert.run("default_fasta_bytes", String(bytes));
+	insert.run("default_fasta_records", String(records));
+	insert.run("default_fasta_sha256", hash.digest("hex"));
+}
+
 /**
  * Reject an OTU that would make the artifact unusable, as the other
  * implementation's writer does.
@@ -83,3 +83,20 @@ export class IndexSequenceNotFoundError extends IndexArtifactError {
 
 /** An indexed OTU has no isolates, or one of its isolates has no sequences. */
 export class IndexOtuIntegrityError extends IndexArtifactError {}
+
+/**
+ * A default-isolate FASTA precomputed into an artifact does not match the
+ * checksum recorded beside it.
+ *
+ * Not fallen back from. The chunks are the artifact's own, so a mismatch means
+ * the file is damaged, and its sequences are no more trustworthy than its
+ * FASTA.
+ */
+export class IndexDefaultFastaChecksumError extends IndexArtifactError {
+	constructor(expected: string, found: string, options?: ErrorOptions) {
+		super(
+			`Expected the embedded default FASTA to have SHA-256 ${expected} but found ${found}`,
+			options,
+		);
+	}
+}
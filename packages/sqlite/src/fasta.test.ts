@@ -0,0 +1,251 @@
+import { mkdtemp, readFile, rm, stat } from "node:fs/promises";
+import { tmpdir } from "node:os";
+import { dirname, join } from "node:path";
+import { DatabaseSync } from "node:sqlite";
+import { fileURLToPath } from "node:url";
+import { gunzipSync } from "node:zlib";
+import { afterEach, beforeEach, describe, expect, it } from "vitest";
+import { createIndexArtifact } from "./create";
+import { IndexDefaultFastaChecksumError } from "./errors";
+import { writeDefaultFasta, writeFasta } from "./fasta";
+import golden from "./fixtures/golden.json" with { type: "json" };
+import {
+	type IndexOtu,
+	type IndexReference,
+	openWorkflowIndex,
+	type WorkflowIndex,
+} from "./queries";
+import { REFERENCE_SQLITE_FILE_NAME } from "./schema";
+
+const FIXTURES = join(dirname(fileURLToPath(import.meta.url)), "fixtures");
+
+let workPath: string;
+let index: WorkflowIndex;
+
+beforeEach(async () => {
+	workPath = await mkdtemp(join(tmpdir(), "vt-index-fasta-"));
+	index = openWorkflowIndex({
+		id: 1,
+		path: join(FIXTURES, REFERENCE_SQLITE_FILE_NAME),
+	});
+});
+
+afterEach(async () => {
+	index.close();
+	await rm(workPath, { recursive: true, force: true });
+});
+
+describe("writeFasta", () => {
+	it("writes byte-identical output to the golden", async () => {
+		const path = join(workPath, "reference.fa");
+
+		await writeFasta(path, index.iterDefaultSequences());
+
+		expect(await readFile(path, "utf8")).toBe(
+			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		);
+	});
+
+	it("writes nothing for an empty iterator", async () => {
+		const path = join(workPath, "empty.fa");
+
+		await writeFasta(path, index.iterOtuSequences([]));
+
+		expect(await readFile(path, "utf8")).toBe("");
+	});
+
+	it("writes a gzip copy that decompresses to the golden", async () => {
+		const path = join(workPath, "reference.fa");
+		const gzipPath = join(workPath, "reference.fa.gz");
+
+		await writeFasta(path, index.iterDefaultSequences(), { gzipPath });
+
+		const golden = await readFile(join(FIXTURES, "default.fa"), "utf8");
+
+		expect(await readFile(path, "utf8")).toBe(golden);
+		expect(gunzipSync(await readFile(gzipPath)).toString("utf8")).toBe(golden);
+	});
+
+	it("reports what it wrote", async () => {
+		const path = join(workPath, "reference.fa");
+
+		const stats = await writeFasta(path, index.iterDefaultSequences());
+
+		const golden = await readFile(join(FIXTURES, "default.fa"));
+
+		expect(stats.bytes).toBe(golden.length);
+		expect(stats.records).toBe(golden.toString("utf8").match(/^>/gm)?.length);
+		expect(stats.megabytesPerSecond).toBeGreaterThanOrEqual(0);
+	});
+
+	it("keeps order across buffers and around a sequence larger than one", async () => {
+		const path = join(workPath, "large.fa");
+		const gzipPath = join(workPath, "large.fa.gz");
+
+		// Enough records to fill several buffers, with one sequence too large
+		// for any buffer in the middle of them.
+		const sequences = Array.from({ length: 3000 }, (_, position) => ({
+			id: `seq_${position}`,
+			sequence:
+				position === 1500
+					? "A".repeat(9 * 1024 * 1024)
+					: "ACGT".repeat(1000 + (position % 7)),
+		}));
+
+		async function* stream() {
+			yield* sequences;
+		}
+
+		await writeFasta(path, stream(), { gzipPath });
+
+		const expected = sequences
+			.map((sequence) => `>${sequence.id}\n${sequence.sequence}\n`)
+			.join("");
+
+		expect(await readFile(path, "utf8")).toBe(expected);
+		expect(gunzipSync(await readFile(gzipPath)).toString("utf8")).toBe(
+			expected,
+		);
+	});
+
+	it("rejects with the source's error", async () => {
+		async function* failing() {
+			yield { id: "seq_a", sequence: "ACGT" };
+			throw new Error("source failed");
+		}
+
+		await expect(
+			writeFasta(join(workPath, "failed.fa"), failing(), {
+				gzipPath: join(workPath, "failed.fa.gz"),
+			}),
+		).rejects.toThrow("source failed");
+	});
+
+	it("rejects with the gzip output's error", async () => {
+		await expect(
+			writeFasta(join(workPath, "reference.fa"), index.iterDefaultSequences(), {
+				gzipPath: join(workPath, "missing", "reference.fa.gz"),
+			}),
+		).rejects.toThrow(/ENOENT/);
+	});
+});
+
+describe("writeDefaultFasta", () => {
+	const OTUS = golden.otus as IndexOtu[];
+	const REFERENCE = golden.referenceMetadata as IndexReference;
+
+	async function embedded(
+		options: { bulkLoad?: boolean; packSequences?: boolean } = {},
+		otus: IndexOtu[] = OTUS,
+	): Promise<string> {
+		const path = join(workPath, "embedded.sqlite");
+
+		await createIndexArtifact(path, REFERENCE, otus, {
+			...options,
+			embedDefaultFasta: true,
+		});
+
+		return path;
+	}
+
+	it("writes the golden from an artifact with nothing embedded", async () => {
+		const path = join(workPath, "reference.fa");
+
+		expect(await index.getDefaultFasta()).toBeNull();
+
+		await writeDefaultFasta(path, index);
+
+		expect(await readFile(path, "utf8")).toBe(
+			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		);
+	});
+
+	it.each([
+		["in one transaction", {}],
+		["with bulkLoad", { bulkLoad: true }],
+		["with packed sequences", { packSequences: true }],
+	])("copies out the golden embedded %s", async (_name, options) => {
+		const embeddedIndex = openWorkflowIndex({
+			id: 2,
+			path: await embedded(options),
+		});
+
+		const path = join(workPath, "reference.fa");
+		const gzipPath = join(workPath, "reference.fa.gz");
+
+		const stats = await writeDefaultFasta(path, embeddedIndex, { gzipPath });
+
+		embeddedIndex.close();
+
+		const expected = await readFile(join(FIXTURES, "default.fa"), "utf8");
+
+		expect(await readFile(path, "utf8")).toBe(expected);
+		expect(gunzipSync(await readFile(gzipPath)).toString("utf8")).toBe(
+			expected,
+		);
+		expect(stats.bytes).toBe(Buffer.byteLength(expected));
+		expect(stats.records).toBe(expected.match(/^>/gm)?.length);
+	});
+
+	it("copies out a FASTA spanning several chunks", async () => {
+		const large = OTUS.map((otu) => ({
+			...otu,
+			isolates: otu.isolates.map((isolate) => ({
+				...isolate,
+				sequences: isolate.sequences.map((sequence) => ({
+					...sequence,
+					sequence: sequence.sequence.repeat(300_000),
+				})),
+			})),
+		}));
+
+		const artifact = await embedded({}, large);
+
+		const database = new DatabaseSync(artifact, { readOnly: true });
+		const chunks = database
+			.prepare("SELECT count(*) AS count FROM default_fasta")
+			.get();
+
+		database.close();
+
+		expect(Number(chunks?.count)).toBeGreaterThan(1);
+
+		const embeddedIndex = openWorkflowIndex({ id: 2, path: artifact });
+
+		const copied = join(workPath, "copied.fa");
+		const formatted = join(workPath, "formatted.fa");
+
+		await writeDefaultFasta(copied, embeddedIndex);
+		await writeFasta(formatted, embeddedIndex.iterDefaultSequences());
+
+		embeddedIndex.close();
+
+		expect((await readFile(copied)).equals(await readFile(formatted))).toBe(
+			true,
+		);
+	});
+
+	it("rejects a damaged FASTA and leaves nothing behind", async () => {
+		const artifact = await embedded();
+		const database = new DatabaseSync(artifact);
+
+		database.exec(
+			"UPDATE default_fasta SET chunk = CAST('>seq\nACGT\n' AS BLOB)",
+		);
+		database.close();
+
+		const embeddedIndex = openWorkflowIndex({ id: 2, path: artifact });
+
+		const path = join(workPath, "reference.fa");
+		const gzipPath = join(workPath, "reference.fa.gz");
+
+		await expect(
+			writeDefaultFasta(path, embeddedIndex, { gzipPath }),
+		).rejects.toThrow(IndexDefaultFastaChecksumError);
+
+		embeddedIndex.close();
+
+		await expect(stat(path)).rejects.toThrow(/ENOENT/);
+		await expect(stat(gzipPath)).rejects.toThrow(/ENOENT/);
+	});
+});
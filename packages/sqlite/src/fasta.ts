@@ -0,0 +1,333 @@
+/**
+ * The FASTA export every mapping workflow starts from.
+ *
+ * The default-isolate FASTA is what `bowtie2-build` indexes, so writing it sits
+ * on the critical path of every pathoscope and NuVs run, and the whole
+ * reference passes through here. Records are assembled into one of two
+ * preallocated buffers and each full buffer goes to disk in a single write, so
+ * the cost per record is a copy rather than a stream chunk. While one buffer is
+ * being written the scan fills the other, and a gzip copy, when asked for, is
+ * compressed on libuv's thread pool from the same buffer at the same time.
+ *
+ * Record order is the order `sequences` yields them in, untouched. That order
+ * is the index reader's, and `fixtures/default.fa` pins it byte for byte.
+ *
+ * A snapshot can carry that FASTA precomputed, in which case
+ * `writeDefaultFasta` copies it out through the same writes and skips the
+ * formatting altogether.
+ */
+
+import { createHash } from "node:crypto";
+import { createWriteStream } from "node:fs";
+import { type FileHandle, open, rm } from "node:fs/promises";
+import type { Writable } from "node:stream";
+import { pipeline } from "node:stream/promises";
+import { createGzip, type Gzip } from "node:zlib";
+import { IndexDefaultFastaChecksumError } from "./errors";
+import type { IndexSequence, WorkflowIndex } from "./queries";
+
+/**
+ * Bytes assembled before each write.
+ *
+ * Large enough that a 500 MB reference is about a hundred writes, small enough
+ * that the two buffers are nothing next to the heap a workflow already uses.
+ */
+const FASTA_BUFFER_SIZE = 4 * 1024 * 1024;
+
+/** Options for {@link writeFasta}. */
+export type WriteFastaOptions = {
+	/**
+	 * Also write a gzip-compressed copy of the same FASTA here.
+	 *
+	 * Compressed alongside the plain file rather than from it afterwards, so the
+	 * reference is scanned once and the compression overlaps the scan.
+	 */
+	gzipPath?: string;
+};
+
+/** What {@link writeFasta} wrote, and how fast. */
+export type WriteFastaStats = {
+	/** Bytes of uncompressed FASTA written. */
+	bytes: number;
+
+	/** Records written, one per sequence. */
+	records: number;
+
+	/** Wall time from the first record requested to the last byte written. */
+	seconds: number;
+
+	/** Uncompressed throughput, in MB per second. */
+	megabytesPerSecond: number;
+};
+
+/**
+ * Write `sequences` to `path` as FASTA, one record per sequence.
+ *
+ * Nothing is collected: the records are the whole index, and at most two
+ * buffers of them are held at once. The scan waits on the disk (and on gzip)
+ * only when both buffers are full, so it is paced by whichever is slower.
+ *
+ * Returns the byte count and throughput for the caller to log.
+ */
+export async function writeFasta(
+	path: string,
+	sequences: AsyncIterable<Pick<IndexSequence, "id" | "sequence">>,
+	{ gzipPath }: WriteFastaOptions = {},
+): Promise<WriteFastaStats> {
+	const start = performance.now();
+
+	let bytes = 0;
+	let records = 0;
+
+	await writeOutputs(path, gzipPath, async (write) => {
+		const buffers = [
+			Buffer.allocUnsafe(FASTA_BUFFER_SIZE),
+			Buffer.allocUnsafe(FASTA_BUFFER_SIZE),
+		] as const;
+
+		let current = 0;
+		let offset = 0;
+
+		async function flush(): Promise<void> {
+			// Returns once the other buffer's write has finished, so it is free
+			// to refill.
+			await write(buffers[current].subarray(0, offset));
+
+			current = current === 0 ? 1 : 0;
+			offset = 0;
+		}
+
+		async function append(text: string): Promise<void> {
+			const length = Buffer.byteLength(text);
+
+			if (offset + length > FASTA_BUFFER_SIZE) {
+				await flush();
+			}
+
+			if (length > FASTA_BUFFER_SIZE) {
+				// A sequence longer than a buffer is written on its own, still in
+				// order, because everything before it was just flushed.
+				await write(Buffer.from(text));
+			} else {
+				offset += buffers[current].write(text, offset);
+			}
+
+			bytes += length;
+		}
+
+		for await (const sequence of sequences) {
+			// Appended piecewise so no record is ever concatenated into a
+			// string of its own.
+			await append(`>${sequence.id}\n`);
+			await append(sequence.sequence);
+			await append("\n");
+
+			records += 1;
+		}
+
+		await flush();
+	});
+
+	return fastaStats(start, bytes, records);
+}
+
+/**
+ * Write the index's default-isolate FASTA to `path`, byte for byte what
+ * {@link writeFasta} writes from `iterDefaultSequences`.
+ *
+ * An artifact built with `embedDefaultFasta` already holds that FASTA, and it is
+ * copied out chunk by chunk, hashed on the way, instead of formatted again from
+ * every sequence. Any other artifact is written from its sequences.
+ *
+ * @throws {IndexDefaultFastaChecksumError} when the copy does not match the
+ * checksum recorded with it. Nothing is left at `path` or `gzipPath` then.
+ */
+export async function writeDefaultFasta(
+	path: string,
+	index: WorkflowIndex,
+	options: WriteFastaOptions = {},
+): Promise<WriteFastaStats> {
+	const fasta = await index.getDefaultFasta();
+
+	if (fasta === null) {
+		return writeFasta(path, index.iterDefaultSequences(), options);
+	}
+
+	const start = performance.now();
+	const hash = createHash("sha256");
+
+	let bytes = 0;
+
+	try {
+		await writeOutputs(path, options.gzipPath, async (write) => {
+			for await (const chunk of fasta.chunks()) {
+				hash.update(chunk);
+				bytes += chunk.length;
+
+				await write(chunk);
+			}
+
+			const found = hash.digest("hex");
+
+			if (found !== fasta.sha256) {
+				throw new IndexDefaultFastaChecksumError(fasta.sha256, found);
+			}
+		});
+	} catch (error) {
+		if (error instanceof IndexDefaultFastaChecksumError) {
+			await rm(path, { force: true });
+
+			if (options.gzipPath !== undefined) {
+				await rm(options.gzipPath, { force: true });
+			}
+		}
+
+		throw error;
+	}
+
+	return fastaStats(start, bytes, fasta.records);
+}
+
+/**
+ * Open `path`, and a gzip copy at `gzipPath` if one is asked for, and hand
+ * `produce` a function that writes a chunk to both.
+ *
+ * One chunk is written at a time. `write` waits for the last to land before
+ * starting the next and resolves without waiting for it, so the producer
+ * prepares its next chunk while the last one is written — and a chunk handed
+ * to `write` is not the producer's to touch again until its next call returns.
+ */
+async function writeOutputs(
+	path: string,
+	gzipPath: string | undefined,
+	produce: (write: (chunk: Uint8Array) => Promise<void>) => Promise<void>,
+): Promise<void> {
+	const handle = await open(path, "w");
+
+	let gzip: Gzip | null = null;
+	let gzipped: Promise<void> | null = null;
+
+	if (gzipPath !== undefined) {
+		gzip = createGzip();
+		gzipped = pipeline(gzip, createWriteStream(gzipPath));
+
+		// Observed now so a failed compression is not reported as unhandled
+		// while the scan is still running; it is awaited, and thrown, below.
+		gzipped.catch(() => {});
+	}
+
+	// The write still in flight, which must finish before the next starts.
+	let inFlight: Promise<void> = Promise.resolve();
+
+	async function write(chunk: Uint8Array): Promise<void> {
+		await inFlight;
+
+		inFlight = writeChunk(handle, gzip, chunk);
+
+		// Awaited before the next write or at the end; observed here so a
+		// failure in between is not reported as unhandled.
+		inFlight.catch(() => {});
+	}
+
+	try {
+		await produce(write);
+		await inFlight;
+	} catch (error) {
+		await inFlight.catch(() => {});
+
+		if (gzip === null || gzipped === null) {
+			throw error;
+		}
+
+		gzip.destroy();
+
+		// When compression failed first, the scan only sees the gzip stream
+		// destroyed under it. The pipeline's own error says why.
+		const gzipError = await gzipped.then(
+			() => undefined,
+			(cause: unknown) => cause,
+		);
+
+		throw isStreamDestroyed(error) && gzipError !== undefined
+			? gzipError
+			: error;
+	} finally {
+		await handle.close();
+	}
+
+	if (gzip !== null && gzipped !== null) {
+		gzip.end();
+
+		await gzipped;
+	}
+}
+
+function fastaStats(
+	start: number,
+	bytes: number,
+	records: number,
+): WriteFastaStats {
+	const seconds = (performance.now() - start) / 1000;
+
+	return {
+		bytes,
+		records,
+		seconds,
+		megabytesPerSecond: seconds > 0 ? bytes / 1e6 / seconds : 0,
+	};
+}
+
+/** Write `chunk` to the file and, if there is one, the gzip stream, together. */
+async function writeChunk(
+	handle: FileHandle,
+	gzip: Writable | null,
+	chunk: Uint8Array,
+): Promise<void> {
+	if (chunk.length === 0) {
+		return;
+	}
+
+	await Promise.all([
+		writeFully(handle, chunk),
+		gzip === null ? undefined : writeToStream(gzip, chunk),
+	]);
+}
+
+/** Write all of `chunk` at the file position, however many calls it takes. */
+async function writeFully(
+	handle: FileHandle,
+	chunk: Uint8Array,
+): Promise<void> {
+	let written = 0;
+
+	while (written < chunk.length) {
+		const { bytesWritten } = await handle.write(chunk, written);
+
+		written += bytesWritten;
+	}
+}
+
+function isStreamDestroyed(error: unknown): boolean {
+	return (
+		error instanceof Error &&
+		(error as NodeJS.ErrnoException).code === "ERR_STREAM_DESTROYED"
+	);
+}
+
+/**
+ * Resolve once `stream` has consumed `chunk`.
+ *
+ * A gzip stream's write callback fires only after the chunk has been
+ * compressed, so the buffer is safe to refill from then on.
+ */
+function writeToStream(stream: Writable, chunk: Uint8Array): Promise<void> {
+	return new Promise((resolve, reject) => {
+		stream.write(chunk, (error) => {
+			if (error) {
+				reject(error);
+			} else {
+				resolve();
+			}
+		});
+	});
+}
@@ -5,6 +5,12 @@ This script is the provenance record for `reference-snapshot.v1.sqlite`,
 can be regenerated and audited against the Python implementation the
 TypeScript reader is pinned to.
 
+It also re-pins `query-plans.json`, the `EXPLAIN QUERY PLAN` of every
+TypeScript reader query over the new fixture, by running `queries.test.ts`
+with `VT_UPDATE_QUERY_PLANS` set. A query or schema change that turns an
+indexed scan into a sort then shows up as a diff to that file, and as a failing
+test until it is reviewed and re-pinned.
+
 Run it against a checkout of the Python server:
 
     cd /path/to/virtool
@@ -15,10 +21,32 @@ in an order that does not match the order the queries must return them in. A
 reader that leaks insertion order instead of applying Python's `ORDER BY`
 produces a different FASTA, a different Bowtie2 index and a different SAM, so
 the fixture has to be able to tell the two apart.
+
+Three OTUs say nothing about speed, and `queries.ts` is tuned for artifacts of
+200-500 MB, so the same script has a scale mode:
+
+    .venv/bin/python .../generate.py --scale /tmp/index-bench --typescript
+
+It synthesizes a seeded reference — `--otus`, `--isolates` per OTU,
+`--sequences` per isolate, `--sequence-length` bases each, defaulting to the
+300 MB artifact `docs/references.md` measures — builds it with
+`WFIndex.create`, and times `iter_otus`, `iter_sequences`,
+`iter_default_sequences`, `iter_otu_sequences` and `write_fasta` on the Python
+`WFIndex`. `--typescript` then runs `queries.bench.ts` over the same file.
+Both report rows per second, the longest and 99th-percentile stretch the event
+loop was held between turns, and peak heap. Python's heap comes from a second,
+`tracemalloc`-traced pass, so tracing does not slow the timed one. Nothing in
+scale mode touches the fixtures.
 """
 
+import argparse
 import asyncio
 import json
+import os
+import random
+import subprocess
+import time
+import tracemalloc
 from pathlib import Path
 
 from virtool.references.sqlite import REFERENCE_SQLITE_FILE_NAME
@@ -172,7 +200,7 @@ async def iter_otus(otus):
         yield otu
 
 
-async def main() -> None:
+async def write_fixture() -> None:
     sqlite_path = HERE / REFERENCE_SQLITE_FILE_NAME
 
     if sqlite_path.exists():
@@ -204,6 +232,290 @@ async def main() -> None:
         json.dumps(golden, indent="\t", sort_keys=True) + "\n",
     )
 
+    write_query_plans()
+
+
+def write_query_plans() -> None:
+    """Re-pin `query-plans.json` against the fixture just written.
+
+    The plans are the TypeScript reader's, so its own test suite writes them;
+    SQLite plans without statistics, so the fixture's plans hold for an
+    artifact of any size.
+    """
+    subprocess.run(
+        ["pnpm", "--filter", "@virtool/sqlite", "test", "src/queries.test.ts"],
+        check=True,
+        cwd=HERE,
+        env={**os.environ, "VT_UPDATE_QUERY_PLANS": "1"},
+    )
+
+
+def synthetic_otus(
+    otus: int, isolates: int, sequences: int, sequence_length: int, seed: int
+) -> list[dict]:
+    """Build `otus` OTU documents shaped like the fixture's, in shuffled order.
+
+    Shuffled for the same reason the fixture is: a reader that leaks insertion
+    order should be measured doing so, not flattered by ids that happen to
+    arrive sorted. Sequences are drawn lazily by `iter_synthetic_otus`, so the
+    documents here carry only their shape.
+    """
+    rng = random.Random(f"index-bench:{seed}")
+
+    documents = [
+        {
+            "_id": f"otu_{otu:06d}",
+            "abbreviation": f"V{otu}",
+            "name": f"Synthetic virus {otu}",
+            "taxid": otu + 1,
+            "version": rng.randint(0, 20),
+            "schema": [
+                {"name": f"Segment {segment}", "molecule": "ssRNA", "required": True}
+                for segment in range(sequences)
+            ],
+            "isolates": [
+                {
+                    "id": f"iso_{otu:06d}_{isolate}",
+                    "default": isolate == 0,
+                    "source_type": "isolate",
+                    "source_name": f"S{isolate}",
+                    "sequences": [
+                        {
+                            "_id": f"seq_{otu:06d}_{isolate}_{segment}",
+                            "accession": f"SY{otu:06d}.{isolate}{segment}",
+                            "definition": f"Synthetic virus {otu} segment {segment}",
+                            "host": None,
+                            "segment": f"Segment {segment}",
+                            "sequence_length": sequence_length,
+                        }
+                        for segment in range(sequences)
+                    ],
+                }
+                for isolate in range(isolates)
+            ],
+        }
+        for otu in range(otus)
+    ]
+
+    rng.shuffle(documents)
+
+    return documents
+
+
+async def iter_synthetic_otus(documents: list[dict], seed: int):
+    """Yield `documents` with their sequences filled in, one OTU at a time.
+
+    Holding every sequence up front would put the whole reference in memory
+    before `WFIndex.create` reads the first OTU.
+    """
+    rng = random.Random(f"index-bench-sequences:{seed}")
+
+    for document in documents:
+        yield {
+            **document,
+            "isolates": [
+                {
+                    **isolate,
+                    "sequences": [
+                        {
+                            **{
+                                key: value
+                                for key, value in seq.items()
+                                if key != "sequence_length"
+                            },
+                            "sequence": "".join(
+                                rng.choices("ACGT", k=seq["sequence_length"])
+                            ),
+                        }
+                        for seq in isolate["sequences"]
+                    ],
+                }
+                for isolate in document["isolates"]
+            ],
+        }
+
+
+async def counted(rows, counter: list[int]):
+    async for row in rows:
+        counter[0] += 1
+        yield row
+
+
+async def drain(rows) -> None:
+    async for _ in rows:
+        pass
+
+
+def python_queries(index, directory: Path, otu_ids: list[str]) -> dict:
+    """The reads to time, by name, each taking a row counter."""
+    return {
+        "iter_otus": lambda n: drain(counted(index.iter_otus(), n)),
+        "iter_sequences": lambda n: drain(counted(index.iter_sequences(), n)),
+        "iter_default_sequences": lambda n: drain(
+            counted(index.iter_default_sequences(), n)
+        ),
+        "iter_otu_sequences": lambda n: drain(
+            counted(index.iter_otu_sequences(otu_ids), n)
+        ),
+        "write_fasta": lambda n: index.write_fasta(
+            directory / "python.fa", counted(index.iter_default_sequences(), n)
+        ),
+    }
+
+
+async def measure_blocking(run) -> tuple[float, list[float]]:
+    """Await `run`, returning its seconds and every gap between loop turns.
+
+    A heartbeat task yields to the loop and records how long it was kept
+    waiting each time. A gap is how long something else held the loop, so the
+    largest is the longest a reader blocked between turns.
+    """
+    gaps = []
+    done = False
+
+    async def heartbeat() -> None:
+        last = time.perf_counter()
+
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+
+    # Let the heartbeat take its first timestamp, or a reader that never yields
+    # would finish before it started and record no gap at all.
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await run
+    seconds = time.perf_counter() - start
+
+    done = True
+    await beat
+
+    return seconds, gaps
+
+
+async def bench_python(index, directory: Path, otu_ids: list[str]) -> list[dict]:
+    rows = []
+
+    for name, query in python_queries(index, directory, otu_ids).items():
+        counter = [0]
+        seconds, gaps = await measure_blocking(query(counter))
+
+        # A second pass, traced, for the heap. Tracing slows every allocation,
+        # so it cannot share a pass with the timing.
+        tracemalloc.start()
+        await query([0])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        gaps.sort()
+
+        rows.append(
+            {
+                "implementation": "python",
+                "query": name,
+                "rows": counter[0],
+                "seconds": seconds,
+                "rows_per_second": counter[0] / seconds,
+                "event_loop_block_ms": {
+                    "mean": sum(gaps) / len(gaps) * 1000 if gaps else 0.0,
+                    "p99": gaps[int(len(gaps) * 0.99)] * 1000 if gaps else 0.0,
+                    "max": gaps[-1] * 1000 if gaps else 0.0,
+                },
+                "peak_heap_mb": peak / 1024 / 1024,
+            }
+        )
+
+    return rows
+
+
+def bench_typescript(directory: Path) -> list[dict]:
+    results = directory / "bench.jsonl"
+    results.unlink(missing_ok=True)
+
+    subprocess.run(
+        ["pnpm", "--filter", "@virtool/sqlite", "bench"],
+        check=True,
+        cwd=HERE,
+        env={**os.environ, "VT_INDEX_BENCH_DIR": str(directory.resolve())},
+    )
+
+    return [json.loads(line) for line in results.read_text().splitlines()]
+
+
+async def scale(args: argparse.Namespace) -> None:
+    directory: Path = args.scale
+    directory.mkdir(parents=True, exist_ok=True)
+
+    sqlite_path = directory / REFERENCE_SQLITE_FILE_NAME
+    sqlite_path.unlink(missing_ok=True)
+
+    documents = synthetic_otus(
+        args.otus, args.isolates, args.sequences, args.sequence_length, args.seed
+    )
+
+    start = time.perf_counter()
+    index = await WFIndex.create(
+        1, sqlite_path, REFERENCE, iter_synthetic_otus(documents, args.seed)
+    )
+    print(
+        f"built {sqlite_path.stat().st_size / 1024 / 1024:.0f} MB artifact in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+
+    # Every tenth OTU, by id, so both readers query the same set.
+    otu_ids = sorted(document["_id"] for document in documents)[::10]
+    (directory / "otu-ids.json").write_text(json.dumps(otu_ids))
+
+    rows = await bench_python(index, directory, otu_ids)
+
+    if args.typescript:
+        rows += bench_typescript(directory)
+
+    print(
+        f"\n{'implementation':<14} {'query':<24} {'rows':>9} {'rows/s':>12} "
+        f"{'block max ms':>13} {'block p99 ms':>13} {'peak heap MB':>13}"
+    )
+
+    for row in rows:
+        block = row["event_loop_block_ms"]
+
+        print(
+            f"{row['implementation']:<14} {row['query']:<24} {row['rows']:>9,} "
+            f"{row['rows_per_second']:>12,.0f} {block['max']:>13.1f} "
+            f"{block['p99']:>13.1f} {row['peak_heap_mb']:>13.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scale",
+        type=Path,
+        metavar="DIR",
+        help="build a synthetic artifact in DIR and benchmark reads against it",
+    )
+    parser.add_argument("--otus", type=int, default=20_000)
+    parser.add_argument("--isolates", type=int, default=1, help="per OTU")
+    parser.add_argument("--sequences", type=int, default=3, help="per isolate")
+    parser.add_argument("--sequence-length", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=2852)
+    parser.add_argument(
+        "--typescript",
+        action="store_true",
+        help="also run queries.bench.ts over the artifact",
+    )
+    args = parser.parse_args()
+
+    if args.scale is None:
+        asyncio.run(write_fixture())
+    else:
+        asyncio.run(scale(args))
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,139 @@
+/**
+ * Time every streaming read over a synthetic artifact from `generate.py --scale`.
+ *
+ * Run through `vitest bench`, which resolves this package's extensionless
+ * imports the way its tests do. `generate.py --scale <dir> --typescript` runs it
+ * for you; by hand:
+ *
+ * ```
+ * VT_INDEX_BENCH_DIR=<dir> pnpm --filter @virtool/sqlite bench
+ * ```
+ *
+ * Every query runs exactly once, because a 300 MB artifact takes seconds to
+ * scan and tinybench's repeated samples would say nothing a single pass does
+ * not. Each one appends a JSON line to `bench.jsonl` in the directory, with the
+ * fields `generate.py` reports for the Python reader: rows per second, peak
+ * heap, and how long the event loop was held between turns. That last one is
+ * what `SEQUENCE_BATCH_SIZE` in `queries.ts` trades against throughput.
+ *
+ * Without `VT_INDEX_BENCH_DIR` the suite is skipped.
+ */
+
+import { appendFileSync, readFileSync } from "node:fs";
+import { join } from "node:path";
+import { monitorEventLoopDelay } from "node:perf_hooks";
+import { bench, describe } from "vitest";
+import { writeFasta } from "../fasta";
+import { openWorkflowIndex, type WorkflowIndex } from "../queries";
+import { REFERENCE_SQLITE_FILE_NAME } from "../schema";
+
+const directory = process.env.VT_INDEX_BENCH_DIR;
+
+/** Rows between heap samples, often enough to catch a peak. */
+const HEAP_SAMPLE_INTERVAL = 100;
+
+/** Run one query to completion, passing every row it yields through `sample`. */
+type Query = (
+	index: WorkflowIndex,
+	sample: <T>(rows: AsyncIterable<T>) => AsyncIterable<T>,
+) => Promise<void>;
+
+async function drain(rows: AsyncIterable<unknown>): Promise<void> {
+	for await (const _row of rows) {
+		// Consumed for the timing alone.
+	}
+}
+
+/** The queries, by the name `generate.py` reports the Python reader's under. */
+function queries(benchDirectory: string): Record<string, Query> {
+	const otuIds: string[] = JSON.parse(
+		readFileSync(join(benchDirectory, "otu-ids.json"), "utf8"),
+	);
+
+	return {
+		iter_otus: (index, sample) => drain(sample(index.iterOtus())),
+		iter_sequences: (index, sample) => drain(sample(index.iterSequences())),
+		iter_default_sequences: (index, sample) =>
+			drain(sample(index.iterDefaultSequences())),
+		iter_otu_sequences: (index, sample) =>
+			drain(sample(index.iterOtuSequences(otuIds))),
+		write_fasta: (index, sample) =>
+			writeFasta(
+				join(benchDirectory, "typescript.fa"),
+				sample(index.iterDefaultSequences()),
+			),
+	};
+}
+
+async function measure(
+	benchDirectory: string,
+	name: string,
+	query: Query,
+): Promise<void> {
+	const index = openWorkflowIndex({
+		id: 1,
+		path: join(benchDirectory, REFERENCE_SQLITE_FILE_NAME),
+	});
+
+	let rows = 0;
+	let peakHeap = process.memoryUsage().heapUsed;
+
+	async function* sample<T>(source: AsyncIterable<T>): AsyncGenerator<T> {
+		for await (const row of source) {
+			rows += 1;
+
+			if (rows % HEAP_SAMPLE_INTERVAL === 0) {
+				peakHeap = Math.max(peakHeap, process.memoryUsage().heapUsed);
+			}
+
+			yield row;
+		}
+	}
+
+	const delay = monitorEventLoopDelay({ resolution: 1 });
+
+	delay.enable();
+	const start = performance.now();
+
+	try {
+		await query(index, sample);
+	} finally {
+		delay.disable();
+		index.close();
+	}
+
+	const seconds = (performance.now() - start) / 1000;
+
+	appendFileSync(
+		join(benchDirectory, "bench.jsonl"),
+		`${JSON.stringify({
+			implementation: "typescript",
+			query: name,
+			rows,
+			seconds,
+			rows_per_second: rows / seconds,
+			// The histogram records nanoseconds.
+			event_loop_block_ms: {
+				mean: delay.mean / 1e6,
+				p99: delay.percentile(99) / 1e6,
+				max: delay.max / 1e6,
+			},
+			peak_heap_mb: peakHeap / 1024 / 1024,
+		})}\n`,
+	);
+}
+
+describe.skipIf(directory === undefined)("index artifact reads", () => {
+	if (directory === undefined) {
+		return;
+	}
+
+	for (const [name, query] of Object.entries(queries(directory))) {
+		bench(name, () => measure(directory, name, query), {
+			iterations: 1,
+			time: 0,
+			warmupIterations: 0,
+			warmupTime: 0,
+		});
+	}
+});
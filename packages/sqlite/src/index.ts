@@ -1,4 +1,6 @@
 export * from "./create";
 export * from "./errors";
+export * from "./fasta";
+export * from "./nucleotides";
 export * from "./queries";
 export * from "./schema";
@@ -0,0 +1,61 @@
+import { describe, expect, it } from "vitest";
+import { IndexArtifactError } from "./errors";
+import golden from "./fixtures/golden.json" with { type: "json" };
+import { packSequence, unpackSequence } from "./nucleotides";
+
+describe("packSequence", () => {
+	it("round-trips every fixture sequence", () => {
+		for (const { sequence } of golden.sequences) {
+			expect(unpackSequence(packSequence(sequence))).toBe(sequence);
+		}
+	});
+
+	it.each([
+		["an empty sequence", ""],
+		["a partial last byte", "ACGTACG"],
+		["nothing but N", "NNNNNNNNNN"],
+		["IUPAC ambiguity codes", "ACRYSWKMBDHVNT"],
+		["soft-masked runs", "acgtACGTnnnnACgt"],
+		["gaps and stops", "AC-GT*ACGT.."],
+		["characters outside ASCII", "ACGTΩACGT"],
+	])("round-trips %s", (_name, sequence) => {
+		expect(unpackSequence(packSequence(sequence))).toBe(sequence);
+	});
+
+	it("packs ACGT to a quarter of its length", () => {
+		const sequence = "ACGT".repeat(10_000);
+
+		// Five bytes of header: three for the length and one for each empty
+		// run count.
+		expect(packSequence(sequence).length).toBe(sequence.length / 4 + 5);
+	});
+
+	it("writes the pinned layout", () => {
+		expect(Buffer.from(packSequence("ACGTNNacgtR")).toString("hex")).toBe(
+			"0b0204024e040152010604e4400e",
+		);
+	});
+});
+
+describe("unpackSequence", () => {
+	it("throws on a truncated header", () => {
+		expect(() => unpackSequence(Uint8Array.of(0x8b))).toThrow(
+			IndexArtifactError,
+		);
+	});
+
+	it("throws when the bases are cut short", () => {
+		const packed = packSequence("ACGTACGTACGT");
+
+		expect(() => unpackSequence(packed.subarray(0, packed.length - 1))).toThrow(
+			/2 bytes of bases for 12 characters/,
+		);
+	});
+
+	it("throws when a run ends past the sequence", () => {
+		// Four characters, one exception run of eight N.
+		expect(() =>
+			unpackSequence(Uint8Array.of(4, 1, 0, 8, 0x4e, 0, 0)),
+		).toThrow(/exceptions past its end/);
+	});
+});
@@ -0,0 +1,332 @@
+/**
+ * The 2-bit nucleotide encoding of a packed (`format_version` 2) artifact.
+ *
+ * Sequences are most of an artifact's bytes, and nearly every character in
+ * them is one of `ACGT`. Packed, those take two bits each instead of a byte,
+ * and everything else a sequence can hold — `N`, the other IUPAC ambiguity
+ * codes, gaps, soft-masked lowercase — is kept exactly in two run lists beside
+ * the bases. A packed sequence always unpacks to the string that was packed.
+ *
+ * The layout, every count an unsigned LEB128 varint:
+ *
+ * ```
+ * length                         characters in the sequence
+ * exception run count
+ *   gap, length, code            a run of one code unit that is not ACGT
+ * lowercase run count
+ *   gap, length                  a run of ASCII lowercase letters
+ * bases                          ceil(length / 4) bytes, four bases a byte
+ * ```
+ *
+ * A run's gap is its start less the end of the run before it, so runs are in
+ * order and never overlap. Exception codes are stored uppercased wherever the
+ * lowercase runs restore the case. Bases are packed low bits first, `A`, `C`,
+ * `G`, `T` as 0 to 3, and a position covered by an exception packs as `A`.
+ *
+ * The other implementation's reader has to agree with this byte for byte;
+ * `nucleotides.test.ts` pins a packed value to hold it to that.
+ */
+
+import { IndexArtifactError } from "./errors";
+
+/** The code of each 2-bit base, by uppercase character code; 255 for none. */
+const BASE_CODES = new Uint8Array(128).fill(255);
+
+BASE_CODES["A".charCodeAt(0)] = 0;
+BASE_CODES["C".charCodeAt(0)] = 1;
+BASE_CODES["G".charCodeAt(0)] = 2;
+BASE_CODES["T".charCodeAt(0)] = 3;
+
+/** The four characters of every packed byte, as ASCII, for unpacking. */
+const BYTE_BASES = new Uint8Array(256 * 4);
+
+for (let byte = 0; byte < 256; byte++) {
+	for (let position = 0; position < 4; position++) {
+		BYTE_BASES[byte * 4 + position] = "ACGT".charCodeAt(
+			(byte >> (position * 2)) & 3,
+		);
+	}
+}
+
+/** {@link BYTE_BASES} as one 32-bit word a byte. */
+const BYTE_WORDS = new Uint32Array(BYTE_BASES.buffer);
+
+const LOWERCASE_A = "a".charCodeAt(0);
+const LOWERCASE_Z = "z".charCodeAt(0);
+
+/** Added to an ASCII lowercase letter's code to uppercase it. */
+const UPPERCASE_OFFSET = "A".charCodeAt(0) - LOWERCASE_A;
+
+/** A packed sequence's header, read back by {@link unpackSequence}. */
+type PackedHeader = {
+	length: number;
+	exceptions: { start: number; length: number; code: number }[];
+	lowercase: { start: number; length: number }[];
+	basesOffset: number;
+};
+
+/**
+ * Pack `sequence` into the 2-bit encoding.
+ *
+ * Any string packs; one that is mostly `ACGT` packs to about a quarter of its
+ * length.
+ */
+export function packSequence(sequence: string): Uint8Array {
+	const length = sequence.length;
+	const bases = new Uint8Array(Math.ceil(length / 4));
+
+	// Flattened as [gap, length, code, gap, length, code, ...].
+	const exceptions: number[] = [];
+	const lowercase: number[] = [];
+
+	let exceptionEnd = 0;
+	let exceptionStart = -1;
+	let exceptionCode = -1;
+
+	let lowercaseEnd = 0;
+	let lowercaseStart = -1;
+
+	let packedByte = 0;
+
+	for (let position = 0; position < length; position++) {
+		let code = sequence.charCodeAt(position);
+
+		const isLowercase = code >= LOWERCASE_A && code <= LOWERCASE_Z;
+
+		if (isLowercase) {
+			code += UPPERCASE_OFFSET;
+
+			if (lowercaseStart === -1) {
+				lowercaseStart = position;
+			}
+		} else if (lowercaseStart !== -1) {
+			lowercase.push(lowercaseStart - lowercaseEnd, position - lowercaseStart);
+			lowercaseEnd = position;
+			lowercaseStart = -1;
+		}
+
+		const base = code < 128 ? (BASE_CODES[code] ?? 255) : 255;
+
+		if (base !== 255) {
+			packedByte |= base << ((position & 3) * 2);
+		}
+
+		if ((position & 3) === 3 || position === length - 1) {
+			bases[position >> 2] = packedByte;
+			packedByte = 0;
+		}
+
+		if (exceptionStart !== -1 && code !== exceptionCode) {
+			exceptions.push(
+				exceptionStart - exceptionEnd,
+				position - exceptionStart,
+				exceptionCode,
+			);
+			exceptionEnd = position;
+			exceptionStart = -1;
+		}
+
+		if (base === 255 && exceptionStart === -1) {
+			exceptionStart = position;
+			exceptionCode = code;
+		}
+	}
+
+	if (exceptionStart !== -1) {
+		exceptions.push(
+			exceptionStart - exceptionEnd,
+			length - exceptionStart,
+			exceptionCode,
+		);
+	}
+
+	if (lowercaseStart !== -1) {
+		lowercase.push(lowercaseStart - lowercaseEnd, length - lowercaseStart);
+	}
+
+	const header = [
+		length,
+		exceptions.length / 3,
+		...exceptions,
+		lowercase.length / 2,
+		...lowercase,
+	];
+
+	const packed = new Uint8Array(
+		header.reduce((size, value) => size + varintSize(value), 0) +
+			bases.length,
+	);
+
+	let offset = 0;
+
+	for (const value of header) {
+		offset = writeVarint(packed, offset, value);
+	}
+
+	packed.set(bases, offset);
+
+	return packed;
+}
+
+/**
+ * Unpack a sequence written by {@link packSequence}.
+ *
+ * @throws {IndexArtifactError} when `packed` is truncated or is not a packed
+ * sequence at all.
+ */
+export function unpackSequence(packed: Uint8Array): string {
+	const header = readHeader(packed);
+	const { length, basesOffset } = header;
+
+	// Every code unit but the exceptions' is ASCII, so unless an exception is
+	// not, one byte per character decodes as Latin-1.
+	const wide = header.exceptions.some(({ code }) => code > 0x7f);
+	const characters = wide ? new Uint16Array(length) : new Uint8Array(length);
+
+	writeBases(packed.subarray(basesOffset), characters);
+
+	for (const run of header.exceptions) {
+		characters.fill(run.code, run.start, run.start + run.length);
+	}
+
+	for (const run of header.lowercase) {
+		const end = run.start + run.length;
+
+		for (let position = run.start; position < end; position++) {
+			characters[position] = (characters[position] ?? 0) - UPPERCASE_OFFSET;
+		}
+	}
+
+	return Buffer.from(
+		characters.buffer,
+		characters.byteOffset,
+		characters.byteLength,
+	).toString(wide ? "utf16le" : "latin1");
+}
+
+/** Write the character of every packed base into `characters`. */
+function writeBases(
+	bases: Uint8Array,
+	characters: Uint8Array | Uint16Array,
+): void {
+	const length = characters.length;
+	let position = 0;
+
+	if (characters instanceof Uint8Array) {
+		// Four characters a byte, so one 32-bit store each. Both views use the
+		// platform's byte order, so the characters land in order either way.
+		const words = new Uint32Array(characters.buffer, 0, length >> 2);
+
+		for (let byte = 0; byte < words.length; byte++) {
+			words[byte] = BYTE_WORDS[bases[byte] ?? 0] ?? 0;
+		}
+
+		position = words.length * 4;
+	}
+
+	for (; position < length; position++) {
+		characters[position] =
+			BYTE_BASES[(bases[position >> 2] ?? 0) * 4 + (position & 3)] ?? 0;
+	}
+}
+
+function readHeader(packed: Uint8Array): PackedHeader {
+	let offset = 0;
+
+	function next(): number {
+		let value = 0;
+		let shift = 0;
+
+		while (true) {
+			const byte = packed[offset];
+
+			if (byte === undefined || shift > 28) {
+				throw new IndexArtifactError(
+					"A packed sequence in the index is truncated or corrupt",
+				);
+			}
+
+			offset += 1;
+			value += (byte & 0x7f) * 2 ** shift;
+
+			if (byte < 0x80) {
+				return value;
+			}
+
+			shift += 7;
+		}
+	}
+
+	const length = next();
+
+	const exceptions: PackedHeader["exceptions"] = [];
+	let end = 0;
+
+	for (let count = next(); count > 0; count--) {
+		const start = end + next();
+		const runLength = next();
+
+		exceptions.push({ start, length: runLength, code: next() });
+		end = start + runLength;
+	}
+
+	if (end > length) {
+		throw new IndexArtifactError(
+			"A packed sequence in the index has exceptions past its end",
+		);
+	}
+
+	const lowercase: PackedHeader["lowercase"] = [];
+	end = 0;
+
+	for (let count = next(); count > 0; count--) {
+		const start = end + next();
+		const runLength = next();
+
+		lowercase.push({ start, length: runLength });
+		end = start + runLength;
+	}
+
+	if (end > length) {
+		throw new IndexArtifactError(
+			"A packed sequence in the index has lowercase runs past its end",
+		);
+	}
+
+	if (packed.length - offset !== Math.ceil(length / 4)) {
+		throw new IndexArtifactError(
+			`A packed sequence in the index holds ${packed.length - offset} bytes of bases for ${length} characters`,
+		);
+	}
+
+	return { length, exceptions, lowercase, basesOffset: offset };
+}
+
+function varintSize(value: number): number {
+	let size = 1;
+
+	for (let rest = value; rest >= 0x80; rest = Math.floor(rest / 0x80)) {
+		size += 1;
+	}
+
+	return size;
+}
+
+function writeVarint(
+	target: Uint8Array,
+	offset: number,
+	value: number,
+): number {
+	let rest = value;
+	let position = offset;
+
+	while (rest >= 0x80) {
+		target[position] = (rest & 0x7f) | 0x80;
+		rest = Math.floor(rest / 0x80);
+		position += 1;
+	}
+
+	target[position] = rest;
+
+	return position + 1;
+}
@@ -1,4 +1,4 @@
-import { mkdtemp, readFile, rm, writeFile } from "node:fs/promises";
+import { mkdtemp, rm, writeFile } from "node:fs/promises";
 import { tmpdir } from "node:os";
 import { dirname, join } from "node:path";
 import { DatabaseSync } from "node:sqlite";
@@ -13,12 +13,14 @@ import {
 	IndexSequenceNotFoundError,
 } from "./errors";
 import golden from "./fixtures/golden.json" with { type: "json" };
+import queryPlans from "./fixtures/query-plans.json" with { type: "json" };
 import {
+	createOtuRefCache,
 	type IndexOtu,
+	type IndexQueryMetrics,
 	type IndexSequence,
 	openWorkflowIndex,
 	type WorkflowIndex,
-	writeFasta,
 } from "./queries";
 import {
 	createIndexArtifactSchema,
@@ -42,6 +44,34 @@ afterEach(async () => {
 	await rm(workPath, { recursive: true, force: true });
 });
 
+/** `count` OTUs of one default isolate each, holding `sequences` sequences. */
+function manyOtus(count: number, sequences: number): IndexOtu[] {
+	return Array.from({ length: count }, (_unused, otu) => ({
+		abbreviation: "",
+		id: `otu_${String(otu).padStart(3, "0")}`,
+		isolates: [
+			{
+				default: true,
+				id: "iso",
+				sequences: Array.from({ length: sequences }, (_unused, sequence) => ({
+					accession: `ACC${sequence}`,
+					definition: "definition",
+					host: null,
+					id: `otu_${otu}_seq_${String(sequence).padStart(4, "0")}`,
+					segment: null,
+					sequence: "ACGT",
+				})),
+				source_name: "S",
+				source_type: "isolate",
+			},
+		],
+		name: `OTU ${otu}`,
+		schema: [],
+		taxid: null,
+		version: 0,
+	}));
+}
+
 async function collect<T>(iterator: AsyncIterable<T>): Promise<T[]> {
 	const items: T[] = [];
 
@@ -90,14 +120,14 @@ describe("openWorkflowIndex", () => {
 		database.exec("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)");
 		database
 			.prepare("INSERT INTO metadata VALUES (?, ?), (?, ?)")
-			.run("format", "virtool-reference-sqlite", "format_version", "2");
+			.run("format", "virtool-reference-sqlite", "format_version", "3");
 		database.close();
 
 		expect(() => openWorkflowIndex({ id: 1, path })).toThrow(
 			IndexArtifactFormatError,
 		);
 		expect(() => openWorkflowIndex({ id: 1, path })).toThrow(
-			/Expected format_version=1 but found format_version=2/,
+			/Expected format_version=1 or format_version=2 but found format_version=3/,
 		);
 	});
 
@@ -184,6 +214,28 @@ describe("iterOtus", () => {
 		expect(await collect(index.iterOtus())).toEqual(golden.otus);
 	});
 
+	it("folds OTUs that span several batches back as they were written", async () => {
+		const path = join(workPath, "many.sqlite");
+
+		// Sequence ids descending, so only insertion order gives them back as
+		// they went in.
+		const otus = manyOtus(3, 1200).map((otu) => ({
+			...otu,
+			isolates: otu.isolates.map((isolate) => ({
+				...isolate,
+				sequences: isolate.sequences.toReversed(),
+			})),
+		}));
+
+		await createIndexArtifact(path, null, otus);
+
+		const many = openWorkflowIndex({ id: 3, path });
+
+		expect(await collect(many.iterOtus())).toEqual(otus);
+
+		many.close();
+	});
+
 	it("throws when an isolate has no sequences", async () => {
 		const path = join(workPath, "hollow.sqlite");
 
@@ -242,61 +294,253 @@ describe("getOtuRefsBySequenceIds", () => {
 			/seq_nope/,
 		);
 	});
+
+	it("keys the result in sequence id order", async () => {
+		const refs = await index.getOtuRefsBySequenceIds(
+			golden.otuRefsBySequenceId.sequenceIds,
+		);
+
+		expect(Object.keys(refs)).toEqual(
+			Object.keys(golden.otuRefsBySequenceId.result),
+		);
+	});
+
+	it("resolves more ids than one statement takes", async () => {
+		const path = join(workPath, "many.sqlite");
+
+		await createIndexArtifact(path, null, manyOtus(3, 2000));
+
+		const many = openWorkflowIndex({ id: 4, path });
+		const ids = (await collect(many.iterSequences())).map(
+			(sequence) => sequence.id,
+		);
+
+		const refs = await many.getOtuRefsBySequenceIds([...ids].reverse());
+
+		many.close();
+
+		expect(Object.keys(refs)).toEqual(ids);
+		expect(refs["otu_2_seq_1999"]?.id).toBe("otu_002");
+	});
+
+	it("names every missing id across statements", async () => {
+		const path = join(workPath, "many.sqlite");
+
+		await createIndexArtifact(path, null, manyOtus(3, 2000));
+
+		const many = openWorkflowIndex({ id: 4, path });
+
+		await expect(
+			many.getOtuRefsBySequenceIds([
+				"seq_nope_1",
+				...Array.from({ length: 5000 }, (_unused, sequence) =>
+					`otu_${sequence % 3}_seq_${String(sequence % 2000).padStart(4, "0")}`,
+				),
+				"seq_nope_2",
+			]),
+		).rejects.toThrow(/seq_nope_1.*seq_nope_2/);
+
+		many.close();
+	});
 });
 
-describe("writeFasta", () => {
-	it("writes byte-identical output to the golden", async () => {
-		const path = join(workPath, "reference.fa");
+describe("createOtuRefCache", () => {
+	it("serves cached ids without reading the artifact", async () => {
+		const cache = createOtuRefCache(100);
+		const cached = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ otuRefCache: cache },
+		);
 
-		await writeFasta(path, index.iterDefaultSequences());
+		const first = await cached.getOtuRefsBySequenceIds(
+			golden.otuRefsBySequenceId.sequenceIds,
+		);
 
-		expect(await readFile(path, "utf8")).toBe(
-			await readFile(join(FIXTURES, "default.fa"), "utf8"),
+		// A closed handle throws on any statement, so this can only be answered
+		// from the cache.
+		cached.close();
+
+		expect(
+			await cached.getOtuRefsBySequenceIds(
+				golden.otuRefsBySequenceId.sequenceIds,
+			),
+		).toEqual(first);
+		expect(first).toEqual(golden.otuRefsBySequenceId.result);
+	});
+
+	it("is shared by handles on the same artifact", async () => {
+		const cache = createOtuRefCache(100);
+		const cached = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ otuRefCache: cache },
+		);
+
+		await cached.getOtuRefsBySequenceIds(["seq_a1"]);
+
+		cached.close();
+
+		expect(cache.get(FIXTURE_PATH, "seq_a1")).toEqual(
+			golden.otuRefsBySequenceId.result.seq_a1,
 		);
+		expect(cache.get(join(workPath, "other.sqlite"), "seq_a1")).toBeUndefined();
 	});
 
-	it("writes nothing for an empty iterator", async () => {
-		const path = join(workPath, "empty.fa");
+	it("evicts the least recently used entry", () => {
+		const cache = createOtuRefCache(2);
+		const ref = golden.otuRefsBySequenceId.result.seq_a1;
+
+		cache.set("a.sqlite", "seq_1", ref);
+		cache.set("a.sqlite", "seq_2", ref);
+		cache.get("a.sqlite", "seq_1");
+		cache.set("a.sqlite", "seq_3", ref);
+
+		expect(cache.size).toBe(2);
+		expect(cache.get("a.sqlite", "seq_1")).toEqual(ref);
+		expect(cache.get("a.sqlite", "seq_2")).toBeUndefined();
+	});
+
+	it("hands back copies the cache does not share", async () => {
+		const cache = createOtuRefCache(100);
+		const cached = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ otuRefCache: cache },
+		);
+
+		const refs = await cached.getOtuRefsBySequenceIds(["seq_a1"]);
+
+		cached.close();
+
+		if (refs.seq_a1 === undefined) {
+			throw new Error("seq_a1 did not resolve");
+		}
+
+		refs.seq_a1.name = "edited";
 
-		await writeFasta(path, index.iterOtuSequences([]));
+		expect(cache.get(FIXTURE_PATH, "seq_a1")?.name).not.toBe("edited");
+	});
+
+	it("still throws on an unknown id, and caches nothing for it", async () => {
+		const cache = createOtuRefCache(100);
+		const cached = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ otuRefCache: cache },
+		);
+
+		await expect(
+			cached.getOtuRefsBySequenceIds(["seq_a1", "seq_nope"]),
+		).rejects.toThrow(IndexSequenceNotFoundError);
+
+		cached.close();
+
+		expect(cache.get(FIXTURE_PATH, "seq_nope")).toBeUndefined();
+	});
+
+	it("refuses a size below one", () => {
+		expect(() => createOtuRefCache(0)).toThrow(RangeError);
+	});
+});
+
+describe("openWorkflowIndex with mmap", () => {
+	it("matches every pinned golden", async () => {
+		const mapped = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ mmap: true },
+		);
+
+		expect(await collect(mapped.iterOtus())).toEqual(golden.otus);
+		expect(await collect(mapped.iterSequences())).toEqual(golden.sequences);
+		expect(
+			await mapped.getOtuRefsBySequenceIds(
+				golden.otuRefsBySequenceId.sequenceIds,
+			),
+		).toEqual(golden.otuRefsBySequenceId.result);
 
-		expect(await readFile(path, "utf8")).toBe("");
+		mapped.close();
+	});
+});
+
+describe("openWorkflowIndex with readerThreads", () => {
+	it("matches every pinned golden with the scans running at once", async () => {
+		const threaded = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ readerThreads: 2 },
+		);
+
+		const [otus, sequences, defaultSequences, otuSequences] = await Promise.all(
+			[
+				collect(threaded.iterOtus()),
+				collect(threaded.iterSequences()),
+				collect(threaded.iterDefaultSequences()),
+				collect(threaded.iterOtuSequences(golden.otuSequences.otuIds)),
+			],
+		);
+
+		threaded.close();
+
+		expect(otus).toEqual(golden.otus);
+		expect(sequences).toEqual(golden.sequences);
+		expect(defaultSequences).toEqual(golden.defaultSequences);
+		expect(otuSequences).toEqual(golden.otuSequences.result);
+	});
+
+	it("streams a scan larger than one batch in order", async () => {
+		const path = join(workPath, "many.sqlite");
+
+		await createIndexArtifact(path, null, manyOtus(3, 400));
+
+		const local = openWorkflowIndex({ id: 4, path });
+		const threaded = openWorkflowIndex({ id: 4, path }, { readerThreads: 1 });
+
+		const [expected, sequences] = await Promise.all([
+			collect(local.iterSequences()),
+			collect(threaded.iterSequences()),
+		]);
+
+		local.close();
+		threaded.close();
+
+		expect(sequences).toHaveLength(1200);
+		expect(sequences).toEqual(expected);
+	});
+
+	it("frees a thread when the caller stops early", async () => {
+		const threaded = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ readerThreads: 1 },
+		);
+
+		for await (const _sequence of threaded.iterSequences()) {
+			break;
+		}
+
+		expect(await collect(threaded.iterDefaultSequences())).toEqual(
+			golden.defaultSequences,
+		);
+
+		threaded.close();
+	});
+
+	it("refuses a thread count that is not a whole number", () => {
+		expect(() =>
+			openWorkflowIndex({ id: 1, path: FIXTURE_PATH }, { readerThreads: -1 }),
+		).toThrow(RangeError);
+	});
+
+	it("still rejects a missing artifact before starting a thread", () => {
+		expect(() =>
+			openWorkflowIndex(
+				{ id: 12, path: join(workPath, "absent.sqlite") },
+				{ readerThreads: 2 },
+			),
+		).toThrow(IndexArtifactMissingError);
 	});
 });
 
 describe("batching", () => {
 	it("yields to the event loop while a scan runs", async () => {
 		const path = join(workPath, "many.sqlite");
-		const otus: IndexOtu[] = [];
-
-		for (let otu = 0; otu < 3; otu++) {
-			otus.push({
-				abbreviation: "",
-				id: `otu_${String(otu).padStart(3, "0")}`,
-				isolates: [
-					{
-						default: true,
-						id: "iso",
-						sequences: Array.from({ length: 400 }, (_unused, sequence) => ({
-							accession: `ACC${sequence}`,
-							definition: "definition",
-							host: null,
-							id: `otu_${otu}_seq_${String(sequence).padStart(4, "0")}`,
-							segment: null,
-							sequence: "ACGT",
-						})),
-						source_name: "S",
-						source_type: "isolate",
-					},
-				],
-				name: `OTU ${otu}`,
-				schema: [],
-				taxid: null,
-				version: 0,
-			});
-		}
 
-		await createIndexArtifact(path, null, otus);
+		await createIndexArtifact(path, null, manyOtus(3, 400));
 
 		const many = openWorkflowIndex({ id: 4, path });
 
@@ -314,3 +558,126 @@ describe("batching", () => {
 		expect(ticks).toBeGreaterThan(0);
 	});
 });
+
+describe("explainQueryPlans", () => {
+	// `generate.py` sets this after rebuilding the fixture, to re-pin the plans
+	// against it.
+	it.skipIf(process.env.VT_UPDATE_QUERY_PLANS !== undefined)(
+		"matches the pinned plans",
+		() => {
+			expect(index.explainQueryPlans()).toEqual(queryPlans);
+		},
+	);
+
+	it.skipIf(process.env.VT_UPDATE_QUERY_PLANS === undefined)(
+		"re-pins the plans",
+		async () => {
+			await writeFile(
+				join(FIXTURES, "query-plans.json"),
+				`${JSON.stringify(index.explainQueryPlans(), null, "\t")}\n`,
+			);
+		},
+	);
+
+	// A whole-table sort reads the entire artifact before the first row comes
+	// back, and holds it in a temporary B-tree. Sorting the last term within
+	// each isolate, as two of the queries do, is bounded by one isolate.
+	it("never sorts a whole table", () => {
+		for (const plan of Object.values(index.explainQueryPlans())) {
+			expect(plan).not.toContain("USE TEMP B-TREE FOR ORDER BY");
+		}
+	});
+});
+
+describe("onQueryMetrics", () => {
+	async function openMany(options: { readerThreads?: number } = {}) {
+		const path = join(workPath, "many.sqlite");
+		const reported: IndexQueryMetrics[] = [];
+
+		await createIndexArtifact(path, null, manyOtus(3, 400));
+
+		const many = openWorkflowIndex(
+			{ id: 4, path },
+			{ ...options, onQueryMetrics: (metrics) => reported.push(metrics) },
+		);
+
+		return { many, reported };
+	}
+
+	it("reports a scan's rows and batches once it ends", async () => {
+		const { many, reported } = await openMany();
+
+		await collect(many.iterSequences());
+
+		many.close();
+
+		expect(reported).toHaveLength(1);
+		expect(reported[0]).toEqual({
+			query: "iter_sequences",
+			rows: 1200,
+			batches: 3,
+			seconds: reported[0]?.seconds,
+			maxBatchMs: reported[0]?.maxBatchMs,
+			completed: true,
+		});
+		expect(reported[0]?.maxBatchMs).toBeGreaterThan(0);
+		expect(reported[0]?.seconds).toBeGreaterThanOrEqual(
+			(reported[0]?.maxBatchMs ?? 0) / 1000,
+		);
+	});
+
+	it("reports a scan the caller abandons as incomplete", async () => {
+		const { many, reported } = await openMany();
+
+		for await (const _sequence of many.iterDefaultSequences()) {
+			break;
+		}
+
+		many.close();
+
+		expect(
+			reported.map(({ query, rows, completed }) => ({ query, rows, completed })),
+		).toEqual([
+			{ query: "iter_default_sequences", rows: 1, completed: false },
+		]);
+	});
+
+	it("reports scans on reader threads", async () => {
+		const { many, reported } = await openMany({ readerThreads: 1 });
+
+		await collect(many.iterOtuSequences(["otu_000", "otu_001"]));
+
+		many.close();
+
+		expect(
+			reported.map(({ query, rows, batches }) => ({ query, rows, batches })),
+		).toEqual([
+			{ query: "iter_otu_sequences", rows: 800, batches: 2 },
+		]);
+	});
+
+	it("reports the rows each lookup read from the artifact", async () => {
+		const reported: IndexQueryMetrics[] = [];
+
+		const local = openWorkflowIndex(
+			{ id: 1, path: FIXTURE_PATH },
+			{ onQueryMetrics: (metrics) => reported.push(metrics) },
+		);
+
+		await local.getOtuRefsBySequenceIds(
+			golden.otuRefsBySequenceId.sequenceIds,
+		);
+
+		local.close();
+
+		expect(
+			reported.map(({ query, rows, batches }) => ({ query, rows, batches })),
+		).toEqual([
+			{
+				query: "get_otu_refs_by_sequence_ids",
+				rows: golden.otuRefsBySequenceId.sequenceIds.length,
+				batches: 1,
+			},
+		]);
+	});
+});
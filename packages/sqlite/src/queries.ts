@@ -25,32 +25,39 @@
  * on any of these puts the whole index in the heap.
  */
 
-import { createWriteStream } from "node:fs";
+import { performance } from "node:perf_hooks";
 import type { DatabaseSync, SQLInputValue, SQLOutputValue } from "node:sqlite";
-import { pipeline } from "node:stream/promises";
 import { setImmediate } from "node:timers/promises";
 import {
+	IndexArtifactError,
 	IndexOtuIntegrityError,
 	IndexReferenceNotFoundError,
 	IndexSequenceNotFoundError,
 } from "./errors";
-import { type IndexArtifactSource, openIndexArtifact } from "./schema";
+import { unpackSequence } from "./nucleotides";
+import { type ReaderThreads, startReaderThreads } from "./readerThreads";
+import {
+	INDEX_ARTIFACT_MMAP_SIZE,
+	type IndexArtifactSource,
+	openIndexArtifact,
+} from "./schema";
 
 /**
  * Rows scanned between turns of the event loop.
  *
- * `node:sqlite` is synchronous and there is no thread to move the scan to, so
- * this sizes how long the loop is blocked.
+ * `node:sqlite` is synchronous, so on the main thread this sizes how long the
+ * loop is blocked. Reader threads (`readerThreads`) read in the same batches.
  */
 const SEQUENCE_BATCH_SIZE = 500;
 
 /**
- * OTU documents scanned between turns of the event loop.
+ * Sequence ids resolved per statement by `getOtuRefsBySequenceIds`, with a turn
+ * of the event loop between chunks.
  *
- * One, because a single OTU document carries every sequence of every isolate
- * and is large on its own.
+ * A sample can ask for tens of thousands at once; resolved in one statement,
+ * that is one long block of the loop and every row collected at once.
  */
-const OTU_BATCH_SIZE = 1;
+const OTU_REF_CHUNK_SIZE = 2000;
 
 /** Reference metadata, without the OTUs. */
 export type IndexReference = {
@@ -190,6 +197,126 @@ export type IndexOtuRef = {
 	version: number;
 };
 
+/**
+ * The default-isolate FASTA an artifact built with `embedDefaultFasta` holds.
+ *
+ * The same bytes `writeFasta` writes from `iterDefaultSequences`, formatted
+ * once when the artifact was built.
+ */
+export type IndexDefaultFasta = {
+	/** The length of the FASTA in bytes */
+	bytes: number;
+
+	/** The number of records, one per default-isolate sequence */
+	records: number;
+
+	/** The hex SHA-256 of the whole FASTA, recorded when it was built */
+	sha256: string;
+
+	/** Stream the FASTA's bytes in order, one stored chunk at a time */
+	chunks(): AsyncIterableIterator<Uint8Array>;
+};
+
+/**
+ * A bounded map of sequence id to {@link IndexOtuRef}, shared between handles.
+ *
+ * An artifact is immutable once written, so an entry never goes stale. Entries
+ * are keyed by artifact path as well as sequence id, so one cache can serve
+ * every handle a run opens — pathoscope resolves the same ids against its
+ * collapsed reference in more than one step.
+ */
+export type OtuRefCache = {
+	/** The most entries held before the least recently used is evicted */
+	readonly maxEntries: number;
+
+	/** How many entries are held now */
+	readonly size: number;
+
+	/** Look up a sequence's OTU, marking it recently used */
+	get(path: string, sequenceId: string): IndexOtuRef | undefined;
+
+	/** Record a sequence's OTU, evicting the least recently used if full */
+	set(path: string, sequenceId: string, ref: IndexOtuRef): void;
+
+	/** Drop every entry */
+	clear(): void;
+};
+
+/** The name of each query a {@link WorkflowIndex} runs, as reported. */
+export type IndexQueryName =
+	| "iter_otus"
+	| "iter_sequences"
+	| "iter_default_sequences"
+	| "iter_otu_sequences"
+	| "get_otu_refs_by_sequence_ids"
+	| "default_fasta_chunks";
+
+/**
+ * How one query ran, reported to `onQueryMetrics` when it ends.
+ *
+ * A batch is the rows read between two turns of the event loop. On the main
+ * thread, how long one takes is how long the loop was held, the caller's work
+ * on those rows included; on a reader thread it is mostly the wait for the
+ * thread to send it.
+ */
+export type IndexQueryMetrics = {
+	/** Which query ran */
+	query: IndexQueryName;
+
+	/** Rows the statement returned, before any were folded into documents */
+	rows: number;
+
+	/** Batches the rows were read in */
+	batches: number;
+
+	/** Seconds from the first row asked for to the end, the caller's included */
+	seconds: number;
+
+	/** The longest any one batch took, in milliseconds */
+	maxBatchMs: number;
+
+	/** Whether the query ran out of rows rather than being abandoned */
+	completed: boolean;
+};
+
+/** Options for {@link openWorkflowIndex}. */
+export type WorkflowIndexOptions = {
+	/**
+	 * Memoize `getOtuRefsBySequenceIds` through this cache.
+	 *
+	 * Only ids the cache misses are read from the artifact. Nothing is cached
+	 * without one.
+	 */
+	otuRefCache?: OtuRefCache;
+
+	/**
+	 * Read the artifact through a memory map, as `openIndexArtifact` explains.
+	 *
+	 * For a node running several jobs against one reference: every handle on
+	 * the same file then reads the kernel's one copy of its pages.
+	 */
+	mmap?: boolean;
+
+	/**
+	 * Run the iterators' scans on this many worker threads instead of the main
+	 * one, each with its own memory-mapped handle.
+	 *
+	 * Iterators are spread over the threads, so up to this many scan at once and
+	 * the event loop is never blocked by one. The lookups stay on the main
+	 * thread, since each is a single short statement. Zero, the default, starts
+	 * none.
+	 */
+	readerThreads?: number;
+
+	/**
+	 * Called with each query's {@link IndexQueryMetrics} as it ends, whether
+	 * it ran out of rows, was abandoned or failed.
+	 *
+	 * Costs two clock reads a batch, and nothing without it.
+	 */
+	onQueryMetrics?: (metrics: IndexQueryMetrics) => void;
+};
+
 /** A reference index artifact, open for reading. */
 export type WorkflowIndex = {
 	/** The id of the index the artifact was built for */
@@ -204,6 +331,9 @@ export type WorkflowIndex = {
 	/** Read the reference metadata */
 	getReferenceMetadata(): Promise<IndexReference>;
 
+	/** Find the precomputed default-isolate FASTA, or null if there is none */
+	getDefaultFasta(): Promise<IndexDefaultFasta | null>;
+
 	/** Resolve sequence ids to the OTUs that own them */
 	getOtuRefsBySequenceIds(
 		sequenceIds: Iterable<string>,
@@ -222,8 +352,23 @@ export type WorkflowIndex = {
 
 	/** Iterate every sequence in the index */
 	iterSequences(): AsyncIterableIterator<IndexSequence>;
+
+	/**
+	 * Ask SQLite how it would run each query on this artifact, as the lines of
+	 * `EXPLAIN QUERY PLAN` indented by depth.
+	 *
+	 * Leaves out `default_fasta_chunks`, a primary-key scan of a table most
+	 * artifacts do not have. `fixtures/query-plans.json` pins the fixture's.
+	 */
+	explainQueryPlans(): Record<ExplainedQueryName, string[]>;
 };
 
+/** The queries {@link WorkflowIndex.explainQueryPlans} explains. */
+export type ExplainedQueryName = Exclude<
+	IndexQueryName,
+	"default_fasta_chunks"
+>;
+
 const SELECT_SEQUENCES = `
 	SELECT
 		sequences.id AS id,
@@ -241,70 +386,91 @@ const SELECT_SEQUENCES = `
 /**
  * The ordering for every sequence query but `iterSequences`, which replaces it
  * with the sequence id alone.
+ *
+ * Exported for the artifact writer, whose embedded default FASTA has to come
+ * out byte for byte as `writeFasta(iterDefaultSequences())` would.
  */
-const SEQUENCE_ORDER = `
+export const SEQUENCE_ORDER = `
 	ORDER BY isolates.otu_id, isolates.virtool_id, sequences.id
 `;
 
 /**
- * The nested OTU document, assembled by SQLite rather than in JavaScript.
+ * Every row of every OTU document, in one ordered statement for {@link foldOtus}
+ * to fold back into documents.
+ *
+ * Two arms, merged on the OTU id: each OTU's schema items (`part` 0), then one
+ * row per sequence of each of its isolates (`part` 1). An OTU with no isolates,
+ * or an isolate with no sequences, still contributes a row through the left
+ * joins, so `checkOtu` sees it and refuses it rather than it vanishing.
  *
- * **The `ORDER BY` in each subquery below does nothing, and must stay anyway.**
- * SQLite applies an `ORDER BY` to the single row an aggregate produces, not to
- * the rows going into it, so `json_group_array` collects isolates and sequences
- * in whatever order the scan yields — which the indexes on `isolates.otu_id`
- * and `sequences.isolate_id` make insertion order, not id order. That insertion
- * order is the point: pathoscope feeds these sequences to `cd-hit-est`, which
- * picks its cluster representative by the order it sees them in. Removing these
- * clauses, or "fixing" them into a real sort, changes which sequences survive
+ * **Isolates and sequences come back in insertion order, by rowid, not by id.**
+ * That order is the point: pathoscope feeds these sequences to `cd-hit-est`,
+ * which picks its cluster representative by the order it sees them in, and the
+ * golden pins it. "Fixing" the sort to the ids changes which sequences survive
  * collapsing and so changes the analysis.
+ *
+ * Every `ORDER BY` term is met by an index — `otus`' primary key, the
+ * `otu_schema` key, and `isolates_otu_id_idx` and `sequences_isolate_id_idx`,
+ * whose entries run in rowid order within a key — so SQLite merges the two arms
+ * as it scans and never sorts the reference into a temporary B-tree.
  */
-const SELECT_OTUS = `
-	SELECT json_object(
-		'id', otus.id,
-		'abbreviation', otus.abbreviation,
-		'isolates', json((
-			SELECT coalesce(json_group_array(json_object(
-				'default', json(CASE WHEN isolates.is_default = 1 THEN 'true' ELSE 'false' END),
-				'id', isolates.virtool_id,
-				'sequences', json((
-					SELECT coalesce(json_group_array(json_object(
-						'id', sequences.id,
-						'accession', sequences.accession,
-						'definition', sequences.definition,
-						'host', sequences.host,
-						'segment', sequences.segment,
-						'sequence', sequences.sequence
-					)), json('[]'))
-					FROM sequences
-					WHERE sequences.isolate_id = isolates.id
-					ORDER BY sequences.id
-				)),
-				'source_name', isolates.source_name,
-				'source_type', isolates.source_type
-			)), json('[]'))
-			FROM isolates
-			WHERE isolates.otu_id = otus.id
-			ORDER BY isolates.virtool_id
-		)),
-		'name', otus.name,
-		'schema', json((
-			SELECT coalesce(json_group_array(json_object(
-				'molecule', otu_schema.molecule,
-				'name', otu_schema.name,
-				'required', json(CASE WHEN otu_schema.required = 1 THEN 'true' ELSE 'false' END)
-			)), json('[]'))
-			FROM otu_schema
-			WHERE otu_schema.otu_id = otus.id
-			ORDER BY otu_schema.name
-		)),
-		'taxid', otus.taxid,
-		'version', otus.version
-	) AS document
+const SELECT_OTU_ROWS = `
+	SELECT
+		otus.id AS otu_id,
+		0 AS part,
+		otus.abbreviation AS abbreviation,
+		otus.name AS name,
+		otus.taxid AS taxid,
+		otus.version AS version,
+		otu_schema.name AS schema_name,
+		otu_schema.molecule AS schema_molecule,
+		otu_schema.required AS schema_required,
+		NULL AS isolate_rowid,
+		NULL AS isolate_id,
+		NULL AS is_default,
+		NULL AS source_name,
+		NULL AS source_type,
+		NULL AS sequence_rowid,
+		NULL AS sequence_id,
+		NULL AS accession,
+		NULL AS definition,
+		NULL AS host,
+		NULL AS segment,
+		NULL AS sequence
+	FROM otus
+	JOIN otu_schema ON otu_schema.otu_id = otus.id
+	UNION ALL
+	SELECT
+		otus.id,
+		1,
+		otus.abbreviation,
+		otus.name,
+		otus.taxid,
+		otus.version,
+		NULL,
+		NULL,
+		NULL,
+		isolates.id,
+		isolates.virtool_id,
+		isolates.is_default,
+		isolates.source_name,
+		isolates.source_type,
+		sequences.rowid,
+		sequences.id,
+		sequences.accession,
+		sequences.definition,
+		sequences.host,
+		sequences.segment,
+		sequences.sequence
 	FROM otus
-	ORDER BY otus.id
+	LEFT JOIN isolates ON isolates.otu_id = otus.id
+	LEFT JOIN sequences ON sequences.isolate_id = isolates.id
+	ORDER BY otu_id, part, schema_name, isolate_rowid, sequence_rowid
 `;
 
+/** The `part` of a {@link SELECT_OTU_ROWS} row carrying a schema item. */
+const SCHEMA_PART = 0;
+
 /**
  * Bind an id set as one JSON array rather than one parameter per id.
  *
@@ -316,25 +482,109 @@ const SELECT_OTUS = `
  */
 const IN_ID_SET = "(SELECT value FROM json_each(?))";
 
+/** Every sequence id's OTU, for the set of ids bound to its one parameter. */
+const SELECT_OTU_REFS = `
+	SELECT
+		sequences.id AS sequence_id,
+		otus.id AS otu_id,
+		otus.abbreviation AS abbreviation,
+		otus.name AS name,
+		otus.taxid AS taxid,
+		otus.version AS version
+	FROM sequences
+	JOIN isolates ON sequences.isolate_id = isolates.id
+	JOIN otus ON isolates.otu_id = otus.id
+	WHERE sequences.id IN ${IN_ID_SET}
+`;
+
+/**
+ * The SQL behind every query name, so the name a metric reports and the plan
+ * `explainQueryPlans` returns are always the statement that ran.
+ *
+ * Without statistics from `ANALYZE`, which no writer runs, SQLite plans these
+ * from the schema alone, so the fixture's plans are the plans on any artifact.
+ * None sorts a whole table. The two filtered by isolate sort only the last term
+ * of their order, one isolate's few sequences at a time, because the schema —
+ * the other implementation's as much as this one's — has no index on
+ * `sequences (isolate_id, id)`.
+ */
+const QUERIES: Record<IndexQueryName, string> = {
+	iter_otus: SELECT_OTU_ROWS,
+	iter_sequences: `${SELECT_SEQUENCES} ORDER BY sequences.id`,
+	iter_default_sequences: `${SELECT_SEQUENCES} WHERE isolates.is_default = 1 ${SEQUENCE_ORDER}`,
+	iter_otu_sequences: `${SELECT_SEQUENCES} WHERE isolates.otu_id IN ${IN_ID_SET} ${SEQUENCE_ORDER}`,
+	get_otu_refs_by_sequence_ids: SELECT_OTU_REFS,
+	default_fasta_chunks: "SELECT chunk FROM default_fasta ORDER BY position",
+};
+
 /**
  * Open the artifact at `source.path` for reading.
  *
  * The returned handle holds an open file descriptor. A workflow process is
  * one-shot and exit reclaims it, so `close` matters only where a run opens
  * artifacts repeatedly — pathoscope reloads its collapsed reference in several
- * steps.
+ * steps. With `readerThreads`, `close` also stops the threads.
  *
  * @throws {IndexArtifactMissingError} when the artifact is absent or unopenable.
  * @throws {IndexArtifactFormatError} when it is not an artifact this reader understands.
  */
-export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
-	const database = openIndexArtifact(source);
+export function openWorkflowIndex(
+	source: IndexArtifactSource,
+	{
+		otuRefCache,
+		mmap = false,
+		readerThreads = 0,
+		onQueryMetrics,
+	}: WorkflowIndexOptions = {},
+): WorkflowIndex {
+	if (!Number.isInteger(readerThreads) || readerThreads < 0) {
+		throw new RangeError(
+			`readerThreads must be a whole number, not ${readerThreads}`,
+		);
+	}
+
+	const database = openIndexArtifact(source, { mmap });
+
+	// Started only once the artifact has opened and passed its format check,
+	// so a bad file fails here rather than on some thread later.
+	const threads =
+		readerThreads > 0
+			? startReaderThreads(
+					source.path,
+					readerThreads,
+					INDEX_ARTIFACT_MMAP_SIZE,
+				)
+			: null;
+
+	function record(query: IndexQueryName): QueryRecorder | null {
+		return onQueryMetrics === undefined
+			? null
+			: createQueryRecorder(query, onQueryMetrics);
+	}
+
+	function iterate<T>(
+		query: IndexQueryName,
+		parameters: SQLInputValue[],
+		batchSize: number,
+		shape: (row: Record<string, SQLOutputValue>) => T,
+	): AsyncGenerator<T> {
+		const sql = QUERIES[query];
+
+		return threads === null
+			? iterateRows(database, sql, parameters, batchSize, shape, () =>
+					record(query),
+				)
+			: iterateThreadRows(threads, sql, parameters, batchSize, shape, () =>
+					record(query),
+				);
+	}
 
 	return {
 		id: source.id,
 		path: source.path,
 
 		close() {
+			threads?.close();
 			database.close();
 		},
 
@@ -360,6 +610,42 @@ export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
 			};
 		},
 
+		async getDefaultFasta(): Promise<IndexDefaultFasta | null> {
+			const rows = database
+				.prepare(
+					`SELECT "key", value FROM metadata WHERE "key" IN (
+						'default_fasta_bytes',
+						'default_fasta_records',
+						'default_fasta_sha256'
+					)`,
+				)
+				.all();
+
+			const metadata = new Map(
+				rows.map((row) => [asString(row, "key"), asString(row, "value")]),
+			);
+
+			const sha256 = metadata.get("default_fasta_sha256");
+
+			if (sha256 === undefined) {
+				return null;
+			}
+
+			return {
+				bytes: Number(metadata.get("default_fasta_bytes")),
+				records: Number(metadata.get("default_fasta_records")),
+				sha256,
+				// A chunk is megabytes, so one is a batch of its own.
+				chunks: () =>
+					iterate(
+						"default_fasta_chunks",
+						[],
+						1,
+						(row) => asBlob(row, "chunk"),
+					),
+			};
+		},
+
 		async getOtuRefsBySequenceIds(
 			sequenceIds: Iterable<string>,
 		): Promise<Record<string, IndexOtuRef>> {
@@ -369,47 +655,56 @@ export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
 				return {};
 			}
 
-			const rows = database
-				.prepare(
-					`SELECT
-						sequences.id AS sequence_id,
-						otus.id AS otu_id,
-						otus.abbreviation AS abbreviation,
-						otus.name AS name,
-						otus.taxid AS taxid,
-						otus.version AS version
-					FROM sequences
-					JOIN isolates ON sequences.isolate_id = isolates.id
-					JOIN otus ON isolates.otu_id = otus.id
-					WHERE sequences.id IN ${IN_ID_SET}`,
-				)
-				.all(JSON.stringify([...wanted]));
+			const found = new Map<string, IndexOtuRef>();
+			const uncached: string[] = [];
 
-			const refs: Record<string, IndexOtuRef> = {};
+			for (const id of wanted) {
+				const cached = otuRefCache?.get(source.path, id);
 
-			for (const row of rows) {
-				refs[asString(row, "sequence_id")] = {
-					abbreviation: asString(row, "abbreviation"),
-					id: asString(row, "otu_id"),
-					name: asString(row, "name"),
-					taxid: asNumberOrNull(row, "taxid"),
-					version: asNumber(row, "version"),
-				};
+				if (cached === undefined) {
+					uncached.push(id);
+				} else {
+					found.set(id, cached);
+				}
+			}
+
+			if (uncached.length > 0) {
+				await resolveOtuRefs(
+					database,
+					uncached,
+					(id, ref) => {
+						found.set(id, ref);
+						otuRefCache?.set(source.path, id, ref);
+					},
+					record("get_otu_refs_by_sequence_ids"),
+				);
 			}
 
-			const missing = [...wanted].filter((id) => !(id in refs));
+			const missing = [...wanted].filter((id) => !found.has(id));
 
 			if (missing.length > 0) {
 				throw new IndexSequenceNotFoundError(missing);
 			}
 
+			// Keyed in sequence id order, as the golden pins, however the ids
+			// were split between the cache and the chunks.
+			// Every ref is a copy, so a caller cannot edit the cache's.
+			const refs: Record<string, IndexOtuRef> = {};
+
+			const sorted = [...found].sort(([left], [right]) =>
+				compareIds(left, right),
+			);
+
+			for (const [id, ref] of sorted) {
+				refs[id] = { ...ref };
+			}
+
 			return refs;
 		},
 
 		iterDefaultSequences(): AsyncIterableIterator<IndexSequence> {
-			return iterateRows(
-				database,
-				`${SELECT_SEQUENCES} WHERE isolates.is_default = 1 ${SEQUENCE_ORDER}`,
+			return iterate(
+				"iter_default_sequences",
 				[],
 				SEQUENCE_BATCH_SIZE,
 				shapeSequence,
@@ -417,8 +712,8 @@ export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
 		},
 
 		iterOtus(): AsyncIterableIterator<IndexOtu> {
-			return iterateRows(database, SELECT_OTUS, [], OTU_BATCH_SIZE, (row) =>
-				checkOtu(JSON.parse(asString(row, "document")) as IndexOtu),
+			return foldOtus(
+				iterate("iter_otus", [], SEQUENCE_BATCH_SIZE, (row) => row),
 			);
 		},
 
@@ -432,9 +727,8 @@ export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
 				return emptyIterator();
 			}
 
-			return iterateRows(
-				database,
-				`${SELECT_SEQUENCES} WHERE isolates.otu_id IN ${IN_ID_SET} ${SEQUENCE_ORDER}`,
+			return iterate(
+				"iter_otu_sequences",
 				[JSON.stringify([...wanted])],
 				SEQUENCE_BATCH_SIZE,
 				shapeSequence,
@@ -442,34 +736,150 @@ export function openWorkflowIndex(source: IndexArtifactSource): WorkflowIndex {
 		},
 
 		iterSequences(): AsyncIterableIterator<IndexSequence> {
-			return iterateRows(
-				database,
-				`${SELECT_SEQUENCES} ORDER BY sequences.id`,
+			return iterate(
+				"iter_sequences",
 				[],
 				SEQUENCE_BATCH_SIZE,
 				shapeSequence,
 			);
 		},
+
+		explainQueryPlans() {
+			return {
+				iter_otus: explainQueryPlan(database, QUERIES.iter_otus),
+				iter_sequences: explainQueryPlan(database, QUERIES.iter_sequences),
+				iter_default_sequences: explainQueryPlan(
+					database,
+					QUERIES.iter_default_sequences,
+				),
+				iter_otu_sequences: explainQueryPlan(
+					database,
+					QUERIES.iter_otu_sequences,
+				),
+				get_otu_refs_by_sequence_ids: explainQueryPlan(
+					database,
+					QUERIES.get_otu_refs_by_sequence_ids,
+				),
+			};
+		},
 	};
 }
 
 /**
- * Stream `sequences` to `path` as FASTA, one record per sequence.
+ * Create an {@link OtuRefCache} holding at most `maxEntries` refs.
  *
- * Written through a stream rather than a joined string: the records are the
- * whole index, and a caller reaching for `writeFile` would hold all of it at
- * once. `pipeline` propagates backpressure, so the SQLite scan is paced by how
- * fast the disk takes the bytes.
+ * Bounded by entries rather than bytes: a ref is five short fields, so a few
+ * hundred bytes each, and a hundred thousand of them is tens of megabytes.
+ */
+export function createOtuRefCache(maxEntries: number): OtuRefCache {
+	if (!Number.isInteger(maxEntries) || maxEntries < 1) {
+		throw new RangeError(
+			`An OTU ref cache must hold at least one entry, not ${maxEntries}`,
+		);
+	}
+
+	// A `Map` iterates in insertion order, so re-inserting on every hit keeps
+	// the least recently used entry first.
+	const entries = new Map<string, IndexOtuRef>();
+
+	const key = (path: string, sequenceId: string) => `${path}\0${sequenceId}`;
+
+	return {
+		maxEntries,
+
+		get size() {
+			return entries.size;
+		},
+
+		get(path, sequenceId) {
+			const ref = entries.get(key(path, sequenceId));
+
+			if (ref !== undefined) {
+				entries.delete(key(path, sequenceId));
+				entries.set(key(path, sequenceId), ref);
+			}
+
+			return ref;
+		},
+
+		set(path, sequenceId, ref) {
+			entries.delete(key(path, sequenceId));
+			entries.set(key(path, sequenceId), ref);
+
+			if (entries.size > maxEntries) {
+				const oldest = entries.keys().next();
+
+				if (!oldest.done) {
+					entries.delete(oldest.value);
+				}
+			}
+		},
+
+		clear() {
+			entries.clear();
+		},
+	};
+}
+
+/**
+ * Resolve `sequenceIds` to their OTUs, a chunk per statement, handing each to
+ * `found`. Ids with no sequence are skipped, for the caller to report.
  */
-export async function writeFasta(
-	path: string,
-	sequences: AsyncIterable<Pick<IndexSequence, "id" | "sequence">>,
+async function resolveOtuRefs(
+	database: DatabaseSync,
+	sequenceIds: string[],
+	found: (sequenceId: string, ref: IndexOtuRef) => void,
+	recorder: QueryRecorder | null,
 ): Promise<void> {
-	await pipeline(async function* () {
-		for await (const sequence of sequences) {
-			yield `>${sequence.id}\n${sequence.sequence}\n`;
+	const statement = database.prepare(QUERIES.get_otu_refs_by_sequence_ids);
+
+	let completed = false;
+
+	try {
+		for (
+			let start = 0;
+			start < sequenceIds.length;
+			start += OTU_REF_CHUNK_SIZE
+		) {
+			if (start > 0) {
+				await setImmediate();
+			}
+
+			const chunk = sequenceIds.slice(start, start + OTU_REF_CHUNK_SIZE);
+
+			let rows = 0;
+
+			recorder?.startBatch();
+
+			for (const row of statement.iterate(JSON.stringify(chunk))) {
+				found(asString(row, "sequence_id"), {
+					abbreviation: asString(row, "abbreviation"),
+					id: asString(row, "otu_id"),
+					name: asString(row, "name"),
+					taxid: asNumberOrNull(row, "taxid"),
+					version: asNumber(row, "version"),
+				});
+
+				rows += 1;
+			}
+
+			recorder?.endBatch(rows);
 		}
-	}, createWriteStream(path));
+
+		completed = true;
+	} finally {
+		recorder?.end(completed);
+	}
+}
+
+/**
+ * Order ids as SQLite's `BINARY` collation does.
+ *
+ * UTF-16 order, which `<` compares by, differs from UTF-8 byte order only
+ * above the Basic Multilingual Plane, and Virtool's ids are ASCII.
+ */
+function compareIds(left: string, right: string): number {
+	return left < right ? -1 : left > right ? 1 : 0;
 }
 
 async function* iterateRows<T>(
@@ -478,24 +888,150 @@ async function* iterateRows<T>(
 	parameters: SQLInputValue[],
 	batchSize: number,
 	shape: (row: Record<string, SQLOutputValue>) => T,
+	startRecording: () => QueryRecorder | null,
 ): AsyncGenerator<T> {
 	const statement = database.prepare(sql);
+	const recorder = startRecording();
 
 	let sinceYield = 0;
+	let completed = false;
+
+	recorder?.startBatch();
+
+	try {
+		for (const row of statement.iterate(...parameters)) {
+			// Counted before the yield, which is where an abandoned scan stops.
+			sinceYield += 1;
+
+			yield shape(row);
+
+			if (sinceYield >= batchSize) {
+				recorder?.endBatch(sinceYield);
+				sinceYield = 0;
+
+				await setImmediate();
+
+				recorder?.startBatch();
+			}
+		}
+
+		completed = true;
+	} finally {
+		recorder?.endBatch(sinceYield);
+		recorder?.end(completed);
+	}
+}
+
+/**
+ * {@link iterateRows} on a reader thread.
+ *
+ * The thread reads in the same batches, and the event loop turns between
+ * every one while the next is read.
+ */
+async function* iterateThreadRows<T>(
+	threads: ReaderThreads,
+	sql: string,
+	parameters: SQLInputValue[],
+	batchSize: number,
+	shape: (row: Record<string, SQLOutputValue>) => T,
+	startRecording: () => QueryRecorder | null,
+): AsyncGenerator<T> {
+	const recorder = startRecording();
 
-	for (const row of statement.iterate(...parameters)) {
-		yield shape(row);
+	let sinceBatch = 0;
+	let completed = false;
 
-		sinceYield += 1;
+	recorder?.startBatch();
 
-		if (sinceYield >= batchSize) {
-			sinceYield = 0;
+	try {
+		for await (const row of threads.iterate(sql, parameters, batchSize)) {
+			sinceBatch += 1;
 
-			await setImmediate();
+			yield shape(row);
+
+			if (sinceBatch >= batchSize) {
+				recorder?.endBatch(sinceBatch);
+				sinceBatch = 0;
+				recorder?.startBatch();
+			}
 		}
+
+		completed = true;
+	} finally {
+		recorder?.endBatch(sinceBatch);
+		recorder?.end(completed);
 	}
 }
 
+/** Times one query's batches and reports its metrics when it ends. */
+type QueryRecorder = {
+	/** The next batch is being read from now */
+	startBatch(): void;
+
+	/** The batch started last is done, after `rows` rows */
+	endBatch(rows: number): void;
+
+	/** Report the metrics; `completed` if the query ran out of rows */
+	end(completed: boolean): void;
+};
+
+function createQueryRecorder(
+	query: IndexQueryName,
+	report: (metrics: IndexQueryMetrics) => void,
+): QueryRecorder {
+	const start = performance.now();
+
+	let batchStart = start;
+	let rows = 0;
+	let batches = 0;
+	let maxBatchMs = 0;
+
+	return {
+		startBatch() {
+			batchStart = performance.now();
+		},
+
+		endBatch(batchRows) {
+			// A query that ends on a batch boundary reads nothing past it, and
+			// that read is not a batch of its own.
+			if (batchRows === 0) {
+				return;
+			}
+
+			rows += batchRows;
+			batches += 1;
+			maxBatchMs = Math.max(maxBatchMs, performance.now() - batchStart);
+		},
+
+		end(completed) {
+			report({
+				query,
+				rows,
+				batches,
+				seconds: (performance.now() - start) / 1000,
+				maxBatchMs,
+				completed,
+			});
+		},
+	};
+}
+
+/** `EXPLAIN QUERY PLAN` for `sql`, each line indented two spaces a level. */
+function explainQueryPlan(database: DatabaseSync, sql: string): string[] {
+	const depths = new Map<number, number>();
+
+	return database
+		.prepare(`EXPLAIN QUERY PLAN ${sql}`)
+		.all()
+		.map((row) => {
+			const depth = (depths.get(asNumber(row, "parent")) ?? -1) + 1;
+
+			depths.set(asNumber(row, "id"), depth);
+
+			return `${"  ".repeat(depth)}${asString(row, "detail")}`;
+		});
+}
+
 async function* emptyIterator<T>(): AsyncGenerator<T> {}
 
 function shapeSequence(row: Record<string, SQLOutputValue>): IndexSequence {
@@ -507,10 +1043,92 @@ function shapeSequence(row: Record<string, SQLOutputValue>): IndexSequence {
 		isolate_id: asString(row, "isolate_id"),
 		otu_id: asString(row, "otu_id"),
 		segment: asStringOrNull(row, "segment"),
-		sequence: asString(row, "sequence"),
+		sequence: asSequence(row, "sequence"),
 	};
 }
 
+/**
+ * Fold the rows of {@link SELECT_OTU_ROWS} into OTU documents.
+ *
+ * An OTU's rows are consecutive, so each document is yielded as soon as the
+ * next OTU's first row arrives, and only the one being assembled is held. Keys
+ * are set in the order SQLite's `json_object` wrote them when it built the
+ * documents, so a document serialises the same as it always has.
+ */
+async function* foldOtus(
+	rows: AsyncIterable<Record<string, SQLOutputValue>>,
+): AsyncGenerator<IndexOtu> {
+	let otu: IndexOtu | null = null;
+	let isolate: IndexOtuIsolate | null = null;
+	let isolateRowid: SQLOutputValue = null;
+
+	for await (const row of rows) {
+		const otuId = asString(row, "otu_id");
+
+		if (otu?.id !== otuId) {
+			if (otu !== null) {
+				yield checkOtu(otu);
+			}
+
+			otu = {
+				id: otuId,
+				abbreviation: asString(row, "abbreviation"),
+				isolates: [],
+				name: asString(row, "name"),
+				schema: [],
+				taxid: asNumberOrNull(row, "taxid"),
+				version: asNumber(row, "version"),
+			};
+			isolate = null;
+		}
+
+		if (asNumber(row, "part") === SCHEMA_PART) {
+			otu.schema.push({
+				molecule: asStringOrNull(row, "schema_molecule"),
+				name: asString(row, "schema_name"),
+				required: asNumber(row, "schema_required") === 1,
+			});
+
+			continue;
+		}
+
+		// The left join's row for an OTU with no isolates.
+		if (column(row, "isolate_rowid") === null) {
+			continue;
+		}
+
+		if (isolate === null || column(row, "isolate_rowid") !== isolateRowid) {
+			isolate = {
+				default: asNumber(row, "is_default") === 1,
+				id: asString(row, "isolate_id"),
+				sequences: [],
+				source_name: asString(row, "source_name"),
+				source_type: asString(row, "source_type"),
+			};
+			isolateRowid = column(row, "isolate_rowid");
+			otu.isolates.push(isolate);
+		}
+
+		// And for an isolate with no sequences.
+		if (column(row, "sequence_rowid") === null) {
+			continue;
+		}
+
+		isolate.sequences.push({
+			id: asString(row, "sequence_id"),
+			accession: asString(row, "accession"),
+			definition: asString(row, "definition"),
+			host: asStringOrNull(row, "host"),
+			segment: asStringOrNull(row, "segment"),
+			sequence: asSequence(row, "sequence"),
+		});
+	}
+
+	if (otu !== null) {
+		yield checkOtu(otu);
+	}
+}
+
 /**
  * An OTU with no isolates, or an isolate with no sequences, contributes nothing
  * to a FASTA and would otherwise pass silently into a Bowtie2 build that has
@@ -580,3 +1198,26 @@ function asNumberOrNull(
 
 	return value === null ? null : Number(value);
 }
+
+function asBlob(row: Record<string, SQLOutputValue>, name: string): Uint8Array {
+	const value = column(row, name);
+
+	if (!(value instanceof Uint8Array)) {
+		throw new IndexArtifactError(`Index query returned a non-blob ${name}`);
+	}
+
+	return value;
+}
+
+/**
+ * Read a sequence, unpacking it if the artifact stores it packed.
+ *
+ * A packed artifact's sequences come back as blobs and a text one's as strings,
+ * so the value says which it is. Either way a sequence is decoded only when a
+ * query that selects it yields its row.
+ */
+function asSequence(row: Record<string, SQLOutputValue>, name: string): string {
+	const value = column(row, name);
+
+	return value instanceof Uint8Array ? unpackSequence(value) : String(value);
+}
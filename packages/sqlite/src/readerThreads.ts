@@ -0,0 +1,202 @@
+/**
+ * Worker threads that run an artifact's scans off the main thread.
+ *
+ * `node:sqlite` is synchronous, so a scan on the main thread blocks the event
+ * loop for every batch it reads. Each thread here opens its own read-only,
+ * memory-mapped handle on the artifact and streams rows back a batch at a
+ * time, so several iterators can scan at once while the main thread only
+ * shapes rows. Every handle maps the same file, so the pages are the kernel's
+ * one copy rather than one per thread.
+ *
+ * The thread's body is a string evaluated as CommonJS rather than a module of
+ * its own: the workflows are bundled into a single file, where a second entry
+ * point would have to be configured in every app that reads an index. It
+ * needs nothing but `node:sqlite`, and the SQL it runs comes from the caller.
+ *
+ * Not exported from the package; `openWorkflowIndex` is the way in.
+ */
+
+import type { SQLInputValue, SQLOutputValue } from "node:sqlite";
+import { MessageChannel, type MessagePort, Worker } from "node:worker_threads";
+
+const READER_THREAD_SOURCE = `
+const { parentPort, workerData } = require("node:worker_threads");
+const { DatabaseSync } = require("node:sqlite");
+
+const database = new DatabaseSync(workerData.path, { readOnly: true });
+database.exec("PRAGMA mmap_size = " + workerData.mmapSize);
+
+parentPort.on("message", ({ sql, parameters, batchSize, port }) => {
+	let rows;
+
+	port.on("close", () => rows?.return?.());
+
+	port.on("message", () => {
+		try {
+			rows ??= database.prepare(sql).iterate(...parameters);
+
+			const batch = [];
+			let done = false;
+
+			while (batch.length < batchSize) {
+				const result = rows.next();
+
+				if (result.done) {
+					done = true;
+					break;
+				}
+
+				batch.push(result.value);
+			}
+
+			port.postMessage({ rows: batch, done });
+		} catch (error) {
+			port.postMessage({ error });
+		}
+	});
+});
+`;
+
+/** What a thread sends back for each batch requested. */
+type ReaderMessage =
+	| { rows: Record<string, SQLOutputValue>[]; done: boolean }
+	| { error: unknown };
+
+type ReaderThread = {
+	worker: Worker;
+
+	/** Scans running on this thread now. */
+	active: number;
+
+	/** Why the thread died, once it has. */
+	failure?: unknown;
+};
+
+/** A set of reader threads over one artifact. */
+export type ReaderThreads = {
+	/**
+	 * Run `sql` on the least busy thread and yield its rows.
+	 *
+	 * The next batch is requested before the current one is yielded, so the
+	 * thread reads ahead while the caller works.
+	 */
+	iterate(
+		sql: string,
+		parameters: SQLInputValue[],
+		batchSize: number,
+	): AsyncGenerator<Record<string, SQLOutputValue>>;
+
+	/** Stop every thread, abandoning any scan still running. */
+	close(): void;
+};
+
+/**
+ * Start `count` reader threads on the artifact at `path`.
+ *
+ * The threads never hold the process open on their own: each is unreferenced,
+ * and only a scan's message port keeps the event loop alive while it runs.
+ */
+export function startReaderThreads(
+	path: string,
+	count: number,
+	mmapSize: number,
+): ReaderThreads {
+	const threads: ReaderThread[] = Array.from({ length: count }, () => {
+		const thread: ReaderThread = {
+			worker: new Worker(READER_THREAD_SOURCE, {
+				eval: true,
+				workerData: { path, mmapSize },
+			}),
+			active: 0,
+		};
+
+		thread.worker.on("error", (error) => {
+			thread.failure = error;
+		});
+
+		thread.worker.unref();
+
+		return thread;
+	});
+
+	return {
+		async *iterate(sql, parameters, batchSize) {
+			const thread = threads.reduce((least, candidate) =>
+				candidate.active < least.active ? candidate : least,
+			);
+
+			if (thread.failure !== undefined) {
+				throw readerThreadError(thread);
+			}
+
+			const { port1, port2 } = new MessageChannel();
+
+			thread.active += 1;
+			thread.worker.postMessage({ sql, parameters, batchSize, port: port2 }, [
+				port2,
+			]);
+
+			let pending = request(port1, thread);
+
+			try {
+				while (true) {
+					const message = await pending;
+
+					if ("error" in message) {
+						throw message.error;
+					}
+
+					if (!message.done) {
+						pending = request(port1, thread);
+					}
+
+					yield* message.rows;
+
+					if (message.done) {
+						return;
+					}
+				}
+			} finally {
+				// Closing the port ends the scan on the thread as well. A
+				// request still in flight then rejects, which nothing awaits.
+				pending.catch(() => {});
+				port1.close();
+				thread.active -= 1;
+			}
+		},
+
+		close() {
+			for (const thread of threads) {
+				void thread.worker.terminate();
+			}
+		},
+	};
+}
+
+/** Ask for the next batch, rejecting if the thread goes away first. */
+function request(
+	port: MessagePort,
+	thread: ReaderThread,
+): Promise<ReaderMessage> {
+	return new Promise((resolve, reject) => {
+		function onMessage(message: ReaderMessage) {
+			port.off("close", onClose);
+			resolve(message);
+		}
+
+		function onClose() {
+			port.off("message", onMessage);
+			reject(readerThreadError(thread));
+		}
+
+		port.once("message", onMessage);
+		port.once("close", onClose);
+		port.postMessage("next");
+	});
+}
+
+function readerThreadError(thread: ReaderThread): Error {
+	return new Error("An index reader thread stopped mid-scan", {
+		cause: thread.failure,
+	});
+}
@@ -41,13 +41,25 @@ export const INDEX_SQLITE_FILE_NAME = "index.v1.sqlite";
 /** The `format` value every artifact carries in its `metadata` table. */
 export const REFERENCE_SQLITE_FORMAT = "virtool-reference-sqlite";
 
-/** The `format_version` value this reader understands. */
+/**
+ * The `format_version` of an artifact holding its sequences as text, which is
+ * what every writer produces unless asked otherwise.
+ */
 export const REFERENCE_SQLITE_FORMAT_VERSION = "1";
 
+/**
+ * The `format_version` of an artifact holding its sequences 2-bit packed, as
+ * `nucleotides.ts` specifies.
+ *
+ * Otherwise the same schema. This reader opens both; the other implementation
+ * does not yet, so nothing it reads is written at this version.
+ */
+export const REFERENCE_SQLITE_PACKED_FORMAT_VERSION = "2";
+
 /** The `created_by` value this package writes. */
 const REFERENCE_SQLITE_CREATED_BY = "virtool";
 
-const INDEX_SQLITE_DDL = `
+const INDEX_SQLITE_TABLES_DDL = `
 CREATE TABLE metadata (
 	"key" TEXT NOT NULL,
 	value TEXT NOT NULL,
@@ -106,12 +118,46 @@ CREATE TABLE sequences (
 	PRIMARY KEY (id),
 	FOREIGN KEY(isolate_id) REFERENCES isolates (id)
 );
+`;
 
+/**
+ * The tables of a packed artifact, whose one difference is the type of the
+ * column the packed sequences go in.
+ */
+const INDEX_SQLITE_PACKED_TABLES_DDL = INDEX_SQLITE_TABLES_DDL.replace(
+	"sequence TEXT NOT NULL",
+	"sequence BLOB NOT NULL",
+);
+
+/**
+ * The secondary indexes, kept apart from the tables so a bulk load can create
+ * them once over the finished rows instead of maintaining them insert by
+ * insert. Either way they end up with the same DDL text in `sqlite_master`.
+ */
+const INDEX_SQLITE_INDEXES_DDL = `
 CREATE INDEX isolates_otu_id_idx ON isolates (otu_id);
 CREATE INDEX sequences_isolate_id_idx ON sequences (isolate_id);
 CREATE INDEX sequences_segment_idx ON sequences (segment);
 `;
 
+/**
+ * The optional table an artifact built with `embedDefaultFasta` holds its
+ * default-isolate FASTA in, as consecutive chunks by `position`.
+ *
+ * Three `metadata` rows describe the whole FASTA: `default_fasta_bytes`,
+ * `default_fasta_records` and `default_fasta_sha256`, its hex SHA-256. An
+ * artifact without them has no FASTA embedded, whether or not the table is
+ * there. Nothing else in the schema refers to the table, so a reader that
+ * predates it opens the artifact as before.
+ */
+const INDEX_SQLITE_DEFAULT_FASTA_DDL = `
+CREATE TABLE default_fasta (
+	position INTEGER NOT NULL,
+	chunk BLOB NOT NULL,
+	PRIMARY KEY (position)
+);
+`;
+
 /** Where an artifact came from, for the errors this module throws. */
 export type IndexArtifactSource = {
 	/** The id of the index the artifact was built for. */
@@ -129,6 +175,26 @@ export type IndexArtifactSource = {
 	storageKey?: string;
 };
 
+/**
+ * The most of an artifact SQLite maps into memory when asked to.
+ *
+ * Past the largest artifact there is; SQLite maps no more than the file, and
+ * clamps this to its compile-time ceiling of just under 2 GiB.
+ */
+export const INDEX_ARTIFACT_MMAP_SIZE = 2 ** 31;
+
+/** Options for {@link openIndexArtifact}. */
+export type OpenIndexArtifactOptions = {
+	/**
+	 * Read through a memory map of the file instead of SQLite's page cache.
+	 *
+	 * Pages then come straight from the kernel's cache of the file, which every
+	 * handle on the same file shares — across threads and across processes —
+	 * instead of each handle copying the pages it reads into its own heap.
+	 */
+	mmap?: boolean;
+};
+
 /**
  * Open an artifact read-only, rejecting anything that is not one.
  *
@@ -140,7 +206,10 @@ export type IndexArtifactSource = {
  * @throws {IndexArtifactFormatError} when the `metadata` table is missing,
  * incomplete, or names a format this reader does not understand.
  */
-export function openIndexArtifact(source: IndexArtifactSource): DatabaseSync {
+export function openIndexArtifact(
+	source: IndexArtifactSource,
+	{ mmap = false }: OpenIndexArtifactOptions = {},
+): DatabaseSync {
 	let database: DatabaseSync;
 
 	try {
@@ -156,6 +225,10 @@ export function openIndexArtifact(source: IndexArtifactSource): DatabaseSync {
 
 	try {
 		checkIndexArtifactFormat(database, source);
+
+		if (mmap) {
+			database.exec(`PRAGMA mmap_size = ${INDEX_ARTIFACT_MMAP_SIZE}`);
+		}
 	} catch (error) {
 		database.close();
 
@@ -165,6 +238,21 @@ export function openIndexArtifact(source: IndexArtifactSource): DatabaseSync {
 	return database;
 }
 
+/** Options for {@link createIndexArtifactSchema}. */
+export type CreateIndexArtifactSchemaOptions = {
+	/**
+	 * Leave out the secondary indexes, for a caller that will add them with
+	 * {@link createIndexArtifactIndexes} once every row is in.
+	 */
+	deferIndexes?: boolean;
+
+	/**
+	 * Declare the artifact as {@link REFERENCE_SQLITE_PACKED_FORMAT_VERSION},
+	 * for a caller that writes its sequences with `packSequence`.
+	 */
+	packSequences?: boolean;
+};
+
 /**
  * Create an empty artifact at `path`, replacing any file already there.
  *
@@ -172,23 +260,55 @@ export function openIndexArtifact(source: IndexArtifactSource): DatabaseSync {
  * against an isolate that was never inserted fails at the insert rather than
  * becoming an unreachable row.
  */
-export function createIndexArtifactSchema(path: string): DatabaseSync {
+export function createIndexArtifactSchema(
+	path: string,
+	{
+		deferIndexes = false,
+		packSequences = false,
+	}: CreateIndexArtifactSchemaOptions = {},
+): DatabaseSync {
 	const database = new DatabaseSync(path);
 
 	database.exec("PRAGMA foreign_keys = ON");
-	database.exec(INDEX_SQLITE_DDL);
+	database.exec(
+		packSequences ? INDEX_SQLITE_PACKED_TABLES_DDL : INDEX_SQLITE_TABLES_DDL,
+	);
+
+	if (!deferIndexes) {
+		createIndexArtifactIndexes(database);
+	}
 
 	const insert = database.prepare(
 		"INSERT INTO metadata (key, value) VALUES (?, ?)",
 	);
 
 	insert.run("format", REFERENCE_SQLITE_FORMAT);
-	insert.run("format_version", REFERENCE_SQLITE_FORMAT_VERSION);
+	insert.run(
+		"format_version",
+		packSequences
+			? REFERENCE_SQLITE_PACKED_FORMAT_VERSION
+			: REFERENCE_SQLITE_FORMAT_VERSION,
+	);
 	insert.run("created_by", REFERENCE_SQLITE_CREATED_BY);
 
 	return database;
 }
 
+/**
+ * Create the secondary indexes on an artifact made with `deferIndexes`.
+ *
+ * Building an index over rows already in the table is one sort, where keeping
+ * it up to date through the load is a B-tree insert per row.
+ */
+export function createIndexArtifactIndexes(database: DatabaseSync): void {
+	database.exec(INDEX_SQLITE_INDEXES_DDL);
+}
+
+/** Add the table a precomputed default-isolate FASTA is stored in. */
+export function createIndexArtifactDefaultFasta(database: DatabaseSync): void {
+	database.exec(INDEX_SQLITE_DEFAULT_FASTA_DDL);
+}
+
 function checkIndexArtifactFormat(
 	database: DatabaseSync,
 	source: IndexArtifactSource,
@@ -211,17 +331,20 @@ function checkIndexArtifactFormat(
 	);
 
 	const expected = [
-		["format", REFERENCE_SQLITE_FORMAT],
-		["format_version", REFERENCE_SQLITE_FORMAT_VERSION],
+		["format", [REFERENCE_SQLITE_FORMAT]],
+		[
+			"format_version",
+			[REFERENCE_SQLITE_FORMAT_VERSION, REFERENCE_SQLITE_PACKED_FORMAT_VERSION],
+		],
 	] as const;
 
-	for (const [key, want] of expected) {
+	for (const [key, wanted] of expected) {
 		const found = metadata.get(key);
 
-		if (found !== want) {
+		if (!wanted.some((want) => want === found)) {
 			throw new IndexArtifactFormatError(
 				source,
-				`${key}=${want}`,
+				wanted.map((want) => `${key}=${want}`).join(" or "),
 				found === undefined ? `no ${key}` : `${key}=${found}`,
 			);
 		}
@@ -4,6 +4,7 @@ import { tmpdir } from "node:os";
 import { join } from "node:path";
 import { setTimeout as delay } from "node:timers/promises";
 import { gzipSync } from "node:zlib";
+import { compressSeekableGzip } from "@virtool/archive/seekable";
 import type { StorageBackend } from "@virtool/storage";
 import { MemoryStorage, StorageKeyNotFoundError } from "@virtool/storage";
 import { afterEach, beforeEach, describe, expect, it } from "vitest";
@@ -113,6 +114,25 @@ describe("downloadGzipToPath", () => {
 		expect(await readFile(path, "utf8")).toBe("raw sqlite bytes");
 	});
 
+	it("decompresses a seekable gzip object block by block", async () => {
+		const storage = new MemoryStorage();
+		const data = randomBytes(64 * 1024);
+		const source = join(workPath, "snapshot.sqlite");
+		const compressed = join(workPath, "snapshot.sqlite.gz");
+
+		await writeFile(source, data);
+		await compressSeekableGzip(source, compressed, { blockSize: 4096 });
+		await storage.write(
+			"indexes/1/snapshot",
+			oneChunk(await readFile(compressed)),
+		);
+
+		const path = join(workPath, "indexes", "1", "snapshot.sqlite");
+		await downloadGzipToPath(storage, "indexes/1/snapshot", path);
+
+		expect((await readFile(path)).equals(data)).toBe(true);
+	});
+
 	it("propagates missing-storage and corrupt-gzip failures", async () => {
 		const storage = new MemoryStorage();
 
@@ -18,9 +18,9 @@ import { mkdir } from "node:fs/promises";
 import { dirname } from "node:path";
 import { pipeline } from "node:stream/promises";
 import {
-	type DecompressGzipToFileOptions,
-	decompressGzipToFile,
-} from "@virtool/archive/compression";
+	type DecompressSeekableGzipToFileOptions,
+	decompressSeekableGzipToFile,
+} from "@virtool/archive/seekable";
 import type { StorageBackend } from "@virtool/storage";
 
 /**
@@ -46,15 +46,17 @@ export async function downloadToPath(
  * Stream the gzip object at `key` into a decompressed file at `path`.
  *
  * No compressed copy is retained on disk and neither representation is
- * buffered in memory.
+ * buffered in memory. A seekable gzip — the index snapshot — is inflated a
+ * block at a time on every core while the rest is still downloading; any
+ * other gzip streams through one gunzip as before.
  */
 export async function downloadGzipToPath(
 	storage: StorageBackend,
 	key: string,
 	path: string,
-	options?: DecompressGzipToFileOptions,
+	options?: DecompressSeekableGzipToFileOptions,
 ): Promise<void> {
-	await decompressGzipToFile(storage.read(key), path, options);
+	await decompressSeekableGzipToFile(storage.read(key), path, options);
 }
 
 /**